@@ -4,8 +4,8 @@
 # Author:   Livia Chandra, Roshni Venkat, & Darren Seubert
 #
 # Description:
-# This file is used to convert audio file into MIDI file using librosa, pydub,
-# and mido libraries.
+# This file is used to convert audio file into MIDI file using librosa, with
+# one note per beat written by midi_writer.
 #
 # Usage (Optional):
 # [Instructions or examples demonstrating how to use the code in this file.
@@ -20,8 +20,8 @@
 import numpy as np
 import scipy.io.wavfile as wav
 import librosa
-from mido import MidiFile, MidiTrack, Message
-import math
+from midi_writer import note_array, write_midi
+from shared_analysis import AudioAnalysis
 
 
 def divide_y(array, desired_len):
@@ -51,12 +51,13 @@ def convert_to_midi(input_file, output_file):
         output_file (String): Path to save the output MIDI file
     """
 
-    # Load audio file using librosa
-    y, sr = librosa.load(input_file)
+    # Load audio file using librosa, decoded once and shared
+    analysis = AudioAnalysis.load(input_file)
+    y, sr = analysis.y, analysis.sr
     print(y)
 
-    # Obtain bpm
-    tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
+    # Obtain bpm from the shared onset envelope
+    tempo, beat_frames = analysis.beat_track()
     print(tempo)
 
     # Obtain time
@@ -81,46 +82,27 @@ def convert_to_midi(input_file, output_file):
         frequency_list.append(mean)
     # print(frequency_list)
 
-    midi_note = []
-
-    for freq in frequency_list:
-        n = (int)((12 * math.log(freq / 220.0) / math.log(2.0)) + 57.01)
-        midi_note.append(n)
+    midi_note = (
+        12 * np.log2(np.asarray(frequency_list) / 220.0) + 57.01
+    ).astype(int)
     # print(midi_note)
 
-    # Create a new MIDI file and track
-    midi = MidiFile()
-    track = MidiTrack()
-    midi.tracks.append(track)
-
-    # Define velocity and time values for MIDI messages
+    # Define velocity for the notes
     velocity = 100
 
-    for time in beat_times:
-        times = 60000 / (tempo * 192)
-
-    # Create MIDI messages
-    for note, time in zip(midi_note, beat_times):
-        if note > 0:
-            # Write MIDI message and append to the MIDI track
-            message_on = Message(
-                "note_on",
-                note=int(round(note)),
-                velocity=velocity,
-                time=math.floor(time),
-            )
-            message_off = Message(
-                "note_off",
-                note=int(round(note)),
-                velocity=velocity,
-                time=math.ceil(time + 1),
-            )
-
-            track.append(message_on)
-            track.append(message_off)
-
-    # Save MIDI file
-    midi.save(output_file)
+    # One note per beat, lasting until the next beat (one beat for the last)
+    n_notes = min(len(midi_note), len(beat_times))
+    beat_ends = np.append(beat_times[1:], beat_times[-1:] + 60 / tempo)
+    keep = midi_note[:n_notes] > 0
+    notes = note_array(
+        beat_times[:n_notes][keep],
+        (beat_ends - beat_times)[:n_notes][keep],
+        midi_note[:n_notes][keep],
+        velocity,
+    )
+
+    # Save MIDI file at the estimated tempo
+    write_midi(notes, output_file, tempo=int(60 * 10**6 / tempo))
 
 
 if __name__ == "__main__":
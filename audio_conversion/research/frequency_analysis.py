@@ -5,7 +5,11 @@
 #
 # Description:
 # This file is used to visualize the frequencies of audio file in frequency
-# graph which help converting frequencies into MIDI file.
+# graph which help converting frequencies into MIDI file. The analysis itself
+# is done by spectrum_to_midi, which maps every FFT bin to a MIDI pitch in one
+# array operation and sums the spectral energy of each MIDI pitch and pitch
+# class with np.bincount. Plotting is optional, so the analysis also runs
+# headless.
 #
 # Usage (Optional):
 # [Instructions or examples demonstrating how to use the code in this file.
@@ -19,97 +23,85 @@
 
 import numpy as np
 import scipy.io.wavfile as wav
-import librosa as lb
-import matplotlib.pyplot as plt
-from mido import MidiFile, MidiTrack, Message
+from midi_writer import note_array, write_midi
+from shared_analysis import AudioAnalysis
 
+# Pitch class names, indexed by MIDI note % 12
+PITCH_CLASSES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
 
-def wav_to_frequency_scipy(input_file, output_file):
-    sample_rate, raw_audio = wav.read(input_file)
-    print(f"Sample Rate (scipy): {sample_rate}")
-    print(f"Raw Audio Data (scipy): {raw_audio}")
 
-    # Compute the Fourier Transform
-    frequencies = np.fft.fftfreq(len(raw_audio)) * sample_rate
-    spectrum = np.fft.fft(raw_audio)
+def frequencies_to_midi(frequencies):
+    """
+    Map frequencies to fractional MIDI notes in one array operation.
 
-    # Plot the frequencies
-    plt.figure(figsize=(10, 4))
-    plt.plot(frequencies, np.abs(spectrum))
-    plt.title("Frequency Spectrum")
-    plt.xlabel("Frequency (Hz)")
-    plt.ylabel("Magnitude")
-    plt.grid(True)
-    plt.show()
+    Args:
+        frequencies (ndarray): Frequencies in Hz.
 
-    # Use the librosa function to convert frequencies into midi note
-    converted_frequencies = []
-    for frequency in frequencies:
-        if frequency > 0:
-            converted_frequencies.append(lb.hz_to_midi(frequency))
-        else:
-            converted_frequencies.append(0)
+    Returns:
+        ndarray: The MIDI note of every frequency, or 0 where the frequency
+        is not positive.
+    """
+    frequencies = np.asarray(frequencies, dtype=float)
+    midi_notes = np.zeros_like(frequencies)
+    positive = frequencies > 0
+    midi_notes[positive] = 12 * np.log2(frequencies[positive] / 440.0) + 69
+    return midi_notes
 
-    # Plot the frequency against the MIDI note
-    plt.figure(figsize=(12, 6))
-    plt.plot(frequencies, converted_frequencies, color="blue")
-    plt.title("Frequency to MIDI")
-    plt.xlabel("Frequency (Hz)")
-    plt.ylabel("MIDI Notes")
-    plt.grid(True)
-    plt.xlim(0, 10000)  # Limit x-axis to focus on lower frequencies
-    plt.ylim(0, 127)  # Limit y-axis to MIDI note range
-    plt.xticks(np.arange(0, 10001, 500))  # Set x-axis ticks every 500 Hz
-    plt.yticks(np.arange(0, 128, 12))  # Set y-axis ticks every octave
-    plt.show()
 
-    # Test output by creating a new MIDI file
-    mid = MidiFile()
+def spectrum_to_midi(frequencies, magnitudes, plot=False):
+    """
+    Sum the spectral energy of every MIDI pitch and pitch class.
+
+    Each bin is rounded to its nearest MIDI note and its energy (magnitude
+    squared) is added to that note with np.bincount; the MIDI energies are
+    then folded into a 12-bin pitch class (chroma) histogram.
 
-    # Add a track to the MIDI file
-    track = MidiTrack()
-    mid.tracks.append(track)
+    Args:
+        frequencies (ndarray): Frequency of every bin in Hz, e.g. from
+            np.fft.rfftfreq.
+        magnitudes (ndarray): Magnitude of every bin.
+        plot (bool): Whether to plot the spectrum, the frequency to MIDI
+            mapping and the histograms with matplotlib.
 
-    # Iterate over the converted frequencies and add note on/off messages to the track
-    for midi_note in converted_frequencies:
-        if 0 <= midi_note <= 127:  # Skip MIDI notes with value 0
-            midi_note = int(np.abs(midi_note))
-            track.append(Message("note_on", note=midi_note, velocity=64, time=0))
-            track.append(Message("note_off", note=midi_note, velocity=0, time=480))
+    Returns:
+        tuple: The energy of each of the 128 MIDI notes and of each of the 12
+        pitch classes, starting from C.
+    """
+    midi_notes = frequencies_to_midi(frequencies)
+    nearest = np.rint(midi_notes).astype(int)
+    valid = (np.asarray(frequencies) > 0) & (nearest >= 0) & (nearest <= 127)
+    energy = np.asarray(magnitudes, dtype=float) ** 2
 
-    # Save the MIDI file
-    mid.save(output_file)
+    midi_energy = np.bincount(nearest[valid], weights=energy[valid], minlength=128)
+    pitch_class_energy = np.bincount(
+        np.arange(128) % 12, weights=midi_energy, minlength=12
+    )
 
+    if plot:
+        plot_spectrum(frequencies, magnitudes, midi_notes, midi_energy, pitch_class_energy)
 
-def wav_to_frequency_librosa(input_file, output_file):
-    # Read the WAV file using librosa library
-    raw_audio, sample_rate = lb.load(input_file)
-    print(f"Raw Audio Data (librosa): {raw_audio}")
-    print(f"Sample Rate (librosa): {sample_rate}")
+    return midi_energy, pitch_class_energy
 
-    frequencies = np.fft.fftfreq(len(raw_audio)) * sample_rate
-    spectrum = np.fft.fft(raw_audio)
 
-    # Plot the frequencies using librosa library
+def plot_spectrum(frequencies, magnitudes, midi_notes, midi_energy, pitch_class_energy):
+    """
+    Plot the results of spectrum_to_midi.
+    """
+    # Only needed for plotting, so headless callers never import it
+    import matplotlib.pyplot as plt
+
+    # Plot the frequencies
     plt.figure(figsize=(10, 4))
-    plt.plot(frequencies, np.abs(spectrum))
+    plt.plot(frequencies, magnitudes)
     plt.title("Frequency Spectrum")
     plt.xlabel("Frequency (Hz)")
     plt.ylabel("Magnitude")
     plt.grid(True)
     plt.show()
 
-    # Use the librosa function to convert frequencies into midi note
-    converted_frequencies = []
-    for frequency in frequencies:
-        if frequency > 0:
-            converted_frequencies.append(lb.hz_to_midi(frequency))
-        else:
-            converted_frequencies.append(0)
-
     # Plot the frequency against the MIDI note
     plt.figure(figsize=(12, 6))
-    plt.plot(frequencies, converted_frequencies, color="blue")
+    plt.plot(frequencies, midi_notes, color="blue")
     plt.title("Frequency to MIDI")
     plt.xlabel("Frequency (Hz)")
     plt.ylabel("MIDI Notes")
@@ -120,22 +112,80 @@ def wav_to_frequency_librosa(input_file, output_file):
     plt.yticks(np.arange(0, 128, 12))  # Set y-axis ticks every octave
     plt.show()
 
-    # Test output by creating a new MIDI file
-    mid = MidiFile()
+    # Plot the energy of every MIDI note and pitch class
+    _, (midi_axis, chroma_axis) = plt.subplots(1, 2, figsize=(14, 4))
+    midi_axis.bar(np.arange(128), midi_energy)
+    midi_axis.set_title("Energy per MIDI Note")
+    midi_axis.set_xlabel("MIDI Note")
+    chroma_axis.bar(PITCH_CLASSES, pitch_class_energy)
+    chroma_axis.set_title("Energy per Pitch Class")
+    plt.show()
+
+
+def save_midi_energy(midi_energy, output_file, threshold=0.01):
+    """
+    Write the MIDI notes carrying energy to a MIDI file, one note each.
+
+    Args:
+        midi_energy (ndarray): Energy of each MIDI note, from spectrum_to_midi.
+        output_file (str): Path to save the MIDI file to.
+        threshold (float): Notes with less than this fraction of the energy of
+            the strongest note are left out.
+    """
+    # One half-second note (480 ticks at 120 BPM) per MIDI pitch in turn,
+    # louder for more energy
+    peak = midi_energy.max()
+    notes = np.flatnonzero((midi_energy > 0) & (midi_energy >= threshold * peak))
+    velocities = np.rint(127 * np.sqrt(midi_energy[notes] / peak))
+    onsets = 0.5 * np.arange(len(notes))
+    write_midi(note_array(onsets, 0.5, notes, velocities), output_file)
+
+
+def analyze_audio(raw_audio, sample_rate, output_file, plot=True):
+    """
+    Analyze the spectrum of a whole recording and save its MIDI notes.
+
+    Args:
+        raw_audio (ndarray): Audio samples, mono or with one column per channel.
+        sample_rate (int): Sample rate of raw_audio.
+        output_file (str): Path to save the MIDI file to.
+        plot (bool): Whether to plot the analysis.
+
+    Returns:
+        tuple: The MIDI note and pitch class energies.
+    """
+    raw_audio = np.asarray(raw_audio, dtype=float)
+    if raw_audio.ndim > 1:
+        raw_audio = raw_audio.mean(axis=1)
+
+    # Compute the Fourier Transform; the negative frequencies mirror the
+    # positive ones for real audio, so only the latter are computed
+    frequencies = np.fft.rfftfreq(len(raw_audio), d=1 / sample_rate)
+    spectrum = np.abs(np.fft.rfft(raw_audio))
+
+    midi_energy, pitch_class_energy = spectrum_to_midi(frequencies, spectrum, plot)
+    save_midi_energy(midi_energy, output_file)
+    return midi_energy, pitch_class_energy
+
+
+def wav_to_frequency_scipy(input_file, output_file, plot=True):
+    sample_rate, raw_audio = wav.read(input_file)
+    print(f"Sample Rate (scipy): {sample_rate}")
+    print(f"Raw Audio Data (scipy): {raw_audio}")
+
+    return analyze_audio(raw_audio, sample_rate, output_file, plot)
 
-    # Add a track to the MIDI file
-    track = MidiTrack()
-    mid.tracks.append(track)
 
-    # Iterate over the converted frequencies and add note on/off messages to the track
-    for midi_note in converted_frequencies:
-        if 0 <= midi_note <= 127:  # Skip MIDI notes with value 0
-            midi_note = int(np.abs(midi_note))
-            track.append(Message("note_on", note=midi_note, velocity=64, time=0))
-            track.append(Message("note_off", note=midi_note, velocity=0, time=480))
+def wav_to_frequency_librosa(input_file, output_file, plot=True):
+    # Read the WAV file using librosa library, decoded once and shared
+    analysis = AudioAnalysis.load(input_file)
+    print(f"Raw Audio Data (librosa): {analysis.y}")
+    print(f"Sample Rate (librosa): {analysis.sr}")
 
-    # Save the MIDI file
-    mid.save(output_file)
+    frequencies, spectrum = analysis.spectrum()
+    midi_energy, pitch_class_energy = spectrum_to_midi(frequencies, spectrum, plot)
+    save_midi_energy(midi_energy, output_file)
+    return midi_energy, pitch_class_energy
 
 
 if __name__ == "__main__":
@@ -14,8 +14,8 @@
 #
 # Usage (Optional):
 # User can use the provided functions to convert audio files to MIDI format.
-# Ensure that the required dependencies, such as pydub, librosa, numpy, scipy,
-# and mido, are installed in user's Python environment.
+# Ensure that the required dependencies, such as pydub, librosa, numpy and scipy,
+# are installed in user's Python environment.
 #
 # Notes:
 # - This file supports audio files with extensions mp3, m4a, and wav.
@@ -30,11 +30,14 @@ import os
 import pydub
 import librosa
 import numpy as np
+import scipy.fft
 import scipy.signal as signal
-import math
-import mido
+from numpy.lib.stride_tricks import sliding_window_view
+from midi_writer import note_array, write_midi
+from shared_analysis import AudioAnalysis
 
 midi_folder = "./app/utils/midi_output"
+TICKS_PER_BEAT = 480
 
 import subprocess
 
@@ -84,45 +87,21 @@ def audio_to_wav(audio_file):
     if extension[1:] not in available_extension:
         return None
 
+    # WAV files are read in place, without exporting a copy
+    if extension[1:] == "wav":
+        return file_name, audio_file
+
     # Convert input audio file to wav file
     current_directory = os.getcwd()
-    wav_file_path = os.path.join(current_directory, file_name + ".wav")
-    # wav_file_path = os.path.join(audio_folder, file_name + ".wav")
-    wav_file = pydub.AudioSegment.from_file(audio_file, extension[1:]).export(
-        wav_file_path, format="wav"
-    )
+    wav_file = os.path.join(current_directory, file_name + ".wav")
+    # wav_file = os.path.join(audio_folder, file_name + ".wav")
+    pydub.AudioSegment.from_file(audio_file, extension[1:]).export(
+        wav_file, format="wav"
+    ).close()
 
     return file_name, wav_file
 
 
-def divide_audio_data(audio_data, sample_rate, tempo):
-    """
-    Helper function to divide array into segments with variable length based on BPM.
-
-    Args:
-        audio_data (ndarray): 1D array that contains audio signal information
-        sample_rate (int): Number of samples per second (Hz) used when loading the
-                           audio file.
-        tempo (float64): Estimated tempo of the audio signal in beats per minute (BPM)
-
-    Yields:
-        ndarray: Segments of audio data with variable length based on the BPM.
-    """
-    try:
-        # Calculate the duration of one beat in seconds
-        beat_duration = 60 / tempo
-
-        # Calculate the desired length of each segment based on the beat duration
-        desired_len = int(sample_rate * beat_duration * 2)
-
-        # Loop through the array and yield segments of the desired length
-        for i in range(0, len(audio_data), desired_len):
-            yield audio_data[i : i + desired_len]
-    except Exception as e:
-        print("An error occurred during audio data division:", e)
-        return None
-
-
 def is_webm_file(file_path):
     _, file_extension = os.path.splitext(file_path)
     return file_extension.lower() == ".webm"
@@ -150,151 +129,204 @@ def change_extension_to_mp3(file_path):
         return file_path
 
 
-def wav_to_midi(audio_file):
+def segment_median_frequencies(
+    audio_data, sample_rate, segment_length, window_size=512, hop_length=128, magnitude=None
+):
     """
-    Convert audio file to MIDI format.
+    Find the weighted median frequency of consecutive segments of a signal.
+
+    A single STFT is computed over the whole signal and every frame is
+    assigned to the segment its center falls in, so frames near a boundary
+    see the neighboring segment instead of zero padding. The magnitude spectra of each
+    segment's frames are averaged with one reduction over the segment
+    boundaries, and the median of every averaged spectrum is found at once.
 
     Args:
-        audio_file (str): The path to the audio file.
+        audio_data (ndarray): 1D array that contains audio signal information.
+        sample_rate (int): Number of samples per second (Hz) of audio_data.
+        segment_length (int): Number of samples per segment.
+        window_size (int): STFT window size.
+        hop_length (int): Number of samples between STFT frames.
+        magnitude (ndarray): Precomputed (frames, bins) magnitudes of the
+            centered STFT with window_size and hop_length, such as
+            AudioAnalysis.magnitude(window_size, hop_length).T; computed
+            here if None.
 
     Returns:
-        str: The path to the generated MIDI file.
+        ndarray: The weighted median frequency of each segment in Hz, or 0
+        for segments too short to hold the center of a frame.
     """
+    n_segments = -(-len(audio_data) // segment_length)
+    if n_segments == 0:
+        return np.zeros(0)
+
+    # Frame t is centered on sample t * hop_length; keep frames centered
+    # inside the signal
+    n_frames = (len(audio_data) - 1) // hop_length + 1
+    if magnitude is None:
+        # The frames of scipy.signal.stft: Hann windows centered on every
+        # hop_length-th sample of the zero-padded signal. Taking them as
+        # strided views and transforming them with one real FFT is several
+        # times faster than scipy.signal.stft on long signals.
+        nperseg = min(len(audio_data), window_size)
+        padded = np.pad(np.asarray(audio_data, dtype=np.float32), nperseg // 2)
+        frames = sliding_window_view(padded, nperseg)[::hop_length][:n_frames]
+        window = signal.get_window("hann", nperseg).astype(np.float32)
+        magnitude = np.abs(scipy.fft.rfft(frames * window, axis=1))
+    else:
+        nperseg = 2 * (magnitude.shape[1] - 1)
+        magnitude = magnitude[:n_frames]
+        n_frames = len(magnitude)
+
+    # First frame of every segment
+    starts = -(-np.arange(n_segments) * segment_length // hop_length)
+    counts = np.diff(np.append(np.minimum(starts, n_frames), n_frames))
+    valid = counts > 0
+
+    # Mean magnitude spectrum of each segment, one row per segment
+    magnitude_spectrum = np.zeros((n_segments, magnitude.shape[1]))
+    magnitude_spectrum[valid] = (
+        np.add.reduceat(magnitude, starts[valid], axis=0) / counts[valid, np.newaxis]
+    )
 
-    # Check if it is webm
-    if is_webm_file(audio_file):
-        mp3_output_path = change_extension_to_mp3(audio_file)
-        convert_webm_to_mp3(audio_file, mp3_output_path)
-        audio_file = mp3_output_path
+    # Weighted median: the first bin where the cumulative magnitude reaches half
+    cumulative = np.cumsum(magnitude_spectrum, axis=1)
+    median_index = np.argmax(cumulative >= cumulative[:, -1:] / 2, axis=1)
+    frequency_bins = np.fft.rfftfreq(nperseg, d=1 / sample_rate)
 
-    # Convert audio file into wav file
-    file_name, wav_file = audio_to_wav(audio_file)
+    median_freq = frequency_bins[median_index]
+    median_freq[~valid] = 0
+    return median_freq
 
-    # Load audio file using librosa
-    audio_data, sample_rate = librosa.load(wav_file)
-
-    # Set min and max frequencies for pitch detection
-    fmin = librosa.note_to_hz("C1")
-    fmax = librosa.note_to_hz("C8")
-
-    # Perform pitch detection to identify dominant pitch
-    pitch = librosa.yin(y=audio_data, sr=sample_rate, fmin=fmin, fmax=fmax)
-
-    # Find the most frequent pitch
-    dominant_pitch = np.argmax(pitch)
-
-    # Determine key signature by mapping MIDI note number
-    key_map = {
-        0: "C",
-        1: "C#",
-        2: "D",
-        3: "D#",
-        4: "E",
-        5: "F",
-        6: "F#",
-        7: "G",
-        8: "G#",
-        9: "A",
-        10: "A#",
-        11: "B",
-    }
-    key_signature = key_map[int(dominant_pitch) % 12]
-
-    # Obtain BPM
-    tempo, beat_frames = librosa.beat.beat_track(y=audio_data, sr=sample_rate)
 
-    # Obtain time
-    beat_times = librosa.frames_to_time(beat_frames, sr=sample_rate)
+def segment_median_frequencies_loop(
+    audio_data, sample_rate, segment_length, window_size=512, hop_length=128
+):
+    """
+    Reference implementation of segment_median_frequencies.
 
-    # Divide audio into segments with variable length based on BPM
-    trimmed_frequency = list(divide_audio_data(audio_data, sample_rate, tempo))
+    This is the per-segment loop wav_to_midi used before, with the median
+    taken over the rfftfreq bins, kept to benchmark and check the vectorized
+    version against. Each segment gets its own STFT, so frames near segment
+    boundaries are padded with zeros instead of overlapping the neighbor.
 
-    # STFT Parameters
-    window_size = 512  # Window size
-    hop_length = 128  # Hop length
+    Args:
+        audio_data (ndarray): 1D array that contains audio signal information.
+        sample_rate (int): Number of samples per second (Hz) of audio_data.
+        segment_length (int): Number of samples per segment.
+        window_size (int): STFT window size.
+        hop_length (int): Number of samples between STFT frames.
 
-    # Analyze frequency for each time frame
+    Returns:
+        ndarray: The weighted median frequency of each segment in Hz.
+    """
     frequency_list = []
-
-    # Compute STFT for each segment
-    for frequency in trimmed_frequency:
+    for i in range(0, len(audio_data), segment_length):
+        segment = audio_data[i : i + segment_length]
 
         # Adjust nperseg and noverlap based on the length of the segment
-        nperseg = min(len(frequency), window_size)
-        noverlap = nperseg - hop_length
+        nperseg = min(len(segment), window_size)
+        noverlap = max(nperseg - hop_length, 0)
         _, _, stft = signal.stft(
-            frequency, fs=sample_rate, nperseg=nperseg, noverlap=noverlap
+            segment, fs=sample_rate, nperseg=nperseg, noverlap=noverlap
         )
 
-        # Sum across time axis to get magnitude spectrum
+        # Average across time axis to get magnitude spectrum
         magnitude_spectrum = np.abs(stft).mean(axis=1)
-
-        # Convert to frequency domain
-        frequency_bins = np.fft.fftfreq(len(magnitude_spectrum)) * sample_rate
+        frequency_bins = np.fft.rfftfreq(nperseg, d=1 / sample_rate)
 
         # Weighted median frequency
         median_freq_index = np.argmax(
             np.cumsum(magnitude_spectrum) >= np.sum(magnitude_spectrum) / 2
         )
-        median_freq = frequency_bins[median_freq_index]
+        frequency_list.append(frequency_bins[median_freq_index])
 
-        frequency_list.append(median_freq)
+    return np.array(frequency_list)
 
-    # Filter out invalid frequencies
-    filtered_frequency_list = [freq for freq in frequency_list if freq > 0]
 
-    # Set the velocity to determine the volume of output midi file
-    velocity = 127
+def wav_to_midi(audio_file):
+    """
+    Convert audio file to MIDI format.
 
-    # Calculate MIDI notes
-    midi_note = [
-        (int(12 * math.log(freq / 440.0) / math.log(2)) + 69)
-        for freq in filtered_frequency_list
-    ]
+    Args:
+        audio_file (str): The path to the audio file.
 
-    # Create a new MIDI file and track
-    midi = mido.MidiFile()
-    track = mido.MidiTrack()
-    midi.tracks.append(track)
+    Returns:
+        str: The path to the generated MIDI file.
+    """
 
-    # Set the key signature meta message
-    key_sig_message = mido.MetaMessage("key_signature", key=key_signature, time=0)
-    track.append(key_sig_message)
+    # Check if it is webm
+    if is_webm_file(audio_file):
+        mp3_output_path = change_extension_to_mp3(audio_file)
+        convert_webm_to_mp3(audio_file, mp3_output_path)
+        audio_file = mp3_output_path
 
-    # Create and append the tempo meta message in microseconds
-    tempo_microseconds = int(60 * 10**6 / tempo)
-    tempo_message = mido.MetaMessage("set_tempo", tempo=tempo_microseconds)
-    track.append(tempo_message)
+    # Convert audio file into wav file
+    file_name, wav_file = audio_to_wav(audio_file)
 
-    # Calculate MIDI time based on tempo
-    midi_time = [
-        (beat_times[i] - beat_times[i - 1]) * 60 / tempo
-        for i in range(1, len(beat_times))
-    ]
+    # Load audio file once; every feature below shares its decode
+    analysis = AudioAnalysis.load(wav_file)
+    audio_data, sample_rate = analysis.y, analysis.sr
+
+    # Determine key signature from the chroma of the whole recording
+    key_signature = analysis.key()
+
+    # Obtain BPM from the shared onset envelope
+    tempo, beat_frames = analysis.beat_track()
+
+    # Obtain time
+    beat_times = librosa.frames_to_time(beat_frames, sr=sample_rate)
+
+    # Weighted median frequency of each segment of two beats, from the
+    # shared STFT with the window and hop used for segments
+    segment_length = int(sample_rate * (60 / tempo) * 2)
+    frequency_list = segment_median_frequencies(
+        audio_data,
+        sample_rate,
+        segment_length,
+        magnitude=analysis.magnitude(n_fft=512, hop_length=128).T,
+    )
 
-    # Reverse the time list
-    midi_new_time = list(reversed(midi_time))
+    # Filter out invalid frequencies
+    frequencies = frequency_list[frequency_list > 0]
 
-    # Create MIDI messages
-    for note, time in zip(midi_note, midi_new_time):
+    # Set the velocity to determine the volume of output midi file
+    velocity = 127
 
-        # Convert time from seconds to ticks
-        ticks_per_beat = midi.ticks_per_beat
-        time_ticks = int(round(time * sample_rate / (60 * tempo / ticks_per_beat)))
+    # Calculate MIDI notes
+    midi_note = (12 * np.log2(frequencies / 440.0)).astype(int) + 69
 
-        # Write MIDI message and append to the MIDI track
-        if note > 0:
-            message_on = mido.Message(
-                "note_on", note=note, velocity=velocity, time=time_ticks
-            )
-            message_off = mido.Message(
-                "note_off", note=note, velocity=velocity, time=time_ticks
-            )
-            track.append(message_on)
-            track.append(message_off)
+    # Tempo in microseconds per beat
+    tempo_microseconds = int(60 * 10**6 / tempo)
+
+    # Calculate MIDI time based on tempo, in reverse order
+    midi_new_time = (np.diff(beat_times) * 60 / tempo)[::-1]
+
+    # Convert time from seconds to ticks; every note lasts its time and
+    # follows the previous note after a rest just as long
+    n_notes = min(len(midi_note), len(midi_new_time))
+    midi_note = midi_note[:n_notes]
+    time_ticks = np.rint(
+        midi_new_time[:n_notes] * sample_rate / (60 * tempo / TICKS_PER_BEAT)
+    ).astype(int)[midi_note > 0]
+    midi_note = midi_note[midi_note > 0]
+    end_ticks = np.cumsum(2 * time_ticks)
+    seconds_per_tick = tempo_microseconds / (TICKS_PER_BEAT * 10**6)
+    notes = note_array(
+        (end_ticks - time_ticks) * seconds_per_tick,
+        time_ticks * seconds_per_tick,
+        midi_note,
+        velocity,
+    )
 
-    # Save MIDI file
+    # Save MIDI file with the key signature and tempo
     midi_file_name = os.path.join(midi_folder, file_name + ".mid")
-    midi.save(midi_file_name)
+    write_midi(
+        notes,
+        midi_file_name,
+        ticks_per_beat=TICKS_PER_BEAT,
+        tempo=tempo_microseconds,
+        key=key_signature,
+    )
 
     return midi_file_name
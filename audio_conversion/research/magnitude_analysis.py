@@ -20,16 +20,16 @@
 import numpy as np
 import librosa as lb
 import matplotlib.pyplot as plt
+from shared_analysis import AudioAnalysis
 
 
 def wav_to_magnitude_numpy(input_file):
-    # Obtain audio data of audio file using librosa
-    raw_audio, _ = lb.load(input_file)
-    print(f"Raw Audio Data (librosa): {raw_audio}")
+    # Obtain audio data of audio file, decoded once and shared
+    analysis = AudioAnalysis.load(input_file)
+    print(f"Raw Audio Data (librosa): {analysis.y}")
 
     # Use fast-fourier transform from numpy
-    raw_audio_arr = np.array(raw_audio, dtype=float)
-    audio_fft = np.fft.fft(raw_audio_arr)
+    audio_fft = analysis.fft()
     print(f"Fast-Fourier Transform: {audio_fft}")
 
     # Obtain the magnitudes of the frequencies
@@ -63,20 +63,20 @@ def wav_to_magnitude_numpy(input_file):
 
 
 def wav_to_magnitude_librosa(input_file):
-    # Obtain audio data of audio file using librosa
-    raw_audio, _ = lb.load(input_file)
-    print(f"Raw Audio Data (librosa): {raw_audio}")
+    # Obtain audio data of audio file, decoded once and shared
+    analysis = AudioAnalysis.load(input_file)
+    print(f"Raw Audio Data (librosa): {analysis.y}")
 
     # Use short-time fourier transform to analyze frequencies in the audio file
-    audio_stft = lb.stft(raw_audio)
+    audio_stft = analysis.stft()
     print(f"Short-Time Fourier Transform: {audio_stft}")
 
     # Obtain the magnitudes of the frequencies
-    magnitudes_stft, _ = lb.magphase(audio_stft)
+    magnitudes_stft = analysis.magnitude()
     print(f"Magnitudes of the frequencies: {magnitudes_stft}")
 
     # Convert magnitudes into decibels
-    db_stft = lb.amplitude_to_db(magnitudes_stft)
+    db_stft = analysis.db()
     print(f"Decibel representation of the magnitudes: {db_stft}")
 
     # Visualize the magnitude of the frequencies
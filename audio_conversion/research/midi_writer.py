@@ -0,0 +1,252 @@
+################################################################################
+# Filename: midi_writer.py
+# Purpose:  Write note arrays to Standard MIDI Files without mido messages.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains a compact representation of notes, a structured NumPy
+# array with one (onset, duration, pitch, velocity) record per note, and a
+# serializer writing it as a format 0 Standard MIDI File. The note_on and
+# note_off events are sorted, their delta times encoded as variable-length
+# quantities and their bytes, with running status, laid out with array
+# operations, and the track is written to a file or buffer block by block, so
+# dense note sets are written without creating a Python object per event.
+#
+# Usage (Optional):
+#   from midi_writer import note_array, write_midi
+#   notes = note_array(onsets, durations, pitches, velocities)
+#   write_midi(notes, "../midi_output/take.mid", tempo=500000, key="Am")
+#
+# Notes:
+# - Onsets and durations are in seconds and converted to ticks with the
+#   tempo, which is written as the track's set_tempo event.
+# - At equal times note_off events are written before note_on events, so a
+#   note repeated right after itself is not cut short.
+# - The key names are the server's MAJOR_KEYS and MINOR_KEYS, imported from
+#   its package like shared_analysis.py does.
+#
+###############################################################################
+
+import os
+import struct
+import sys
+from io import BytesIO
+
+import numpy as np
+
+# The key names, imported from the server's package
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "server")
+)
+from app.utils.audio_analysis import MAJOR_KEYS, MINOR_KEYS  # noqa: E402
+
+NOTE_DTYPE = np.dtype(
+    [("onset", "f8"), ("duration", "f8"), ("pitch", "u1"), ("velocity", "u1")]
+)
+
+DEFAULT_TICKS_PER_BEAT = 480
+DEFAULT_TEMPO = 500000
+# Events serialized per block written
+BLOCK_EVENTS = 1 << 16
+# Largest delta time a 4-byte variable-length quantity holds
+MAX_DELTA = (1 << 28) - 1
+
+END_OF_TRACK = b"\x00\xff\x2f\x00"
+
+
+def note_array(onsets, durations, pitches, velocities=100) -> np.ndarray:
+    """
+    Build a note array from columns.
+
+    Args:
+        onsets (array_like): Start of every note in seconds.
+        durations (array_like): Length of every note in seconds.
+        pitches (array_like): MIDI note numbers, 0 to 127.
+        velocities (array_like): Velocities, 1 to 127, or one for all notes.
+
+    Returns:
+        np.ndarray: The notes, of dtype NOTE_DTYPE.
+    """
+    onsets = np.asarray(onsets, dtype=float)
+    notes = np.zeros(len(onsets), dtype=NOTE_DTYPE)
+    notes["onset"] = onsets
+    notes["duration"] = durations
+    notes["pitch"] = np.clip(pitches, 0, 127)
+    notes["velocity"] = np.clip(velocities, 1, 127)
+    return notes
+
+
+def encode_vlq(values) -> bytes:
+    """
+    Encode non-negative integers as MIDI variable-length quantities.
+
+    Args:
+        values (array_like): Integers below 2**28.
+
+    Returns:
+        bytes: The concatenated quantities.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    lengths = _vlq_lengths(values)
+    out = np.zeros(int(lengths.sum()), dtype=np.uint8)
+    _write_vlq(out, np.cumsum(lengths) - lengths, values, lengths)
+    return out.tobytes()
+
+
+def _vlq_lengths(values) -> np.ndarray:
+    """
+    Return the number of bytes of the variable-length quantity of every value.
+    """
+    return 1 + (values >= 1 << 7) + (values >= 1 << 14) + (values >= 1 << 21)
+
+
+def _write_vlq(out, starts, values, lengths):
+    """
+    Write variable-length quantities into a byte array at given offsets.
+
+    Each quantity holds 7 bits per byte, most significant first, with the top
+    bit set on every byte but the last.
+    """
+    for index in range(4):
+        has_byte = lengths > index
+        shift = 7 * (lengths[has_byte] - 1 - index)
+        byte = (values[has_byte] >> shift) & 0x7F
+        more = index < lengths[has_byte] - 1
+        out[starts[has_byte] + index] = byte | (more << 7)
+
+
+def key_signature_bytes(key: str) -> bytes:
+    """
+    Return the key_signature meta event of a key, at delta time 0.
+
+    Args:
+        key (str): The key as mido spells it, e.g. "C", "F#" or "Ebm".
+    """
+    if key in MAJOR_KEYS:
+        sharps, minor = MAJOR_KEYS.index(key) - 7, 0
+    elif key in MINOR_KEYS:
+        sharps, minor = MINOR_KEYS.index(key) - 7, 1
+    else:
+        raise ValueError(f"Unknown key {key!r}")
+    return struct.pack("<BBBBbB", 0, 0xFF, 0x59, 2, sharps, minor)
+
+
+def _event_arrays(notes, ticks_per_beat, tempo, channel):
+    """
+    Return the sorted note_on and note_off events of a note array.
+
+    Returns:
+        tuple: The delta time, status byte, pitch and velocity of every event.
+    """
+    ticks_per_second = ticks_per_beat * 1e6 / tempo
+    on_ticks = np.rint(notes["onset"] * ticks_per_second).astype(np.int64)
+    off_ticks = np.rint((notes["onset"] + notes["duration"]) * ticks_per_second)
+    # Every note lasts at least one tick
+    off_ticks = np.maximum(off_ticks.astype(np.int64), on_ticks + 1)
+    if len(notes) and on_ticks.min() < 0:
+        raise ValueError("Notes must not start before 0 seconds")
+
+    ticks = np.concatenate([on_ticks, off_ticks])
+    is_on = np.repeat([True, False], len(notes))
+    pitches = np.tile(notes["pitch"], 2)
+    velocities = np.concatenate([notes["velocity"], np.zeros(len(notes), np.uint8)])
+
+    # By time, note_off before note_on, then in note order
+    order = np.lexsort((is_on, ticks))
+    ticks = ticks[order]
+    deltas = np.diff(ticks, prepend=0)
+    if len(deltas) and deltas.max() > MAX_DELTA:
+        raise ValueError("Gap between notes too long for a MIDI delta time")
+    statuses = np.where(is_on[order], 0x90, 0x80) | channel
+    return deltas, statuses.astype(np.uint8), pitches[order], velocities[order]
+
+
+def _event_sizes(deltas, statuses, previous_status):
+    """
+    Return the delta time length and the running status of every event.
+
+    With running status an event repeating the previous event's status byte
+    leaves it out, as mido and most writers do.
+    """
+    lengths = _vlq_lengths(deltas)
+    previous = np.concatenate([[previous_status], statuses[:-1]])
+    return lengths, statuses == previous
+
+
+def _serialize_events(deltas, statuses, pitches, velocities, previous_status=-1) -> bytes:
+    """
+    Lay out channel events as delta time, status, pitch and velocity bytes.
+    """
+    lengths, running = _event_sizes(deltas, statuses, previous_status)
+    sizes = lengths + 3 - running
+    starts = np.cumsum(sizes) - sizes
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    _write_vlq(out, starts, deltas, lengths)
+    data_starts = starts + lengths + ~running
+    out[(starts + lengths)[~running]] = statuses[~running]
+    out[data_starts] = pitches
+    out[data_starts + 1] = velocities
+    return out.tobytes()
+
+
+def write_midi(
+    notes,
+    file,
+    ticks_per_beat: int = DEFAULT_TICKS_PER_BEAT,
+    tempo: int = DEFAULT_TEMPO,
+    key: str | None = None,
+    channel: int = 0,
+):
+    """
+    Write notes to a format 0 Standard MIDI File.
+
+    Args:
+        notes (np.ndarray): Notes of dtype NOTE_DTYPE, in any order.
+        file: Path to write to, or a binary file-like object such as BytesIO.
+        ticks_per_beat (int): Resolution of the file.
+        tempo (int): Tempo in microseconds per beat.
+        key (str): Key signature as mido spells it, e.g. "Am", or None.
+        channel (int): MIDI channel of the notes, 0 to 15.
+    """
+    if not hasattr(file, "write"):
+        with open(file, "wb") as midi_file:
+            write_midi(notes, midi_file, ticks_per_beat, tempo, key, channel)
+        return
+
+    deltas, statuses, pitches, velocities = _event_arrays(
+        np.asarray(notes, dtype=NOTE_DTYPE), ticks_per_beat, tempo, channel
+    )
+
+    meta = b"\x00\xff\x51\x03" + int(tempo).to_bytes(3, "big")
+    if key is not None:
+        meta += key_signature_bytes(key)
+    # The track length comes first, so it is counted before any event is laid out
+    lengths, running = _event_sizes(deltas, statuses, -1)
+    track_length = (
+        len(meta) + int((lengths + 3 - running).sum()) + len(END_OF_TRACK)
+    )
+
+    file.write(b"MThd" + struct.pack(">IHHH", 6, 0, 1, ticks_per_beat))
+    file.write(b"MTrk" + struct.pack(">I", track_length) + meta)
+    for start in range(0, len(deltas), BLOCK_EVENTS):
+        block = slice(start, start + BLOCK_EVENTS)
+        previous_status = statuses[start - 1] if start else -1
+        file.write(
+            _serialize_events(
+                deltas[block],
+                statuses[block],
+                pitches[block],
+                velocities[block],
+                previous_status,
+            )
+        )
+    file.write(END_OF_TRACK)
+
+
+def midi_bytes(notes, **kwargs) -> bytes:
+    """
+    Return notes as Standard MIDI File bytes; see write_midi for the options.
+    """
+    buffer = BytesIO()
+    write_midi(notes, buffer, **kwargs)
+    return buffer.getvalue()
@@ -4,8 +4,12 @@
 # Author:   Livia Chandra, Roshni Venkat, & Darren Seubert
 #
 # Description:
-# This file is used to convert audio file into MIDI file using librosa, pydub,
-# and mido libraries.
+# This file is used to convert audio file into MIDI file using librosa and pydub
+# libraries. The dominant pitch of every frame found by librosa.piptrack is
+# taken, and consecutive frames with the same pitch are merged into one note,
+# so the MIDI file holds one note_on and note_off pair per note instead of per
+# frame and pitch bin. The notes are kept in a note array and written by
+# midi_writer.
 #
 # Usage (Optional):
 # [Instructions or examples demonstrating how to use the code in this file.
@@ -20,10 +24,71 @@
 import os
 import librosa
 import numpy as np
-from mido import MidiFile, MidiTrack, Message
+from midi_writer import note_array, write_midi
 from pydub import AudioSegment as auseg
 
 
+def extract_notes(pitches, magnitudes, sr, hop_length=512, min_magnitude=0.05, min_frames=2):
+    """
+    Turn librosa.piptrack output into notes.
+
+    The dominant pitch of every frame is the pitch bin with the largest
+    magnitude. All frames are converted to MIDI notes in one array operation,
+    and runs of consecutive frames with the same note are merged into one note
+    with run-length encoding.
+
+    Args:
+        pitches (ndarray): (bins, frames) pitches from librosa.piptrack, in Hz.
+        magnitudes (ndarray): (bins, frames) magnitudes from librosa.piptrack.
+        sr (int): Sample rate of the analysed audio.
+        hop_length (int): Hop length used by librosa.piptrack.
+        min_magnitude (float): Frames whose dominant magnitude is below this
+            fraction of the loudest frame's are rests.
+        min_frames (int): Shortest note kept, in frames.
+
+    Returns:
+        ndarray: The notes as a midi_writer note array, with onsets and
+        durations in seconds, in order of onset.
+    """
+    n_frames = pitches.shape[1]
+    if n_frames == 0:
+        return note_array([], [], [], [])
+
+    # Dominant pitch of every frame
+    frames = np.arange(n_frames)
+    dominant = np.argmax(magnitudes, axis=0)
+    frequency = pitches[dominant, frames]
+    magnitude = magnitudes[dominant, frames]
+
+    # MIDI note of every frame, -1 for rests
+    loudest = magnitude.max()
+    sounding = (frequency > 0) & (magnitude > 0) & (magnitude >= min_magnitude * loudest)
+    midi_notes = np.full(n_frames, -1)
+    midi_notes[sounding] = np.round(
+        12 * np.log2(frequency[sounding] / 440.0) + 69
+    ).astype(int)
+    midi_notes[(midi_notes < 0) | (midi_notes > 127)] = -1
+
+    # Run-length encoding: the first frame and length of every run
+    starts = np.flatnonzero(np.diff(midi_notes, prepend=-2))
+    lengths = np.diff(np.append(starts, n_frames))
+    run_notes = midi_notes[starts]
+    run_magnitudes = np.add.reduceat(magnitude, starts) / lengths
+
+    # Keep the runs that are notes and long enough
+    keep = (run_notes >= 0) & (lengths >= min_frames)
+    velocities = np.clip(
+        np.round(127 * run_magnitudes[keep] / loudest), 1, 127
+    ).astype(int)
+    seconds_per_frame = hop_length / sr
+    return note_array(
+        starts[keep] * seconds_per_frame,
+        lengths[keep] * seconds_per_frame,
+        run_notes[keep],
+        velocities,
+    )
+
+
 def convert_to_midi(input_file, output_file):
     """
     Function that convert raw audio file into MIDI file and saves it.
@@ -54,49 +119,15 @@ def convert_to_midi(input_file, output_file):
     y, sr = librosa.load(temp_wav_path, sr=None)
 
     # Get pitches using librosa's pitch detection
-    pitches, _ = librosa.piptrack(y=y, sr=sr)
-
-    # Create a new MIDI file and track
-    midi = MidiFile()
-    track = MidiTrack()
-    midi.tracks.append(track)
-
-    # Define velocity and time values for MIDI messages
-    velocity = 64
-    time_increment = 0.001
-
-    # Process the pitches and create MIDI messages
-    # Use a context manager to suppress the divide-by-zero warning
-    with np.errstate(divide="ignore"):
-        for i in range(pitches.shape[1]):  # iterate over frames
-            for j in range(pitches.shape[0]):  # iterate over pitches
-                midi_note = librosa.hz_to_midi(pitches[j, i])
-
-                # Check if the MIDI note is a finite number
-                if np.isfinite(midi_note):
-                    midi_note = int(round(midi_note))
-
-                    if midi_note > 0:
-
-                        # Write MIDI message and append to the MIDI track
-                        message_on = Message(
-                            "note_on",
-                            note=midi_note,
-                            velocity=velocity,
-                            time=int(i * time_increment * sr),
-                        )
-                        message_off = Message(
-                            "note_off",
-                            note=midi_note,
-                            velocity=velocity,
-                            time=int((i + 1) * time_increment * sr),
-                        )
-
-                        track.append(message_on)
-                        track.append(message_off)
-
-    # Save MIDI file
-    midi.save(output_file)
+    hop_length = 512
+    pitches, magnitudes = librosa.piptrack(y=y, sr=sr, hop_length=hop_length)
+
+    # Merge the dominant pitch of every frame into notes
+    notes = extract_notes(pitches, magnitudes, sr, hop_length)
+
+    # Write one note_on and note_off pair per note at the default tempo of
+    # 120 BPM
+    write_midi(notes, output_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,299 @@
+################################################################################
+# Filename: shared_analysis.py
+# Purpose:  Decode and transform an audio file once for every research analysis.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains the AudioAnalysis class used by the research scripts. The
+# audio file is decoded once (PCM WAV files block by block through the server's
+# memory-mapped WavReader, other formats with librosa) and written to a .npy
+# file in a cache directory, which is then memory-mapped, so a file analysed
+# again (in this run or a later one) is neither decoded nor held in memory
+# twice. Every spectral feature is computed on first use and memoized under its
+# parameters: the full-signal FFT, the STFT and its magnitude and decibels,
+# chroma, the onset envelope with the tempo and beats derived from it, the
+# piptrack and YIN pitch tracks, and the key. Features built on the STFT reuse
+# the same transform, so running several analyses on one file costs one decode
+# and one transform.
+#
+# Usage (Optional):
+#   from shared_analysis import AudioAnalysis
+#   analysis = AudioAnalysis.load("../audio_sample/sample.wav")
+#   db = analysis.db(n_fft=2048, hop_length=512)
+#   tempo, beat_frames = analysis.beat_track()
+#
+# Notes:
+# - AudioAnalysis.load returns the same object for the same file and sample
+#   rate, so separate research functions share their features. Only the
+#   ANALYSIS_MAX_FILES most recently loaded files are kept.
+# - The key is estimated with the server's estimate_key.
+# - The decoded samples are cached in the system temporary directory unless
+#   ANALYSIS_CACHE_DIR is set; the cache key includes the file's size and
+#   modification time, so edited files are decoded again.
+#
+###############################################################################
+
+import hashlib
+import os
+import sys
+import tempfile
+from collections import OrderedDict
+
+import librosa
+import numpy as np
+
+# The server's WAV reader and key estimation, imported from its package so
+# the modules are the ones the server loads (the Basic Pitch model is not
+# loaded by the import)
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "server")
+)
+from app.utils.audio_analysis import PITCH_CLASSES, estimate_key  # noqa: E402
+from app.utils.wav_reader import WavFormatError, WavReader, is_wav_file  # noqa: E402
+
+ANALYSIS_CACHE_DIR = os.environ.get(
+    "ANALYSIS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "melodymapper_analysis")
+)
+# Number of files whose analyses are kept by AudioAnalysis.load
+ANALYSIS_MAX_FILES = int(os.environ.get("ANALYSIS_MAX_FILES", "8"))
+
+
+class AudioAnalysis:
+    """
+    Lazily computed, memoized features of one decoded audio file.
+
+    Attributes:
+        path (str): The analysed audio file.
+        sr (int): Sample rate of the decoded samples.
+        y (np.memmap): The decoded mono samples, memory-mapped read-only.
+    """
+
+    # Shared instances, by absolute path and sample rate, least recently
+    # used first
+    _instances = OrderedDict()
+
+    def __init__(self, path, sr=22050, cache_dir=ANALYSIS_CACHE_DIR):
+        self.path = path
+        self.sr = sr
+        self.y = self._load_samples(cache_dir)
+        self._features = {}
+
+    @classmethod
+    def load(cls, path, sr=22050):
+        """
+        Return the shared analysis of an audio file.
+
+        The least recently used analysis is dropped once more than
+        ANALYSIS_MAX_FILES files are loaded.
+
+        Args:
+            path (str): Path to the audio file.
+            sr (int): Sample rate to decode at.
+
+        Returns:
+            AudioAnalysis: The analysis, created on the first call.
+        """
+        key = (os.path.abspath(path), sr)
+        if key in cls._instances:
+            cls._instances.move_to_end(key)
+        else:
+            cls._instances[key] = cls(path, sr)
+            while len(cls._instances) > ANALYSIS_MAX_FILES:
+                cls._instances.popitem(last=False)
+        return cls._instances[key]
+
+    def _load_samples(self, cache_dir):
+        """
+        Decode the file into the cache directory once and memory-map it.
+        """
+        stat = os.stat(self.path)
+        source = f"{os.path.abspath(self.path)}:{stat.st_size}:{stat.st_mtime_ns}:{self.sr}"
+        cache_path = os.path.join(
+            cache_dir, hashlib.sha256(source.encode("utf-8")).hexdigest() + ".npy"
+        )
+        if not os.path.exists(cache_path):
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write under a temporary name so readers never see a partial file
+            partial_path = f"{cache_path}.{os.getpid()}.npy"
+            if not self._decode_wav(partial_path):
+                np.save(partial_path, librosa.load(self.path, sr=self.sr)[0])
+            os.replace(partial_path, cache_path)
+        return np.load(cache_path, mmap_mode="r")
+
+    def _decode_wav(self, npy_path):
+        """
+        Write a PCM WAV file's samples to a .npy file block by block.
+
+        The WAV file is memory-mapped and only one block is converted and
+        resampled at a time, so long recordings are decoded with flat memory
+        use. The samples are the same as librosa.load's.
+
+        Returns:
+            bool: False if the file is not a WAV file WavReader can read.
+        """
+        if not is_wav_file(self.path):
+            return False
+        try:
+            reader = WavReader(self.path)
+        except WavFormatError:
+            return False
+
+        n_samples = -(-reader.n_frames * self.sr // reader.sample_rate)
+        y = np.lib.format.open_memmap(npy_path, mode="w+", dtype=np.float32, shape=(n_samples,))
+        written = 0
+        for block in reader.iter_blocks(sample_rate=self.sr):
+            y[written : written + len(block)] = block
+            written += len(block)
+        y.flush()
+        del y
+        return written == n_samples
+
+    def _memoize(self, name, params, compute):
+        """
+        Return a feature, computing it on first use.
+
+        Args:
+            name (str): Name of the feature.
+            params (dict): Parameters the feature depends on.
+            compute: Function computing the feature.
+
+        Returns:
+            The memoized feature.
+        """
+        key = (name, tuple(sorted(params.items())))
+        if key not in self._features:
+            self._features[key] = compute()
+        return self._features[key]
+
+    def fft(self):
+        """
+        Return the FFT of the whole signal.
+        """
+        return self._memoize("fft", {}, lambda: np.fft.fft(self.y))
+
+    def spectrum(self):
+        """
+        Return the frequencies and magnitudes of the positive FFT bins.
+        """
+        return self._memoize(
+            "spectrum",
+            {},
+            lambda: (
+                np.fft.rfftfreq(len(self.y), d=1 / self.sr),
+                np.abs(np.fft.rfft(self.y)),
+            ),
+        )
+
+    def stft(self, n_fft=2048, hop_length=512):
+        """
+        Return the complex STFT, of shape (1 + n_fft // 2, frames).
+        """
+        return self._memoize(
+            "stft",
+            {"n_fft": n_fft, "hop_length": hop_length},
+            lambda: librosa.stft(np.asarray(self.y), n_fft=n_fft, hop_length=hop_length),
+        )
+
+    def magnitude(self, n_fft=2048, hop_length=512):
+        """
+        Return the STFT magnitudes.
+        """
+        return self._memoize(
+            "magnitude",
+            {"n_fft": n_fft, "hop_length": hop_length},
+            lambda: np.abs(self.stft(n_fft, hop_length)),
+        )
+
+    def db(self, n_fft=2048, hop_length=512):
+        """
+        Return the STFT magnitudes in decibels.
+        """
+        return self._memoize(
+            "db",
+            {"n_fft": n_fft, "hop_length": hop_length},
+            lambda: librosa.amplitude_to_db(self.magnitude(n_fft, hop_length)),
+        )
+
+    def chroma(self, n_fft=2048, hop_length=512):
+        """
+        Return the chromagram of the STFT power, of shape (12, frames).
+        """
+        return self._memoize(
+            "chroma",
+            {"n_fft": n_fft, "hop_length": hop_length},
+            lambda: librosa.feature.chroma_stft(
+                S=self.magnitude(n_fft, hop_length) ** 2, sr=self.sr, n_fft=n_fft
+            ),
+        )
+
+    def onset_envelope(self, n_fft=2048, hop_length=512):
+        """
+        Return the onset strength of every STFT frame, from its mel spectrogram.
+        """
+
+        def compute():
+            mel = librosa.feature.melspectrogram(
+                S=self.magnitude(n_fft, hop_length) ** 2, sr=self.sr, n_fft=n_fft
+            )
+            return librosa.onset.onset_strength(
+                S=librosa.power_to_db(mel), sr=self.sr, hop_length=hop_length
+            )
+
+        return self._memoize(
+            "onset_envelope", {"n_fft": n_fft, "hop_length": hop_length}, compute
+        )
+
+    def beat_track(self, n_fft=2048, hop_length=512):
+        """
+        Return the tempo in BPM and the beat frames, from the onset envelope.
+        """
+
+        def compute():
+            tempo, beat_frames = librosa.beat.beat_track(
+                onset_envelope=self.onset_envelope(n_fft, hop_length),
+                sr=self.sr,
+                hop_length=hop_length,
+            )
+            # Newer librosa versions return the tempo as a one-element array
+            return float(np.atleast_1d(tempo)[0]), beat_frames
+
+        return self._memoize(
+            "beat_track", {"n_fft": n_fft, "hop_length": hop_length}, compute
+        )
+
+    def piptrack(self, n_fft=2048, hop_length=512):
+        """
+        Return librosa.piptrack's pitches and magnitudes of the STFT.
+        """
+        return self._memoize(
+            "piptrack",
+            {"n_fft": n_fft, "hop_length": hop_length},
+            lambda: librosa.piptrack(
+                S=self.magnitude(n_fft, hop_length), sr=self.sr, n_fft=n_fft
+            ),
+        )
+
+    def pitch_track(self, fmin=librosa.note_to_hz("C1"), fmax=librosa.note_to_hz("C8")):
+        """
+        Return the YIN fundamental frequency of every frame, in Hz.
+        """
+        return self._memoize(
+            "pitch_track",
+            {"fmin": fmin, "fmax": fmax},
+            lambda: librosa.yin(y=np.asarray(self.y), sr=self.sr, fmin=fmin, fmax=fmax),
+        )
+
+    def key(self, n_fft=2048, hop_length=512):
+        """
+        Estimate the key from the chroma summed over the whole file.
+
+        Returns:
+            str: The key as mido spells it, e.g. "C" or "Am", or "C" if the
+            chroma is flat.
+        """
+
+        def compute():
+            key_number = estimate_key(self.chroma(n_fft, hop_length).sum(axis=1)) or 0
+            return PITCH_CLASSES[key_number % 12] + ("m" if key_number >= 12 else "")
+
+        return self._memoize("key", {"n_fft": n_fft, "hop_length": hop_length}, compute)
@@ -23,8 +23,7 @@ import { useEffect, useState } from "react";
 import ReactPaginate from "react-paginate";
 import "./ConversionHistory.css";
 import { getApiUrl } from "../../utils/getApiUrl";
-import downloadMidi from "../../utils/downloadMidi";
-import downloadXml from "../../utils/downloadXml";
+import downloadFromUrl from "../../utils/downloadFromUrl";
 
 // Mock data for conversion history
 const mockConversionHistoryData = [
@@ -165,11 +164,10 @@ const ConversionHistory = ({ isDebug = false, refreshKey }) => {
    */
   const handleDownloadMIDI = async (title, midi_id) => {
     const data = await handleGetData(midi_id);
-    const midiData = data.midi_data; // base64 encoded MIDI data
     const filename = data.title + ".mid"; // Generate a file name
 
     // Call download function
-    downloadMidi(midiData, filename);
+    downloadFromUrl(`${apiUrl}${data.midi_url}`, filename);
   };
 
   /**
@@ -179,11 +177,10 @@ const ConversionHistory = ({ isDebug = false, refreshKey }) => {
    */
   const handleDownloadXML = async (title, midi_id) => {
     const data = await handleGetData(midi_id);
-    const xmlData = data.xml_data;
     const filename = data.title + ".musicxml"; // Generate a file name
 
     // Call download function
-    downloadXml(xmlData, filename);
+    downloadFromUrl(`${apiUrl}${data.xml_url}`, filename);
   };
 
   /**
@@ -5,8 +5,8 @@
  *
  * Description:
  * This React component renders a button that, when clicked, triggers the download of a
- * MIDI file. The component fetches MIDI file data using a unique MIDI ID from a specified
- * API endpoint and uses the `downloadMidi` utility function to facilitate the download.
+ * MIDI file. The component fetches the MIDI metadata using a unique MIDI ID from a specified
+ * API endpoint and uses the `downloadFromUrl` utility function to download the linked file.
  *
  * Usage:
  * To use this component, import it into your React component and pass the required `data`
@@ -30,15 +30,15 @@
  * Notes:
  * - Ensure that the `REACT_APP_API_URL` environment variable is set in your environment.
  *   This variable should point to the base URL of your API.
- * - The component expects the API to respond with a JSON object that includes a `midi_data`
- *   field containing base64-encoded MIDI data and a `title` field for the filename.
+ * - The component expects the API to respond with a JSON object that includes a `midi_url`
+ *   field linking to the raw MIDI file and a `title` field for the filename.
  * - Error handling is included, logging any errors to the console.
  * - The component is designed to be flexible and can be placed in any part of your React application
  *   where file download functionality is required.
  ******************************************************************************/
 
 import { getApiUrl } from "../../utils/getApiUrl";
-import downloadMidi from "../../utils/downloadMidi";
+import downloadFromUrl from "../../utils/downloadFromUrl";
 
 const FileDownload = ({ data }) => {
   // Data is expecting to be a JSON and have midi_id field
@@ -49,11 +49,10 @@ const FileDownload = ({ data }) => {
     fetch(`${apiUrl}/api/v1/midis/${data.midi_id}`)
       .then((response) => response.json())
       .then((data) => {
-        const midiData = data.midi_data; // base64 encoded MIDI data
         const filename = data.title + ".mid"; // Generate a file name
 
         // Call download function
-        downloadMidi(midiData, filename);
+        downloadFromUrl(`${apiUrl}${data.midi_url}`, filename);
       })
       .catch((error) => {
         console.error("Error:", error);
@@ -18,16 +18,16 @@ import { render, fireEvent, screen, waitFor } from "@testing-library/react";
 import FileDownload from "./FileDownload";
 import { getApiUrl } from "../../utils/getApiUrl";
 
-jest.mock("../../utils/downloadMidi", () => jest.fn());
+jest.mock("../../utils/downloadFromUrl", () => jest.fn());
 
 describe("FileDownload", () => {
-  it("should call downloadMidi function on button click", () => {
+  it("should call downloadFromUrl function on button click", () => {
     const data = { midi_id: "123", title: "test" };
     const apiUrl = getApiUrl();
-    const midiData = "base64 encoded MIDI data";
+    const midiUrl = `/api/v1/midis/${data.midi_id}/file.mid`;
 
     global.fetch = jest.fn().mockResolvedValueOnce({
-      json: jest.fn().mockResolvedValueOnce({ midi_data: midiData }),
+      json: jest.fn().mockResolvedValueOnce({ midi_url: midiUrl }),
     });
 
     render(<FileDownload data={data} />);
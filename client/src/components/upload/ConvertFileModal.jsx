@@ -16,8 +16,7 @@
 
 import { useState } from "react";
 import { Button, Form, Modal, Spinner } from "react-bootstrap";
-import downloadMidi from "../../utils/downloadMidi";
-import downloadXml from "../../utils/downloadXml";
+import downloadFromUrl from "../../utils/downloadFromUrl";
 import { getApiUrl } from "../../utils/getApiUrl";
 
 export default function ConvertFileModal(props) {
@@ -121,20 +120,18 @@ export default function ConvertFileModal(props) {
   // Download functions
   const handleDownloadMIDI = () => {
     const data = backendResponse;
-    const midiData = data.midi_data; // base64 encoded MIDI data
     const filename = data.title + ".mid"; // Generate a file name
 
     // Call download function
-    downloadMidi(midiData, filename);
+    downloadFromUrl(`${getApiUrl()}${data.midi_url}`, filename);
   };
 
   const handleDownloadXml = () => {
     const data = backendResponse;
-    const xmlData = data.xml_data; // base64 encoded MIDI data
     const filename = data.title + ".musicxml"; // Generate a file name
 
     // Call download function
-    downloadXml(xmlData, filename);
+    downloadFromUrl(`${getApiUrl()}${data.xml_url}`, filename);
   };
 
   const ConversionDetailsForm = () => {
@@ -73,7 +73,10 @@ describe("ConvertFileModal", () => {
       Promise.resolve({
         status: 201,
         json: () =>
-          Promise.resolve({ midi_data: "mockMidiData", title: "mockTitle" }),
+          Promise.resolve({
+            midi_url: "/api/v1/midis/1/file.mid",
+            title: "mockTitle",
+          }),
       }),
     );
     global.URL.createObjectURL = jest.fn(() => "mockUrl");
@@ -128,7 +131,10 @@ describe("ConvertFileModal", () => {
       Promise.resolve({
         status: 201,
         json: () =>
-          Promise.resolve({ midi_data: "mockMidiData", title: "mockTitle" }),
+          Promise.resolve({
+            midi_url: "/api/v1/midis/1/file.mid",
+            title: "mockTitle",
+          }),
       }),
     );
     global.URL.createObjectURL = jest.fn(() => "mockUrl");
@@ -185,7 +191,10 @@ describe("ConvertFileModal", () => {
     global.fetch = jest.fn(() =>
       Promise.resolve({
         json: () =>
-          Promise.resolve({ midi_data: "mockMidiData", title: "mockTitle" }),
+          Promise.resolve({
+            midi_url: "/api/v1/midis/1/file.mid",
+            title: "mockTitle",
+          }),
       }),
     );
     render(
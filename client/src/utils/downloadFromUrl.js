@@ -0,0 +1,39 @@
+/******************************************************************************
+ * Filename: downloadFromUrl.js
+ * Purpose:  Facilitates the download of files served by the API.
+ * Author:   Darren Seubert
+ *
+ * Description:
+ * This module contains a function that triggers the download of a file the
+ * API serves as raw bytes, such as `/api/v1/midis/<id>/file.mid`. The browser
+ * streams the file straight to disk, so it is never held in memory as a
+ * base64 string.
+ *
+ * Usage:
+ * Import the `downloadFromUrl` function from this module and call it with the
+ * URL of the file and a filename to initiate a download:
+ *
+ * ```javascript
+ * import downloadFromUrl from './downloadFromUrl';
+ *
+ * downloadFromUrl(`${apiUrl}${data.midi_url}`, "example.mid");
+ * ```
+ *
+ * Notes:
+ * - The `download` query argument asks the API to send the file as an
+ *   attachment, so it is saved rather than opened even across origins.
+ ******************************************************************************/
+
+export default function downloadFromUrl(url, filename) {
+  const separator = url.includes("?") ? "&" : "?";
+
+  // Create a link element, use it for downloading the file, and remove it when done
+  const link = document.createElement("a");
+  link.href = `${url}${separator}download=1`;
+  link.download = filename; // Set the file name for the download
+
+  // Append the link, trigger the download, then remove the link
+  document.body.appendChild(link);
+  link.click();
+  document.body.removeChild(link);
+}
@@ -0,0 +1,75 @@
+/******************************************************************************
+ * Filename: downloadFromUrl.test.js
+ * Purpose:  Tests the downloadFromUrl utility function.
+ * Author:   Darren Seubert
+ *
+ * Description:
+ * This file contains tests for the downloadFromUrl utility function. The tests
+ * ensure that the `download` query argument is appended with the right
+ * separator, and that a link to the file is created, clicked, and removed.
+ * The DOM functions are mocked to prevent actual downloads during testing.
+ *
+ * Usage:
+ * Run the tests using the command `npm test` or `yarn test`.
+ *
+ ******************************************************************************/
+
+import downloadFromUrl from "./downloadFromUrl";
+
+describe("downloadFromUrl", () => {
+  let link;
+  let createElementSpy;
+  let appendChildSpy;
+  let removeChildSpy;
+
+  beforeEach(() => {
+    // Mock the necessary functions
+    link = { click: jest.fn() };
+    createElementSpy = jest
+      .spyOn(document, "createElement")
+      .mockImplementation(() => link);
+    appendChildSpy = jest
+      .spyOn(document.body, "appendChild")
+      .mockImplementation(() => {});
+    removeChildSpy = jest
+      .spyOn(document.body, "removeChild")
+      .mockImplementation(() => {});
+  });
+
+  afterEach(() => {
+    // Clean up the mocks after each test
+    createElementSpy.mockRestore();
+    appendChildSpy.mockRestore();
+    removeChildSpy.mockRestore();
+  });
+
+  it("starts the query with ? when the URL has none", () => {
+    downloadFromUrl("http://localhost:5000/api/v1/midis/1/file.mid", "a.mid");
+
+    expect(link.href).toBe(
+      "http://localhost:5000/api/v1/midis/1/file.mid?download=1"
+    );
+  });
+
+  it("appends to the query with & when the URL has one", () => {
+    downloadFromUrl("/api/v1/midis/1/file.mid?version=2", "a.mid");
+
+    expect(link.href).toBe("/api/v1/midis/1/file.mid?version=2&download=1");
+  });
+
+  it("clicks a link named after the file and removes it", () => {
+    downloadFromUrl("/api/v1/midis/1/score.musicxml", "score.musicxml");
+
+    expect(createElementSpy).toHaveBeenCalledWith("a");
+    expect(link.download).toBe("score.musicxml");
+    expect(appendChildSpy).toHaveBeenCalledWith(link);
+    expect(link.click).toHaveBeenCalledTimes(1);
+    expect(removeChildSpy).toHaveBeenCalledWith(link);
+    expect(appendChildSpy.mock.invocationCallOrder[0]).toBeLessThan(
+      link.click.mock.invocationCallOrder[0]
+    );
+    expect(link.click.mock.invocationCallOrder[0]).toBeLessThan(
+      removeChildSpy.mock.invocationCallOrder[0]
+    );
+  });
+});
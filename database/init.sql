@@ -39,13 +39,55 @@ Attributes:
     user_id(integer): the user id
     title: the title of the MIDI file
     date: the date it was recorded
-    midi_data (bytes): the midi data
+    midi_key, midi_size: blob store key and size of the midi data
+    xml_key, xml_size: blob store key and size of the zlib-compressed MusicXML
+    audio_key, audio_size: blob store key and size of the source audio
+    midi_data (bytes): legacy inline midi data, moved by migrate_blobs.py
+    xml_data (bytes): legacy inline compressed MusicXML, moved likewise
 */
 CREATE TABLE IF NOT EXISTS midis (
     midi_id INT AUTO_INCREMENT PRIMARY KEY,
     user_id INT,
     title VARCHAR(255),
     date DATETIME,
-    midi_data LONGBLOB,
-    FOREIGN KEY (user_id) REFERENCES users(user_id)
-);
\ No newline at end of file
+    midi_key VARCHAR(255) NULL,
+    midi_size INT NULL,
+    xml_key VARCHAR(255) NULL,
+    xml_size INT NULL,
+    audio_key VARCHAR(255) NULL,
+    audio_size INT NULL,
+    midi_data LONGBLOB NULL,
+    xml_data LONGBLOB NULL,
+    FOREIGN KEY (user_id) REFERENCES users(user_id),
+    CONSTRAINT ck_midis_midi_stored CHECK (midi_key IS NOT NULL OR midi_data IS NOT NULL),
+    INDEX ix_midis_title_midi_id (title, midi_id),
+    INDEX ix_midis_date_midi_id (date, midi_id)
+);
+
+/*
+Creates the conversion jobs table in the database
+Attributes:
+    job_id(integer): the job id
+    status(string): queued, running, succeeded or failed
+    name(string): the name of the submitting user
+    email(string): the email of the submitting user
+    title: the title of the MIDI file
+    audio_path(string): the uploaded audio waiting to be converted
+    midi_id(integer): the midi created by the job
+    error: the error message of a failed job
+    created_at: the date the job was submitted
+    updated_at: the date the job status last changed
+*/
+CREATE TABLE IF NOT EXISTS conversion_jobs (
+    job_id INT AUTO_INCREMENT PRIMARY KEY,
+    status VARCHAR(16) NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    title VARCHAR(255) NOT NULL,
+    audio_path VARCHAR(512) NOT NULL,
+    midi_id INT,
+    error TEXT,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    FOREIGN KEY (midi_id) REFERENCES midis(midi_id)
+);
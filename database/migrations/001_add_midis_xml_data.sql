@@ -0,0 +1,23 @@
+/*
+# Filename: 001_add_midis_xml_data.sql
+# Purpose: Store the MusicXML of every MIDI next to the MIDI data
+# Author: Darren Seubert
+#
+# Description:
+# Adds the xml_data column to the midis table of an existing database. The
+# column holds the zlib-compressed MusicXML produced when the MIDI is created,
+# so it no longer has to be regenerated with music21 on every read.
+#
+# Usage (Optional):
+#   mysql -u root -p mp_database < 001_add_midis_xml_data.sql
+#
+# Notes:
+# Existing rows keep xml_data NULL; the server renders and stores their
+# MusicXML the first time each of them is retrieved. Databases created from
+# the current init.sql already have the column.
+#
+*/
+
+USE mp_database;
+
+ALTER TABLE midis ADD COLUMN xml_data LONGBLOB NULL AFTER midi_data;
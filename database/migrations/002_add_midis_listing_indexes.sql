@@ -0,0 +1,22 @@
+/*
+# Filename: 002_add_midis_listing_indexes.sql
+# Purpose: Index the columns the MIDI listing is sorted and paginated on
+# Author: Darren Seubert
+#
+# Description:
+# GET /api/v1/midis sorts by title or date and paginates with a cursor on
+# (sort column, midi_id). These composite indexes let each page be read
+# directly from the index instead of sorting the whole midis table.
+#
+# Usage (Optional):
+#   mysql -u root -p mp_database < 002_add_midis_listing_indexes.sql
+#
+# Notes:
+# Databases created from the current init.sql already have these indexes.
+#
+*/
+
+USE mp_database;
+
+CREATE INDEX ix_midis_title_midi_id ON midis (title, midi_id);
+CREATE INDEX ix_midis_date_midi_id ON midis (date, midi_id);
@@ -0,0 +1,32 @@
+/*
+# Filename: 003_add_midis_blob_keys.sql
+# Purpose: Reference MIDI, MusicXML and audio blobs stored outside the database
+# Author: Darren Seubert
+#
+# Description:
+# MIDI and MusicXML bytes now live in the blob store and the midis table only
+# keeps their keys and sizes. This migration adds those columns and makes the
+# inline midi_data column optional for new rows.
+#
+# Usage (Optional):
+#   mysql -u root -p mp_database < 003_add_midis_blob_keys.sql
+#   cd server && python migrate_blobs.py
+#
+# Notes:
+# migrate_blobs.py moves the blobs of existing rows to the blob store and
+# clears midi_data and xml_data. Rows are readable before and after the move.
+#
+*/
+
+USE mp_database;
+
+ALTER TABLE midis
+    ADD COLUMN midi_key VARCHAR(255) NULL,
+    ADD COLUMN midi_size INT NULL,
+    ADD COLUMN xml_key VARCHAR(255) NULL,
+    ADD COLUMN xml_size INT NULL,
+    ADD COLUMN audio_key VARCHAR(255) NULL,
+    ADD COLUMN audio_size INT NULL,
+    MODIFY COLUMN midi_data LONGBLOB NULL,
+    ADD CONSTRAINT ck_midis_midi_stored
+        CHECK (midi_key IS NOT NULL OR midi_data IS NOT NULL);
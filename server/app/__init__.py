@@ -22,6 +22,8 @@ from flask import Flask
 from flask_cors import CORS
 from app.routes.midi_routes import midi_bp
 from app.routes.user_routes import user_bp
+from app.routes.stats_routes import stats_bp
+from app.routes.job_routes import job_bp
 from app.database import db
 
 
@@ -56,5 +58,7 @@ def create_app(config_object=None):
     # Register blueprints
     app.register_blueprint(midi_bp)
     app.register_blueprint(user_bp)
+    app.register_blueprint(stats_bp)
+    app.register_blueprint(job_bp)
 
     return app
@@ -0,0 +1,296 @@
+################################################################################
+# Filename: job_controller.py
+# Purpose:  Handles RESTful API routes for asynchronous conversion jobs
+# Author:   Darren Seubert
+#
+# Description:
+# This module is responsible for defining and handling the RESTful API routes
+# that submit an audio file for conversion in the background, poll the status
+# of the conversion, and fetch the resulting MIDI once it is done. Submitting
+# a job only saves the upload and a job row, so the request returns within
+# milliseconds while the background worker pool runs the conversion.
+#
+# Usage (Optional):
+# This module is not intended to be run as a standalone script. Instead, it should
+# be imported and used in conjunction with a Flask application. For example:
+#
+#     from job_controller import submit_job, get_job
+#     app.route('/jobs', methods=['POST'])(submit_job)
+#     app.route('/jobs/<int:job_id>', methods=['GET'])(get_job)
+#
+# Notes:
+# - Job state lives in the database, so a job can be polled from any worker
+#   even though it is run by the worker that accepted it.
+# - The queue of a worker is lost when the worker exits. recover_jobs, run
+#   when a converting gunicorn worker boots, queues the jobs still waiting
+#   again and fails the ones left running, and a job polled while it has
+#   been running for longer than JOB_STALE_SECONDS (default 900) is failed.
+#   A job only leaves RUNNING once, so a job failed as stale stays failed
+#   even if its worker finishes later, and the MIDI it saved is discarded.
+# - Only client-safe messages are stored as a job's error; the exception
+#   itself, which can hold ffmpeg output, paths or database errors, is
+#   logged.
+################################################################################
+
+from app.database import db
+from app.controllers import midi_controller
+from app.models.job_model import ConversionJob, QUEUED, RUNNING, SUCCEEDED, FAILED
+from app.utils.audio_decoder import AudioDecodeError
+from app.utils.job_queue import job_queue
+from app.utils.status_codes import ACCEPTED, CONFLICT, NOT_FOUND, OK
+from app.utils.isodate_converter import DateConverter
+from flask import current_app, jsonify, request, url_for
+from datetime import timedelta
+from sqlalchemy import select, update
+import os
+import traceback
+
+# Seconds after which a running job is considered lost with its worker
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", "900"))
+INTERRUPTED_ERROR = "The conversion was interrupted, please submit the file again"
+CONVERSION_ERROR = "The conversion failed"
+
+
+def job_to_json(job):
+    """
+    Build the JSON representation of a conversion job.
+
+    Args:
+        job (ConversionJob): The job to represent.
+
+    Returns:
+        dict: The job status with links to poll it and fetch its result.
+    """
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "title": job.title,
+        "midi_id": job.midi_id,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat(),
+        "status_url": url_for("job_bp.get_job", job_id=job.job_id),
+        "result_url": url_for("job_bp.get_job_result", job_id=job.job_id),
+    }
+
+
+def job_error(error: Exception) -> str:
+    """
+    Return the message shown to clients for an exception raised by a job.
+
+    The messages of ValueErrors raised by the controllers, such as
+    "Unsupported audio format", are meant for clients; any other exception
+    is reported as CONVERSION_ERROR.
+
+    Args:
+        error (Exception): The exception that failed the job.
+
+    Returns:
+        str: The message.
+    """
+    if isinstance(error, ValueError) and not isinstance(error, AudioDecodeError) and str(error):
+        return str(error)
+    return CONVERSION_ERROR
+
+
+def finish_job(job_id, **values) -> bool:
+    """
+    Record the outcome of a job, unless it is no longer running.
+
+    Args:
+        job_id (int): The ID of the job.
+        **values: Columns to set, such as status and error.
+
+    Returns:
+        bool: False if the job had already left RUNNING, e.g. failed as stale.
+    """
+    finished = db.session.execute(
+        update(ConversionJob)
+        .where(ConversionJob.job_id == job_id, ConversionJob.status == RUNNING)
+        .values(updated_at=DateConverter.current_time(), **values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return bool(finished)
+
+
+def run_job(app, job_id):
+    """
+    Run a queued conversion job and record its outcome.
+
+    The outcome is only recorded while the job is still running; the MIDI
+    saved by a job that was failed as stale in the meantime is discarded.
+
+    Args:
+        app (Flask): The application whose database holds the job.
+        job_id (int): The ID of the job to run.
+    """
+    with app.app_context():
+        # Claim the job so it is never run twice
+        claimed = db.session.execute(
+            update(ConversionJob)
+            .where(ConversionJob.job_id == job_id, ConversionJob.status == QUEUED)
+            .values(status=RUNNING, updated_at=DateConverter.current_time())
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return
+
+        job = db.session.get(ConversionJob, job_id)
+        audio_path = job.audio_path
+        try:
+            audio_data = midi_controller.read_source_audio(audio_path)
+            midi_data, xml_data = midi_controller.convert_upload(audio_path)
+            new_user, new_midi = midi_controller.save_midi(
+                job.name, job.email, job.title, midi_data, xml_data, audio_data
+            )
+        except Exception as e:
+            db.session.rollback()
+            print(f"Job {job_id} failed: {e!r}")
+            traceback.print_exc()
+            if os.path.exists(audio_path):
+                os.remove(audio_path)
+            finish_job(job_id, status=FAILED, error=job_error(e))
+            return
+
+        if not finish_job(job_id, status=SUCCEEDED, midi_id=new_midi.midi_id):
+            print(f"Job {job_id} finished after it was failed, discarding its MIDI")
+            midi_controller.discard_midi(new_user, new_midi)
+
+
+def fail_stale_jobs(stale_after: float | None = None) -> int:
+    """
+    Fail the jobs that have been running for too long to still be alive.
+
+    Args:
+        stale_after (float): Seconds since the job started running, defaults
+            to JOB_STALE_SECONDS.
+
+    Returns:
+        int: The number of jobs failed.
+    """
+    now = DateConverter.current_time()
+    cutoff = now - timedelta(seconds=JOB_STALE_SECONDS if stale_after is None else stale_after)
+    failed = db.session.execute(
+        update(ConversionJob)
+        .where(ConversionJob.status == RUNNING, ConversionJob.updated_at < cutoff)
+        .values(status=FAILED, error=INTERRUPTED_ERROR, updated_at=now)
+        # Jobs in the session are refreshed by the caller instead of compared
+        # in Python, where the stored times have no time zone
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return failed
+
+
+def recover_jobs(app) -> int:
+    """
+    Queue the jobs left waiting by workers that exited, and fail stale ones.
+
+    A job queued here that another worker still holds is only run once, as
+    run_job claims it before converting it.
+
+    Args:
+        app (Flask): The application whose database holds the jobs.
+
+    Returns:
+        int: The number of jobs queued again.
+    """
+    with app.app_context():
+        failed = fail_stale_jobs()
+        job_ids = db.session.scalars(
+            select(ConversionJob.job_id)
+            .where(ConversionJob.status == QUEUED)
+            .order_by(ConversionJob.job_id)
+        ).all()
+
+    for job_id in job_ids:
+        job_queue.submit(run_job, app, job_id)
+    if failed or job_ids:
+        print(f"[pid {os.getpid()}] Recovered {len(job_ids)} queued jobs, failed {failed} stale jobs")
+    return len(job_ids)
+
+
+def check_stale(job):
+    """
+    Fail a polled job that has been running for longer than JOB_STALE_SECONDS.
+
+    Args:
+        job (ConversionJob): The polled job, refreshed if it was failed.
+    """
+    if job.status == RUNNING and fail_stale_jobs():
+        db.session.refresh(job)
+
+
+def submit_job():
+    """
+    Queue an uploaded audio file for conversion to MIDI.
+
+    Returns:
+        tuple: A JSON representation of the queued job, the HTTP status code
+        ACCEPTED (202) and a Location header pointing at the job status.
+    """
+    name = request.form["name"]
+    email = request.form["email"]
+    title = request.form["title"]
+    audio_file = request.files["file"]
+
+    audio_file_path = midi_controller.save_upload(audio_file)
+
+    now = DateConverter.current_time()
+    job = ConversionJob(
+        name=name,
+        email=email,
+        title=title,
+        audio_path=audio_file_path,
+        status=QUEUED,
+        created_at=now,
+        updated_at=now,
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    job_queue.submit(run_job, current_app._get_current_object(), job.job_id)
+
+    job_data = job_to_json(job)
+    return jsonify(job_data), ACCEPTED, {"Location": job_data["status_url"]}
+
+
+def get_job(job_id):
+    """
+    Retrieve the status of a conversion job.
+
+    Args:
+        job_id (int): The ID of the job.
+
+    Returns:
+        tuple: A JSON representation of the job and the HTTP status code OK (200).
+    """
+    job = db.session.get(ConversionJob, job_id)
+    if not job:
+        return jsonify({"message": "Job not found"}), NOT_FOUND
+    check_stale(job)
+    return jsonify(job_to_json(job)), OK
+
+
+def get_job_result(job_id):
+    """
+    Retrieve the MIDI produced by a conversion job.
+
+    Args:
+        job_id (int): The ID of the job.
+
+    Returns:
+        tuple: The MIDI of a succeeded job as returned by GET /midis/<id>, the
+        job status with ACCEPTED (202) while it is still running, or the job
+        status with CONFLICT (409) if it has failed.
+    """
+    job = db.session.get(ConversionJob, job_id)
+    if not job:
+        return jsonify({"message": "Job not found"}), NOT_FOUND
+    check_stale(job)
+    if job.status == SUCCEEDED:
+        return midi_controller.get_midi(job.midi_id)
+    if job.status == FAILED:
+        return jsonify(job_to_json(job)), CONFLICT
+    return jsonify(job_to_json(job)), ACCEPTED
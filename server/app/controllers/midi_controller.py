@@ -24,162 +24,820 @@
 from app.database import db
 from app.models.midi_model import MIDI
 from app.models.user_model import User
-from app.utils.status_codes import OK, CREATED, NO_CONTENT, NOT_FOUND
-from app.utils.base64_converter import BinaryConverter
+from app.utils.status_codes import (
+    OK,
+    CREATED,
+    NO_CONTENT,
+    NOT_FOUND,
+    BAD_REQUEST,
+    SERVICE_UNAVAILABLE,
+)
+from app.utils.compression import Compressor
 from app.utils.isodate_converter import DateConverter
-from flask import jsonify, request
-from app.utils.conversion import convert_to_midi
-from app.utils.midi_to_musicxml import midi_to_musicxml
+from flask import Response, jsonify, request, stream_with_context, url_for
+from sqlalchemy import and_, func, or_, select
+from app.utils.batch_conversion import (
+    BATCH_MAX_FILES,
+    BatchLimitError,
+    BatchStaging,
+    batch_pool,
+    convert_batch,
+)
+from app.utils.blob_store import BlobNotFoundError, blob_store
+from app.utils.audio_decoder import AudioDecodeError, decode_stream
+from app.utils.conversion import (
+    convert_pcm_to_midi,
+    convert_stream_to_midi,
+    get_transcriber,
+    stream_audio,
+)
+from app.utils.conversion_cache import conversion_cache
+from app.utils.midi_to_musicxml import MUSICXML_PARAMS, midi_to_musicxml
+from app.utils.musicxml_pool import MusicXMLError
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import wrap_file
+import base64
+import binascii
+import hashlib
+import json
 import os
+import uuid
+import zipfile
+from datetime import datetime
+from io import BytesIO
+
+AUDIO_UPLOAD_DIR = "./app/utils/audio_sample"
+# Keep the uploaded recording of every MIDI in the blob store
+STORE_SOURCE_AUDIO = os.environ.get("STORE_SOURCE_AUDIO", "0") == "1"
+
+# Listing: sortable columns, and the attribute holding them in a result row
+SORT_COLUMNS = {
+    "id": MIDI.midi_id,
+    "title": MIDI.title,
+    "author": User.name,
+    "date": MIDI.date,
+}
+SORT_ATTRIBUTES = {"id": "midi_id", "title": "title", "author": "name", "date": "date"}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Downloads: content types, and the encodings the MusicXML can be sent in, in
+# order of preference (gzip first, as it is sent exactly as stored)
+MIDI_MIMETYPE = "audio/midi"
+MUSICXML_MIMETYPE = "application/vnd.recordare.musicxml+xml"
+XML_ENCODINGS = ["gzip", "br"] if Compressor.brotli_available() else ["gzip"]
+
+
+def encode_cursor(sort_value, midi_id):
+    """
+    Encode the position after a listed MIDI as an opaque cursor.
+
+    Args:
+        sort_value: Value of the sort column of the last listed MIDI.
+        midi_id (int): ID of the last listed MIDI.
+
+    Returns:
+        str: A URL-safe cursor.
+    """
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    cursor = json.dumps([sort_value, midi_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(cursor).decode("utf-8")
+
+
+def decode_cursor(cursor, sort):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Args:
+        cursor (str): The cursor from the request.
+        sort (str): The sort key the cursor was produced for.
+
+    Returns:
+        tuple: The sort value and MIDI ID to continue after.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        sort_value, midi_id = json.loads(base64.urlsafe_b64decode(cursor))
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError("Invalid cursor") from e
+
+    # The values are compared with the sort column, so they must have its type
+    value_type = int if sort == "id" else str
+    for value, expected in ((sort_value, value_type), (midi_id, int)):
+        if not isinstance(value, expected) or isinstance(value, bool):
+            raise ValueError("Invalid cursor")
+    if sort == "date":
+        try:
+            sort_value = DateConverter.encode_date(sort_value)
+        except ValueError as e:
+            raise ValueError("Invalid cursor") from e
+    return sort_value, midi_id
 
 
 def get_all_midis():
     """
-    Retrieve a list of all MIDI files.
+    Retrieve a list of MIDI files.
+
+    The list is built with a single query joining the users table that only
+    selects metadata columns, so the MIDI and MusicXML blobs are never loaded.
+
+    Query Args:
+        sort (str): One of id (default), title, author or date.
+        order (str): asc (default) or desc.
+        search (str): Case-insensitive text matched against the title, author
+            name and email.
+        email (str): Only list MIDIs of this email address.
+        date_from (str), date_to (str): ISO 8601 bounds on the MIDI date.
+        limit (int): Page size; when given (or with a cursor), the list is
+            paginated and the next page is linked from the response headers.
+        cursor (str): Opaque cursor from the X-Next-Cursor header.
 
     Returns:
-        tuple: A JSON list of MIDI files and the HTTP status code OK (200).
+        tuple: A JSON list of MIDI files and the HTTP status code OK (200), or
+        BAD REQUEST (400) for invalid query arguments.
     """
-    midis = MIDI.query.all()
-    midis_list = []
-    for midi in midis:
-        # Parse date
-        midi_date = midi.date.isoformat()
+    args = request.args
+    sort = args.get("sort", "id")
+    order = args.get("order", "asc")
+    if sort not in SORT_COLUMNS or order not in ("asc", "desc"):
+        return jsonify({"message": "Invalid sort or order"}), BAD_REQUEST
+    sort_column = SORT_COLUMNS[sort]
+
+    query = select(
+        MIDI.midi_id, MIDI.title, MIDI.date, User.name, User.email
+    ).join(User, User.user_id == MIDI.user_id)
+
+    # Filtering
+    try:
+        if args.get("search"):
+            pattern = f"%{args['search'].lower()}%"
+            query = query.where(
+                or_(
+                    func.lower(MIDI.title).like(pattern),
+                    func.lower(User.name).like(pattern),
+                    func.lower(User.email).like(pattern),
+                )
+            )
+        if args.get("email"):
+            query = query.where(User.email == args["email"])
+        if args.get("date_from"):
+            query = query.where(MIDI.date >= DateConverter.encode_date(args["date_from"]))
+        if args.get("date_to"):
+            query = query.where(MIDI.date <= DateConverter.encode_date(args["date_to"]))
+
+        paginate = "limit" in args or "cursor" in args
+        limit = min(int(args.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError("Invalid limit")
+
+        # Keyset pagination: continue strictly after the cursor position
+        if args.get("cursor"):
+            sort_value, last_id = decode_cursor(args["cursor"], sort)
+            if order == "asc":
+                after = or_(
+                    sort_column > sort_value,
+                    and_(sort_column == sort_value, MIDI.midi_id > last_id),
+                )
+            else:
+                after = or_(
+                    sort_column < sort_value,
+                    and_(sort_column == sort_value, MIDI.midi_id < last_id),
+                )
+            query = query.where(after)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), BAD_REQUEST
+
+    # The MIDI ID breaks ties so that the order, and the cursor, are stable
+    if order == "asc":
+        query = query.order_by(sort_column.asc(), MIDI.midi_id.asc())
+    else:
+        query = query.order_by(sort_column.desc(), MIDI.midi_id.desc())
+    if paginate:
+        # Fetch one extra row to know whether there is a next page
+        query = query.limit(limit + 1)
+
+    rows = db.session.execute(query).all()
+
+    headers = {}
+    if paginate and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, SORT_ATTRIBUTES[sort]), last.midi_id)
+        next_args = {**args.to_dict(), "cursor": next_cursor, "limit": limit}
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{url_for("midi_bp.get_all_midis", **next_args)}>; rel="next"'
+
+    midis_list = [
+        {
+            "midi_id": row.midi_id,
+            "name": row.name,
+            "email": row.email,
+            "title": row.title,
+            "date": row.date.isoformat(),
+        }
+        for row in rows
+    ]
 
-        # Retrieve user
-        user = db.session.get(User, midi.user_id)
+    return jsonify(midis_list), OK, headers
 
-        # Create midi json
-        midis_list.append(
-            {
-                "midi_id": midi.midi_id,
-                "name": user.name,
-                "email": user.email,
-                "title": midi.title,
-                "date": midi_date,
-            }
-        )
 
-    return jsonify(midis_list), OK
+def try_render_musicxml(midi_data):
+    """
+    Render MIDI data to MusicXML for a new MIDI entry.
+
+    Args:
+        midi_data (bytes): The raw MIDI data.
+
+    Returns:
+        bytes: The MusicXML document, or None if it cannot be rendered now;
+        the entry is then saved without it and rendered on its first download.
+    """
+    try:
+        return midi_to_musicxml(midi_data)
+    except MusicXMLError as e:
+        print(f"Could not render MusicXML: {e}")
+        return None
+
+
+def midi_to_json(midi, user):
+    """
+    Build the JSON representation of a MIDI entry.
+
+    The MIDI and MusicXML files are not embedded; the representation links
+    to the endpoints serving them as raw bytes.
+
+    Args:
+        midi (MIDI): The MIDI entry.
+        user (User): The user who created it.
+
+    Returns:
+        dict: The MIDI metadata and links.
+    """
+    return {
+        "midi_id": midi.midi_id,
+        "name": user.name,
+        "email": user.email,
+        "title": midi.title,
+        "date": midi.date.isoformat(),
+        "url": url_for("midi_bp.get_midi", midi_id=midi.midi_id),
+        "midi_url": url_for("midi_bp.get_midi_file", midi_id=midi.midi_id),
+        "xml_url": url_for("midi_bp.get_midi_score", midi_id=midi.midi_id),
+    }
+
+
+def blob_etag(key, data=None):
+    """
+    Build the entity tag of a blob.
+
+    Blobs are never rewritten under the same key, so the tag of a stored blob
+    is derived from its key without reading it. Legacy inline blobs are
+    tagged by their contents.
+
+    Args:
+        key (str): The blob store key, or None for inline data.
+        data (bytes): The inline data when key is None.
+
+    Returns:
+        str: The entity tag, without quotes.
+    """
+    source = key.encode("utf-8") if key is not None else data
+    return hashlib.sha256(source).hexdigest()[:32]
+
+
+def send_blob(blob_file, size, mimetype, etag, filename, headers=None):
+    """
+    Stream a blob, answering conditional and range requests.
+
+    Args:
+        blob_file: A binary file-like object; it is closed once sent.
+        size (int): Size of the blob in bytes.
+        mimetype (str): Content type of the blob.
+        etag (str): Entity tag of the representation.
+        filename (str): File name suggested to the client.
+        headers (dict): Extra response headers.
+
+    Returns:
+        Response: The streamed response; 206 for ranges, 304 if the client
+        copy is current.
+    """
+    response = Response(
+        wrap_file(request.environ, blob_file),
+        mimetype=mimetype,
+        headers=headers,
+        direct_passthrough=True,
+    )
+    response.content_length = size
+    response.set_etag(etag)
+    # Let clients cache the file but revalidate it with If-None-Match
+    response.cache_control.no_cache = True
+    disposition = "attachment" if "download" in request.args else "inline"
+    response.headers.set("Content-Disposition", disposition, filename=filename)
+    return response.make_conditional(
+        request, accept_ranges=True, complete_length=size
+    )
+
+
+def download_name(midi, extension):
+    """
+    Return the file name a MIDI entry is downloaded as.
+    """
+    return f"{secure_filename(midi.title) or 'midi'}{extension}"
+
+
+def get_midi_data(midi):
+    """
+    Return the MIDI data of a MIDI entry.
+
+    Args:
+        midi (MIDI): The MIDI entry.
+
+    Returns:
+        bytes: The raw MIDI data, from the blob store or, for rows that have
+        not been migrated yet, from the midis table.
+    """
+    if midi.midi_key is not None:
+        return blob_store.get(midi.midi_key)
+    return midi.midi_data
+
+
+def get_stored_xml(midi):
+    """
+    Return the compressed MusicXML of a MIDI entry, rendering it for legacy rows.
+
+    Rows created before the MusicXML was stored are rendered once and the
+    result is saved, so music21 only runs on the first read of such a row.
+
+    Args:
+        midi (MIDI): The MIDI entry.
+
+    Returns:
+        bytes: The MusicXML document, compressed by Compressor.
+    """
+    if midi.xml_key is not None:
+        return blob_store.get(midi.xml_key)
+    if midi.xml_data is not None:
+        return midi.xml_data
+
+    compressed = Compressor.compress(midi_to_musicxml(get_midi_data(midi)))
+    midi.xml_key = blob_store.put(compressed, "xml")
+    midi.xml_size = len(compressed)
+    db.session.commit()
+    return compressed
 
 
 def get_midi(midi_id):
     """
-    Retrieve a single MIDI file by its ID.
+    Retrieve the metadata of a single MIDI file by its ID.
 
     Args:
         midi_id (int): The ID of the MIDI file to retrieve.
 
     Returns:
-        tuple: A JSON representation of the MIDI file and the HTTP status code OK (200).
+        tuple: A JSON representation of the MIDI file, with links to its MIDI
+        and MusicXML files, and the HTTP status code OK (200).
     """
     midi = db.session.get(MIDI, midi_id)
-
-    # Parse date
-    midi_date = midi.date.isoformat()
+    if not midi:
+        return jsonify({"message": "MIDI not found"}), NOT_FOUND
 
     # Retrieve user
     user = db.session.get(User, midi.user_id)
 
-    # Parse binary data
-    midi_encode = BinaryConverter.encode_binary(midi.midi_data)
-
-    # Save file
-    # Decode Base64 encoded data
-    midi_binary = BinaryConverter.decode_binary(midi_encode)
-
-    # Save the decoded MIDI data to a file
-    midi_file_path = f"./app/utils/midi_output/{midi.title}.mid"  # Construct a file name with MIDI ID
-    with open(midi_file_path, "wb") as midi_file:
-        midi_file.write(midi_binary)
-
-    # Convert midi to music xml
-    xml_output_path = midi_to_musicxml(midi_file_path)
-    with open(xml_output_path, "rb") as binary_file:
-        xml_output_file = binary_file.read()
-    xml_data_encoded = BinaryConverter.encode_binary(xml_output_file)
-
-    if midi:
-        midi_data = {
-            "midi_id": midi.midi_id,
-            "name": user.name,
-            "email": user.email,
-            "title": midi.title,
-            "date": midi_date,
-            "midi_data": midi_encode,  # Return the base64-encoded MIDI data
-            "xml_data": xml_data_encoded,  # Return the base64-encoded MIDI data
-        }
-        return jsonify(midi_data), OK
-    else:
+    return jsonify(midi_to_json(midi, user)), OK
+
+
+def get_midi_file(midi_id):
+    """
+    Stream the MIDI file of a MIDI entry.
+
+    Supports If-None-Match and Range requests; pass the download query
+    argument to receive the file as an attachment.
+
+    Args:
+        midi_id (int): The ID of the MIDI file to retrieve.
+
+    Returns:
+        Response: The raw MIDI file with the HTTP status code OK (200).
+    """
+    midi = db.session.get(MIDI, midi_id)
+    if not midi:
         return jsonify({"message": "MIDI not found"}), NOT_FOUND
 
+    if midi.midi_key is not None:
+        try:
+            blob_file = blob_store.open(midi.midi_key)
+        except BlobNotFoundError:
+            return jsonify({"message": "MIDI file not found"}), NOT_FOUND
+        size = midi.midi_size
+    else:
+        blob_file = BytesIO(midi.midi_data)
+        size = len(midi.midi_data)
+
+    return send_blob(
+        blob_file,
+        size,
+        MIDI_MIMETYPE,
+        blob_etag(midi.midi_key, midi.midi_data),
+        download_name(midi, ".mid"),
+    )
+
 
-def create_midi():
+def get_midi_score(midi_id):
     """
-    Create a new MIDI entry in the database.
+    Send the MusicXML score of a MIDI entry.
+
+    The score is sent gzip-encoded, exactly as stored, to clients accepting
+    gzip, brotli-encoded to clients that only or preferably accept brotli,
+    and uncompressed otherwise. Supports If-None-Match and Range requests on
+    the encoded bytes; pass the download query argument to receive the file
+    as an attachment.
+
+    Args:
+        midi_id (int): The ID of the MIDI file whose score to retrieve.
 
     Returns:
-        tuple: A JSON representation of the newly created MIDI entry and the HTTP status code CREATED (201).
+        Response: The MusicXML document with the HTTP status code OK (200), or
+        SERVICE UNAVAILABLE (503) if a legacy row cannot be rendered now.
     """
-    name = request.form["name"]
-    email = request.form["email"]
-    title = request.form["title"]
-    audio_file = request.files["file"]
+    midi = db.session.get(MIDI, midi_id)
+    if not midi:
+        return jsonify({"message": "MIDI not found"}), NOT_FOUND
 
-    # Process file
-    # Define file path for saving the audio file
-    safe_filename = secure_filename(audio_file.filename)
-    audio_file_path = os.path.join("./app/utils/audio_sample", safe_filename)
+    try:
+        compressed = get_stored_xml(midi)
+    except BlobNotFoundError:
+        return jsonify({"message": "MusicXML file not found"}), NOT_FOUND
+    except MusicXMLError as e:
+        print(f"Could not render MusicXML of MIDI {midi_id}: {e}")
+        return jsonify({"message": "MusicXML could not be rendered"}), SERVICE_UNAVAILABLE
+
+    encoding = request.accept_encodings.best_match(XML_ENCODINGS)
+    if encoding == "gzip":
+        # Rows stored before gzip was used hold zlib data
+        body = (
+            compressed
+            if Compressor.is_gzip(compressed)
+            else Compressor.compress(Compressor.decompress(compressed))
+        )
+    elif encoding == "br":
+        body = Compressor.compress_brotli(Compressor.decompress(compressed))
+    else:
+        body = Compressor.decompress(compressed)
+
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    etag = blob_etag(midi.xml_key, compressed) + "-" + (encoding or "identity")
+    return send_blob(
+        BytesIO(body),
+        len(body),
+        MUSICXML_MIMETYPE,
+        etag,
+        download_name(midi, ".musicxml"),
+        headers,
+    )
+
+
+def save_upload(audio_file):
+    """
+    Save an uploaded audio file under a name that is unique to this upload.
+
+    Args:
+        audio_file (FileStorage): The uploaded audio file.
+
+    Returns:
+        str: The path the audio file was saved to.
+    """
+    # Prefix the sanitized name so concurrent uploads never share a path
+    safe_filename = f"{uuid.uuid4().hex}_{secure_filename(audio_file.filename)}"
+    audio_file_path = os.path.join(AUDIO_UPLOAD_DIR, safe_filename)
     # Ensure the directory exists
     os.makedirs(os.path.dirname(audio_file_path), exist_ok=True)
 
     # Save the file
     audio_file.save(audio_file_path)
+    return audio_file_path
+
+
+def convert_pcm(pcm, transcriber=None):
+    """
+    Convert decoded audio to MIDI and MusicXML.
 
-    output_filename = convert_to_midi(audio_file_path)
+    The samples are looked up in the conversion cache first, so a recording
+    that has been converted before skips transcription and music21.
 
-    with open(output_filename, "rb") as binary_file:
-        output_file = binary_file.read()
+    Args:
+        pcm (np.ndarray): Mono float32 samples at the model's sample rate.
+        transcriber (Transcriber): The transcriber to use, defaults to the
+            configured one.
 
-    midi_data_encoded = BinaryConverter.encode_binary(output_file)
+    Returns:
+        tuple: The binary data of the MIDI file and of the MusicXML file, or
+        None in place of the MusicXML if it could not be rendered.
+    """
+    transcriber = transcriber or get_transcriber()
+    cache_key = conversion_cache.make_key(
+        pcm, {**transcriber.params, "musicxml": MUSICXML_PARAMS}
+    )
+    cached = conversion_cache.get(cache_key)
+    if cached:
+        return cached
 
-    # Remove the file
-    os.remove(audio_file_path)
+    midi_data = convert_pcm_to_midi(pcm, transcriber)
+    xml_data = try_render_musicxml(midi_data)
 
-    # Convert midi to music xml
-    xml_output_path = midi_to_musicxml(output_filename)
-    with open(xml_output_path, "rb") as binary_file:
-        xml_output_file = binary_file.read()
-    xml_data_encoded = BinaryConverter.encode_binary(xml_output_file)
+    if xml_data is not None:
+        conversion_cache.put(cache_key, midi_data, xml_data)
+    return midi_data, xml_data
 
-    # Create User
-    new_user = User(name=name, email=email)
-    db.session.add(new_user)
-    db.session.commit()
 
-    # Create MIDI
-    user_id = new_user.user_id
-    date = DateConverter.current_time()
+def decode_upload(audio_file, stream=None):
+    """
+    Decode an uploaded audio file to PCM without saving it.
+
+    Any audio container in INPUT_FORMATS is accepted, including the WEBM
+    recordings made by browsers, so the upload is not filtered by its
+    extension; ffmpeg itself refuses playlists and other formats.
+
+    Args:
+        audio_file (FileStorage): The uploaded audio file.
+        stream: Stream to read the upload from, defaults to its own stream.
+
+    Returns:
+        np.ndarray: The decoded samples.
+
+    Raises:
+        ValueError: If the audio format is not supported or cannot be decoded.
+    """
+    try:
+        return decode_stream(stream or audio_file.stream, audio_file.filename)
+    except AudioDecodeError as e:
+        print(f"Could not decode {audio_file.filename}: {e}")
+        raise ValueError("Unsupported audio format") from e
+
+
+def convert_upload(audio_file_path):
+    """
+    Convert a saved audio file to MIDI and MusicXML and remove the audio file.
+
+    Jobs may hold long recordings, so the file is decoded and converted in a
+    stream and never held in memory as a whole. When the conversion cache is
+    enabled the samples must be hashed before they are converted, so the file
+    is decoded once into memory and the same samples are hashed and, on a
+    miss, converted.
+
+    Args:
+        audio_file_path (str): Path of the saved audio file.
+
+    Returns:
+        tuple: The binary data of the MIDI file and of the MusicXML file, or
+        None in place of the MusicXML if it could not be rendered.
+
+    Raises:
+        ValueError: If the audio format is not supported or cannot be decoded.
+    """
+    try:
+        cache_key = None
+        pcm_chunks = stream_audio(audio_file_path)
+        if conversion_cache.enabled:
+            pcm_chunks = list(pcm_chunks)
+            cache_key = conversion_cache.make_stream_key(
+                pcm_chunks,
+                {**get_transcriber().stream_params, "musicxml": MUSICXML_PARAMS},
+            )
+            cached = conversion_cache.get(cache_key)
+            if cached:
+                return cached
+
+        midi_data = convert_stream_to_midi(iter(pcm_chunks))
+    except AudioDecodeError as e:
+        print(f"Could not decode {audio_file_path}: {e}")
+        raise ValueError("Unsupported audio format") from e
+    finally:
+        if os.path.exists(audio_file_path):
+            os.remove(audio_file_path)
+
+    xml_data = try_render_musicxml(midi_data)
+    if cache_key and xml_data is not None:
+        conversion_cache.put(cache_key, midi_data, xml_data)
+    return midi_data, xml_data
+
+
+def read_source_audio(audio_file_path):
+    """
+    Read a saved recording if source audio is kept in the blob store.
+
+    Args:
+        audio_file_path (str): Path of the saved audio file.
+
+    Returns:
+        bytes: The audio file, or None if STORE_SOURCE_AUDIO is disabled.
+    """
+    if not STORE_SOURCE_AUDIO:
+        return None
+    with open(audio_file_path, "rb") as audio_file:
+        return audio_file.read()
+
+
+def discard_blobs(keys):
+    """
+    Delete blobs written for an entry that could not be saved.
+
+    Keys of a content-addressed store can be shared with existing entries,
+    so a key still referenced by a midis row is kept.
+
+    Args:
+        keys (list): Keys returned by blob_store.put.
+    """
+    for key in keys:
+        referenced = db.session.scalar(
+            select(func.count())
+            .select_from(MIDI)
+            .where(or_(MIDI.midi_key == key, MIDI.xml_key == key, MIDI.audio_key == key))
+        )
+        if not referenced:
+            blob_store.delete(key)
+
 
-    new_midi = MIDI(user_id=user_id, title=title, midi_data=output_file, date=date)
+def discard_midi(user, midi):
+    """
+    Delete an entry saved by save_midi that is no longer wanted, with the
+    user row and the blobs saved for it.
 
-    db.session.add(new_midi)
+    Args:
+        user (User): The user returned by save_midi.
+        midi (MIDI): The MIDI entry returned by save_midi.
+    """
+    keys = [key for key in (midi.midi_key, midi.xml_key, midi.audio_key) if key]
+    db.session.delete(midi)
+    db.session.delete(user)
     db.session.commit()
+    discard_blobs(keys)
+
+
+def save_midi(name, email, title, midi_data, xml_data=None, audio_data=None):
+    """
+    Store a converted MIDI file together with the user who submitted it.
+
+    The MIDI, MusicXML and audio bytes are written to the blob store first and
+    the midis row only records their keys and sizes. The user and MIDI rows
+    are then committed in one transaction, so a failure leaves neither row
+    behind, and the blobs written for them are deleted.
+
+    Args:
+        name (str): The name of the user.
+        email (str): The email address of the user.
+        title (str): Title of the song.
+        midi_data (bytes): The raw MIDI data.
+        xml_data (bytes): The MusicXML rendering, stored compressed. If None,
+            it is rendered the first time the MIDI is retrieved.
+        audio_data (bytes): The source recording, or None to not keep it.
+
+    Returns:
+        tuple: The newly created User and MIDI entries.
+    """
+    new_midi = MIDI(title=title, date=DateConverter.current_time())
+    written = []
+    try:
+        new_midi.midi_key = blob_store.put(midi_data, "midi")
+        written.append(new_midi.midi_key)
+        new_midi.midi_size = len(midi_data)
+        if xml_data is not None:
+            compressed = Compressor.compress(xml_data)
+            new_midi.xml_key = blob_store.put(compressed, "xml")
+            written.append(new_midi.xml_key)
+            new_midi.xml_size = len(compressed)
+        if audio_data is not None:
+            new_midi.audio_key = blob_store.put(audio_data, "audio")
+            written.append(new_midi.audio_key)
+            new_midi.audio_size = len(audio_data)
+
+        new_user = User(name=name, email=email)
+        db.session.add(new_user)
+        # Assign the user ID without committing
+        db.session.flush()
+        new_midi.user_id = new_user.user_id
+        db.session.add(new_midi)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        discard_blobs(written)
+        raise
+
+    return new_user, new_midi
+
+
+def create_midi():
+    """
+    Create a new MIDI entry in the database.
+
+    The upload is decoded straight from the request stream through an ffmpeg
+    pipe and converted in memory, so it is not saved to disk first. The
+    optional transcriber form field selects the transcriber ("basic_pitch" or
+    "dsp") instead of the configured one.
+
+    Returns:
+        tuple: A JSON representation of the newly created MIDI entry, with
+        links to its MIDI and MusicXML files, and the HTTP status code CREATED (201),
+        or BAD REQUEST (400) if the audio cannot be decoded or the transcriber
+        is unknown.
+    """
+    name = request.form["name"]
+    email = request.form["email"]
+    title = request.form["title"]
+    audio_file = request.files["file"]
+    try:
+        transcriber = get_transcriber(request.form.get("transcriber"))
+    except ValueError as e:
+        return jsonify({"message": str(e)}), BAD_REQUEST
+
+    # Keep the upload in memory only if it is stored along with the MIDI
+    audio_data = audio_file.stream.read() if STORE_SOURCE_AUDIO else None
+    stream = BytesIO(audio_data) if audio_data is not None else None
+
+    # Process file
+    try:
+        pcm = decode_upload(audio_file, stream)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), BAD_REQUEST
+    output_file, xml_output_file = convert_pcm(pcm, transcriber)
+
+    new_user, new_midi = save_midi(
+        name, email, title, output_file, xml_output_file, audio_data
+    )
+
+    midi_json = midi_to_json(new_midi, new_user)
+    return jsonify(midi_json), CREATED, {"Location": midi_json["url"]}
+
+
+def create_midis_batch():
+    """
+    Convert a batch of audio files, or zip archives of audio files, to MIDI.
+
+    The files are converted in parallel on a process pool and every converted
+    file is stored as a new MIDI entry. One JSON object per file is streamed
+    back as soon as that file completes, so a failing file is reported without
+    failing the rest of the batch. The optional transcriber form field selects
+    the transcriber of every file. The batch is converted while the request is
+    open, so it may hold at most BATCH_MAX_FILES audio files.
+
+    Returns:
+        tuple: A newline-delimited JSON stream of per-file results and the HTTP
+        status code OK (200), or BAD REQUEST (400) if no valid files were sent,
+        the batch is too large or the transcriber is unknown.
+    """
+    name = request.form["name"]
+    email = request.form["email"]
+    uploads = request.files.getlist("files")
+    transcriber = request.form.get("transcriber")
+    try:
+        get_transcriber(transcriber)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), BAD_REQUEST
+
+    staging = BatchStaging(BATCH_MAX_FILES)
+    try:
+        for upload in uploads:
+            staging.add_stream(upload.filename, upload.stream)
+    except zipfile.BadZipFile:
+        staging.cleanup()
+        return jsonify({"message": "Invalid zip archive"}), BAD_REQUEST
+    except BatchLimitError as e:
+        staging.cleanup()
+        return jsonify({"message": str(e)}), BAD_REQUEST
+
+    if not staging.files:
+        staging.cleanup()
+        return jsonify({"message": "No audio files to convert"}), BAD_REQUEST
+
+    def generate_results():
+        try:
+            for skipped in staging.skipped:
+                yield json.dumps(
+                    {"file": skipped, "status": "skipped", "error": "Not an audio file"}
+                ) + "\n"
+
+            for result in convert_batch(
+                staging.files, transcriber=transcriber, pool=batch_pool
+            ):
+                if result["status"] == "succeeded":
+                    title = os.path.splitext(os.path.basename(result["file"]))[0]
+                    _, new_midi = save_midi(name, email, title, result.pop("midi_data"))
+                    result["midi_id"] = new_midi.midi_id
+                    result["title"] = new_midi.title
+                yield json.dumps(result) + "\n"
+        finally:
+            staging.cleanup()
 
     return (
-        jsonify(
-            {
-                "midi_id": new_midi.midi_id,
-                "name": new_user.name,
-                "email": new_user.email,
-                "title": new_midi.title,
-                "date": new_midi.date.isoformat(),
-                "midi_data": midi_data_encoded,  # Return the base64-encoded MIDI data
-                "xml_data": xml_data_encoded,  # Return the base64-encoded MIDI data
-            }
+        Response(
+            stream_with_context(generate_results()),
+            mimetype="application/x-ndjson",
         ),
-        CREATED,
+        OK,
     )
 
 
@@ -0,0 +1,47 @@
+################################################################################
+# Filename: stats_controller.py
+# Purpose:  Handles RESTful API routes for runtime statistics
+# Author:   Darren Seubert
+#
+# Description:
+# This module reports runtime statistics of the worker process that serves the
+# request, such as how long the Basic Pitch model took to load, how long
+# each inference takes, how often the conversion cache was hit, and how well
+# the inference scheduler fills its batches.
+#
+# Usage (Optional):
+# This module is not intended to be run as a standalone script. Instead, it should
+# be imported and used in conjunction with a Flask application. For example:
+#
+#     from stats_controller import get_stats
+#     app.route('/stats', methods=['GET'])(get_stats)
+#
+# Notes:
+# Each gunicorn worker keeps its own statistics, so successive requests may be
+# answered by different workers.
+################################################################################
+
+from app.utils.conversion_cache import conversion_cache
+from app.utils.inference_scheduler import inference_scheduler
+from app.utils.model_manager import model_manager
+from app.utils.status_codes import OK
+from flask import jsonify
+
+
+def get_stats():
+    """
+    Retrieve the runtime statistics of the current worker.
+
+    Returns:
+        tuple: A JSON object of statistics and the HTTP status code OK (200).
+    """
+    return (
+        jsonify(
+            {
+                "model": model_manager.stats(),
+                "cache": conversion_cache.stats(),
+                "scheduler": inference_scheduler.stats(),
+            }
+        ),
+        OK,
+    )
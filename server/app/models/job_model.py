@@ -0,0 +1,76 @@
+################################################################################
+# Filename: job_model.py
+# Purpose:  Define the ConversionJob model for tracking asynchronous conversions.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains the definition of the ConversionJob class, which is used
+# as a model to persist the state of an audio to MIDI conversion that runs in
+# the background job queue. A job moves from queued to running and ends up
+# either succeeded, with a reference to the created MIDI, or failed, with an
+# error message.
+#
+# Usage (Optional):
+#   job = ConversionJob(name=name, email=email, title=title, audio_path=path)
+#   db.session.add(job)
+#   db.session.commit()
+#
+# Notes:
+# The job row is the source of truth for the job status, so any worker can
+# answer a status request for a job submitted to another worker.
+#
+###############################################################################
+
+from app.database import db
+from sqlalchemy import Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
+from typing import Optional
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class ConversionJob(db.Model):
+    """
+    ConversionJob class representing a background conversion in the database.
+
+    Attributes:
+        job_id (int): The unique identifier for the job.
+        status (str): One of queued, running, succeeded or failed.
+        name (str): The name of the submitting user.
+        email (str): The email address of the submitting user.
+        title (str): Title of the song.
+        audio_path (str): Path of the uploaded audio waiting to be converted.
+        midi_id (int): The MIDI created by the job, once it has succeeded.
+        error (str): The error message, if the job has failed.
+        created_at (DateTime): When the job was submitted.
+        updated_at (DateTime): When the job status last changed.
+    """
+
+    __tablename__ = "conversion_jobs"
+    job_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    status: Mapped[str] = mapped_column(String, default=QUEUED, nullable=False)
+    name: Mapped[str] = mapped_column(String, nullable=False)
+    email: Mapped[str] = mapped_column(String, nullable=False)
+    title: Mapped[str] = mapped_column(String, nullable=False)
+    audio_path: Mapped[str] = mapped_column(String, nullable=False)
+    midi_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("midis.midi_id"), nullable=True
+    )
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, nullable=False
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, nullable=False
+    )
+
+    def __repr__(self):
+        """
+        Return a string representation of the ConversionJob object.
+        """
+        return f"<ConversionJob(job_id={self.job_id}, status='{self.status}', title='{self.title}')>"
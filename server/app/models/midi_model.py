@@ -20,9 +20,18 @@
 ###############################################################################
 
 from app.database import db
-from sqlalchemy import Integer, String, LargeBinary, DateTime, ForeignKey
+from sqlalchemy import (
+    CheckConstraint,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+)
 from sqlalchemy.orm import Mapped, mapped_column
 from datetime import datetime
+from typing import Optional
 
 
 class MIDI(db.Model):
@@ -34,10 +43,29 @@ class MIDI(db.Model):
         user_id (int): The unique reference identifier for User data.
         title (str): Title of the song.
         date (DateTime): The MIDI file generation date.
-        midi_data (LargeBinary): The raw MIDI data.
+        midi_key (str): Blob store key of the raw MIDI data.
+        midi_size (int): Size of the MIDI data in bytes.
+        xml_key (str): Blob store key of the zlib-compressed MusicXML
+            rendering, or None until it has been rendered.
+        xml_size (int): Size of the compressed MusicXML in bytes.
+        audio_key (str): Blob store key of the source audio, if it was kept.
+        audio_size (int): Size of the source audio in bytes.
+        midi_data (LargeBinary): Legacy inline MIDI data of rows that have not
+            been moved to the blob store yet (see migrate_blobs.py).
+        xml_data (LargeBinary): Legacy inline compressed MusicXML, as above.
     """
 
     __tablename__ = "midis"
+    # Composite indexes backing the sorted, keyset-paginated listing
+    __table_args__ = (
+        Index("ix_midis_title_midi_id", "title", "midi_id"),
+        Index("ix_midis_date_midi_id", "date", "midi_id"),
+        # Every row keeps its MIDI either in the blob store or, legacy, inline
+        CheckConstraint(
+            "midi_key IS NOT NULL OR midi_data IS NOT NULL",
+            name="ck_midis_midi_stored",
+        ),
+    )
     midi_id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("users.user_id"), nullable=False
@@ -46,7 +74,14 @@ class MIDI(db.Model):
     date: Mapped[datetime] = mapped_column(
         DateTime, default=datetime.utcnow, nullable=False
     )
-    midi_data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    midi_key: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    midi_size: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    xml_key: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    xml_size: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    audio_key: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    audio_size: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    midi_data: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    xml_data: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
 
     def __repr__(self):
         """
@@ -0,0 +1,37 @@
+################################################################################
+# Filename: job_routes.py
+# Purpose:  Define routes for asynchronous conversion jobs in the Flask application.
+# Author:   Darren Seubert
+#
+# Description:
+# This file creates a Blueprint for job routes and defines endpoints for
+# submitting an audio file for background conversion, polling the status of
+# a job, and fetching the result of a finished job. The routes are associated
+# with corresponding view functions in the job_controller module.
+#
+# Usage (Optional):
+# Import this Blueprint in the main application and register it to add the
+# job routes to the application. For example:
+#   from job_routes import job_bp
+#   app.register_blueprint(job_bp)
+#
+# Notes:
+# Ensure that the job_controller module contains the necessary view functions
+# with the correct signatures to handle requests for these routes.
+#
+###############################################################################
+
+from flask import Blueprint
+from app.controllers import job_controller
+
+# Create a Blueprint instance for job routes
+job_bp = Blueprint("job_bp", __name__, url_prefix="/api/v1")
+
+# Define routes for submitting and polling conversion jobs
+job_bp.route("/jobs", methods=["POST"])(job_controller.submit_job)
+
+job_bp.route("/jobs/<int:job_id>", methods=["GET"])(job_controller.get_job)
+
+job_bp.route("/jobs/<int:job_id>/result", methods=["GET"])(
+    job_controller.get_job_result
+)
@@ -6,9 +6,9 @@
 # Description:
 # This file creates a Blueprint for MIDI routes and defines endpoints for
 # CRUD operations on MIDI resources, such as retrieving all MIDIs, getting a
-# single MIDI by ID, creating a new MIDI, updating an existing MIDI, and
-# deleting a MIDI. The routes are associated with corresponding view functions
-# in the midi_controller module.
+# single MIDI by ID, downloading its MIDI file and MusicXML score, creating a
+# new MIDI, updating an existing MIDI, and deleting a MIDI. The routes are
+# associated with corresponding view functions in the midi_controller module.
 #
 # Usage (Optional):
 # Import this Blueprint in the main application and register it to add the
@@ -33,8 +33,18 @@ midi_bp.route("/midis", methods=["GET"])(midi_controller.get_all_midis)
 
 midi_bp.route("/midis/<int:midi_id>", methods=["GET"])(midi_controller.get_midi)
 
+midi_bp.route("/midis/<int:midi_id>/file.mid", methods=["GET"])(
+    midi_controller.get_midi_file
+)
+
+midi_bp.route("/midis/<int:midi_id>/score.musicxml", methods=["GET"])(
+    midi_controller.get_midi_score
+)
+
 midi_bp.route("/midis", methods=["POST"])(midi_controller.create_midi)
 
+midi_bp.route("/midis/batch", methods=["POST"])(midi_controller.create_midis_batch)
+
 midi_bp.route("/midis/<int:midi_id>", methods=["PUT"])(midi_controller.update_midi)
 
 midi_bp.route("/midis/<int:midi_id>", methods=["DELETE"])(midi_controller.delete_midi)
@@ -0,0 +1,26 @@
+################################################################################
+# Filename: stats_routes.py
+# Purpose:  Define routes for runtime statistics in the Flask application.
+# Author:   Darren Seubert
+#
+# Description:
+# This file creates a Blueprint for the statistics route, which reports model
+# load and inference timings of the worker serving the request. The route is
+# associated with the corresponding view function in the stats_controller
+# module.
+#
+# Usage (Optional):
+# Import this Blueprint in the main application and register it to add the
+# statistics route to the application. For example:
+#   from stats_routes import stats_bp
+#   app.register_blueprint(stats_bp)
+#
+###############################################################################
+
+from flask import Blueprint
+from app.controllers import stats_controller
+
+# Create a Blueprint instance for statistics routes
+stats_bp = Blueprint("stats_bp", __name__, url_prefix="/api/v1")
+
+stats_bp.route("/stats", methods=["GET"])(stats_controller.get_stats)
@@ -0,0 +1,369 @@
+################################################################################
+# Filename: audio_analysis.py
+# Purpose:  Estimate the key and tempo of a recording in a single pass.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains the AudioAnalyzer class, which estimates the key and the
+# tempo of a recording from one shared short-time Fourier transform. Samples
+# are fed chunk by chunk, so it can follow a conversion stream without holding
+# the recording, and every STFT frame feeds two features at once:
+#   - a chroma vector (the spectral energy of each of the 12 pitch classes),
+#     summed over the recording and matched against the Krumhansl-Kessler
+#     major and minor key profiles;
+#   - the positive spectral flux of the frame, which forms the onset envelope
+#     whose autocorrelation, weighted towards 120 BPM, gives the tempo.
+# Only the chroma sum and the autocorrelation of the onset envelope at the
+# lags of the tempo range are kept, so memory does not grow with the stream.
+#
+# Usage (Optional):
+#   from app.utils.audio_analysis import analyze_pcm
+#   analysis = analyze_pcm(pcm, 22050)
+#   analysis["key"], analysis["tempo"]
+#
+# Notes:
+# - Frames are processed in fixed blocks of absolute frame indices, so the
+#   results do not depend on how the samples are chunked.
+# - Recordings without any sound have no key and the default tempo.
+#
+###############################################################################
+
+import numpy as np
+
+N_FFT = 2048
+HOP_LENGTH = 512
+BLOCK_FRAMES = 256
+
+# Chroma is taken from the bins between C1 and C8
+CHROMA_FMIN = 32.7
+CHROMA_FMAX = 4186.0
+
+# Krumhansl-Kessler key profiles, starting from the tonic
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+PITCH_CLASSES = ["C", "C#", "D", "Eb", "E", "F", "F#", "G", "Ab", "A", "Bb", "B"]
+# Key names as mido spells them, in order of fifths from 7 flats to 7 sharps
+MAJOR_KEYS = ["Cb", "Gb", "Db", "Ab", "Eb", "Bb", "F", "C", "G", "D", "A", "E", "B", "F#", "C#"]
+MINOR_KEYS = [
+    "Abm", "Ebm", "Bbm", "Fm", "Cm", "Gm", "Dm", "Am", "Em", "Bm", "F#m", "C#m", "G#m", "D#m", "A#m"
+]
+
+# Tempo search range and prior: log-normal around 120 BPM, one octave wide
+MIN_TEMPO = 40.0
+MAX_TEMPO = 240.0
+PRIOR_TEMPO = 120.0
+PRIOR_OCTAVES = 1.0
+DEFAULT_TEMPO = 120.0
+
+
+def key_name(key_number: int) -> str:
+    """
+    Return the name of a key number, 0 to 11 for C to B major and 12 to 23
+    for C to B minor, as in pretty_midi.KeySignature.
+    """
+    mode = "major" if key_number < 12 else "minor"
+    return f"{PITCH_CLASSES[key_number % 12]} {mode}"
+
+
+def estimate_key(chroma) -> int | None:
+    """
+    Find the key whose profile correlates best with a chroma vector.
+
+    Args:
+        chroma (np.ndarray): Energy of the 12 pitch classes, starting from C.
+
+    Returns:
+        int: The key number, 0 to 11 for C to B major and 12 to 23 for C to B
+        minor, or None if the chroma is flat.
+    """
+    chroma = np.asarray(chroma, dtype=float)
+    if chroma.max() - chroma.min() <= 0:
+        return None
+
+    # Every rotation of both profiles: row k has the tonic on pitch class k
+    shifts = (np.arange(12)[None, :] - np.arange(12)[:, None]) % 12
+    profiles = np.concatenate([MAJOR_PROFILE[shifts], MINOR_PROFILE[shifts]])
+
+    # Pearson correlation of the chroma with all 24 profiles at once
+    centered = profiles - profiles.mean(axis=1, keepdims=True)
+    chroma = chroma - chroma.mean()
+    correlation = centered @ chroma / (
+        np.linalg.norm(centered, axis=1) * np.linalg.norm(chroma)
+    )
+    return int(np.argmax(correlation))
+
+
+def tempo_lags(frame_rate: float) -> tuple[int, int]:
+    """
+    Return the shortest and longest beat period in frames that are searched.
+
+    Args:
+        frame_rate (float): Frames per second.
+
+    Returns:
+        tuple: The lags of MAX_TEMPO and MIN_TEMPO, in frames.
+    """
+    return (
+        int(np.floor(60 * frame_rate / MAX_TEMPO)),
+        int(np.ceil(60 * frame_rate / MIN_TEMPO)),
+    )
+
+
+def tempo_from_autocorrelation(autocorrelation, frame_rate: float) -> float | None:
+    """
+    Pick the tempo from the autocorrelation of a mean-centered onset envelope.
+
+    Args:
+        autocorrelation (np.ndarray): Autocorrelation at lags 0 to the longest
+            lag of tempo_lags plus one.
+        frame_rate (float): Frames per second.
+
+    Returns:
+        float: The tempo in beats per minute, or None if the envelope is flat.
+    """
+    min_lag, max_lag = tempo_lags(frame_rate)
+    if autocorrelation[0] <= 0:
+        return None
+
+    lags = np.arange(min_lag, max_lag + 1)
+    tempi = 60 * frame_rate / lags
+    prior = np.exp(-0.5 * (np.log2(tempi / PRIOR_TEMPO) / PRIOR_OCTAVES) ** 2)
+    score = autocorrelation[lags] / autocorrelation[0] * prior
+    best = int(np.argmax(score))
+    lag = float(lags[best])
+
+    # Parabolic interpolation around the best lag
+    if 0 < best < len(lags) - 1:
+        left, center, right = autocorrelation[lags[best] + np.array([-1, 0, 1])]
+        curvature = left - 2 * center + right
+        if curvature < 0:
+            lag += float(np.clip(0.5 * (left - right) / curvature, -0.5, 0.5))
+    return 60 * frame_rate / lag
+
+
+def estimate_tempo(onset_envelope, frame_rate: float) -> float | None:
+    """
+    Estimate the tempo from the periodicity of an onset envelope.
+
+    Args:
+        onset_envelope (np.ndarray): Onset strength of every frame.
+        frame_rate (float): Frames per second.
+
+    Returns:
+        float: The tempo in beats per minute, or None if the envelope is too
+        short or flat.
+    """
+    envelope = np.asarray(onset_envelope, dtype=float)
+    _, max_lag = tempo_lags(frame_rate)
+    if len(envelope) <= max_lag + 1:
+        return None
+    envelope = envelope - envelope.mean()
+    if not envelope.any():
+        return None
+
+    # Autocorrelation of the envelope through the FFT
+    n_fft = 1 << int(np.ceil(np.log2(2 * len(envelope))))
+    spectrum = np.fft.rfft(envelope, n_fft)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum), n_fft)[: max_lag + 2]
+    return tempo_from_autocorrelation(autocorrelation, frame_rate)
+
+
+class OnsetAutocorrelation:
+    """
+    Accumulates the autocorrelation of an onset envelope at short lags.
+
+    The envelope itself is not kept: only the lagged products, the sum of all
+    values, and the first and last n_lags - 1 values, from which the
+    autocorrelation of the mean-centered envelope is found at the end.
+
+    Attributes:
+        n_lags (int): Number of lags, starting from 0.
+        count (int): Number of values added.
+    """
+
+    def __init__(self, n_lags: int):
+        self.n_lags = n_lags
+        self.count = 0
+        self._total = 0.0
+        self._products = np.zeros(n_lags)
+        self._head = np.zeros(0)
+        self._tail = np.zeros(0)
+
+    def add(self, values):
+        """
+        Add the next values of the envelope.
+
+        Args:
+            values (np.ndarray): Onset strengths of the next frames.
+        """
+        values = np.asarray(values, dtype=float)
+        joined = np.concatenate([self._tail, values])
+        start = len(self._tail)
+        # Products of the pairs whose later value is one of the new values
+        for lag in range(min(self.n_lags, len(joined))):
+            first = max(start, lag)
+            self._products[lag] += joined[first - lag : len(joined) - lag] @ joined[first:]
+
+        self.count += len(values)
+        self._total += float(values.sum())
+        if len(self._head) < self.n_lags - 1:
+            self._head = np.concatenate([self._head, values])[: self.n_lags - 1]
+        self._tail = joined[len(joined) - (self.n_lags - 1) :]
+
+    def result(self) -> np.ndarray | None:
+        """
+        Return the autocorrelation of the mean-centered envelope.
+
+        Returns:
+            np.ndarray: The autocorrelation at every lag, or None if fewer
+            than n_lags values were added or the envelope is flat.
+        """
+        if self.count < self.n_lags:
+            return None
+        mean = self._total / self.count
+        # Sums of the first and of the last k values, for every lag k
+        head_sums = np.concatenate([[0.0], np.cumsum(self._head)])
+        tail_sums = np.concatenate([[0.0], np.cumsum(self._tail[::-1])])
+        lags = np.arange(self.n_lags)
+        autocorrelation = (
+            self._products
+            - mean * ((self._total - tail_sums) + (self._total - head_sums))
+            + (self.count - lags) * mean**2
+        )
+        # Rounding leaves a tiny variance where a constant envelope has none
+        if autocorrelation[0] <= 1e-9 * self._products[0]:
+            return None
+        return autocorrelation
+
+
+class AudioAnalyzer:
+    """
+    Estimates the key and tempo of samples fed to it chunk by chunk.
+
+    Attributes:
+        sample_rate (int): Sample rate of the fed samples.
+        chroma (np.ndarray): Sum of the normalized chroma of every frame.
+        onset_autocorrelation (OnsetAutocorrelation): Autocorrelation of the
+            onset strength of every processed frame.
+    """
+
+    def __init__(self, sample_rate: int, n_fft: int = N_FFT, hop_length: int = HOP_LENGTH):
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self._window = np.hanning(n_fft + 1)[:-1].astype(np.float32)
+
+        # Pitch class of every STFT bin in the chroma range
+        frequencies = np.fft.rfftfreq(n_fft, d=1 / sample_rate)
+        self._chroma_bins = np.flatnonzero(
+            (frequencies >= CHROMA_FMIN) & (frequencies <= CHROMA_FMAX)
+        )
+        pitch_classes = (
+            np.rint(12 * np.log2(frequencies[self._chroma_bins] / 440.0)).astype(int) + 9
+        ) % 12
+        self._chroma_matrix = np.zeros((len(self._chroma_bins), 12), dtype=np.float32)
+        self._chroma_matrix[np.arange(len(self._chroma_bins)), pitch_classes] = 1
+
+        # Frames are centered: frame i covers samples from i * hop - n_fft / 2
+        self._samples = np.zeros(n_fft // 2, dtype=np.float32)
+        self._n_frames = 0
+        self._previous = None
+        self.chroma = np.zeros(12)
+        _, max_lag = tempo_lags(sample_rate / hop_length)
+        self.onset_autocorrelation = OnsetAutocorrelation(max_lag + 2)
+
+    def feed(self, chunk):
+        """
+        Analyze the next chunk of samples.
+
+        Args:
+            chunk (np.ndarray): Mono float32 samples at sample_rate.
+        """
+        self._samples = np.concatenate([self._samples, np.asarray(chunk, dtype=np.float32)])
+        block_samples = (BLOCK_FRAMES - 1) * self.hop_length + self.n_fft
+        while len(self._samples) >= block_samples:
+            self._process(self._samples[:block_samples], BLOCK_FRAMES)
+            self._samples = self._samples[BLOCK_FRAMES * self.hop_length :]
+
+    def tap(self, pcm_chunks):
+        """
+        Analyze a stream of samples while passing it on.
+
+        Args:
+            pcm_chunks: Iterable of mono float32 sample chunks.
+
+        Yields:
+            np.ndarray: The same chunks, after each has been fed.
+        """
+        for chunk in pcm_chunks:
+            self.feed(chunk)
+            yield chunk
+
+    def _process(self, samples, n_frames: int):
+        """
+        Add the chroma and onset strength of n_frames frames of samples.
+        """
+        frames = np.lib.stride_tricks.sliding_window_view(samples, self.n_fft)[
+            :: self.hop_length
+        ][:n_frames]
+        magnitude = np.abs(np.fft.rfft(frames * self._window, axis=1))
+
+        # Chroma of every frame, normalized so loud passages do not dominate
+        power = magnitude[:, self._chroma_bins] ** 2
+        chroma = power @ self._chroma_matrix
+        peaks = chroma.max(axis=1, keepdims=True)
+        self.chroma += (chroma / np.where(peaks > 0, peaks, 1)).sum(axis=0)
+
+        # Positive spectral flux of the log magnitude
+        log_magnitude = np.log1p(100 * magnitude)
+        previous = log_magnitude[:1] if self._previous is None else self._previous
+        rise = np.diff(log_magnitude, axis=0, prepend=previous)
+        self.onset_autocorrelation.add(np.maximum(rise, 0).sum(axis=1))
+        self._previous = log_magnitude[-1:]
+        self._n_frames += n_frames
+
+    def finish(self) -> dict:
+        """
+        Analyze the remaining samples and return the estimates.
+
+        Returns:
+            dict: The key number (see estimate_key) and name, or None for
+            both, and the tempo in beats per minute.
+        """
+        n_samples = self._n_frames * self.hop_length + len(self._samples) - self.n_fft // 2
+        # One frame is centered on every hop_length-th sample
+        remaining = (n_samples - 1) // self.hop_length + 1 - self._n_frames
+        if remaining > 0:
+            needed = (remaining - 1) * self.hop_length + self.n_fft
+            self._samples = np.pad(self._samples, (0, max(needed - len(self._samples), 0)))
+            self._process(self._samples, remaining)
+            self._samples = self._samples[:0]
+
+        key_number = estimate_key(self.chroma)
+        autocorrelation = self.onset_autocorrelation.result()
+        tempo = None
+        if autocorrelation is not None:
+            tempo = tempo_from_autocorrelation(
+                autocorrelation, self.sample_rate / self.hop_length
+            )
+        return {
+            "key_number": key_number,
+            "key": key_name(key_number) if key_number is not None else None,
+            "tempo": tempo or DEFAULT_TEMPO,
+        }
+
+
+def analyze_pcm(pcm, sample_rate: int) -> dict:
+    """
+    Estimate the key and tempo of samples held in memory.
+
+    Args:
+        pcm (np.ndarray): Mono float32 samples.
+        sample_rate (int): Sample rate of pcm.
+
+    Returns:
+        dict: The estimates, as returned by AudioAnalyzer.finish.
+    """
+    analyzer = AudioAnalyzer(sample_rate)
+    analyzer.feed(pcm)
+    return analyzer.finish()
@@ -0,0 +1,352 @@
+################################################################################
+# Filename: audio_decoder.py
+# Purpose:  Decode uploaded audio to PCM samples through an ffmpeg pipe.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains functions that decode audio to mono float32 PCM at the
+# model's sample rate by piping it through ffmpeg. An upload stream is written
+# to ffmpeg's stdin while the decoded samples are read from its stdout in
+# chunks, so the audio is never staged on disk and never re-encoded. Formats
+# whose container must be seeked to be read (MP4/M4A keep their index at the
+# end of the file) are first written to a temporary directory, which is
+# removed as soon as the file is decoded.
+#
+# Usage (Optional):
+#   pcm = decode_stream(request.files["file"].stream, "take.webm")
+#   for chunk in iter_pcm_chunks(path="take.wav"):
+#       ...
+#
+# Notes:
+# - Requires the ffmpeg binary; FFMPEG_BINARY overrides its path.
+# - Decoding errors are raised as AudioDecodeError, a ValueError.
+# - ffmpeg may only open the input itself (through the pipe or the file
+#   protocol) and only with the audio demuxers in INPUT_FORMATS. Playlists
+#   and concat lists (HLS, ffconcat) are rejected, as they would make it
+#   read other local files or fetch URLs named in an upload.
+# - Set CONVERSION_TEMP_FILES=1 to retry seekable streams ffmpeg cannot
+#   decode from a pipe, such as MP4 audio sent without a file name, from a
+#   temporary file.
+#
+###############################################################################
+
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from app.utils.basic_pitch_constants import AUDIO_SAMPLE_RATE
+
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+# Retry streams that fail to decode from a pipe from a temporary file
+TEMP_FILE_FALLBACK = os.environ.get("CONVERSION_TEMP_FILES", "0") == "1"
+# Number of samples yielded per chunk (one second at the model's rate)
+CHUNK_SAMPLES = AUDIO_SAMPLE_RATE
+# Size of the blocks copied from the upload stream to ffmpeg
+STREAM_BLOCK_SIZE = 64 * 1024
+# Common audio file extensions ffmpeg can decode, used to pick audio files out
+# of folders and archives; uploads are not filtered by extension
+AUDIO_EXTENSIONS = {
+    "3gp", "aac", "aif", "aifc", "aiff", "amr", "caf", "flac", "m4a", "mka",
+    "mov", "mp3", "mp4", "oga", "ogg", "opus", "wav", "weba", "webm", "wma",
+}
+# Demuxers ffmpeg may pick for an input, covering AUDIO_EXTENSIONS. Each
+# name matches the demuxers registered under it, e.g. "webm" the Matroska
+# demuxer and "m4a" the MP4/MOV one.
+INPUT_FORMATS = (
+    "wav", "mp3", "ogg", "webm", "m4a", "flac", "aac", "aiff", "amr", "caf",
+    "asf",
+)
+# Containers that ffmpeg cannot read from a non-seekable pipe
+SEEKABLE_EXTENSIONS = {"m4a", "mp4", "mov", "3gp"}
+# Bytes of ffmpeg's error output kept for error messages
+STDERR_LIMIT = 4096
+
+PCM_DTYPE = np.dtype("<f4")
+
+
+class AudioDecodeError(ValueError):
+    """
+    Raised when ffmpeg cannot decode an audio file.
+    """
+
+
+def ffmpeg_command(source: str, sample_rate: int = AUDIO_SAMPLE_RATE) -> list:
+    """
+    Build the ffmpeg command decoding a source to mono float32 PCM on stdout.
+
+    The input may only be read through the pipe, or the file protocol for a
+    path, and only with one of the INPUT_FORMATS demuxers.
+
+    Args:
+        source (str): Input file path, or "pipe:0" to read from stdin.
+        sample_rate (int): Output sample rate.
+
+    Returns:
+        list: The command arguments.
+    """
+    return [
+        FFMPEG_BINARY,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-protocol_whitelist",
+        "pipe" if source.startswith("pipe:") else "file",
+        "-format_whitelist",
+        ",".join(INPUT_FORMATS),
+        "-i",
+        source,
+        "-vn",
+        "-ac",
+        "1",
+        "-ar",
+        str(sample_rate),
+        "-f",
+        "f32le",
+        "pipe:1",
+    ]
+
+
+def _copy_to_stdin(stream, stdin):
+    """
+    Copy a binary stream to ffmpeg's stdin, then close it.
+    """
+    try:
+        while True:
+            block = stream.read(STREAM_BLOCK_SIZE)
+            if not block:
+                break
+            stdin.write(block)
+    except (BrokenPipeError, ValueError):
+        # ffmpeg exited early; its exit code reports the reason
+        pass
+    finally:
+        try:
+            stdin.close()
+        except BrokenPipeError:
+            pass
+
+
+def _drain_stderr(stderr, output):
+    """
+    Read ffmpeg's error output, keeping its tail.
+    """
+    for line in stderr:
+        output.append(line)
+        while sum(map(len, output)) > STDERR_LIMIT and len(output) > 1:
+            output.pop(0)
+
+
+def iter_pcm_chunks(
+    stream=None,
+    path=None,
+    sample_rate: int = AUDIO_SAMPLE_RATE,
+    chunk_samples: int = CHUNK_SAMPLES,
+):
+    """
+    Decode audio with ffmpeg and yield its samples chunk by chunk.
+
+    Exactly one of stream and path must be given.
+
+    Args:
+        stream: A binary file-like object to pipe into ffmpeg.
+        path (str): A file for ffmpeg to read directly.
+        sample_rate (int): Output sample rate.
+        chunk_samples (int): Number of samples per yielded chunk; the last
+            chunk may be shorter.
+
+    Yields:
+        np.ndarray: Mono float32 samples.
+
+    Raises:
+        AudioDecodeError: If ffmpeg fails to decode the audio.
+    """
+    if (stream is None) == (path is None):
+        raise ValueError("Pass either a stream or a path")
+
+    process = subprocess.Popen(
+        ffmpeg_command("pipe:0" if stream is not None else path, sample_rate),
+        stdin=subprocess.PIPE if stream is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    # Feed stdin and drain stderr on threads so none of the pipes can fill up
+    # and block ffmpeg while this generator reads stdout
+    threads = []
+    if stream is not None:
+        threads.append(
+            threading.Thread(
+                target=_copy_to_stdin, args=(stream, process.stdin), daemon=True
+            )
+        )
+    stderr_lines = []
+    threads.append(
+        threading.Thread(
+            target=_drain_stderr, args=(process.stderr, stderr_lines), daemon=True
+        )
+    )
+    for thread in threads:
+        thread.start()
+
+    chunk_bytes = chunk_samples * PCM_DTYPE.itemsize
+    try:
+        while True:
+            data = process.stdout.read(chunk_bytes)
+            if not data:
+                break
+            # A read may end mid-sample only at the very end of the output
+            usable = len(data) - len(data) % PCM_DTYPE.itemsize
+            if usable:
+                yield np.frombuffer(data[:usable], dtype=PCM_DTYPE)
+
+        return_code = process.wait()
+        for thread in threads:
+            thread.join()
+        if return_code != 0:
+            message = b"".join(stderr_lines).decode("utf-8", "replace").strip()
+            raise AudioDecodeError(message or f"ffmpeg exited with {return_code}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+
+def needs_seekable_input(filename: str) -> bool:
+    """
+    Whether a file's container cannot be decoded from a pipe.
+
+    Args:
+        filename (str): Name of the file, used for its extension.
+    """
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    return extension in SEEKABLE_EXTENSIONS
+
+
+def _concatenate(chunks) -> np.ndarray:
+    """
+    Join decoded chunks into one array.
+    """
+    chunks = list(chunks)
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(chunks)
+
+
+def decode_file(path: str, sample_rate: int = AUDIO_SAMPLE_RATE) -> np.ndarray:
+    """
+    Decode an audio file to mono float32 PCM.
+
+    Args:
+        path (str): Path of the audio file.
+        sample_rate (int): Output sample rate.
+
+    Returns:
+        np.ndarray: The decoded samples.
+    """
+    return _concatenate(iter_pcm_chunks(path=path, sample_rate=sample_rate))
+
+
+@contextmanager
+def temporary_file(stream, suffix: str = ""):
+    """
+    Copy a stream to a file in a new temporary directory.
+
+    The directory and the file are removed when the context exits, whether
+    or not decoding succeeded.
+
+    Args:
+        stream: A binary file-like object.
+        suffix (str): Extension of the file, which ffmpeg may probe.
+
+    Yields:
+        str: The path of the file.
+    """
+    with tempfile.TemporaryDirectory(prefix="melody_audio_") as temp_dir:
+        temp_path = os.path.join(temp_dir, f"audio{suffix}")
+        with open(temp_path, "wb") as temp_file:
+            shutil.copyfileobj(stream, temp_file, STREAM_BLOCK_SIZE)
+        yield temp_path
+
+
+def iter_stream_chunks(
+    stream,
+    filename: str = "",
+    sample_rate: int = AUDIO_SAMPLE_RATE,
+    chunk_samples: int = CHUNK_SAMPLES,
+):
+    """
+    Decode an audio stream, such as an upload, chunk by chunk.
+
+    The stream is piped into ffmpeg. Only containers that must be seeked are
+    written to a temporary file first. With TEMP_FILE_FALLBACK, a seekable
+    stream that ffmpeg fails to decode from the pipe, or decodes to no
+    samples at all, is decoded again from a temporary file.
+
+    Args:
+        stream: A binary file-like object.
+        filename (str): Original name of the file, used for its extension.
+        sample_rate (int): Output sample rate.
+        chunk_samples (int): Number of samples per yielded chunk.
+
+    Yields:
+        np.ndarray: Mono float32 samples.
+
+    Raises:
+        AudioDecodeError: If the audio cannot be decoded.
+    """
+    suffix = os.path.splitext(filename)[1]
+    if needs_seekable_input(filename):
+        with temporary_file(stream, suffix) as temp_path:
+            yield from iter_pcm_chunks(
+                path=temp_path, sample_rate=sample_rate, chunk_samples=chunk_samples
+            )
+        return
+
+    start = stream.tell() if TEMP_FILE_FALLBACK and stream.seekable() else None
+    decoded = False
+    try:
+        for chunk in iter_pcm_chunks(
+            stream=stream, sample_rate=sample_rate, chunk_samples=chunk_samples
+        ):
+            decoded = True
+            yield chunk
+    except AudioDecodeError as e:
+        if start is None or decoded:
+            raise
+        reason = e
+    else:
+        # ffmpeg reads a container it cannot seek to the end without output
+        if start is None or decoded or stream.tell() == start:
+            return
+        reason = "no samples decoded from the pipe"
+    print(f"Decoding {filename or 'audio stream'} from a temporary file: {reason}")
+
+    stream.seek(start)
+    with temporary_file(stream, suffix) as temp_path:
+        yield from iter_pcm_chunks(
+            path=temp_path, sample_rate=sample_rate, chunk_samples=chunk_samples
+        )
+
+
+def decode_stream(
+    stream, filename: str = "", sample_rate: int = AUDIO_SAMPLE_RATE
+) -> np.ndarray:
+    """
+    Decode an audio stream, such as an upload, to mono float32 PCM.
+
+    See iter_stream_chunks for when the stream is written to a temporary
+    file instead of being piped into ffmpeg.
+
+    Args:
+        stream: A binary file-like object.
+        filename (str): Original name of the file, used for its extension.
+        sample_rate (int): Output sample rate.
+
+    Returns:
+        np.ndarray: The decoded samples.
+    """
+    return _concatenate(iter_stream_chunks(stream, filename, sample_rate))
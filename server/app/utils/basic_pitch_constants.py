@@ -0,0 +1,34 @@
+################################################################################
+# Filename: basic_pitch_constants.py
+# Purpose:  Basic Pitch model constants that do not require importing it.
+# Author:   Darren Seubert
+#
+# Description:
+# Importing anything from the basic_pitch package, even its constants,
+# imports TensorFlow, which takes seconds and hundreds of megabytes. The
+# sample rate, hop and window sizes of the model are fixed by the model
+# itself, so they are repeated here for the modules that only need them,
+# such as the audio decoder, and TensorFlow is imported once a model is
+# actually run.
+#
+# Usage (Optional):
+#   from app.utils.basic_pitch_constants import AUDIO_SAMPLE_RATE
+#
+# Notes:
+# - The values are those of basic_pitch.constants for basic-pitch 0.4 and
+#   are checked against it in tests/test_conversion.py.
+#
+###############################################################################
+
+AUDIO_SAMPLE_RATE = 22050
+FFT_HOP = 256
+# Length of one model window in seconds
+AUDIO_WINDOW_LENGTH = 2
+ANNOTATIONS_FPS = AUDIO_SAMPLE_RATE // FFT_HOP
+ANNOT_N_FRAMES = ANNOTATIONS_FPS * AUDIO_WINDOW_LENGTH
+AUDIO_N_SAMPLES = AUDIO_SAMPLE_RATE * AUDIO_WINDOW_LENGTH - FFT_HOP
+# Resolution of the pitch contours, used to scale pitch bends
+CONTOURS_BINS_PER_SEMITONE = 3
+
+# File name of the model basic_pitch loads by default with TensorFlow
+DEFAULT_MODEL_NAME = "nmp"
@@ -0,0 +1,422 @@
+################################################################################
+# Filename: batch_conversion.py
+# Purpose:  Convert many audio files to MIDI in parallel on a process pool.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains helpers for converting a batch of recordings at once.
+# Audio files and zip archives of audio files are staged under unique names in
+# a temporary directory, then their conversion is spread across a pool of
+# processes. Each file is decoded by ffmpeg and converted in a stream, so
+# long recordings do not grow a worker's memory. For Basic Pitch batches each
+# process loads and warms up the model once and reuses it for every file it
+# is given; DSP batches never load it.
+# Results are yielded as soon as each file completes, and a file that fails
+# to convert is reported without failing the rest of the batch.
+#
+# Usage (Optional):
+#   with BatchStaging() as staging:
+#       staging.add_path("takes.zip")
+#       for result in convert_batch(staging.files):
+#           print(result["file"], result["status"])
+#
+# Notes:
+# - The pool uses the "spawn" start method; forking a process that already
+#   runs TensorFlow threads is not safe.
+# - The command line creates a pool per batch, sized to the available cores.
+#   The server shares one pool per worker process between its batch requests
+#   instead (batch_pool, BATCH_WORKERS processes, default the available
+#   cores), created on the first batch and shut down when the worker exits,
+#   so concurrent batches do not load the model again for every request.
+# - A batch request is converted while it is open, so it must finish within
+#   the cpu pool's timeout (see app/utils/serving.py). BATCH_MAX_FILES
+#   (default 50) caps the audio files of one request to keep it there;
+#   larger backfills are converted with batch_convert.py.
+# - Zip archives are checked before anything is extracted: a batch may hold
+#   at most BATCH_MAX_ARCHIVE_MEMBERS archive members (default 1000) and
+#   BATCH_MAX_EXTRACTED_BYTES of extracted audio (default 1 GiB), and no
+#   member may be compressed more than BATCH_MAX_COMPRESSION_RATIO times
+#   (default 100), so a small zip bomb cannot fill the staging disk.
+#
+###############################################################################
+
+import os
+import shutil
+import tempfile
+import zipfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+
+from app.utils.audio_decoder import AUDIO_EXTENSIONS
+from app.utils.conversion import convert_stream_to_midi, get_transcriber, stream_audio
+from app.utils.model_manager import model_manager
+
+# Extensions accepted into a batch, all decoded directly by ffmpeg
+BATCH_EXTENSIONS = AUDIO_EXTENSIONS
+# Most audio files a batch request may hold
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "50"))
+# Limits on the zip archives of a batch, checked before extracting them
+BATCH_MAX_ARCHIVE_MEMBERS = int(os.environ.get("BATCH_MAX_ARCHIVE_MEMBERS", "1000"))
+BATCH_MAX_EXTRACTED_BYTES = int(
+    os.environ.get("BATCH_MAX_EXTRACTED_BYTES", str(1024 * 1024 * 1024))
+)
+# Audio barely compresses, so a far higher ratio means a crafted archive
+BATCH_MAX_COMPRESSION_RATIO = float(os.environ.get("BATCH_MAX_COMPRESSION_RATIO", "100"))
+
+
+class BatchLimitError(ValueError):
+    """
+    Raised when a batch exceeds one of its limits.
+    """
+
+
+def available_cores() -> int:
+    """
+    Return the number of cores this process is allowed to run on.
+
+    Returns:
+        int: The number of available cores, at least 1.
+    """
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def is_batch_audio_file(file_name: str) -> bool:
+    """
+    Checks if a file can be part of a batch based on its extension.
+
+    Args:
+        file_name (str): Name of the file.
+
+    Returns:
+        bool: True if the file is an audio file accepted into a batch.
+    """
+    extension = os.path.splitext(file_name)[1].lower().lstrip(".")
+    return extension in BATCH_EXTENSIONS
+
+
+class BatchStaging:
+    """
+    Temporary directory holding the audio files of one batch.
+
+    Every staged file gets a unique name, so files that share a name (for
+    example the same take name in two folders of an archive) never overwrite
+    each other or each other's MIDI output.
+
+    Attributes:
+        directory (str): The temporary staging directory.
+        files (list): (original name, staged path) tuples in submission order.
+        skipped (list): Names of archive members that are not audio files.
+        max_files (int): Most audio files the batch may hold, or None.
+        archive_members (int): Members of the zip archives staged so far.
+        extracted_bytes (int): Bytes extracted from zip archives so far.
+    """
+
+    def __init__(self, max_files=None):
+        self.directory = tempfile.mkdtemp(prefix="melody_batch_")
+        self.files = []
+        self.skipped = []
+        self.max_files = max_files
+        self.archive_members = 0
+        self.extracted_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+    def _check_room(self, count: int = 1):
+        """
+        Check that count more audio files fit in the batch.
+
+        Raises:
+            BatchLimitError: If the batch would exceed max_files.
+        """
+        if self.max_files is not None and len(self.files) + count > self.max_files:
+            raise BatchLimitError(f"A batch may hold at most {self.max_files} audio files")
+
+    def _check_archive(self, archive: zipfile.ZipFile, members: list):
+        """
+        Check an archive against the batch's archive limits.
+
+        The sizes are those recorded in the archive, which zipfile also
+        enforces while extracting, so nothing has to be extracted first.
+
+        Args:
+            archive (zipfile.ZipFile): The archive.
+            members (list): The audio members that would be extracted.
+
+        Raises:
+            BatchLimitError: If a limit would be exceeded.
+        """
+        self.archive_members += len(archive.infolist())
+        if self.archive_members > BATCH_MAX_ARCHIVE_MEMBERS:
+            raise BatchLimitError(
+                f"Zip archives may hold at most {BATCH_MAX_ARCHIVE_MEMBERS} files"
+            )
+        for member in members:
+            if member.file_size > BATCH_MAX_COMPRESSION_RATIO * max(member.compress_size, 1):
+                raise BatchLimitError(f"{member.filename} is compressed too much")
+        self.extracted_bytes += sum(member.file_size for member in members)
+        if self.extracted_bytes > BATCH_MAX_EXTRACTED_BYTES:
+            raise BatchLimitError(
+                f"Zip archives may hold at most {BATCH_MAX_EXTRACTED_BYTES} bytes of audio"
+            )
+
+    def _staged_path(self, name: str) -> str:
+        """
+        Return a unique path in the staging directory for a file name.
+        """
+        base_name = os.path.basename(name.replace("\\", "/"))
+        return os.path.join(self.directory, f"{len(self.files):05d}_{base_name}")
+
+    def add_stream(self, name: str, stream):
+        """
+        Stage an audio file, or every audio file in a zip archive, from a stream.
+
+        Args:
+            name (str): Original file name.
+            stream (file-like): Binary stream with the file contents.
+
+        Raises:
+            BatchLimitError: If the batch would exceed one of its limits.
+        """
+        if name.lower().endswith(".zip"):
+            with zipfile.ZipFile(stream) as archive:
+                self._add_archive(archive)
+            return
+
+        self._check_room()
+        staged_path = self._staged_path(name)
+        with open(staged_path, "wb") as staged_file:
+            shutil.copyfileobj(stream, staged_file)
+        self.files.append((name, staged_path))
+
+    def add_path(self, path: str):
+        """
+        Stage an audio file, or every audio file in a zip archive, from disk.
+
+        Args:
+            path (str): Path to an audio file or zip archive.
+        """
+        if path.lower().endswith(".zip"):
+            with zipfile.ZipFile(path) as archive:
+                self._add_archive(archive)
+            return
+
+        self._check_room()
+        # Link instead of copying; the staged name only has to be unique
+        staged_path = self._staged_path(path)
+        os.symlink(os.path.abspath(path), staged_path)
+        self.files.append((path, staged_path))
+
+    def _add_archive(self, archive: zipfile.ZipFile):
+        """
+        Stage the audio members of a zip archive.
+
+        Raises:
+            BatchLimitError: If the batch would exceed one of its limits,
+                checked before anything is extracted.
+        """
+        members = []
+        for member in archive.infolist():
+            base_name = os.path.basename(member.filename)
+            if member.is_dir() or member.filename.startswith("__MACOSX/"):
+                continue
+            if not is_batch_audio_file(base_name) or base_name.startswith("."):
+                self.skipped.append(member.filename)
+                continue
+            members.append(member)
+        self._check_room(len(members))
+        self._check_archive(archive, members)
+
+        for member in members:
+            base_name = os.path.basename(member.filename)
+            staged_path = self._staged_path(base_name)
+            with archive.open(member) as source, open(staged_path, "wb") as target:
+                shutil.copyfileobj(source, target)
+            self.files.append((member.filename, staged_path))
+
+    def cleanup(self):
+        """
+        Remove the staging directory and everything in it.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def init_worker(transcriber: str | None = None):
+    """
+    Process pool initializer: load and warm up the model once per process,
+    if the batch is transcribed with Basic Pitch.
+
+    Args:
+        transcriber (str): Name of the transcriber, defaults to the configured one.
+    """
+    if get_transcriber(transcriber).name == "basic_pitch":
+        model_manager.warm_up()
+
+
+def convert_file(name: str, audio_path: str, transcriber: str | None = None) -> dict:
+    """
+    Convert one staged audio file to MIDI, capturing any failure.
+
+    Args:
+        name (str): Original file name, used to identify the result.
+        audio_path (str): Path of the staged audio file.
+        transcriber (str): Name of the transcriber, defaults to the configured one.
+
+    Returns:
+        dict: The file name, status, and either the MIDI data or the error.
+    """
+    try:
+        midi_data = convert_stream_to_midi(
+            stream_audio(audio_path), transcriber=get_transcriber(transcriber)
+        )
+    except Exception as e:
+        return {"file": name, "status": "failed", "error": str(e) or repr(e)}
+
+    return {"file": name, "status": "succeeded", "midi_data": midi_data}
+
+
+def create_executor(max_workers=None, transcriber=None):
+    """
+    Create the process pool used to convert a batch.
+
+    Args:
+        max_workers (int): Number of processes, defaults to the available cores.
+        transcriber (str): Name of the transcriber the processes are warmed
+            up for, defaults to the configured one.
+
+    Returns:
+        ProcessPoolExecutor: A pool whose processes each hold a warm model
+        when the transcriber runs one.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers or available_cores(),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(transcriber,),
+    )
+
+
+class BatchPool:
+    """
+    Process pool shared by the batch conversions of a server process.
+
+    Attributes:
+        size (int): Number of conversion processes.
+    """
+
+    def __init__(self, size=1):
+        self.size = size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+
+    def get_executor(self, transcriber=None):
+        """
+        Return the pool of this process, creating it on first use.
+
+        A process forked from one that used the pool gets a new one, as the
+        parent's conversion processes are not its children. The processes
+        are warmed up for the transcriber of the batch that creates the pool;
+        a later batch with another transcriber loads its model on first use.
+
+        Args:
+            transcriber (str): Name of the transcriber, defaults to the
+                configured one.
+        """
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = create_executor(self.size, transcriber)
+            return self._executor
+
+    def discard(self, executor):
+        """
+        Replace a pool whose processes died by a new one on the next batch.
+        """
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        """
+        Stop the conversion processes of this process, if any were started.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            if self._pid != os.getpid():
+                return
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def convert_batch(files, max_workers=None, transcriber=None, pool=None):
+    """
+    Convert staged audio files in parallel, yielding each result as it completes.
+
+    Args:
+        files (list): (original name, staged path) tuples, as in BatchStaging.files.
+        max_workers (int): Number of processes of a pool created for this
+            batch, defaults to the available cores.
+        transcriber (str): Name of the transcriber, defaults to the configured one.
+        pool (BatchPool): Shared pool to convert on instead of creating one.
+
+    Yields:
+        dict: The result of convert_file for each file, in completion order.
+    """
+    if not files:
+        return
+
+    if pool is None:
+        max_workers = min(max_workers or available_cores(), len(files))
+        with create_executor(max_workers, transcriber) as executor:
+            yield from convert_on(executor, files, transcriber)
+        return
+
+    executor = pool.get_executor(transcriber)
+    try:
+        yield from convert_on(executor, files, transcriber)
+    except BrokenProcessPool:
+        pool.discard(executor)
+
+
+def convert_on(executor, files, transcriber=None):
+    """
+    Convert staged audio files on an executor, yielding each result as it
+    completes.
+
+    Raises:
+        BrokenProcessPool: After every file has been reported, if a process
+            of the pool died while converting.
+    """
+    futures = {
+        executor.submit(convert_file, name, path, transcriber): name
+        for name, path in files
+    }
+    broken = False
+    try:
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                # A worker process died (e.g. out of memory) while converting
+                broken = broken or isinstance(e, BrokenProcessPool)
+                yield {"file": futures[future], "status": "failed", "error": repr(e)}
+    finally:
+        # Leave the shared pool to other batches if this one is abandoned
+        for future in futures:
+            future.cancel()
+    if broken:
+        raise BrokenProcessPool("A batch conversion process died")
+
+
+# Shared pool used by the batch requests of this process
+batch_pool = BatchPool(int(os.environ.get("BATCH_WORKERS") or available_cores()))
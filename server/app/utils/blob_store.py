@@ -0,0 +1,296 @@
+################################################################################
+# Filename: blob_store.py
+# Purpose:  Store MIDI, MusicXML and source audio blobs outside the database.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains a small object storage abstraction used to keep large
+# binary files out of the midis table. The database only records the key and
+# size of each blob, while the bytes live in one of these backends:
+#   - LocalBlobStore: files under a directory, one random name per blob.
+#   - ContentAddressedBlobStore: files under a directory, named by the
+#     SHA-256 of their contents, so identical blobs are stored once.
+#   - S3BlobStore: objects in an S3-compatible bucket (AWS S3, MinIO, ...).
+#
+# Usage (Optional):
+#   from app.utils.blob_store import blob_store
+#   key = blob_store.put(midi_data, "midi")
+#   midi_data = blob_store.get(key)
+#
+# Notes:
+# - The backend is selected with BLOB_STORE (local, cas or s3). The local
+#   backends read their directory from BLOB_STORE_PATH; the S3 backend reads
+#   S3_BUCKET, S3_PREFIX and S3_ENDPOINT_URL and requires boto3.
+# - Keys are relative, '/'-separated paths that never leave the store root.
+#
+###############################################################################
+
+import hashlib
+import os
+import tempfile
+import uuid
+
+# Kinds of blobs kept in the store; the kind is the first key component
+BLOB_KINDS = {"midi", "xml", "audio"}
+
+
+class BlobNotFoundError(KeyError):
+    """
+    Raised when a key does not exist in a blob store.
+    """
+
+
+class BlobStore:
+    """
+    Interface of a blob store. Backends implement put, get, delete and exists.
+    """
+
+    def put(self, data: bytes, kind: str) -> str:
+        """
+        Store a blob.
+
+        Args:
+            data (bytes): The blob contents.
+            kind (str): One of BLOB_KINDS, used to group keys.
+
+        Returns:
+            str: The key under which the blob can be retrieved.
+        """
+        raise NotImplementedError
+
+    def get(self, key: str) -> bytes:
+        """
+        Retrieve a blob.
+
+        Args:
+            key (str): The key returned by put.
+
+        Returns:
+            bytes: The blob contents.
+
+        Raises:
+            BlobNotFoundError: If the key does not exist.
+        """
+        raise NotImplementedError
+
+    def open(self, key: str):
+        """
+        Open a blob for streaming.
+
+        Args:
+            key (str): The key returned by put.
+
+        Returns:
+            A binary file-like object; the caller must close it.
+
+        Raises:
+            BlobNotFoundError: If the key does not exist.
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """
+        Delete a blob if it exists.
+
+        Args:
+            key (str): The key returned by put.
+        """
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        """
+        Whether a blob exists.
+
+        Args:
+            key (str): The key returned by put.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _check_kind(kind: str):
+        if kind not in BLOB_KINDS:
+            raise ValueError(f"Unknown blob kind: {kind}")
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Blob store keeping each blob as a file with a random name under a directory.
+
+    Attributes:
+        root (str): Directory holding the blobs.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def _make_key(self, data: bytes, kind: str) -> str:
+        return f"{kind}/{uuid.uuid4().hex}"
+
+    def _path(self, key: str) -> str:
+        """
+        Return the file path of a key, refusing keys outside the root.
+        """
+        path = os.path.abspath(os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != self.root or path == self.root:
+            raise ValueError(f"Invalid blob key: {key}")
+        return path
+
+    def put(self, data: bytes, kind: str) -> str:
+        self._check_kind(kind)
+        key = self._make_key(data, kind)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so readers never see partial blobs
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as blob_file:
+                blob_file.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return key
+
+    def get(self, key: str) -> bytes:
+        with self.open(key) as blob_file:
+            return blob_file.read()
+
+    def open(self, key: str):
+        try:
+            return open(self._path(key), "rb")
+        except FileNotFoundError:
+            raise BlobNotFoundError(key) from None
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._path(key))
+
+
+class ContentAddressedBlobStore(LocalBlobStore):
+    """
+    Blob store naming each blob by the SHA-256 of its contents.
+
+    Storing the same contents twice returns the same key and keeps a single
+    copy. Because a key may be shared by several rows, delete should only be
+    used once no row references the key any more.
+
+    Attributes:
+        root (str): Directory holding the blobs.
+    """
+
+    def _make_key(self, data: bytes, kind: str) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        # Fan out into subdirectories to keep directory listings small
+        return f"{kind}/{digest[:2]}/{digest[2:4]}/{digest}"
+
+    def put(self, data: bytes, kind: str) -> str:
+        self._check_kind(kind)
+        key = self._make_key(data, kind)
+        if self.exists(key):
+            return key
+        return super().put(data, kind)
+
+
+class S3BlobStore(BlobStore):
+    """
+    Blob store keeping each blob as an object in an S3-compatible bucket.
+
+    Attributes:
+        bucket (str): Name of the bucket.
+        prefix (str): Prefix prepended to every object name.
+        client: A boto3 S3 client, or any object with the same put_object,
+            get_object, delete_object and head_object methods.
+    """
+
+    def __init__(self, bucket, client, prefix=""):
+        self.bucket = bucket
+        self.client = client
+        self.prefix = prefix
+
+    def _object_name(self, key: str) -> str:
+        return self.prefix + key
+
+    def put(self, data: bytes, kind: str) -> str:
+        self._check_kind(kind)
+        key = f"{kind}/{uuid.uuid4().hex}"
+        self.client.put_object(
+            Bucket=self.bucket, Key=self._object_name(key), Body=data
+        )
+        return key
+
+    def get(self, key: str) -> bytes:
+        with self.open(key) as body:
+            return body.read()
+
+    def open(self, key: str):
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self._object_name(key)
+            )
+        except Exception as e:
+            if _is_missing_object_error(e):
+                raise BlobNotFoundError(key) from None
+            raise
+        # The streaming body is read from the network as it is consumed
+        return response["Body"]
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_name(key))
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_name(key))
+        except Exception as e:
+            if _is_missing_object_error(e):
+                return False
+            raise
+        return True
+
+
+def _is_missing_object_error(error) -> bool:
+    """
+    Whether an error raised by an S3 client means the object does not exist.
+    """
+    response = getattr(error, "response", None) or {}
+    code = str(response.get("Error", {}).get("Code", ""))
+    return code in {"404", "NoSuchKey", "NotFound"}
+
+
+def create_blob_store(backend=None, path=None) -> BlobStore:
+    """
+    Create the blob store selected by the environment.
+
+    Args:
+        backend (str): local, cas or s3; defaults to BLOB_STORE or local.
+        path (str): Root directory of the local backends; defaults to
+            BLOB_STORE_PATH or ./blob_store.
+
+    Returns:
+        BlobStore: The configured blob store.
+    """
+    backend = backend or os.environ.get("BLOB_STORE", "local")
+    path = path or os.environ.get("BLOB_STORE_PATH", "./blob_store")
+
+    if backend == "local":
+        return LocalBlobStore(path)
+    if backend == "cas":
+        return ContentAddressedBlobStore(path)
+    if backend == "s3":
+        import boto3
+
+        client = boto3.client("s3", endpoint_url=os.environ.get("S3_ENDPOINT_URL"))
+        return S3BlobStore(
+            os.environ["S3_BUCKET"], client, os.environ.get("S3_PREFIX", "")
+        )
+    raise ValueError(f"Unknown blob store backend: {backend}")
+
+
+# Shared blob store used by the controllers of this process
+blob_store = create_blob_store()
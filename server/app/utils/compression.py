@@ -0,0 +1,99 @@
+################################################################################
+# Filename: compression.py
+# Purpose:  To compress and decompress stored documents such as MusicXML
+# Author:   Darren Seubert
+#
+# Description:
+# This module provides utilities to compress binary data before it is stored
+# and to decompress it when it is read back. MusicXML is a verbose text format
+# and typically shrinks by an order of magnitude. Data is stored in the gzip
+# format, so it can also be sent as is to clients accepting gzip, and can be
+# re-encoded with brotli for clients that prefer it.
+#
+# Usage:
+# The Compressor class can be used to compress data with gzip before storing
+# it and to decompress it when it is served.
+#
+# Notes:
+# - The methods provided are static, as they do not depend on the state of an
+#   instance of the class. They can be used directly with class reference.
+# - decompress also reads the zlib format used by earlier versions.
+# - Brotli support requires the optional brotli package.
+#
+###############################################################################
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Trade-off between compression ratio and CPU time; 6 is zlib's default
+COMPRESSION_LEVEL = 6
+# Brotli quality used when encoding responses on the fly (0-11)
+BROTLI_QUALITY = 5
+# Lets zlib detect both the gzip and the zlib header
+AUTO_HEADER_WBITS = zlib.MAX_WBITS | 32
+
+
+class Compressor:
+    @staticmethod
+    def compress(data):
+        """
+        Compress binary data with gzip.
+
+        Args:
+            data (bytes): The binary data to compress.
+
+        Returns:
+            bytes: The compressed data.
+        """
+        # A fixed mtime keeps the output identical for identical input
+        return gzip.compress(data, COMPRESSION_LEVEL, mtime=0)
+
+    @staticmethod
+    def decompress(compressed_data):
+        """
+        Decompress data compressed by Compressor.compress.
+
+        Args:
+            compressed_data (bytes): The compressed data.
+
+        Returns:
+            bytes: The original binary data.
+        """
+        return zlib.decompress(compressed_data, AUTO_HEADER_WBITS)
+
+    @staticmethod
+    def is_gzip(compressed_data):
+        """
+        Check whether data is in the gzip format.
+
+        Args:
+            compressed_data (bytes): The compressed data.
+
+        Returns:
+            bool: True if the data starts with the gzip magic number.
+        """
+        return compressed_data[:2] == b"\x1f\x8b"
+
+    @staticmethod
+    def brotli_available():
+        """
+        Check whether the optional brotli package is installed.
+        """
+        return brotli is not None
+
+    @staticmethod
+    def compress_brotli(data):
+        """
+        Compress binary data with brotli.
+
+        Args:
+            data (bytes): The binary data to compress.
+
+        Returns:
+            bytes: The compressed data.
+        """
+        return brotli.compress(data, quality=BROTLI_QUALITY)
@@ -5,8 +5,22 @@
 #
 # Description:
 # This file contains functions for audio processing tasks, including conversion
-# of audio files to MIDI format. It includes helper functions for audio file
-# conversion to wav file, frequency segmentation, and MIDI file generation.
+# of audio files to MIDI format. Audio in any format ffmpeg can read is decoded
+# directly to mono float32 PCM at the model's sample rate and converted by
+# Basic Pitch in memory; PCM WAV files skip ffmpeg and are read through a
+# memory map (see wav_reader.py). Long recordings can be converted in a stream: the
+# model runs over overlapping windows of a PCM generator and note events are
+# created segment by segment, so memory use stays constant however long the
+# recording is.
+#
+# Conversions go through a Transcriber. Besides Basic Pitch, a pure NumPy
+# signal-processing transcriber (see dsp_transcription.py) can be selected,
+# which is much faster on CPU and needs no model. The default is read from the
+# TRANSCRIBER environment variable ("basic_pitch" or "dsp").
+#
+# While the notes are transcribed, the same samples are analysed for their key
+# and tempo (see audio_analysis.py), which are written to the MIDI file as its
+# key signature and tempo.
 #
 # Usage (Optional):
 # User can use the provided functions to convert audio files to MIDI format.
@@ -14,132 +28,758 @@
 # and mido, are installed in user's Python environment.
 #
 # Notes:
-# - This file supports audio files with extensions mp3, m4a, and wav.
+# - This file supports every audio format ffmpeg can read, such as mp3, m4a,
+#   wav and the webm recordings made by browsers.
 # - Ensure that the audio files contain a single melody line for accurate
 #   MIDI conversion.
 # - The MIDI files generated by this file will contain MIDI note messages
 #   corresponding to the detected pitch and rhythm of the input audio.
+# - Basic Pitch, and with it TensorFlow, is imported by the functions that
+#   run the model, so importing this file (and the application) stays fast.
+#   MIDI files are built here with pretty_midi, so conversions with the DSP
+#   transcriber never import it.
 #
 ###############################################################################
 
-from basic_pitch.inference import predict
+from app.utils import dsp_transcription
+from app.utils.audio_analysis import AudioAnalyzer, analyze_pcm
+from app.utils.basic_pitch_constants import (
+    ANNOT_N_FRAMES,
+    ANNOTATIONS_FPS,
+    AUDIO_N_SAMPLES,
+    AUDIO_SAMPLE_RATE,
+    CONTOURS_BINS_PER_SEMITONE,
+    DEFAULT_MODEL_NAME,
+    FFT_HOP,
+)
+from app.utils.audio_decoder import (
+    CHUNK_SAMPLES,
+    AudioDecodeError,
+    decode_file,
+    iter_pcm_chunks,
+    iter_stream_chunks,
+)
+from app.utils.inference_scheduler import inference_scheduler
+from app.utils.model_manager import model_manager
+from app.utils.wav_reader import WavFormatError, WavReader, is_wav_file
+from io import BytesIO
+import numpy as np
 import os
-import subprocess
+import pretty_midi
+
+# Windowing used by Basic Pitch: consecutive model windows overlap by 30 frames
+N_OVERLAPPING_FRAMES = 30
+OVERLAP_LEN = N_OVERLAPPING_FRAMES * FFT_HOP
+HOP_SIZE = AUDIO_N_SAMPLES - OVERLAP_LEN
+
+# Basic Pitch's default note creation settings, as used by predict
+NOTE_PARAMS = {
+    "onset_thresh": 0.5,
+    "frame_thresh": 0.3,
+    # 127.70 ms, converted to model frames
+    "min_note_len": int(np.round(127.70 / 1000 * (AUDIO_SAMPLE_RATE / FFT_HOP))),
+    "min_freq": None,
+    "max_freq": None,
+    "multiple_pitch_bends": False,
+    "melodia_trick": True,
+    "midi_tempo": 120,
+}
+
+# Streaming inference: note events are created one segment of model frames at
+# a time. Segments are cut in the middle of a stretch of silence long enough
+# that no note can span it (Basic Pitch ends a note after ENERGY_TOL quiet
+# frames), or at MAX_SEGMENT_FRAMES when the audio never goes quiet.
+ENERGY_TOL = 11
+QUIET_FRAMES = 2 * (ENERGY_TOL + 1)
+MAX_SEGMENT_FRAMES = 2048
+
+# Everything that changes the output of a conversion for the same audio.
+# Bump "version" whenever the conversion pipeline itself changes.
+CONVERSION_PARAMS = {
+    "version": 5,
+    "model": os.path.basename(model_manager.model_path or DEFAULT_MODEL_NAME),
+    "sample_rate": AUDIO_SAMPLE_RATE,
+}
+# Streamed conversions cut the recording into segments, which can change the
+# notes found near a cut, so their results are cached separately
+STREAM_CONVERSION_PARAMS = {**CONVERSION_PARAMS, "max_segment_frames": MAX_SEGMENT_FRAMES}
+# The DSP transcriber reads the whole stream, so both kinds of conversion
+# give the same notes
+DSP_CONVERSION_PARAMS = {
+    "version": 3,
+    "transcriber": "dsp",
+    "sample_rate": AUDIO_SAMPLE_RATE,
+}
 
-SUPPORTED_EXTENSIONS = {"m4a", "mp3", "wav"}
-MIDI_OUTPUT_DIR = "./app/utils/midi_output"
+DEFAULT_TRANSCRIBER = os.environ.get("TRANSCRIBER", "basic_pitch")
 
+# MIDI files are written as Basic Pitch writes them: one Electric Piano
+# instrument, with pitch bends of up to two semitones either way
+MIDI_PROGRAM = pretty_midi.instrument_name_to_program("Electric Piano 1")
+N_PITCH_BEND_TICKS = 8192
 
-def convert_webm_to_mp3(input_file, output_file):
+
+def open_wav(input_audio_path: str):
     """
-    Converts a WEBM audio file to MP3 format using ffmpeg.
+    Memory-map an audio file if it is a WAV file WavReader can read.
 
     Args:
-        input_file (str): Path to the input WEBM file.
-        output_file (str): Path to save the converted MP3 file.
-    """
-    # Command to convert the WEBM file to MP3
-    command = [
-        "ffmpeg",
-        "-i",
-        input_file,
-        "-vn",
-        "-ab",
-        "192k",
-        "-ar",
-        "44100",
-        "-y",
-        output_file,
-    ]
+        input_audio_path: Path to an audio file.
 
-    # Run the command through the subprocess module
+    Returns:
+        WavReader: The mapped file, or None for other formats and WAV codecs,
+        which are left to ffmpeg.
+    """
+    if not is_wav_file(input_audio_path):
+        return None
     try:
-        subprocess.run(command, check=True)
-        print("Conversion completed successfully.")
-    except subprocess.CalledProcessError:
-        print("An error occurred during conversion.")
+        return WavReader(input_audio_path)
+    except WavFormatError as e:
+        print(f"Decoding {input_audio_path} with ffmpeg: {e}")
+        return None
 
 
-def is_webm_file(file_path: str) -> bool:
+def decode_audio(input_audio_path: str):
     """
-    Checks if the given file is a WEBM file based on its extension.
+    Decode an audio file to mono PCM at the model's sample rate.
+
+    PCM WAV files are read through a memory map; other files are decoded by
+    ffmpeg, which resamples and downmixes while decoding, so no intermediate
+    file is written and the audio is not re-encoded.
 
     Args:
-        file_path (str): Path to the file to be checked.
+        input_audio_path: Path to an audio file in any format ffmpeg can read.
 
     Returns:
-        bool: True if the file is a WEBM file, False otherwise.
+        np.ndarray: The decoded float32 samples.
+
+    Raises:
+        AudioDecodeError: If the file cannot be decoded.
     """
-    return os.path.splitext(file_path)[1].lower() == ".webm"
+    wav = open_wav(input_audio_path)
+    if wav is not None:
+        blocks = list(wav.iter_blocks(sample_rate=AUDIO_SAMPLE_RATE))
+        return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+    return decode_file(input_audio_path, AUDIO_SAMPLE_RATE)
 
 
-def replace_extension(file_path: str, new_ext: str) -> str:
+def stream_audio(input_audio_path: str):
     """
-    Replaces the file extension of the given file path with a new extension.
+    Decode an audio file chunk by chunk at the model's sample rate.
+
+    PCM WAV files are memory-mapped and converted one chunk at a time, so
+    long recordings are read with flat memory use and without ffmpeg.
 
     Args:
-        file_path (str): Original file path.
-        new_ext (str): New file extension (with or without leading dot).
+        input_audio_path: Path to an audio file in any format ffmpeg can read.
 
     Returns:
-        str: File path with the new extension.
+        generator: Mono float32 sample chunks; AudioDecodeError is raised
+        while iterating if the file cannot be decoded.
     """
-    root, _ = os.path.splitext(file_path)
-    new_ext = new_ext if new_ext.startswith(".") else f".{new_ext}"
-    return root + new_ext
+    wav = open_wav(input_audio_path)
+    if wav is not None:
+        return wav.iter_blocks(CHUNK_SAMPLES, sample_rate=AUDIO_SAMPLE_RATE)
+    return iter_pcm_chunks(path=input_audio_path, sample_rate=AUDIO_SAMPLE_RATE)
 
 
-def validate_audio_file(file_path: str) -> str | None:
+def get_inference_model():
     """
-    Validates an audio file for MIDI conversion.
+    Return what conversions run their windows through.
 
-    - Converts WEBM to MP3 if necessary.
-    - Validates supported extensions.
+    Returns:
+        The shared batching scheduler if INFERENCE_BATCH_SIZE enables it,
+        otherwise the warm Basic Pitch model. Both have the same predict.
+    """
+    if inference_scheduler.enabled:
+        return inference_scheduler
+    return model_manager.get_model()
+
+
+def run_pcm_inference(pcm, model, batch_size: int = 1) -> dict:
+    """
+    Run Basic Pitch on decoded samples held in memory.
+
+    This mirrors basic_pitch.inference.run_inference, which can only read
+    audio from a file: the samples are padded, cut into overlapping windows,
+    predicted batch_size windows at a time and unwrapped into one matrix per
+    output.
 
     Args:
-        file_path: Path to the original audio file.
+        pcm (np.ndarray): Mono float32 samples at AUDIO_SAMPLE_RATE.
+        model: A loaded Basic Pitch model, or the inference scheduler.
+        batch_size (int): Number of windows passed to each predict call.
 
     Returns:
-        Path to the prepared audio file (possibly converted), or None if unsupported.
+        dict: The note, onset and contour matrices.
+    """
+    from basic_pitch.inference import unwrap_output, window_audio_file
+
+    padded = np.concatenate([np.zeros(OVERLAP_LEN // 2, dtype=np.float32), pcm])
+    output = {"note": [], "onset": [], "contour": []}
+    windows = []
+    for window, _ in window_audio_file(padded, HOP_SIZE):
+        windows.append(window)
+        if len(windows) == batch_size:
+            for name, value in model.predict(np.stack(windows)).items():
+                output[name].append(value)
+            windows = []
+    if windows:
+        for name, value in model.predict(np.stack(windows)).items():
+            output[name].append(value)
+
+    return {
+        name: unwrap_output(np.concatenate(values), len(pcm), N_OVERLAPPING_FRAMES)
+        for name, values in output.items()
+    }
+
+
+def drop_overlapping_pitch_bends(note_events: list) -> list:
+    """
+    Sort note events and drop the pitch bends of notes that overlap another.
+
+    MIDI pitch bends apply to a whole channel, so the bend of one of two
+    sounding notes would bend both.
+
+    Args:
+        note_events (list): Note events, as in note_events_to_bytes.
+
+    Returns:
+        list: The sorted note events.
+    """
+    note_events = sorted(note_events, key=lambda event: event[:4])
+    for i in range(len(note_events) - 1):
+        for j in range(i + 1, len(note_events)):
+            if note_events[j][0] >= note_events[i][1]:
+                break
+            note_events[i] = note_events[i][:4] + (None,)
+            note_events[j] = note_events[j][:4] + (None,)
+    return note_events
+
+
+def note_events_to_midi(note_events: list, tempo: float) -> pretty_midi.PrettyMIDI:
+    """
+    Build a MIDI file from note events.
+
+    This mirrors basic_pitch.note_creation.note_events_to_midi with single
+    pitch bends, without importing Basic Pitch, and with it TensorFlow, for
+    transcribers that do not run the model.
+
+    Args:
+        note_events (list): Note events, as in note_events_to_bytes.
+        tempo (float): Tempo of the file in beats per minute.
+
+    Returns:
+        pretty_midi.PrettyMIDI: The MIDI file.
+    """
+    midi_data = pretty_midi.PrettyMIDI(initial_tempo=tempo)
+    instrument = pretty_midi.Instrument(program=MIDI_PROGRAM)
+    for start, end, pitch, amplitude, pitch_bend in drop_overlapping_pitch_bends(note_events):
+        instrument.notes.append(
+            pretty_midi.Note(
+                velocity=int(np.round(127 * amplitude)), pitch=pitch, start=start, end=end
+            )
+        )
+        if not pitch_bend:
+            continue
+        bend_times = np.linspace(start, end, len(pitch_bend))
+        bend_ticks = np.round(
+            np.array(pitch_bend) * 4096 / CONTOURS_BINS_PER_SEMITONE
+        ).astype(int)
+        bend_ticks = np.clip(bend_ticks, -N_PITCH_BEND_TICKS, N_PITCH_BEND_TICKS - 1)
+        for bend_time, ticks in zip(bend_times, bend_ticks):
+            instrument.pitch_bends.append(pretty_midi.PitchBend(int(ticks), bend_time))
+    midi_data.instruments.append(instrument)
+    return midi_data
+
+
+def note_events_to_bytes(note_events: list, analysis: dict | None = None) -> bytes:
     """
-    # Convert WEBM → MP3 if needed
-    if is_webm_file(file_path):
-        mp3_path = replace_extension(file_path, "mp3")
-        convert_webm_to_mp3(file_path, mp3_path)
-        file_path = mp3_path
+    Write note events to a MIDI file held in memory.
 
-    # Validate extension after potential conversion
-    _, ext = os.path.splitext(file_path)
-    if ext.lower().lstrip(".") not in SUPPORTED_EXTENSIONS:
-        print(f"Unsupported audio format: {ext}")
+    Args:
+        note_events (list): (start time, end time, pitch, amplitude, pitch
+            bends) tuples, as returned by model_output_to_notes.
+        analysis (dict): Key and tempo of the recording, as returned by
+            analyze_pcm, written as the key_signature and set_tempo meta
+            events. Note times in seconds are the same at any tempo.
+
+    Returns:
+        bytes: The generated MIDI file.
+    """
+    tempo = analysis["tempo"] if analysis else NOTE_PARAMS["midi_tempo"]
+    midi_data = note_events_to_midi(note_events, tempo)
+    if analysis and analysis["key_number"] is not None:
+        midi_data.key_signature_changes.append(
+            pretty_midi.KeySignature(analysis["key_number"], 0)
+        )
+
+    midi_file = BytesIO()
+    midi_data.write(midi_file)
+    return midi_file.getvalue()
+
+
+def convert_pcm_to_midi(pcm, transcriber=None) -> bytes:
+    """
+    Convert decoded samples to MIDI, without temporary files.
+
+    Args:
+        pcm (np.ndarray): Mono float32 samples at AUDIO_SAMPLE_RATE.
+        transcriber (Transcriber): The transcriber to use, defaults to the
+            configured one.
+
+    Returns:
+        bytes: The generated MIDI file.
+    """
+    transcriber = transcriber or get_transcriber()
+    note_events = transcriber.transcribe(pcm)
+    return note_events_to_bytes(note_events, analyze_pcm(pcm, AUDIO_SAMPLE_RATE))
+
+
+def _predict_frames(model, window) -> dict:
+    """
+    Run the model on one window and drop the frames that overlap its neighbors.
+    """
+    n_olap = N_OVERLAPPING_FRAMES // 2
+    output = model.predict(window[np.newaxis, :, np.newaxis])
+    return {name: value[0, n_olap:-n_olap] for name, value in output.items()}
+
+
+def iter_model_output(pcm_chunks, model):
+    """
+    Run Basic Pitch over a stream of samples, one window at a time.
+
+    The windows are exactly those of run_pcm_inference, so the concatenated
+    blocks equal its output, but only one window of samples and one window of
+    model frames are held at a time.
+
+    Args:
+        pcm_chunks: Iterable of mono float32 sample chunks at AUDIO_SAMPLE_RATE.
+        model: A loaded Basic Pitch model, or the inference scheduler.
+
+    Yields:
+        dict: The note, onset and contour matrices of consecutive frames.
+    """
+    samples = np.zeros(OVERLAP_LEN // 2, dtype=np.float32)
+    n_samples = 0
+    pending = []
+    n_yielded = 0
+
+    def ready_frames(final):
+        # Frames past the end of the audio are trimmed like unwrap_output does,
+        # so hold back any frame the samples read so far do not yet cover
+        nonlocal pending, n_yielded
+        if not pending:
+            return None
+        frames = {name: np.concatenate([p[name] for p in pending]) for name in pending[0]}
+        limit = int(np.floor(n_samples * (ANNOTATIONS_FPS / AUDIO_SAMPLE_RATE)))
+        count = max(0, min(limit - n_yielded, len(frames["note"])))
+        pending = [] if final else [{name: value[count:] for name, value in frames.items()}]
+        n_yielded += count
+        return {name: value[:count] for name, value in frames.items()} if count else None
+
+    for chunk in pcm_chunks:
+        samples = np.concatenate([samples, chunk])
+        n_samples += len(chunk)
+        while len(samples) >= AUDIO_N_SAMPLES:
+            pending.append(_predict_frames(model, samples[:AUDIO_N_SAMPLES]))
+            samples = samples[HOP_SIZE:]
+        block = ready_frames(False)
+        if block:
+            yield block
+
+    # Windows starting in the remaining samples are padded with silence
+    while len(samples):
+        window = np.pad(samples, (0, AUDIO_N_SAMPLES - len(samples)))
+        pending.append(_predict_frames(model, window))
+        samples = samples[HOP_SIZE:]
+    block = ready_frames(True)
+    if block:
+        yield block
+
+
+def find_quiet_cut(frames, start: int, stop: int):
+    """
+    Find where a segment of model frames can be cut without splitting a note.
+
+    Args:
+        frames (np.ndarray): Note activations of the buffered frames.
+        start (int): First frame the cut may be placed at.
+        stop (int): Last frame the cut may be placed at.
+
+    Returns:
+        int: The middle of the latest run of QUIET_FRAMES frames without any
+        activation above the frame threshold, or None if there is none.
+    """
+    quiet = frames.max(axis=1) < NOTE_PARAMS["frame_thresh"]
+    # quiet_runs[i] is True if frames i to i + QUIET_FRAMES - 1 are all quiet
+    quiet_runs = np.convolve(quiet, np.ones(QUIET_FRAMES, dtype=int), "valid") == QUIET_FRAMES
+    half = QUIET_FRAMES // 2
+    candidates = np.flatnonzero(quiet_runs[max(start - half, 0) : max(stop - half + 1, 0)])
+    if not len(candidates):
         return None
+    return int(candidates[-1]) + max(start - half, 0) + half
 
-    return file_path
 
+def frame_times(start: int, stop: int) -> np.ndarray:
+    """
+    Return the times in seconds of absolute model frames start to stop.
 
-def convert_to_midi(input_audio_path: str) -> str | None:
+    This is basic_pitch.note_creation.model_frames_to_time for a slice of
+    the frames, so segments far into a recording get the same times.
     """
-    Convert an audio file to MIDI using Basic Pitch.
+    frames = np.arange(start, stop)
+    window_offset = (FFT_HOP / AUDIO_SAMPLE_RATE) * (
+        ANNOT_N_FRAMES - (AUDIO_N_SAMPLES / FFT_HOP)
+    ) + 0.0018
+    return frames * FFT_HOP / float(AUDIO_SAMPLE_RATE) - window_offset * np.floor(
+        frames / ANNOT_N_FRAMES
+    )
+
+
+def segment_notes(output: dict, offset: int) -> list:
+    """
+    Create the note events of one segment of model frames.
 
     Args:
-        input_audio_path: Path to input audio file.
+        output (dict): The note, onset and contour matrices of the segment.
+        offset (int): Absolute index of the segment's first frame.
 
     Returns:
-        Path to generated MIDI file, or None if unsupported.
+        list: (start frame, end frame, pitch, amplitude, pitch bends) tuples
+        with absolute frame indices.
     """
-    # Prepare audio file (convert if needed, validate extension)
-    input_audio_path = validate_audio_file(input_audio_path)
-    if not input_audio_path:
+    from basic_pitch.note_creation import get_pitch_bends, output_to_notes_polyphonic
+
+    # Without any activation above the threshold no note can be found, and
+    # Basic Pitch's onset inference would divide by zero on silent segments
+    if not len(output["note"]) or output["note"].max() < NOTE_PARAMS["frame_thresh"]:
+        return []
+    notes = output_to_notes_polyphonic(
+        output["note"],
+        output["onset"],
+        onset_thresh=NOTE_PARAMS["onset_thresh"],
+        frame_thresh=NOTE_PARAMS["frame_thresh"],
+        min_note_len=NOTE_PARAMS["min_note_len"],
+        infer_onsets=True,
+        max_freq=NOTE_PARAMS["max_freq"],
+        min_freq=NOTE_PARAMS["min_freq"],
+        melodia_trick=NOTE_PARAMS["melodia_trick"],
+        energy_tol=ENERGY_TOL,
+    )
+    return [
+        (start + offset, end + offset, pitch, amplitude, bends)
+        for start, end, pitch, amplitude, bends in get_pitch_bends(output["contour"], notes)
+    ]
+
+
+def stitch_notes(held: list, notes: list, cut: int) -> list:
+    """
+    Join notes cut in two by a segment boundary inside continuous sound.
+
+    Args:
+        held (list): Notes of the previous segment ending near the cut.
+        notes (list): Notes of the next segment.
+        cut (int): Absolute frame index of the boundary.
+
+    Returns:
+        list: The notes of the next segment, with every note that continues
+        a held note of the same pitch merged into it. Held notes that are not
+        continued are returned unchanged.
+    """
+    stitched = list(notes)
+    for left in held:
+        for i, right in enumerate(stitched):
+            if right[2] == left[2] and right[0] <= cut + ENERGY_TOL:
+                left_len = left[1] - left[0]
+                right_len = right[1] - right[0]
+                # Fill the frames between the two parts with the last bend
+                gap = [left[4][-1]] * (right[0] - left[1]) if left[4] else []
+                stitched[i] = (
+                    left[0],
+                    right[1],
+                    left[2],
+                    (left[3] * left_len + right[3] * right_len) / (left_len + right_len),
+                    left[4] + gap + right[4] if left[4] and right[4] else None,
+                )
+                break
+        else:
+            stitched.append(left)
+    return stitched
+
+
+def find_note_gap(notes: list, start: int, stop: int):
+    """
+    Find where a segment can be cut between the notes found in it.
+
+    Args:
+        notes (list): Note events with frame indices relative to the segment.
+        start (int): First frame the cut may be placed at.
+        stop (int): Last frame the cut may be placed at.
+
+    Returns:
+        int: The middle of the longest stretch of frames between start and
+        stop that no note covers, or None if notes cover all of them.
+    """
+    covered = np.zeros(stop + 1, dtype=bool)
+    for note_start, note_end, *_ in notes:
+        covered[max(note_start, 0) : note_end + 1] = True
+    free = ~covered[start:]
+    if not free.any():
         return None
 
-    # Extract base name for MIDI file
-    base_name = os.path.splitext(os.path.basename(input_audio_path))[0]
+    # Boundaries of the runs of free frames, as (first, past-the-end) pairs
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], free.astype(int), [0]])))
+    runs = edges.reshape(-1, 2)
+    lengths = runs[:, 1] - runs[:, 0]
+    # The longest run, preferring the latest one
+    first, end = runs[len(lengths) - 1 - int(np.argmax(lengths[::-1]))]
+    return start + int(first + end) // 2
+
+
+def _slice_output(output: dict, start: int, stop: int) -> dict:
+    """
+    Return frames start to stop of every model output matrix.
+    """
+    return {name: value[start:stop] for name, value in output.items()}
+
+
+def iter_note_events(output_blocks, max_segment_frames: int = MAX_SEGMENT_FRAMES):
+    """
+    Create note events from a stream of model output, one segment at a time.
+
+    Each segment is cut, in order of preference, in the middle of a quiet
+    stretch no note can span, in the middle of the longest gap between the
+    notes found in it, or at max_segment_frames. Notes after the first two
+    kinds of cut are found again with the next segment; notes that run into
+    the last kind are joined with their continuation in the next segment.
+
+    Args:
+        output_blocks: Iterable of model output blocks, as iter_model_output
+            yields them.
+        max_segment_frames (int): Most model frames held at a time.
+
+    Yields:
+        tuple: (start time, end time, pitch, amplitude, pitch bends) note
+        events, as in the events returned by model_output_to_notes.
+    """
+    buffered = []
+    n_buffered = 0
+    offset = 0
+    held = []
+    # Frames a note needs after its end to be sure it has ended
+    margin = ENERGY_TOL + 1
+
+    def emit(notes):
+        for start, end, pitch, amplitude, bends in sorted(notes):
+            times = frame_times(start, end + 1)
+            yield (times[0], times[-1], pitch, amplitude, bends)
+
+    for block in output_blocks:
+        buffered.append(block)
+        n_buffered += len(block["note"])
+        while n_buffered >= max_segment_frames:
+            output = {name: np.concatenate([b[name] for b in buffered]) for name in block}
+            segment = _slice_output(output, 0, max_segment_frames)
+            lowest_cut = max_segment_frames // 2
+            cut = find_quiet_cut(segment["note"], lowest_cut, max_segment_frames)
+            if cut is not None:
+                notes = segment_notes(_slice_output(output, 0, cut), offset)
+            else:
+                notes = segment_notes(segment, offset)
+                relative = [(start - offset, end - offset) for start, end, *_ in notes]
+                cut = find_note_gap(relative, lowest_cut, max_segment_frames - margin)
+                if cut is not None:
+                    notes = [note for note in notes if note[0] < offset + cut]
+
+            if held:
+                notes = stitch_notes(held, notes, offset)
+                held = []
+            if cut is None:
+                # Notes that may continue past a cut inside continuous sound
+                # are held until the next segment has been processed
+                cut = max_segment_frames
+                notes = segment_notes(segment, offset)
+                boundary = offset + cut - margin
+                held = [note for note in notes if note[1] >= boundary]
+                notes = [note for note in notes if note[1] < boundary]
+            yield from emit(notes)
+
+            buffered = [_slice_output(output, cut, None)]
+            n_buffered -= cut
+            offset += cut
+
+    if buffered:
+        output = {name: np.concatenate([b[name] for b in buffered]) for name in buffered[0]}
+        notes = segment_notes(output, offset)
+        yield from emit(stitch_notes(held, notes, offset) if held else notes)
+
+
+def convert_stream_to_midi(
+    pcm_chunks, max_segment_frames: int = MAX_SEGMENT_FRAMES, transcriber=None
+) -> bytes:
+    """
+    Convert a stream of samples to MIDI.
+
+    With Basic Pitch, memory use is bounded by the segment size.
+
+    Args:
+        pcm_chunks: Iterable of mono float32 sample chunks at AUDIO_SAMPLE_RATE.
+        max_segment_frames (int): Most model frames held at a time.
+        transcriber (Transcriber): The transcriber to use, defaults to the
+            configured one.
+
+    Returns:
+        bytes: The generated MIDI file.
+    """
+    transcriber = transcriber or get_transcriber()
+    # Analyse the key and tempo as the samples stream past the transcriber
+    analyzer = AudioAnalyzer(AUDIO_SAMPLE_RATE)
+    note_events = transcriber.transcribe_stream(analyzer.tap(pcm_chunks), max_segment_frames)
+    return note_events_to_bytes(note_events, analyzer.finish())
+
+
+class Transcriber:
+    """
+    Turns decoded samples into note events.
+
+    Attributes:
+        name (str): Name the transcriber is selected by.
+        params (dict): Everything that changes the notes found in the same
+            samples, used in conversion cache keys.
+        stream_params (dict): The same for streamed conversions.
+    """
+
+    name = None
+    params = None
+    stream_params = None
+
+    def transcribe(self, pcm) -> list:
+        """
+        Find the notes of decoded samples.
+
+        Args:
+            pcm (np.ndarray): Mono float32 samples at AUDIO_SAMPLE_RATE.
+
+        Returns:
+            list: (start time, end time, pitch, amplitude, pitch bends) note
+            events, as returned by model_output_to_notes.
+        """
+        raise NotImplementedError
+
+    def transcribe_stream(self, pcm_chunks, max_segment_frames: int = MAX_SEGMENT_FRAMES) -> list:
+        """
+        Find the notes of a stream of samples.
+
+        Transcribers that cannot stream join the chunks and transcribe them
+        at once, ignoring max_segment_frames.
+
+        Args:
+            pcm_chunks: Iterable of mono float32 sample chunks.
+            max_segment_frames (int): Most model frames held at a time.
+
+        Returns:
+            list: The note events, as returned by transcribe.
+        """
+        chunks = list(pcm_chunks)
+        pcm = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+        return self.transcribe(pcm)
+
+
+class BasicPitchTranscriber(Transcriber):
+    """
+    Transcribes with the Basic Pitch model, batching windows through the
+    inference scheduler when it is enabled.
+    """
+
+    name = "basic_pitch"
+    params = CONVERSION_PARAMS
+    stream_params = STREAM_CONVERSION_PARAMS
+
+    def transcribe(self, pcm) -> list:
+        from basic_pitch.note_creation import model_output_to_notes
+
+        model = get_inference_model()
+        with model_manager.timed_inference():
+            # Hand the scheduler a full batch of this recording's windows at once
+            model_output = run_pcm_inference(pcm, model, inference_scheduler.batch_size)
+        _, note_events = model_output_to_notes(model_output, **NOTE_PARAMS)
+        return note_events
+
+    def transcribe_stream(self, pcm_chunks, max_segment_frames: int = MAX_SEGMENT_FRAMES) -> list:
+        model = get_inference_model()
+        with model_manager.timed_inference():
+            return list(
+                iter_note_events(iter_model_output(pcm_chunks, model), max_segment_frames)
+            )
+
+
+class DSPTranscriber(Transcriber):
+    """
+    Transcribes a single melody line with NumPy signal processing only.
+    """
+
+    name = "dsp"
+    params = DSP_CONVERSION_PARAMS
+    stream_params = DSP_CONVERSION_PARAMS
 
-    # Run pitch prediction
-    _, midi_data, _ = predict(input_audio_path)
+    def transcribe(self, pcm) -> list:
+        return dsp_transcription.transcribe(pcm, AUDIO_SAMPLE_RATE)
 
-    # Save MIDI file
-    midi_path = os.path.join(MIDI_OUTPUT_DIR, base_name + ".mid")
-    midi_data.write(midi_path)
 
-    return midi_path
+TRANSCRIBERS = {
+    transcriber.name: transcriber
+    for transcriber in (BasicPitchTranscriber(), DSPTranscriber())
+}
+
+
+def get_transcriber(name: str | None = None) -> Transcriber:
+    """
+    Return a transcriber by name.
+
+    Args:
+        name (str): "basic_pitch" or "dsp", defaults to DEFAULT_TRANSCRIBER.
+
+    Returns:
+        Transcriber: The shared transcriber of that name.
+
+    Raises:
+        ValueError: If there is no transcriber of that name.
+    """
+    try:
+        return TRANSCRIBERS[name or DEFAULT_TRANSCRIBER]
+    except KeyError:
+        raise ValueError("Unknown transcriber") from None
+
+
+def convert_to_midi(audio, filename: str = "") -> bytes | None:
+    """
+    Convert audio to MIDI using the configured transcriber.
+
+    The audio is decoded and converted in a stream, so memory use does not
+    grow with the length of the recording, and nothing is written to disk
+    (see iter_stream_chunks for the exceptions).
+
+    Args:
+        audio: Path to an audio file, the audio file as bytes, or a binary
+            file-like object such as BytesIO.
+        filename (str): Original name of in-memory audio, used for its
+            extension.
+
+    Returns:
+        bytes: The MIDI file, or None if the audio cannot be decoded.
+    """
+    if isinstance(audio, (str, os.PathLike)):
+        name = os.fspath(audio)
+        pcm_chunks = stream_audio(name)
+    else:
+        name = filename or "audio stream"
+        if isinstance(audio, (bytes, bytearray, memoryview)):
+            audio = BytesIO(audio)
+        pcm_chunks = iter_stream_chunks(audio, filename, AUDIO_SAMPLE_RATE)
+
+    try:
+        return convert_stream_to_midi(pcm_chunks)
+    except AudioDecodeError as e:
+        print(f"Unsupported audio file {name}: {e}")
+        return None
@@ -0,0 +1,278 @@
+################################################################################
+# Filename: conversion_cache.py
+# Purpose:  Cache conversion results keyed on the decoded audio content.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains the ConversionCache class, a content-addressed on-disk
+# cache of MIDI and MusicXML conversion results. Entries are keyed on the
+# SHA-256 of the decoded PCM samples together with the conversion parameters,
+# so the same recording uploaded twice (even in a different container format)
+# skips Basic Pitch and music21 entirely. The cache is bounded in size and
+# evicts the least recently used entries first.
+#
+# Usage (Optional):
+#   key = conversion_cache.make_key(pcm, CONVERSION_PARAMS)
+#   cached = conversion_cache.get(key)
+#   if cached is None:
+#       conversion_cache.put(key, midi_data, xml_data)
+#
+# Notes:
+# - The cache directory is read from CONVERSION_CACHE_DIR and its size cap,
+#   in bytes, from CONVERSION_CACHE_MAX_BYTES (0 disables the cache).
+# - Entries are written atomically, so gunicorn workers can share a directory.
+#   Hit and miss counters are kept per process.
+# - The total size is tracked in memory, seeded from the directory on the
+#   first put, so the directory is only scanned when an entry is evicted.
+#   Each process counts its own writes and rescans when over the cap.
+#
+###############################################################################
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+
+import numpy as np
+
+ENTRY_EXTENSION = ".entry"
+# Entry layout: 8-byte big-endian MIDI length, MIDI bytes, MusicXML bytes
+HEADER = struct.Struct(">Q")
+
+
+class ConversionCache:
+    """
+    Size-capped, least-recently-used on-disk cache of conversion results.
+
+    Attributes:
+        directory (str): Directory holding the cache entries.
+        max_bytes (int): Maximum total size of the entries, 0 to disable.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that were not in the cache.
+        evictions (int): Number of entries evicted to respect max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # Total size of the entries, seeded from the directory on first put
+        self._size_bytes = None
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether the cache stores and returns entries.
+        """
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(pcm, params: dict) -> str:
+        """
+        Build the cache key of a decoded recording and conversion parameters.
+
+        Args:
+            pcm (np.ndarray): Decoded audio samples.
+            params (dict): Parameters that influence the conversion output.
+
+        Returns:
+            str: Hex SHA-256 digest identifying the conversion.
+        """
+        return ConversionCache.make_stream_key([pcm], params)
+
+    @staticmethod
+    def make_stream_key(pcm_chunks, params: dict) -> str:
+        """
+        Build the cache key of a recording decoded chunk by chunk.
+
+        The key equals make_key of the concatenated samples, but only one
+        chunk is held at a time.
+
+        Args:
+            pcm_chunks: Iterable of decoded sample chunks of one dtype.
+            params (dict): Parameters that influence the conversion output.
+
+        Returns:
+            str: Hex SHA-256 digest identifying the conversion.
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        dtype = None
+        for chunk in pcm_chunks:
+            if dtype is None:
+                dtype = chunk.dtype
+                digest.update(str(dtype).encode("utf-8"))
+            digest.update(memoryview(np.ascontiguousarray(chunk)).cast("B"))
+        if dtype is None:
+            digest.update(str(np.dtype(np.float32)).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        """
+        Return the path of the entry for a key.
+        """
+        return os.path.join(self.directory, key + ENTRY_EXTENSION)
+
+    def get(self, key: str):
+        """
+        Look up a conversion result, marking it as recently used.
+
+        Args:
+            key (str): The cache key from make_key.
+
+        Returns:
+            tuple: The MIDI and MusicXML bytes, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+
+        path = self._entry_path(key)
+        try:
+            with open(path, "rb") as entry_file:
+                entry = entry_file.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        (midi_length,) = HEADER.unpack_from(entry)
+        midi_end = HEADER.size + midi_length
+        return entry[HEADER.size : midi_end], entry[midi_end:]
+
+    def put(self, key: str, midi_data: bytes, xml_data: bytes):
+        """
+        Store a conversion result and evict old entries above the size cap.
+
+        Args:
+            key (str): The cache key from make_key.
+            midi_data (bytes): The converted MIDI file.
+            xml_data (bytes): The converted MusicXML file.
+        """
+        if not self.enabled:
+            return
+
+        entry_size = HEADER.size + len(midi_data) + len(xml_data)
+        if entry_size > self.max_bytes:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._entry_path(key)
+        try:
+            replaced_size = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced_size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as entry_file:
+                entry_file.write(HEADER.pack(len(midi_data)))
+                entry_file.write(midi_data)
+                entry_file.write(xml_data)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self._lock:
+            if self._size_bytes is None:
+                self._size_bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self._size_bytes += entry_size - replaced_size
+            over_limit = self._size_bytes > self.max_bytes
+        if over_limit:
+            self._evict()
+
+    def _entries(self):
+        """
+        Return (mtime, size, path) of every entry, least recently used first.
+        """
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return entries
+        for name in names:
+            if not name.endswith(ENTRY_EXTENSION):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def _evict(self):
+        """
+        Remove least recently used entries until the cache fits max_bytes.
+
+        The directory is scanned again, which also corrects the tracked size
+        for entries written or removed by other processes.
+        """
+        entries = self._entries()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            with self._lock:
+                self.evictions += 1
+        with self._lock:
+            self._size_bytes = total_size
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._size_bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Return the counters and current size of the cache.
+
+        The hit, miss and eviction counters are those of this process only,
+        identified by pid; other workers sharing the directory keep their
+        own. The entries and their size are those on disk.
+
+        Returns:
+            dict: Hit, miss and eviction counters and the on-disk usage.
+        """
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "pid": os.getpid(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "size_bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+
+# Shared cache used by the MIDI controller of this process
+conversion_cache = ConversionCache(
+    os.environ.get("CONVERSION_CACHE_DIR", "./app/utils/conversion_cache"),
+    int(os.environ.get("CONVERSION_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+)
@@ -0,0 +1,322 @@
+################################################################################
+# Filename: dsp_transcription.py
+# Purpose:  Transcribe a monophonic melody to note events with NumPy only.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains a signal-processing transcriber that needs nothing but
+# NumPy, as a lightweight alternative to the Basic Pitch model. It follows the
+# approach of the research scripts (YIN pitch tracking, onsets, segmentation)
+# with every step vectorized over frames:
+#   1. YIN pitch tracking. The difference function is computed from batched
+#      FFT autocorrelations, a block of frames at a time, and voicing is
+#      scored pYIN-style by how many thresholds of a beta prior find a dip.
+#   2. Onset detection from the positive spectral flux of the log magnitude
+#      spectrogram, with peaks picked against a moving average.
+#   3. Note segmentation. Voiced frames are split into notes at onsets and at
+#      changes of the smoothed semitone, and notes that are too short are
+#      dropped.
+#
+# Usage (Optional):
+#   from app.utils.dsp_transcription import transcribe
+#   note_events = transcribe(pcm, 22050)
+#
+# Notes:
+# - Only a single melody line is transcribed, as sung or hummed recordings
+#   are; chords yield their strongest pitch.
+# - Frames use the same hop as Basic Pitch (256 samples at 22050 Hz).
+#
+###############################################################################
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+FRAME_LENGTH = 1024
+HOP_LENGTH = 256
+# Pitch range: C2 to C7
+FMIN = 65.41
+FMAX = 2093.0
+
+# pYIN-style voicing: YIN thresholds weighted by a beta(2, 18) prior
+YIN_THRESHOLDS = np.linspace(0.01, 0.5, 50)
+BETA_PRIOR = YIN_THRESHOLDS * (1 - YIN_THRESHOLDS) ** 17
+BETA_PRIOR = BETA_PRIOR / BETA_PRIOR.sum()
+VOICED_PROBABILITY = 0.5
+# Frames quieter than this, relative to the loudest frame, are unvoiced
+SILENCE_DB = -40.0
+
+# Onset detection
+ONSET_N_FFT = 2048
+ONSET_PEAK_RADIUS = 3
+ONSET_AVERAGE_RADIUS = 10
+ONSET_DELTA = 0.07
+
+# Segmentation
+MEDIAN_FRAMES = 5
+MIN_NOTE_FRAMES = 8
+
+# Frames analysed per FFT batch, which bounds memory on long recordings
+BLOCK_FRAMES = 64
+
+
+def frame_signal(pcm, frame_length: int, hop_length: int = HOP_LENGTH) -> np.ndarray:
+    """
+    Cut samples into overlapping frames without copying them.
+
+    The signal is padded with frame_length // 2 zeros on both sides, so
+    frame i is centered on sample i * hop_length.
+
+    Args:
+        pcm (np.ndarray): Mono samples.
+        frame_length (int): Samples per frame.
+        hop_length (int): Samples between the starts of consecutive frames.
+
+    Returns:
+        np.ndarray: A read-only (n_frames, frame_length) view.
+    """
+    padded = np.pad(np.asarray(pcm, dtype=np.float32), frame_length // 2)
+    if len(padded) < frame_length:
+        padded = np.pad(padded, (0, frame_length - len(padded)))
+    return sliding_window_view(padded, frame_length)[::hop_length]
+
+
+def fast_fft_length(n: int) -> int:
+    """
+    Return the smallest length of at least n of the form 2^k, 3 * 2^k or
+    5 * 2^k, which the FFT computes nearly as fast as a power of two.
+    """
+    return min(m << max(int(np.ceil(np.log2(n / m))), 0) for m in (1, 3, 5))
+
+
+def cumulative_mean_normalized_difference(frames, max_lag: int) -> np.ndarray:
+    """
+    Compute YIN's cumulative mean normalized difference for every frame.
+
+    The difference d(tau) = sum_j (x[j] - x[j + tau]) ** 2 over the first
+    frame_length - max_lag samples is expanded into energies and an
+    autocorrelation, and the autocorrelations of all frames come from one
+    batched real FFT.
+
+    Args:
+        frames (np.ndarray): (n_frames, frame_length) samples.
+        max_lag (int): Largest lag computed.
+
+    Returns:
+        np.ndarray: (n_frames, max_lag + 1) normalized differences.
+    """
+    window = frames.shape[1] - max_lag
+    n_fft = fast_fft_length(frames.shape[1] + window)
+    spectrum = np.fft.rfft(frames, n_fft)
+    head = np.fft.rfft(frames[:, :window], n_fft)
+    # r[tau] = sum_j x[j] * x[j + tau] for j < window
+    correlation = np.fft.irfft(spectrum * np.conj(head), n_fft)[:, : max_lag + 1]
+
+    squares = np.cumsum(np.pad(frames.astype(np.float64) ** 2, ((0, 0), (1, 0))), axis=1)
+    lags = np.arange(max_lag + 1)
+    # Energy of x[tau : tau + window] for every lag
+    shifted_energy = squares[:, window : window + max_lag + 1] - squares[:, : max_lag + 1]
+    difference = shifted_energy[:, :1] + shifted_energy - 2 * correlation
+    difference[:, 0] = 0
+
+    cumulative = np.cumsum(difference[:, 1:], axis=1)
+    normalized = np.ones_like(difference)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        normalized[:, 1:] = difference[:, 1:] * lags[1:] / cumulative
+    normalized[~np.isfinite(normalized)] = 1
+    return normalized
+
+
+def yin(pcm, sample_rate: int, fmin: float = FMIN, fmax: float = FMAX):
+    """
+    Track the fundamental frequency of every frame.
+
+    Args:
+        pcm (np.ndarray): Mono samples.
+        sample_rate (int): Sample rate of pcm.
+        fmin (float): Lowest frequency tracked, in Hz.
+        fmax (float): Highest frequency tracked, in Hz.
+
+    Returns:
+        tuple: The frequency of each frame in Hz, and the probability, from 0
+        to 1, that the frame is voiced.
+    """
+    min_lag = int(np.floor(sample_rate / fmax))
+    max_lag = int(np.ceil(sample_rate / fmin))
+    frames = frame_signal(pcm, FRAME_LENGTH + max_lag)
+    candidates = np.concatenate(
+        [
+            cumulative_mean_normalized_difference(frames[i : i + BLOCK_FRAMES], max_lag)[
+                :, min_lag:max_lag
+            ].astype(np.float32)
+            for i in range(0, len(frames), BLOCK_FRAMES)
+        ]
+    )
+
+    # Voicing: the prior weight of the thresholds the deepest dip falls under
+    deepest = candidates.min(axis=1)
+    voiced_probability = (deepest[:, None] < YIN_THRESHOLDS) @ BETA_PRIOR
+
+    # The first dip under the prior's mean threshold, followed to its minimum:
+    # the first lag under the threshold where the difference stops falling
+    threshold = YIN_THRESHOLDS @ BETA_PRIOR
+    falling_stops = np.zeros_like(candidates, dtype=bool)
+    falling_stops[:, :-1] = candidates[:, :-1] <= candidates[:, 1:]
+    dips = (candidates < threshold) & falling_stops
+    lag = np.where(dips.any(axis=1), dips.argmax(axis=1), candidates.argmin(axis=1))
+
+    # Parabolic interpolation around the chosen lag
+    rows = np.arange(len(lag))
+    inner = np.clip(lag, 1, candidates.shape[1] - 2)
+    left, center, right = (candidates[rows, inner + k] for k in (-1, 0, 1))
+    curvature = left - 2 * center + right
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shift = np.where(np.abs(curvature) > 1e-12, 0.5 * (left - right) / curvature, 0)
+    refined = inner + np.clip(shift, -1, 1) + min_lag
+
+    return sample_rate / refined, voiced_probability
+
+
+def frame_rms(pcm) -> np.ndarray:
+    """
+    Return the root mean square level of every frame.
+    """
+    frames = frame_signal(pcm, FRAME_LENGTH)
+    return np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+
+
+def onset_strength(pcm) -> np.ndarray:
+    """
+    Return the positive spectral flux of every frame.
+
+    Args:
+        pcm (np.ndarray): Mono samples.
+
+    Returns:
+        np.ndarray: Onset strength, scaled to a maximum of 1.
+    """
+    frames = frame_signal(pcm, ONSET_N_FFT)
+    window = np.hanning(ONSET_N_FFT)
+    flux = np.empty(len(frames))
+    previous = None
+    for i in range(0, len(frames), BLOCK_FRAMES):
+        magnitude = np.abs(np.fft.rfft(frames[i : i + BLOCK_FRAMES] * window, axis=1))
+        log_magnitude = np.log1p(100 * magnitude)
+        if previous is None:
+            previous = log_magnitude[:1]
+        rise = np.diff(log_magnitude, axis=0, prepend=previous)
+        flux[i : i + len(log_magnitude)] = np.maximum(rise, 0).sum(axis=1)
+        previous = log_magnitude[-1:]
+    peak = flux.max()
+    return flux / peak if peak > 0 else flux
+
+
+def pick_onsets(strength) -> np.ndarray:
+    """
+    Pick the frames where the onset strength peaks above its local average.
+
+    Args:
+        strength (np.ndarray): Onset strength of every frame.
+
+    Returns:
+        np.ndarray: Boolean mask of onset frames.
+    """
+    padded = np.pad(strength, ONSET_PEAK_RADIUS, mode="edge")
+    local_max = sliding_window_view(padded, 2 * ONSET_PEAK_RADIUS + 1).max(axis=1)
+    padded = np.pad(strength, ONSET_AVERAGE_RADIUS, mode="edge")
+    local_mean = sliding_window_view(padded, 2 * ONSET_AVERAGE_RADIUS + 1).mean(axis=1)
+    return (strength == local_max) & (strength > local_mean + ONSET_DELTA)
+
+
+def median_filter(values, width: int = MEDIAN_FRAMES) -> np.ndarray:
+    """
+    Apply a centered running median, repeating the edge values.
+    """
+    padded = np.pad(values, width // 2, mode="edge")
+    return np.median(sliding_window_view(padded, width), axis=1)
+
+
+def segment_notes(midi_pitch, voiced, onsets, level, min_note_frames: int = MIN_NOTE_FRAMES):
+    """
+    Split a pitch track into notes.
+
+    A note starts at every voiced frame that follows an unvoiced one, carries
+    an onset, or moves to another semitone than the frame before it.
+
+    Args:
+        midi_pitch (np.ndarray): Smoothed pitch of every frame, in MIDI notes.
+        voiced (np.ndarray): Boolean mask of voiced frames.
+        onsets (np.ndarray): Boolean mask of onset frames.
+        level (np.ndarray): Loudness of every frame, from 0 to 1.
+        min_note_frames (int): Shortest note kept, in frames.
+
+    Returns:
+        list: (start frame, end frame, MIDI note, amplitude) tuples.
+    """
+    semitone = np.round(midi_pitch).astype(int)
+    previous_voiced = np.concatenate([[False], voiced[:-1]])
+    previous_semitone = np.concatenate([[-1], semitone[:-1]])
+    starts = voiced & (~previous_voiced | onsets | (semitone != previous_semitone))
+
+    # Number the notes and collect each one's frames
+    note_ids = np.cumsum(starts) - 1
+    frames = np.flatnonzero(voiced)
+    ids = note_ids[frames]
+    boundaries = np.flatnonzero(np.diff(ids)) + 1
+    first = np.concatenate([[0], boundaries])
+    counts = np.diff(np.concatenate([first, [len(frames)]]))
+
+    notes = []
+    if not len(frames):
+        return notes
+    pitch_sums = np.add.reduceat(midi_pitch[frames], first)
+    level_sums = np.add.reduceat(level[frames], first)
+    for index, count, pitch_sum, level_sum in zip(first, counts, pitch_sums, level_sums):
+        if count < min_note_frames:
+            continue
+        start = frames[index]
+        notes.append(
+            (
+                int(start),
+                int(start + count),
+                int(np.round(pitch_sum / count)),
+                float(level_sum / count),
+            )
+        )
+    return notes
+
+
+def transcribe(pcm, sample_rate: int) -> list:
+    """
+    Transcribe the melody of a recording to note events.
+
+    Args:
+        pcm (np.ndarray): Mono float32 samples.
+        sample_rate (int): Sample rate of pcm.
+
+    Returns:
+        list: (start time, end time, MIDI note, amplitude, None) note events,
+        in the format of Basic Pitch's note events (without pitch bends).
+    """
+    if not len(pcm):
+        return []
+
+    frequency, voiced_probability = yin(pcm, sample_rate)
+    rms = frame_rms(pcm)
+    strength = onset_strength(pcm)
+    n_frames = min(len(frequency), len(rms), len(strength))
+    frequency, voiced_probability = frequency[:n_frames], voiced_probability[:n_frames]
+    rms, strength = rms[:n_frames], strength[:n_frames]
+
+    with np.errstate(divide="ignore"):
+        level_db = 20 * np.log10(np.maximum(rms, 1e-10) / max(rms.max(), 1e-10))
+    voiced = (voiced_probability >= VOICED_PROBABILITY) & (level_db > SILENCE_DB)
+    # Smooth octave errors and vibrato over a few frames
+    midi_pitch = median_filter(69 + 12 * np.log2(frequency / 440.0))
+    level = np.clip(1 + level_db / -SILENCE_DB, 0, 1)
+
+    notes = segment_notes(midi_pitch, voiced, pick_onsets(strength), level)
+    seconds_per_frame = HOP_LENGTH / sample_rate
+    return [
+        (start * seconds_per_frame, end * seconds_per_frame, pitch, amplitude, None)
+        for start, end, pitch, amplitude in notes
+    ]
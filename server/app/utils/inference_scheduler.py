@@ -0,0 +1,227 @@
+################################################################################
+# Filename: inference_scheduler.py
+# Purpose:  Batch model windows from concurrent conversions (dynamic batching).
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains the InferenceScheduler class. Conversions running on
+# different threads of a worker process (gunicorn threads, job workers) hand
+# their audio windows to the scheduler instead of calling the model one window
+# at a time. A dispatcher thread collects the queued windows into batches of a
+# fixed size, waiting at most a configurable time for a batch to fill, runs the
+# Basic Pitch model once per batch and sends each window's output back to the
+# conversion that submitted it. Throughput, batch fill and the time windows
+# spend queued are recorded so the batch size and wait can be tuned against
+# the latency of create_midi.
+#
+# Usage (Optional):
+#   from app.utils.inference_scheduler import inference_scheduler
+#   if inference_scheduler.enabled:
+#       output = inference_scheduler.predict(windows)
+#
+# Notes:
+# - The batch size is read from INFERENCE_BATCH_SIZE (default 1, which
+#   disables the scheduler) and the longest wait for a batch to fill, in
+#   milliseconds, from INFERENCE_MAX_WAIT_MS (default 10).
+# - Partial batches are padded with silent windows, so the model always sees
+#   the same input shape and TensorFlow never retraces its graph.
+# - The dispatcher thread is started on the first window, which keeps it out
+#   of the gunicorn master when the application is preloaded.
+#
+###############################################################################
+
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+# Number of recent queueing latencies kept for the percentiles
+LATENCY_SAMPLES = 1024
+
+
+class InferenceScheduler:
+    """
+    Runs model windows submitted by concurrent threads in fixed-size batches.
+
+    Attributes:
+        batch_size (int): Number of windows per model call.
+        max_wait (float): Longest time, in seconds, the first window of a
+            batch waits for the batch to fill.
+        window_count (int): Number of windows run.
+        batch_count (int): Number of model calls.
+        padded_count (int): Number of silent windows added to fill batches.
+        total_model_time (float): Seconds spent in model calls.
+    """
+
+    def __init__(self, get_model, batch_size=1, max_wait=0.01):
+        self._get_model = get_model
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._dispatcher = None
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.window_count = 0
+        self.batch_count = 0
+        self.padded_count = 0
+        self.total_model_time = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether windows are batched; with a batch size of 1 they are not.
+        """
+        return self.batch_size > 1
+
+    def _ensure_dispatcher(self):
+        """
+        Start the dispatcher thread if it is not running in this process.
+        """
+        with self._lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch, name="inference-dispatcher", daemon=True
+                )
+                self._dispatcher.start()
+
+    def submit(self, window) -> Future:
+        """
+        Queue one window for the next batch.
+
+        Args:
+            window (np.ndarray): Model input of shape (AUDIO_N_SAMPLES, 1).
+
+        Returns:
+            Future: Resolves to a dict of the window's note, onset and contour
+            outputs, without the batch axis.
+        """
+        self._ensure_dispatcher()
+        future = Future()
+        self._queue.put((window, future, time.perf_counter()))
+        return future
+
+    def predict(self, x) -> dict:
+        """
+        Run windows through the model as part of shared batches.
+
+        This has the same contract as basic_pitch.inference.Model.predict, so
+        it can be used in its place.
+
+        Args:
+            x (np.ndarray): Windows of shape (n, AUDIO_N_SAMPLES, 1).
+
+        Returns:
+            dict: The note, onset and contour outputs, each with n rows.
+        """
+        futures = [self.submit(window) for window in x]
+        outputs = [future.result() for future in futures]
+        return {name: np.stack([output[name] for output in outputs]) for name in outputs[0]}
+
+    def _next_batch(self) -> list:
+        """
+        Wait for a window, then collect more until the batch is full or the
+        first window has waited max_wait.
+        """
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch(self):
+        """
+        Dispatcher loop: run batches until the process exits.
+        """
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            padding = self.batch_size - len(batch)
+            try:
+                windows = np.stack([window for window, _, _ in batch])
+                if padding:
+                    windows = np.concatenate(
+                        [windows, np.zeros((padding,) + windows.shape[1:], dtype=windows.dtype)]
+                    )
+                output = self._get_model().predict(windows)
+                rows = [
+                    {name: value[i] for name, value in output.items()}
+                    for i in range(len(batch))
+                ]
+            except Exception as e:
+                # Fail the callers of this batch, never the dispatcher itself
+                traceback.print_exc()
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - started
+
+            with self._lock:
+                self.window_count += len(batch)
+                self.batch_count += 1
+                self.padded_count += padding
+                self.total_model_time += elapsed
+                self._latencies.extend(started - queued for _, _, queued in batch)
+            for (_, future, _), row in zip(batch, rows):
+                future.set_result(row)
+
+    def stats(self) -> dict:
+        """
+        Return the batching statistics of this process.
+
+        Returns:
+            dict: Configuration, batch fill, throughput and queueing latency.
+        """
+        with self._lock:
+            latencies = np.array(self._latencies)
+            window_count = self.window_count
+            batch_count = self.batch_count
+            padded_count = self.padded_count
+            total_model_time = self.total_model_time
+
+        def percentile(q):
+            return float(np.percentile(latencies, q)) if len(latencies) else None
+
+        return {
+            "enabled": self.enabled,
+            "batch_size": self.batch_size,
+            "max_wait": self.max_wait,
+            "queued": self._queue.qsize(),
+            "window_count": window_count,
+            "batch_count": batch_count,
+            "padded_count": padded_count,
+            "average_batch_fill": window_count / batch_count if batch_count else None,
+            "total_model_time": total_model_time,
+            # Windows per second of model time
+            "throughput": window_count / total_model_time if total_model_time else None,
+            "queue_latency_p50": percentile(50),
+            "queue_latency_p99": percentile(99),
+            "queue_latency_max": float(latencies.max()) if len(latencies) else None,
+        }
+
+
+def _get_shared_model():
+    """
+    Return the warm model of this process.
+    """
+    from app.utils.model_manager import model_manager
+
+    return model_manager.get_model()
+
+
+# Shared scheduler used by the conversion helpers of this process
+inference_scheduler = InferenceScheduler(
+    _get_shared_model,
+    int(os.environ.get("INFERENCE_BATCH_SIZE", "1")),
+    float(os.environ.get("INFERENCE_MAX_WAIT_MS", "10")) / 1000,
+)
@@ -0,0 +1,118 @@
+################################################################################
+# Filename: job_queue.py
+# Purpose:  Run conversion jobs on a local pool of background worker threads.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains the JobQueue class, a small in-process queue drained by a
+# fixed number of daemon worker threads. Request handlers submit a callable and
+# return immediately, while the workers run the callables one after another.
+# The queue itself only holds work; job state is persisted by the callables.
+#
+# Usage (Optional):
+#   from app.utils.job_queue import job_queue
+#   job_queue.submit(run_job, app, job_id)
+#
+# Notes:
+# - Worker threads are started on the first submit, which keeps them out of
+#   the gunicorn master when the application is preloaded.
+# - The number of workers per process is read from JOB_WORKERS (default 1).
+# - A gunicorn worker that is stopped or recycled waits for its queued jobs
+#   in the worker_exit hook (see gunicorn.conf.py) before it exits.
+#
+###############################################################################
+
+import os
+import queue
+import threading
+import time
+import traceback
+
+
+class JobQueue:
+    """
+    In-process FIFO queue with a pool of worker threads.
+
+    Attributes:
+        num_workers (int): Number of worker threads draining the queue.
+    """
+
+    def __init__(self, num_workers=1):
+        self.num_workers = num_workers
+        self._queue = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def _ensure_workers(self):
+        """
+        Start the worker threads if they are not running in this process.
+        """
+        with self._lock:
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            while len(self._workers) < self.num_workers:
+                worker = threading.Thread(
+                    target=self._work,
+                    name=f"job-worker-{len(self._workers)}",
+                    daemon=True,
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self):
+        """
+        Worker loop: run queued callables until the process exits.
+        """
+        while True:
+            func, args = self._queue.get()
+            try:
+                func(*args)
+            except Exception:
+                # The callable is responsible for recording its own failure;
+                # never let one job take down the worker thread.
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+    def submit(self, func, *args):
+        """
+        Queue a callable to be run by a worker thread.
+
+        Args:
+            func (callable): The function to run.
+            *args: Positional arguments passed to the function.
+        """
+        self._ensure_workers()
+        self._queue.put((func, args))
+
+    def pending(self) -> int:
+        """
+        Return the approximate number of callables waiting to run.
+        """
+        return self._queue.qsize()
+
+    def join(self, timeout: float | None = None) -> bool:
+        """
+        Block until every submitted callable has been run.
+
+        Args:
+            timeout (float): Seconds to wait at most, or None to wait for as
+                long as it takes.
+
+        Returns:
+            bool: Whether every callable was run before the timeout.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                if deadline is None:
+                    self._queue.all_tasks_done.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+
+# Shared queue used by the job controller of this process
+job_queue = JobQueue(int(os.environ.get("JOB_WORKERS", "1")))
@@ -1,46 +1,99 @@
 ################################################################################
-# Filename: midi_to_xml.py
+# Filename: midi_to_musicxml.py
 # Purpose:  Convert MIDI file to MusicXML for sheet music.
 # Author:   Darren Seubert
 #
 # Description:
-# This script converts a MIDI file into a MusicXML file suitable for sheet music
-# using the music21 library.
+# This script converts a MIDI file into a MusicXML document suitable for sheet
+# music, in memory: MIDI data goes in and MusicXML bytes come out.
+# Single-line melodies are rendered by the lightweight renderer in
+# musicxml_renderer.py; everything else, such as chords or several voices, is
+# converted with the music21 library on the worker processes of
+# musicxml_pool.py, so music21 is not imported by the server itself.
 #
 # Usage:
-# Run this script with the path to the MIDI file as an argument.
+#   xml_data = midi_to_musicxml(midi_data)
+#   xml_data = midi_to_musicxml(pretty_midi.PrettyMIDI("take.mid"))
 # Ensure that the music21 library is installed in your Python environment.
 #
+# Notes:
+# - MUSICXML_RENDERER selects the renderer: "auto" (the default) tries the
+#   lightweight renderer first, "music21" always uses music21.
+# - See musicxml_pool.py for the settings of the music21 workers.
+#
 ################################################################################
 
 import os
-from music21 import converter
+from io import BytesIO
+import mido
+import pretty_midi
+from app.utils import musicxml_renderer
+from app.utils.musicxml_pool import musicxml_pool
+
+MUSICXML_RENDERER = os.environ.get("MUSICXML_RENDERER", "auto")
 
+# Everything that changes the MusicXML rendered from the same MIDI file.
+# Bump "version" whenever the rendering itself changes.
+MUSICXML_PARAMS = {"version": 1, "renderer": MUSICXML_RENDERER}
 
-def midi_to_musicxml(midi_file):
+
+def read_midi_data(midi) -> bytes:
     """
-    Convert MIDI file to MusicXML format.
+    Return the bytes of a MIDI file given in any supported form.
 
     Args:
-        midi_file (str): The path to the MIDI file.
+        midi: The MIDI file as bytes, a binary file-like object such as
+            BytesIO, a pretty_midi.PrettyMIDI or mido.MidiFile object, or a
+            path.
 
     Returns:
-        str: The path to the generated MusicXML file.
+        bytes: The raw MIDI data.
+    """
+    if isinstance(midi, (bytes, bytearray, memoryview)):
+        return bytes(midi)
+    if isinstance(midi, (str, os.PathLike)):
+        with open(midi, "rb") as midi_file:
+            return midi_file.read()
+    if hasattr(midi, "read"):
+        return midi.read()
+
+    midi_file = BytesIO()
+    if isinstance(midi, pretty_midi.PrettyMIDI):
+        midi.write(midi_file)
+    elif isinstance(midi, mido.MidiFile):
+        midi.save(file=midi_file)
+    else:
+        raise TypeError(f"Cannot read MIDI data from {type(midi).__name__}")
+    return midi_file.getvalue()
+
+
+def midi_to_musicxml(midi, timeout: float | None = None) -> bytes:
+    """
+    Convert a MIDI file to MusicXML in memory.
+
+    Args:
+        midi: The MIDI file, in any form read_midi_data accepts, or a
+            music21 stream.
+        timeout (float): Seconds music21 may take, defaults to MUSICXML_TIMEOUT.
+
+    Returns:
+        bytes: The MusicXML document.
+
+    Raises:
+        MusicXMLError: If music21 cannot convert the data in time.
     """
-    # Load MIDI file
-    score = converter.parse(midi_file)
+    # A score built with music21 means music21 is loaded here already
+    if type(midi).__module__.startswith("music21."):
+        from music21.musicxml.m21ToXml import GeneralObjectExporter
 
-    # Define output directory for MusicXML files
-    musicxml_output_folder = "./musicxml_output"
+        return GeneralObjectExporter(midi).parse()
 
-    # Create the output directory if it doesn't exist
-    if not os.path.exists(musicxml_output_folder):
-        os.makedirs(musicxml_output_folder)
+    midi_data = read_midi_data(midi)
 
-    # Convert MIDI to MusicXML
-    musicxml_file = os.path.join(
-        musicxml_output_folder, os.path.basename(midi_file).replace(".mid", ".musicxml")
-    )
-    score.write("musicxml", musicxml_file)
+    # Render single-line melodies without music21
+    if MUSICXML_RENDERER != "music21":
+        xml_file = BytesIO()
+        if musicxml_renderer.render_musicxml(midi_data, xml_file):
+            return xml_file.getvalue()
 
-    return musicxml_file
+    return musicxml_pool.render(midi_data, timeout)
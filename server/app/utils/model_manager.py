@@ -0,0 +1,182 @@
+################################################################################
+# Filename: model_manager.py
+# Purpose:  Keep a single warm Basic Pitch model per worker process.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains the ModelManager class, which loads the Basic Pitch model
+# once per process and hands the same instance to every conversion. The model
+# can be warmed up on a silent buffer when a gunicorn worker boots so that the
+# first upload does not pay for loading and tracing the TensorFlow graph. Load
+# time and per-inference time are recorded and reported.
+#
+# Usage (Optional):
+#   from app.utils.model_manager import model_manager
+#   model = model_manager.get_model()
+#   with model_manager.timed_inference():
+#       predict(audio_path, model)
+#
+# Notes:
+# - Each gunicorn worker has its own copy of the model; the warm-up is
+#   triggered from the post_worker_init hook in gunicorn.conf.py.
+# - Set MODEL_WARMUP=0 to skip the warm-up (e.g. for quick local restarts).
+# - Nothing here imports TensorFlow at module load. import_model_modules()
+#   imports it ahead of time, e.g. in the gunicorn master before it forks.
+#
+###############################################################################
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ModelManager:
+    """
+    Lazily loads and caches a Basic Pitch model for the current process.
+
+    Attributes:
+        model_path (str): Path to the serialized model, or None for the default.
+        load_time (float): Seconds spent loading the model, or None if not loaded.
+        warmup_time (float): Seconds spent on the warm-up pass, or None.
+        inference_count (int): Number of inferences run with the model.
+        total_inference_time (float): Total seconds spent in inference.
+        last_inference_time (float): Seconds spent in the latest inference.
+    """
+
+    def __init__(self, model_path=None):
+        self.model_path = model_path
+        self._model = None
+        self._lock = threading.Lock()
+        self.load_time = None
+        self.warmup_time = None
+        self.inference_count = 0
+        self.total_inference_time = 0.0
+        self.last_inference_time = None
+
+    @property
+    def is_loaded(self) -> bool:
+        """
+        Whether the model has been loaded in this process.
+        """
+        return self._model is not None
+
+    def get_model(self):
+        """
+        Return the process-wide model, loading it on first use.
+
+        Returns:
+            basic_pitch.inference.Model: The loaded Basic Pitch model.
+        """
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def _load(self):
+        """
+        Load the Basic Pitch model from disk and record the load time.
+
+        Returns:
+            basic_pitch.inference.Model: The loaded Basic Pitch model.
+        """
+        from basic_pitch import ICASSP_2022_MODEL_PATH
+        from basic_pitch.inference import Model
+
+        start = time.perf_counter()
+        model = Model(self.model_path or ICASSP_2022_MODEL_PATH)
+        self.load_time = time.perf_counter() - start
+        print(f"[pid {os.getpid()}] Basic Pitch model loaded in {self.load_time:.2f}s")
+        return model
+
+    def warm_up(self):
+        """
+        Load the model and run it once on a silent window.
+
+        The first call into a TensorFlow saved model traces the graph, which
+        costs far more than a regular inference. The soxr resampler used when
+        reading WAV uploads at another sample rate is exercised as well. Doing
+        that here keeps both off the request path.
+        """
+        import numpy as np
+        import soxr
+        from app.utils.basic_pitch_constants import AUDIO_N_SAMPLES, AUDIO_SAMPLE_RATE
+
+        model = self.get_model()
+        dummy_window = np.zeros((1, AUDIO_N_SAMPLES, 1), dtype=np.float32)
+
+        start = time.perf_counter()
+        soxr.resample(np.zeros(44100, dtype=np.float32), 44100, AUDIO_SAMPLE_RATE, quality="HQ")
+        model.predict(dummy_window)
+        self.warmup_time = time.perf_counter() - start
+        print(f"[pid {os.getpid()}] Basic Pitch model warmed up in {self.warmup_time:.2f}s")
+
+    @contextmanager
+    def timed_inference(self):
+        """
+        Context manager that records the time spent in one inference.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.inference_count += 1
+                self.total_inference_time += elapsed
+                self.last_inference_time = elapsed
+            print(f"[pid {os.getpid()}] Basic Pitch inference took {elapsed:.2f}s")
+
+    def stats(self) -> dict:
+        """
+        Return the load and inference timings of this process.
+
+        Returns:
+            dict: Timing information for the model in this process.
+        """
+        average = (
+            self.total_inference_time / self.inference_count
+            if self.inference_count
+            else None
+        )
+        return {
+            "pid": os.getpid(),
+            "loaded": self.is_loaded,
+            "load_time": self.load_time,
+            "warmup_time": self.warmup_time,
+            "inference_count": self.inference_count,
+            "total_inference_time": self.total_inference_time,
+            "average_inference_time": average,
+            "last_inference_time": self.last_inference_time,
+        }
+
+
+# Shared instance used by the conversion helpers of this process
+model_manager = ModelManager(os.environ.get("BASIC_PITCH_MODEL_PATH"))
+
+
+def warmup_enabled() -> bool:
+    """
+    Whether the model should be warmed up when a worker boots.
+
+    Returns:
+        bool: False if MODEL_WARMUP is set to a false-like value.
+    """
+    return os.environ.get("MODEL_WARMUP", "1").lower() not in {"0", "false", "no"}
+
+
+def import_model_modules():
+    """
+    Import Basic Pitch and TensorFlow without loading the model.
+
+    Called in the gunicorn master before it forks, so the workers share the
+    imported code copy-on-write instead of each importing it again. The model
+    itself is still loaded in each worker, as TensorFlow's thread pools do not
+    survive a fork.
+    """
+    start = time.perf_counter()
+    import basic_pitch.inference  # noqa: F401
+    import basic_pitch.note_creation  # noqa: F401
+
+    print(f"[pid {os.getpid()}] Basic Pitch modules imported in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,325 @@
+################################################################################
+# Filename: musicxml_pool.py
+# Purpose:  Convert MIDI data to MusicXML on a pool of warm music21 processes.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains the MusicXMLPool class, which keeps a few worker
+# processes running musicxml_worker.py. Each worker imports music21 once and
+# converts MIDI data sent over a pipe, so music21 is never imported by the
+# server process itself, a slow conversion only blocks the request waiting
+# for it, and memory music21 leaks stays in the workers. A worker is
+# replaced after a fixed number of conversions, and a worker that does not
+# answer in time is killed and replaced on the next conversion. Replaced
+# workers are stopped on a background thread, so no request waits for them
+# to exit.
+#
+# Usage (Optional):
+#   from app.utils.musicxml_pool import musicxml_pool
+#   xml_data = musicxml_pool.render(midi_data)
+#
+# Notes:
+# - MUSICXML_WORKERS sets the number of workers per server process (default
+#   1); 0 converts in the calling process instead.
+# - MUSICXML_MAX_JOBS sets the conversions after which a worker is replaced
+#   (default 100), MUSICXML_TIMEOUT the seconds a conversion may take,
+#   waiting for a free worker included (default 60).
+# - Workers are started on the first conversion, or by start() from the
+#   gunicorn post_worker_init hook, never in the gunicorn master.
+#
+###############################################################################
+
+import os
+import queue
+import select
+import subprocess
+import sys
+import threading
+import time
+
+from app.utils.musicxml_worker import (
+    REQUEST_HEADER,
+    RESPONSE_HEADER,
+    STATUS_OK,
+    STATUS_READY,
+    render_music21,
+)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "musicxml_worker.py")
+# Seconds a worker asked to stop may take before it is killed
+STOP_TIMEOUT = 5
+
+
+class MusicXMLError(RuntimeError):
+    """
+    Raised when MIDI data cannot be converted to MusicXML.
+    """
+
+
+class MusicXMLTimeoutError(MusicXMLError):
+    """
+    Raised when a conversion does not finish within the timeout.
+    """
+
+
+class MusicXMLWorker:
+    """
+    One worker process and the pipes to it.
+
+    Attributes:
+        process (subprocess.Popen): The worker process.
+        jobs (int): Number of conversions sent to the worker.
+        ready (bool): Whether the worker has finished warming up.
+    """
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self.jobs = 0
+        self.ready = False
+
+    @property
+    def alive(self) -> bool:
+        """
+        Whether the worker process is still running.
+        """
+        return self.process.poll() is None
+
+    def _read(self, size: int, deadline: float) -> bytes:
+        """
+        Read exactly size bytes from the worker before the deadline.
+
+        Raises:
+            MusicXMLTimeoutError: If the deadline passes first.
+            MusicXMLError: If the worker exits.
+        """
+        data = b""
+        stdout = self.process.stdout.fileno()
+        while len(data) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([stdout], [], [], remaining)[0]:
+                raise MusicXMLTimeoutError("MusicXML conversion timed out")
+            chunk = os.read(stdout, size - len(data))
+            if not chunk:
+                raise MusicXMLError("MusicXML worker exited")
+            data += chunk
+        return data
+
+    def _read_response(self, deadline: float) -> tuple:
+        """
+        Read one response from the worker.
+
+        Returns:
+            tuple: The status and the payload.
+        """
+        status, size = RESPONSE_HEADER.unpack(self._read(RESPONSE_HEADER.size, deadline))
+        return status, self._read(size, deadline)
+
+    def render(self, midi_data: bytes, deadline: float) -> bytes:
+        """
+        Convert MIDI data, waiting for the worker to warm up first.
+
+        A worker that times out or fails to answer is killed.
+
+        Args:
+            midi_data (bytes): The raw MIDI data.
+            deadline (float): time.monotonic() value the conversion must
+                finish by.
+
+        Returns:
+            bytes: The MusicXML document.
+
+        Raises:
+            MusicXMLError: If music21 cannot convert the data, the worker
+                exits, or the deadline passes.
+        """
+        try:
+            if not self.ready:
+                status, _ = self._read_response(deadline)
+                if status != STATUS_READY:
+                    raise MusicXMLError("MusicXML worker failed to start")
+                self.ready = True
+
+            self.jobs += 1
+            self.process.stdin.write(REQUEST_HEADER.pack(len(midi_data)) + midi_data)
+            self.process.stdin.flush()
+            status, payload = self._read_response(deadline)
+        except (MusicXMLError, OSError) as e:
+            self.kill()
+            if isinstance(e, MusicXMLError):
+                raise
+            raise MusicXMLError("MusicXML worker exited") from e
+
+        if status != STATUS_OK:
+            raise MusicXMLError(payload.decode("utf-8", "replace"))
+        return payload
+
+    def stop(self):
+        """
+        Ask the worker to exit once idle, killing it if it does not.
+        """
+        try:
+            self.process.stdin.close()
+            self.process.wait(STOP_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired):
+            self.kill()
+        self.process.stdout.close()
+
+    def kill(self):
+        """
+        Kill the worker process.
+        """
+        self.process.kill()
+        self.process.wait()
+        for pipe in (self.process.stdin, self.process.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+
+class MusicXMLPool:
+    """
+    Pool of music21 worker processes shared by the threads of a process.
+
+    Attributes:
+        size (int): Number of worker processes; 0 converts in process.
+        max_jobs (int): Conversions after which a worker is replaced.
+        timeout (float): Default seconds a conversion may take.
+        started (int): Number of worker processes started so far.
+    """
+
+    def __init__(self, size=1, max_jobs=100, timeout=60.0):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.started = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._slots = None
+        self._reapers = []
+
+    def _get_slots(self) -> queue.Queue:
+        """
+        Return the queue of idle workers of this process.
+
+        A process forked from one that used the pool gets new workers, as the
+        pipes of the parent's workers are not its own.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._slots = queue.Queue()
+                # None stands for a worker not started yet
+                for _ in range(self.size):
+                    self._slots.put(None)
+            return self._slots
+
+    @staticmethod
+    def _take_idle(slots: queue.Queue) -> list:
+        """
+        Take every idle worker, and slot of a worker not started, off the queue.
+        """
+        workers = []
+        while True:
+            try:
+                workers.append(slots.get_nowait())
+            except queue.Empty:
+                return workers
+
+    def _start_worker(self) -> MusicXMLWorker:
+        """
+        Start a worker process.
+        """
+        worker = MusicXMLWorker()
+        with self._lock:
+            self.started += 1
+        return worker
+
+    def _retire(self, worker: MusicXMLWorker):
+        """
+        Stop a worker on a background thread, without waiting for it to exit.
+        """
+        reaper = threading.Thread(target=worker.stop, name="musicxml-reaper", daemon=True)
+        reaper.start()
+        with self._lock:
+            self._reapers = [thread for thread in self._reapers if thread.is_alive()]
+            self._reapers.append(reaper)
+
+    def start(self):
+        """
+        Start every worker that is not running, without waiting for them to
+        warm up.
+        """
+        slots = self._get_slots()
+        for worker in self._take_idle(slots):
+            if worker is None or not worker.alive:
+                worker = self._start_worker()
+            slots.put(worker)
+
+    def render(self, midi_data: bytes, timeout: float | None = None) -> bytes:
+        """
+        Convert MIDI data to MusicXML with music21.
+
+        Args:
+            midi_data (bytes): The raw MIDI data.
+            timeout (float): Seconds to wait for a free worker and the
+                conversion, defaults to the pool's timeout.
+
+        Returns:
+            bytes: The MusicXML document.
+
+        Raises:
+            MusicXMLError: If the data cannot be converted.
+            MusicXMLTimeoutError: If the conversion does not finish in time.
+        """
+        if self.size == 0:
+            try:
+                return render_music21(midi_data)
+            except Exception as e:
+                raise MusicXMLError(str(e) or repr(e)) from e
+
+        deadline = time.monotonic() + (timeout or self.timeout)
+        slots = self._get_slots()
+        try:
+            worker = slots.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            raise MusicXMLTimeoutError("No MusicXML worker became free in time") from None
+
+        try:
+            if worker is None or not worker.alive:
+                worker = self._start_worker()
+            return worker.render(midi_data, deadline)
+        finally:
+            if worker is not None and worker.alive and worker.jobs >= self.max_jobs:
+                # Recycle the worker to release the memory music21 holds on to;
+                # the next conversion starts a new one
+                self._retire(worker)
+                worker = None
+            slots.put(worker if worker is not None and worker.alive else None)
+
+    def shutdown(self):
+        """
+        Stop the idle workers of this process, and wait for the workers being
+        recycled to exit.
+        """
+        slots = self._get_slots()
+        for worker in self._take_idle(slots):
+            if worker is not None and worker.alive:
+                worker.stop()
+            slots.put(None)
+        with self._lock:
+            reapers, self._reapers = self._reapers, []
+        for reaper in reapers:
+            reaper.join()
+
+
+# Shared pool used by the conversions of this process
+musicxml_pool = MusicXMLPool(
+    int(os.environ.get("MUSICXML_WORKERS", "1")),
+    int(os.environ.get("MUSICXML_MAX_JOBS", "100")),
+    float(os.environ.get("MUSICXML_TIMEOUT", "60")),
+)
@@ -0,0 +1,438 @@
+################################################################################
+# Filename: musicxml_renderer.py
+# Purpose:  Render monophonic MIDI files to MusicXML without music21.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains a lightweight MusicXML renderer for the single-line
+# melodies most transcriptions are. The MIDI file is read with mido, its
+# notes are quantized to a sixteenth-note grid, gaps become rests, and notes
+# and rests are split at barlines and into written note values joined by
+# ties. The MusicXML document is written element by element through a
+# streaming XML writer, so no score object model is built. It renders in
+# milliseconds what takes music21 seconds and hundreds of megabytes.
+#
+# Usage (Optional):
+#   if not render_musicxml("take.mid", "take.musicxml"):
+#       ...  # render with music21 instead
+#
+# Notes:
+# - Only MIDI files with one melodic line on one channel, one tempo, one time
+#   signature and one key are rendered. read_melody returns None for anything
+#   else (chords, overlapping voices, tempo or meter changes), and such files
+#   are left to music21 (see midi_to_musicxml.py).
+# - Overlaps of up to one grid step between consecutive notes, as legato
+#   transcriptions have, are cut off rather than treated as a second voice.
+#
+###############################################################################
+
+from io import BytesIO
+from xml.sax.saxutils import XMLGenerator
+
+import mido
+
+from app.utils.audio_analysis import MAJOR_KEYS, MINOR_KEYS
+
+# Grid steps per quarter note: notes are quantized to sixteenths
+DIVISIONS = 4
+# Longest overlap between consecutive notes that is cut off, in grid steps
+MAX_OVERLAP = 1
+
+# Written note values, longest first: (grid steps, type, dotted)
+NOTE_VALUES = [
+    (4 * DIVISIONS, "whole", False),
+    (3 * DIVISIONS, "half", True),
+    (2 * DIVISIONS, "half", False),
+    (3 * DIVISIONS // 2, "quarter", True),
+    (DIVISIONS, "quarter", False),
+    (3 * DIVISIONS // 4, "eighth", True),
+    (DIVISIONS // 2, "eighth", False),
+    (DIVISIONS // 4, "16th", False),
+]
+
+# Spelling of the 12 pitch classes as (step, alter), with sharps and flats
+SHARP_SPELLING = [
+    ("C", 0), ("C", 1), ("D", 0), ("D", 1), ("E", 0), ("F", 0),
+    ("F", 1), ("G", 0), ("G", 1), ("A", 0), ("A", 1), ("B", 0),
+]
+FLAT_SPELLING = [
+    ("C", 0), ("D", -1), ("D", 0), ("E", -1), ("E", 0), ("F", 0),
+    ("G", -1), ("G", 0), ("A", -1), ("A", 0), ("B", -1), ("B", 0),
+]
+# Steps altered by key signatures, in the order sharps and flats are added
+SHARP_ORDER = "FCGDAEB"
+FLAT_ORDER = "BEADGCF"
+ACCIDENTALS = {-1: "flat", 0: "natural", 1: "sharp"}
+
+DOCTYPE = (
+    '<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 4.0 Partwise//EN" '
+    '"http://www.musicxml.org/dtds/partwise.dtd">'
+)
+
+
+def _open_midi(midi_file) -> mido.MidiFile:
+    """
+    Read a MIDI file from a path, a binary file-like object or bytes.
+    """
+    if isinstance(midi_file, (bytes, bytearray)):
+        return mido.MidiFile(file=BytesIO(midi_file))
+    if hasattr(midi_file, "read"):
+        return mido.MidiFile(file=midi_file)
+    return mido.MidiFile(midi_file)
+
+
+def read_melody(midi_file) -> dict | None:
+    """
+    Read and quantize the melody of a MIDI file.
+
+    Args:
+        midi_file: Path, binary file-like object or bytes of a MIDI file.
+
+    Returns:
+        dict: The notes as (start, end, pitch, velocity) tuples, with times
+        in grid steps, in order,
+        with the tempo in BPM, the time signature, and the key signature as
+        fifths and mode; or None if the file is not a single melodic line
+        with one tempo, time signature and key.
+    """
+    try:
+        midi = _open_midi(midi_file)
+    except (OSError, ValueError, EOFError) as e:
+        print(f"Leaving MIDI file to music21: {e}")
+        return None
+    if midi.type == 2:
+        return None
+
+    tempos = {}
+    time_signatures = {}
+    keys = {}
+    notes = []
+    channels = set()
+    for track in midi.tracks:
+        tick = 0
+        # Start ticks of the sounding notes of every (channel, pitch)
+        sounding = {}
+        for message in track:
+            tick += message.time
+            if message.type == "set_tempo":
+                tempos[tick] = message.tempo
+            elif message.type == "time_signature":
+                time_signatures[tick] = (message.numerator, message.denominator)
+            elif message.type == "key_signature":
+                keys[tick] = message.key
+            elif message.type == "note_on" and message.velocity > 0:
+                sounding.setdefault((message.channel, message.note), []).append(
+                    (tick, message.velocity)
+                )
+                channels.add(message.channel)
+            elif message.type in ("note_on", "note_off"):
+                starts = sounding.get((message.channel, message.note))
+                if starts:
+                    start, velocity = starts.pop(0)
+                    notes.append((start, tick, message.note, velocity))
+        # Notes never released end with their track
+        for (_, pitch), starts in sounding.items():
+            notes.extend((start, tick, pitch, velocity) for start, velocity in starts)
+
+    # One tempo, time signature and key, set at the start
+    if len(channels) > 1 or any(
+        len(set(events.values())) > 1 or any(events) for events in (tempos, time_signatures, keys)
+    ):
+        return None
+    numerator, denominator = next(iter(time_signatures.values()), (4, 4))
+    measure_steps = numerator * 4 * DIVISIONS / denominator
+    if measure_steps != int(measure_steps):
+        return None
+
+    # Quantize to the grid; every note lasts at least one step
+    ticks_per_step = midi.ticks_per_beat / DIVISIONS
+    quantized = []
+    for start, end, pitch, velocity in sorted(notes):
+        start = round(start / ticks_per_step)
+        end = max(round(end / ticks_per_step), start + 1)
+        if quantized:
+            previous_start, previous_end, previous_pitch, previous_velocity = quantized[-1]
+            if start < previous_end:
+                # Chords and a second voice need music21
+                if start == previous_start or previous_end - start > MAX_OVERLAP:
+                    return None
+                quantized[-1] = (previous_start, start, previous_pitch, previous_velocity)
+        quantized.append((start, end, pitch, velocity))
+
+    key = next(iter(keys.values()), "C")
+    return {
+        "notes": quantized,
+        "tempo": mido.tempo2bpm(next(iter(tempos.values()), 500000)),
+        "time_signature": (numerator, denominator),
+        "measure_steps": int(measure_steps),
+        "fifths": key_fifths(key),
+        "mode": "minor" if key.endswith("m") else "major",
+    }
+
+
+def key_fifths(key: str) -> int:
+    """
+    Return the number of sharps (positive) or flats (negative) of a key.
+
+    Args:
+        key (str): The key as mido spells it, e.g. "Eb" or "F#m".
+    """
+    for keys in (MAJOR_KEYS, MINOR_KEYS):
+        if key in keys:
+            return keys.index(key) - 7
+    return 0
+
+
+def split_duration(steps: int) -> list:
+    """
+    Split a duration into written note values, longest first.
+
+    Args:
+        steps (int): The duration in grid steps.
+
+    Returns:
+        list: (grid steps, type, dotted) of every tied piece.
+    """
+    pieces = []
+    for value in NOTE_VALUES:
+        while steps >= value[0]:
+            pieces.append(value)
+            steps -= value[0]
+    return pieces
+
+
+class MusicXMLWriter:
+    """
+    Writes an indented XML document to a binary stream element by element.
+    """
+
+    def __init__(self, out):
+        self._generator = XMLGenerator(out, encoding="utf-8", short_empty_elements=True)
+        self._depth = 0
+
+    def start_document(self):
+        self._generator.startDocument()
+        # Written as is: the generator has no doctype event
+        self._generator.ignorableWhitespace(DOCTYPE)
+
+    def start(self, name: str, attributes: dict | None = None):
+        self._generator.ignorableWhitespace("\n" + "  " * self._depth)
+        self._generator.startElement(name, attributes or {})
+        self._depth += 1
+
+    def end(self, name: str, inline: bool = False):
+        self._depth -= 1
+        if not inline:
+            self._generator.ignorableWhitespace("\n" + "  " * self._depth)
+        self._generator.endElement(name)
+
+    def element(self, name: str, text=None, attributes: dict | None = None):
+        self.start(name, attributes)
+        if text is not None:
+            self._generator.characters(str(text))
+        self.end(name, inline=True)
+
+    def end_document(self):
+        self._generator.ignorableWhitespace("\n")
+        self._generator.endDocument()
+
+
+def _events(melody: dict) -> list:
+    """
+    Return the notes and the rests between them as (start, end, note) tuples,
+    with None for rests, up to the end of the last measure.
+    """
+    measure_steps = melody["measure_steps"]
+    events = []
+    position = 0
+    for start, end, pitch, velocity in melody["notes"]:
+        if start > position:
+            events.append((position, start, None))
+        events.append((start, end, (pitch, velocity)))
+        position = end
+    last_bar = max(-(-position // measure_steps), 1) * measure_steps
+    if last_bar > position:
+        events.append((position, last_bar, None))
+    return events
+
+
+def _write_note(writer, value, note, tie, spelling, key_alters, measure_alters):
+    """
+    Write one note or rest element of a written note value.
+
+    Args:
+        writer (MusicXMLWriter): The document being written.
+        value (tuple): The note value, from NOTE_VALUES.
+        note (tuple): The pitch and velocity, or None for a rest.
+        tie (tuple): Whether the piece continues a tie and starts one.
+        spelling (list): (step, alter) of every pitch class.
+        key_alters (dict): Alteration of the steps in the key signature.
+        measure_alters (dict): Alteration of every (step, octave) so far in
+            the measure; updated.
+    """
+    steps, note_type, dotted = value
+    writer.start("note", None if note is None else {"dynamics": f"{note[1] / 90 * 100:.2f}"})
+    accidental = None
+    if note is None:
+        writer.element("rest")
+    else:
+        pitch = note[0]
+        step, alter = spelling[pitch % 12]
+        octave = pitch // 12 - 1
+        # Show an accidental when the alteration differs from what the key
+        # signature or an earlier accidental in the measure implies
+        implied = measure_alters.get((step, octave), key_alters.get(step, 0))
+        if alter != implied and not tie[0]:
+            accidental = ACCIDENTALS[alter]
+        measure_alters[(step, octave)] = alter
+
+        writer.start("pitch")
+        writer.element("step", step)
+        if alter:
+            writer.element("alter", alter)
+        writer.element("octave", octave)
+        writer.end("pitch")
+    writer.element("duration", steps)
+    if note is not None:
+        if tie[0]:
+            writer.element("tie", attributes={"type": "stop"})
+        if tie[1]:
+            writer.element("tie", attributes={"type": "start"})
+    writer.element("type", note_type)
+    if dotted:
+        writer.element("dot")
+    if accidental:
+        writer.element("accidental", accidental)
+    if note is not None and any(tie):
+        writer.start("notations")
+        if tie[0]:
+            writer.element("tied", attributes={"type": "stop"})
+        if tie[1]:
+            writer.element("tied", attributes={"type": "start"})
+        writer.end("notations")
+    writer.end("note")
+
+
+def write_musicxml(melody: dict, out):
+    """
+    Write a melody from read_melody as a MusicXML document.
+
+    Args:
+        melody (dict): The melody, as returned by read_melody.
+        out: A binary file-like object to write to.
+    """
+    measure_steps = melody["measure_steps"]
+    fifths = melody["fifths"]
+    spelling = SHARP_SPELLING if fifths >= 0 else FLAT_SPELLING
+    order = SHARP_ORDER if fifths >= 0 else FLAT_ORDER
+    key_alters = {step: 1 if fifths > 0 else -1 for step in order[: abs(fifths)]}
+    pitches = sorted(pitch for _, _, pitch, _ in melody["notes"])
+    treble = not pitches or pitches[len(pitches) // 2] >= 60
+
+    writer = MusicXMLWriter(out)
+    writer.start_document()
+    writer.start("score-partwise", {"version": "4.0"})
+    writer.start("identification")
+    writer.start("encoding")
+    writer.element("software", "MelodyMapper")
+    writer.end("encoding")
+    writer.end("identification")
+    writer.start("part-list")
+    writer.start("score-part", {"id": "P1"})
+    writer.element("part-name", "Melody")
+    writer.end("score-part")
+    writer.end("part-list")
+    writer.start("part", {"id": "P1"})
+
+    events = _events(melody)
+    n_measures = events[-1][1] // measure_steps
+    index = 0
+    for measure in range(n_measures):
+        bar_start = measure * measure_steps
+        bar_end = bar_start + measure_steps
+        writer.start("measure", {"number": str(measure + 1)})
+        if measure == 0:
+            writer.start("attributes")
+            writer.element("divisions", DIVISIONS)
+            writer.start("key")
+            writer.element("fifths", fifths)
+            writer.element("mode", melody["mode"])
+            writer.end("key")
+            writer.start("time")
+            writer.element("beats", melody["time_signature"][0])
+            writer.element("beat-type", melody["time_signature"][1])
+            writer.end("time")
+            writer.start("clef")
+            writer.element("sign", "G" if treble else "F")
+            writer.element("line", 2 if treble else 4)
+            writer.end("clef")
+            writer.end("attributes")
+            tempo = round(melody["tempo"], 2)
+            tempo = int(tempo) if tempo == int(tempo) else tempo
+            writer.start("direction", {"placement": "above"})
+            writer.start("direction-type")
+            writer.start("metronome")
+            writer.element("beat-unit", "quarter")
+            writer.element("per-minute", tempo)
+            writer.end("metronome")
+            writer.end("direction-type")
+            writer.element("sound", attributes={"tempo": str(tempo)})
+            writer.end("direction")
+
+        measure_alters = {}
+        while index < len(events) and events[index][0] < bar_end:
+            start, end, note = events[index]
+            piece_start = max(start, bar_start)
+            piece_end = min(end, bar_end)
+            if note is None and piece_end - piece_start == measure_steps:
+                # A whole-measure rest, whatever the meter
+                writer.start("note")
+                writer.element("rest", attributes={"measure": "yes"})
+                writer.element("duration", measure_steps)
+                writer.end("note")
+            else:
+                pieces = split_duration(piece_end - piece_start)
+                for i, value in enumerate(pieces):
+                    tie = (
+                        piece_start > start or i > 0,
+                        piece_end < end or i < len(pieces) - 1,
+                    )
+                    _write_note(
+                        writer, value, note, tie, spelling, key_alters, measure_alters
+                    )
+            if end > bar_end:
+                break
+            index += 1
+
+        if measure == n_measures - 1:
+            writer.start("barline", {"location": "right"})
+            writer.element("bar-style", "light-heavy")
+            writer.end("barline")
+        writer.end("measure")
+
+    writer.end("part")
+    writer.end("score-partwise")
+    writer.end_document()
+
+
+def render_musicxml(midi_file, output) -> bool:
+    """
+    Render a MIDI file to MusicXML if it holds a single melodic line.
+
+    Args:
+        midi_file: Path, binary file-like object or bytes of a MIDI file.
+        output: Path or binary file-like object to write the MusicXML to.
+
+    Returns:
+        bool: Whether the file was rendered; False if it needs music21, in
+        which case nothing is written.
+    """
+    melody = read_melody(midi_file)
+    if melody is None:
+        return False
+    if hasattr(output, "write"):
+        write_musicxml(melody, output)
+    else:
+        with open(output, "wb") as xml_file:
+            write_musicxml(melody, xml_file)
+    return True
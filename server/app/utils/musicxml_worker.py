@@ -0,0 +1,119 @@
+################################################################################
+# Filename: musicxml_worker.py
+# Purpose:  Convert MIDI data to MusicXML with music21 in a worker process.
+# Author:   Darren Seubert
+#
+# Description:
+# This file is the program run by the processes of the MusicXML pool (see
+# musicxml_pool.py). It imports music21 and converts a small MIDI file once
+# to warm it up, reports that it is ready, then converts the MIDI files sent
+# on its standard input one after another and writes each MusicXML document,
+# or the error, back to its standard output. The file only depends on the
+# standard library and music21, so a worker never imports the application or
+# TensorFlow.
+#
+# Usage (Optional):
+# The pool starts workers as:
+#   python app/utils/musicxml_worker.py
+# render_music21 can also be imported to convert in the current process:
+#   from app.utils.musicxml_worker import render_music21
+#   xml_data = render_music21(midi_data)
+#
+# Notes:
+# - Requests are a 4-byte big-endian length followed by the MIDI data.
+#   Responses are a status byte and a 4-byte big-endian length followed by
+#   the MusicXML document or the error message.
+# - The worker exits when its standard input is closed, including when the
+#   process that started it exits.
+#
+###############################################################################
+
+import os
+import struct
+import sys
+
+REQUEST_HEADER = struct.Struct(">I")
+RESPONSE_HEADER = struct.Struct(">BI")
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_READY = 2
+
+# One middle C quarter note at 480 ticks per beat, converted at start-up
+WARMUP_MIDI = (
+    b"MThd" + struct.pack(">IHHH", 6, 0, 1, 480)
+    + b"MTrk" + struct.pack(">I", 13)
+    + b"\x00\x90\x3c\x40" + b"\x83\x60\x80\x3c\x00" + b"\x00\xff\x2f\x00"
+)
+
+
+def render_music21(midi_data: bytes) -> bytes:
+    """
+    Convert MIDI data to MusicXML with music21.
+
+    Args:
+        midi_data (bytes): The raw MIDI data.
+
+    Returns:
+        bytes: The MusicXML document, as music21 writes it to a file.
+    """
+    from music21 import converter
+    from music21.musicxml.m21ToXml import GeneralObjectExporter
+
+    score = converter.parse(midi_data, format="midi")
+    return GeneralObjectExporter(score).parse()
+
+
+def read_exact(stream, size: int) -> bytes | None:
+    """
+    Read exactly size bytes from a stream.
+
+    Returns:
+        bytes: The data, or None if the stream ended first.
+    """
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def respond(out, status: int, payload: bytes):
+    """
+    Write one response to the pool.
+    """
+    out.write(RESPONSE_HEADER.pack(status, len(payload)) + payload)
+    out.flush()
+
+
+def main() -> int:
+    """
+    Serve conversion requests until standard input is closed.
+
+    Returns:
+        int: The process exit code.
+    """
+    requests = sys.stdin.buffer
+    # Keep standard output for responses; anything music21 prints goes to stderr
+    responses = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    render_music21(WARMUP_MIDI)
+    respond(responses, STATUS_READY, b"")
+
+    while True:
+        header = read_exact(requests, REQUEST_HEADER.size)
+        if header is None:
+            return 0
+        midi_data = read_exact(requests, REQUEST_HEADER.unpack(header)[0])
+        if midi_data is None:
+            return 0
+        try:
+            respond(responses, STATUS_OK, render_music21(midi_data))
+        except Exception as e:
+            respond(responses, STATUS_ERROR, (str(e) or repr(e)).encode("utf-8"))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
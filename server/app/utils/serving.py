@@ -0,0 +1,192 @@
+################################################################################
+# Filename: serving.py
+# Purpose:  Define the gunicorn worker pools that serve the application.
+# Author:   Darren Seubert
+#
+# Description:
+# Uploads are converted while the request is open, which keeps a worker busy
+# for seconds, whereas listing entries or downloading a MIDI file or score
+# takes milliseconds. When both share one pool of sync workers, a few slow
+# uploads occupy every worker and the cheap requests queue behind them. This
+# file defines separate pools of the same application instead:
+#
+# - "io" serves metadata and downloads on threaded workers, which never load
+#   the Basic Pitch model.
+# - "cpu" serves the conversion routes (see CONVERSION_ROUTES) on a few
+#   workers that load the model, with longer timeouts, and recycles them
+#   after a number of requests to release the memory conversions leave
+#   behind. It also serves the stats route, as the model, cache and
+#   scheduler statistics are only ever collected by these workers.
+# - "all" serves everything from a single pool, as before.
+#
+# gunicorn.conf.py starts the pool named by SERVING_POOL, and the reverse
+# proxy sends each request to its pool (see nginx/nginx.conf, which mirrors
+# pool_for_request).
+#
+# Usage (Optional):
+#   SERVING_POOL=io gunicorn run:app
+#   SERVING_POOL=cpu GUNICORN_BIND=0.0.0.0:5001 gunicorn run:app
+#
+# Notes:
+# - The pool's defaults can be overridden with GUNICORN_BIND,
+#   GUNICORN_WORKERS, GUNICORN_THREADS, GUNICORN_WORKER_CLASS,
+#   GUNICORN_TIMEOUT, GUNICORN_GRACEFUL_TIMEOUT, GUNICORN_KEEPALIVE,
+#   GUNICORN_MAX_REQUESTS and GUNICORN_MAX_REQUESTS_JITTER.
+# - GUNICORN_WORKER_CLASS=gevent can be used for the io pool if gevent is
+#   installed. It is not used by default, as its monkey-patching does not
+#   mix with TensorFlow or the music21 worker pipes in the cpu pool.
+# - gunicorn 21.2's threaded workers can reset connections that are waiting
+#   on a worker when it is recycled, hence the wide jitter in the io pool,
+#   which spreads its restarts, and sync workers in the cpu pool, which
+#   finish their request and leave the rest to the other workers.
+#
+###############################################################################
+
+import os
+import re
+
+# Requests that convert audio, as (method, path pattern) pairs. Jobs are
+# converted by the queue of the process that accepted them, so they belong
+# to the conversion pool too, and so do the statistics of the conversions.
+CONVERSION_ROUTES = (
+    ("POST", re.compile(r"^/api/v1/midis(/batch)?/?$")),
+    ("POST", re.compile(r"^/api/v1/jobs/?$")),
+    ("GET", re.compile(r"^/api/v1/stats/?$")),
+)
+
+# Environment variable overriding each setting, and its type
+ENVIRONMENT_SETTINGS = {
+    "bind": ("GUNICORN_BIND", str),
+    "workers": ("GUNICORN_WORKERS", int),
+    "threads": ("GUNICORN_THREADS", int),
+    "worker_class": ("GUNICORN_WORKER_CLASS", str),
+    "timeout": ("GUNICORN_TIMEOUT", int),
+    "graceful_timeout": ("GUNICORN_GRACEFUL_TIMEOUT", int),
+    "keepalive": ("GUNICORN_KEEPALIVE", int),
+    "max_requests": ("GUNICORN_MAX_REQUESTS", int),
+    "max_requests_jitter": ("GUNICORN_MAX_REQUESTS_JITTER", int),
+}
+
+
+class ServingPool:
+    """
+    gunicorn settings of one pool of worker processes.
+
+    Attributes:
+        name (str): The pool name.
+        settings (dict): gunicorn settings, keyed by their name in a
+            gunicorn configuration file.
+        load_model (bool): Whether the workers load and warm up the Basic
+            Pitch model, and the master imports it before forking.
+    """
+
+    def __init__(self, name: str, load_model: bool, **settings):
+        self.name = name
+        self.load_model = load_model
+        self.settings = {
+            "bind": "0.0.0.0:5000",
+            "keepalive": 2,
+            "max_requests_jitter": 0,
+            **settings,
+        }
+
+    def from_environment(self, environ=None) -> "ServingPool":
+        """
+        Return a copy of the pool with the settings given in the environment.
+
+        Args:
+            environ (dict): The environment, defaults to os.environ.
+
+        Returns:
+            ServingPool: The pool with its settings overridden.
+
+        Raises:
+            ValueError: If a numeric setting is not a number.
+        """
+        environ = os.environ if environ is None else environ
+        settings = dict(self.settings)
+        for setting, (variable, cast) in ENVIRONMENT_SETTINGS.items():
+            if environ.get(variable):
+                try:
+                    settings[setting] = cast(environ[variable])
+                except ValueError:
+                    raise ValueError(f"{variable} must be a number") from None
+        return ServingPool(self.name, self.load_model, **settings)
+
+
+POOLS = {
+    # One pool for every route, as served before the pools were split
+    "all": ServingPool(
+        "all",
+        load_model=True,
+        workers=4,
+        threads=1,
+        worker_class="sync",
+        timeout=300,
+        graceful_timeout=60,
+        max_requests=0,
+    ),
+    # Many threads, as requests mostly wait on the database, the blob store
+    # or the music21 processes
+    "io": ServingPool(
+        "io",
+        load_model=False,
+        workers=2,
+        threads=16,
+        worker_class="gthread",
+        timeout=60,
+        graceful_timeout=30,
+        max_requests=10000,
+        max_requests_jitter=5000,
+    ),
+    # One conversion per worker, as TensorFlow runs its own threads. Set
+    # GUNICORN_THREADS above 1 to let the inference scheduler batch the
+    # windows of concurrent uploads.
+    "cpu": ServingPool(
+        "cpu",
+        load_model=True,
+        workers=2,
+        threads=1,
+        worker_class="sync",
+        timeout=300,
+        graceful_timeout=120,
+        max_requests=200,
+        max_requests_jitter=50,
+    ),
+}
+
+
+def get_pool(name: str | None = None) -> ServingPool:
+    """
+    Return the pool to serve, with its settings from the environment.
+
+    Args:
+        name (str): The pool name, defaults to SERVING_POOL, or "all".
+
+    Returns:
+        ServingPool: The pool.
+
+    Raises:
+        ValueError: If the pool name is unknown.
+    """
+    name = name or os.environ.get("SERVING_POOL", "all")
+    if name not in POOLS:
+        raise ValueError(f"Unknown serving pool: {name} (expected one of {', '.join(POOLS)})")
+    return POOLS[name].from_environment()
+
+
+def pool_for_request(method: str, path: str) -> str:
+    """
+    Return the name of the pool that serves a request when the pools are split.
+
+    Args:
+        method (str): The HTTP method.
+        path (str): The request path.
+
+    Returns:
+        str: "cpu" for the conversion and stats routes, "io" otherwise.
+    """
+    for route_method, pattern in CONVERSION_ROUTES:
+        if method.upper() == route_method and pattern.match(path):
+            return "cpu"
+    return "io"
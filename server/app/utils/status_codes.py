@@ -29,6 +29,9 @@ OK = 200
 CREATED = 201
 ACCEPTED = 202
 NO_CONTENT = 204
+PARTIAL_CONTENT = 206
+
+NOT_MODIFIED = 304
 
 # Client Error
 BAD_REQUEST = 400
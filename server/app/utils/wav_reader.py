@@ -0,0 +1,310 @@
+################################################################################
+# Filename: wav_reader.py
+# Purpose:  Read PCM WAV files through a memory map, one block at a time.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains the WavReader class, which parses the header of a PCM or
+# IEEE float WAV file (RIFF, or RF64 for files over 4 GB) and memory-maps its
+# sample data without reading it. The frames are exposed as a zero-copy
+# (frames, channels) array view of the file; samples are only converted to
+# float32, downmixed and resampled block by block while iterating, so a
+# multi-hour recording is analyzed with flat memory use and without an
+# intermediate WAV export or an ffmpeg process. Pages that have been converted
+# are dropped from memory again while iterating.
+#
+# Usage (Optional):
+#   reader = WavReader("take.wav")
+#   for block in reader.iter_blocks(22050, sample_rate=22050):
+#       ...
+#
+# Notes:
+# - Supports 8, 16, 24 and 32-bit integer PCM and 32 and 64-bit float data,
+#   including WAVE_FORMAT_EXTENSIBLE headers. Other WAV codecs raise
+#   WavFormatError, a ValueError, so callers can fall back to ffmpeg.
+# - Channels are averaged and resampled with soxr at high quality, which is
+#   what librosa.load (used by Basic Pitch's own inference) does, so the
+#   decoded samples are identical to librosa.load's.
+#
+###############################################################################
+
+import itertools
+import mmap
+import struct
+
+import numpy as np
+import soxr
+
+# Frames per block converted to float
+BLOCK_FRAMES = 65536
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Sample dtype of every supported format and sample width; 24-bit samples
+# have no NumPy dtype and are kept as 3 bytes
+SAMPLE_DTYPES = {
+    (WAVE_FORMAT_PCM, 1): np.dtype("u1"),
+    (WAVE_FORMAT_PCM, 2): np.dtype("<i2"),
+    (WAVE_FORMAT_PCM, 3): np.dtype("u1"),
+    (WAVE_FORMAT_PCM, 4): np.dtype("<i4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 4): np.dtype("<f4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 8): np.dtype("<f8"),
+}
+
+
+class WavFormatError(ValueError):
+    """
+    Raised when a file is not a WAV file WavReader can map.
+    """
+
+
+def is_wav_file(path: str) -> bool:
+    """
+    Whether a file starts with a RIFF or RF64 WAVE header.
+
+    Args:
+        path (str): Path of the file.
+    """
+    try:
+        with open(path, "rb") as wav_file:
+            header = wav_file.read(12)
+    except OSError:
+        return False
+    return header[:4] in (b"RIFF", b"RF64") and header[8:12] == b"WAVE"
+
+
+class WavReader:
+    """
+    A memory-mapped PCM WAV file.
+
+    Attributes:
+        path (str): The WAV file.
+        sample_rate (int): Frames per second.
+        channels (int): Number of channels.
+        sample_width (int): Bytes per sample.
+        n_frames (int): Number of frames.
+        frames (np.ndarray): The frames as a read-only (n_frames, channels)
+            view of the file, or (n_frames, channels, 3) bytes for 24-bit
+            files. Nothing is read until it is indexed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        format_tag, data_offset, data_size = self._read_header()
+
+        self._dtype = SAMPLE_DTYPES.get((format_tag, self.sample_width))
+        if self._dtype is None:
+            raise WavFormatError(
+                f"Unsupported WAV format {format_tag:#06x} with "
+                f"{8 * self.sample_width}-bit samples"
+            )
+        self._format_tag = format_tag
+
+        self._frame_size = self.channels * self.sample_width
+        self._data_offset = data_offset
+        self.n_frames = data_size // self._frame_size
+        shape = (self.n_frames, self.channels)
+        if self.sample_width == 3:
+            shape += (3,)
+        self._mmap = None
+        # Bytes of the mapping already dropped by _release
+        self._released = 0
+        if self.n_frames:
+            with open(path, "rb") as wav_file:
+                self._mmap = mmap.mmap(wav_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.frames = np.frombuffer(
+                self._mmap,
+                dtype=self._dtype,
+                count=int(np.prod(shape)),
+                offset=data_offset,
+            ).reshape(shape)
+        else:
+            self.frames = np.zeros(shape, dtype=self._dtype)
+
+    def _read_header(self):
+        """
+        Parse the RIFF chunks up to the data chunk.
+
+        Returns:
+            tuple: The format tag, and the offset and size of the sample data.
+        """
+        with open(self.path, "rb") as wav_file:
+            wav_file.seek(0, 2)
+            file_size = wav_file.tell()
+            wav_file.seek(0)
+
+            riff, _, wave = struct.unpack("<4sI4s", wav_file.read(12).ljust(12, b"\0"))
+            if riff not in (b"RIFF", b"RF64") or wave != b"WAVE":
+                raise WavFormatError(f"{self.path} is not a WAV file")
+
+            format_tag = None
+            rf64_data_size = None
+            while True:
+                header = wav_file.read(8)
+                if len(header) < 8:
+                    raise WavFormatError(f"{self.path} has no data chunk")
+                chunk_id, chunk_size = struct.unpack("<4sI", header)
+                chunk_start = wav_file.tell()
+
+                if chunk_id == b"ds64":
+                    # RF64 keeps the 64-bit sizes of the RIFF and data chunks here
+                    _, rf64_data_size = struct.unpack("<QQ", wav_file.read(16))
+                elif chunk_id == b"fmt ":
+                    fmt = wav_file.read(chunk_size)
+                    if len(fmt) < 16:
+                        raise WavFormatError(f"{self.path} has a truncated fmt chunk")
+                    format_tag, self.channels, self.sample_rate = struct.unpack("<HHI", fmt[:8])
+                    bits_per_sample = struct.unpack("<H", fmt[14:16])[0]
+                    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                        # The sub-format GUID starts with the actual format tag
+                        format_tag = struct.unpack("<H", fmt[24:26])[0]
+                    self.sample_width = (bits_per_sample + 7) // 8
+                    if self.channels == 0 or self.sample_rate == 0:
+                        raise WavFormatError(f"{self.path} has an invalid fmt chunk")
+                elif chunk_id == b"data":
+                    if format_tag is None:
+                        raise WavFormatError(f"{self.path} has no fmt chunk")
+                    if riff == b"RF64" and rf64_data_size is not None:
+                        chunk_size = rf64_data_size
+                    # Recorders that were interrupted leave the size unset or
+                    # too large; the data then runs to the end of the file
+                    data_size = min(chunk_size, file_size - chunk_start)
+                    if chunk_size in (0, 0xFFFFFFFF):
+                        data_size = file_size - chunk_start
+                    return format_tag, chunk_start, data_size
+
+                # Chunks are padded to an even size
+                wav_file.seek(chunk_start + chunk_size + chunk_size % 2)
+
+    @property
+    def duration(self) -> float:
+        """
+        Length of the recording in seconds.
+        """
+        return self.n_frames / self.sample_rate
+
+    def iter_frames(self, block_frames: int = BLOCK_FRAMES, start: int = 0, stop=None):
+        """
+        Yield consecutive blocks of frames as zero-copy views of the file.
+
+        Args:
+            block_frames (int): Frames per block; the last block may be shorter.
+            start (int): First frame.
+            stop (int): Frame to stop before, or None for the end of the file.
+
+        Yields:
+            np.ndarray: Blocks of frames, as in the frames attribute.
+        """
+        stop = self.n_frames if stop is None else min(stop, self.n_frames)
+        for block_start in range(start, stop, block_frames):
+            yield self.frames[block_start : min(block_start + block_frames, stop)]
+
+    def to_float(self, frames, mono: bool = True) -> np.ndarray:
+        """
+        Convert a block of frames to float32 samples between -1 and 1.
+
+        Args:
+            frames (np.ndarray): Frames from iter_frames or the frames attribute.
+            mono (bool): Whether to average the channels.
+
+        Returns:
+            np.ndarray: (frames,) samples if mono, else (frames, channels).
+        """
+        if self._format_tag == WAVE_FORMAT_IEEE_FLOAT:
+            samples = np.asarray(frames, dtype=np.float32)
+        elif self.sample_width == 1:
+            # 8-bit PCM is unsigned, centered on 128
+            samples = (np.asarray(frames, dtype=np.float32) - 128) / 128
+        elif self.sample_width == 3:
+            # Place the 3 bytes in the top of a little-endian int32, so the
+            # arithmetic shift back down extends the sign
+            padded = np.zeros(frames.shape[:-1] + (4,), dtype=np.uint8)
+            padded[..., 1:] = frames
+            samples = (padded.view("<i4")[..., 0] >> 8).astype(np.float32) / np.float32(2**23)
+        else:
+            samples = np.asarray(frames, dtype=np.float32) / np.float32(
+                2 ** (8 * self.sample_width - 1)
+            )
+
+        if mono:
+            samples = samples.mean(axis=1) if self.channels > 1 else samples[:, 0]
+        return samples
+
+    def read(self, start: int = 0, stop=None, mono: bool = True) -> np.ndarray:
+        """
+        Read a range of frames as float32 samples.
+
+        Args:
+            start (int): First frame.
+            stop (int): Frame to stop before, or None for the end of the file.
+            mono (bool): Whether to average the channels.
+
+        Returns:
+            np.ndarray: The samples, as returned by to_float.
+        """
+        return self.to_float(self.frames[start:stop], mono)
+
+    def _release(self, stop: int):
+        """
+        Drop the mapped pages of the frames before stop from memory.
+
+        The mapping is read-only, so the pages are read from the file again
+        if they are indexed later; this only keeps the resident memory of a
+        long sequential read flat.
+        """
+        if self._mmap is None or not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        stop_byte = min(self._data_offset + stop * self._frame_size, len(self._mmap))
+        stop_byte -= stop_byte % mmap.PAGESIZE
+        if stop_byte > self._released:
+            self._mmap.madvise(
+                mmap.MADV_DONTNEED, self._released, stop_byte - self._released
+            )
+            self._released = stop_byte
+
+    def iter_blocks(self, block_samples: int = BLOCK_FRAMES, sample_rate=None):
+        """
+        Yield the recording as mono float32 blocks.
+
+        Only one block of frames is converted at a time. If sample_rate differs
+        from the file's, the blocks are resampled by one soxr stream, which
+        gives the same samples as resampling the whole recording at once.
+
+        Args:
+            block_samples (int): Samples per yielded block; the last block may
+                be shorter.
+            sample_rate (int): Output sample rate, or None for the file's.
+
+        Yields:
+            np.ndarray: Mono float32 samples.
+        """
+        if sample_rate is None or sample_rate == self.sample_rate:
+            for start in range(0, self.n_frames, block_samples):
+                samples = self.read(start, start + block_samples)
+                self._release(start + block_samples)
+                yield samples
+            return
+
+        stream = soxr.ResampleStream(self.sample_rate, sample_rate, 1, dtype="float32")
+        # About block_samples output samples per input block
+        block_frames = max(1, block_samples * self.sample_rate // sample_rate)
+        pending = np.zeros(0, dtype=np.float32)
+        starts = range(0, self.n_frames, block_frames)
+        # A final None flushes the samples soxr holds back
+        for start in itertools.chain(starts, [None]):
+            last = start is None
+            if last:
+                samples = np.zeros(0, dtype=np.float32)
+            else:
+                samples = self.read(start, start + block_frames)
+                self._release(start + block_frames)
+            pending = np.concatenate([pending, stream.resample_chunk(samples, last=last)])
+
+            # Re-cut the resampled output into blocks of exactly block_samples
+            while len(pending) >= block_samples:
+                yield pending[:block_samples]
+                pending = pending[block_samples:]
+        if len(pending):
+            yield pending
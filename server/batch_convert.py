@@ -0,0 +1,126 @@
+################################################################################
+# Filename: batch_convert.py
+# Purpose:  Command line entry point for converting many recordings at once.
+# Author:   Darren Seubert
+#
+# Description:
+# This script converts a list of audio files and/or zip archives of audio
+# files to MIDI, spreading the work across a process pool sized to the
+# available cores. Each MIDI file is written to the output directory as soon
+# as it is converted, and one JSON line per input file is printed so progress
+# can be followed or piped into other tools.
+#
+# Usage (Optional):
+# From the server directory, run:
+#   python batch_convert.py takes.zip more/*.wav -o ./midi_backfill -j 8
+#   python batch_convert.py takes.zip -t dsp
+#
+# Notes:
+# The exit code is 1 if at least one file failed to convert.
+#
+###############################################################################
+
+import argparse
+import json
+import os
+import sys
+
+from app.utils.batch_conversion import BatchStaging, available_cores, convert_batch
+from app.utils.conversion import TRANSCRIBERS
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line arguments.
+
+    Args:
+        argv (list): Arguments to parse, defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Convert audio files or zip archives of audio files to MIDI."
+    )
+    parser.add_argument("inputs", nargs="+", help="audio files or zip archives")
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        default="./batch_output",
+        help="directory to write the MIDI files to (default: ./batch_output)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=available_cores(),
+        help="number of conversion processes (default: available cores)",
+    )
+    parser.add_argument(
+        "-t",
+        "--transcriber",
+        choices=sorted(TRANSCRIBERS),
+        default=None,
+        help="transcriber to convert with (default: the TRANSCRIBER setting)",
+    )
+    return parser.parse_args(argv)
+
+
+def output_path(output_dir, file_name, used_paths):
+    """
+    Return a MIDI path for an input file that no other result has used.
+
+    Args:
+        output_dir (str): The output directory.
+        file_name (str): The original input file name.
+        used_paths (set): Paths already written during this run.
+
+    Returns:
+        str: The path to write the MIDI file to.
+    """
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    path = os.path.join(output_dir, f"{stem}.mid")
+    suffix = 1
+    while path in used_paths:
+        path = os.path.join(output_dir, f"{stem}_{suffix}.mid")
+        suffix += 1
+    used_paths.add(path)
+    return path
+
+
+def main(argv=None):
+    """
+    Convert the given inputs and report one JSON line per file.
+
+    Returns:
+        int: The process exit code.
+    """
+    args = parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    failed = 0
+    used_paths = set()
+    with BatchStaging() as staging:
+        for path in args.inputs:
+            staging.add_path(path)
+
+        for skipped in staging.skipped:
+            print(json.dumps({"file": skipped, "status": "skipped"}), flush=True)
+
+        for result in convert_batch(
+            staging.files, max_workers=args.jobs, transcriber=args.transcriber
+        ):
+            if result["status"] == "succeeded":
+                midi_path = output_path(args.output_dir, result["file"], used_paths)
+                with open(midi_path, "wb") as midi_file:
+                    midi_file.write(result.pop("midi_data"))
+                result["midi_path"] = midi_path
+            else:
+                failed += 1
+            print(json.dumps(result), flush=True)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+################################################################################
+# Filename: benchmark_musicxml.py
+# Purpose:  Compare the MusicXML renderer with music21.
+# Author:   Darren Seubert
+#
+# Description:
+# This script renders each given MIDI file to MusicXML with the lightweight
+# renderer and with music21, timing each after a warm-up run and tracing the
+# peak memory allocated by one run. One JSON line per MIDI file and renderer
+# is printed. Files the renderer leaves to music21, such as chords, are
+# reported with "rendered": false and no native timing.
+#
+# Usage (Optional):
+# From the server directory, run:
+#   python benchmark_musicxml.py
+#   python benchmark_musicxml.py takes/*.mid --repeat 10
+#
+# Notes:
+# Without arguments the sample recordings in app/utils/audio_sample are
+# transcribed with the "dsp" transcriber, which writes single-line melodies.
+#
+###############################################################################
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+from music21 import converter
+from music21.musicxml.m21ToXml import GeneralObjectExporter
+
+from app.utils.conversion import TRANSCRIBERS, decode_audio, note_events_to_bytes
+from app.utils.musicxml_renderer import render_musicxml
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), "app", "utils", "audio_sample")
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line arguments.
+
+    Args:
+        argv (list): Arguments to parse, defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Compare the MusicXML renderer with music21.")
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        help="MIDI files (default: the sample recordings, transcribed)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="timed runs per MIDI file and renderer (default: 5)",
+    )
+    return parser.parse_args(argv)
+
+
+def sample_midi():
+    """
+    Transcribe the sample recordings with the DSP transcriber.
+
+    Returns:
+        list: (name, MIDI bytes) pairs.
+    """
+    transcriber = TRANSCRIBERS["dsp"]
+    return [
+        (os.path.basename(path), note_events_to_bytes(transcriber.transcribe(decode_audio(path))))
+        for path in sorted(glob.glob(os.path.join(SAMPLE_DIR, "sample_*")))
+    ]
+
+
+def render_native(midi_data):
+    """Render MIDI bytes with the lightweight renderer."""
+    out = BytesIO()
+    if not render_musicxml(midi_data, out):
+        return None
+    return out.getvalue()
+
+
+def render_music21(midi_data):
+    """Render MIDI bytes with music21."""
+    score = converter.parse(midi_data, format="midi")
+    return GeneralObjectExporter(score).parse()
+
+
+def time_renderer(render, midi_data, repeat):
+    """
+    Render MIDI bytes repeat times after a warm-up run.
+
+    Returns:
+        tuple: The output, the fastest run time in seconds and the peak
+        traced memory of one run in bytes.
+    """
+    tracemalloc.start()
+    output = render(midi_data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if output is None:
+        return None, None, peak
+
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render(midi_data)
+        best = min(best, time.perf_counter() - started)
+    return output, best, peak
+
+
+def main(argv=None):
+    """
+    Benchmark both renderers and report one JSON line per run.
+
+    Returns:
+        int: The process exit code.
+    """
+    args = parse_args(argv)
+    if args.inputs:
+        inputs = []
+        for path in args.inputs:
+            with open(path, "rb") as midi_file:
+                inputs.append((os.path.basename(path), midi_file.read()))
+    else:
+        inputs = sample_midi()
+
+    for name, midi_data in inputs:
+        for renderer, render in (("native", render_native), ("music21", render_music21)):
+            output, seconds, peak = time_renderer(render, midi_data, args.repeat)
+            print(
+                json.dumps(
+                    {
+                        "file": name,
+                        "renderer": renderer,
+                        "rendered": output is not None,
+                        "seconds": round(seconds, 5) if seconds is not None else None,
+                        "peak_memory_kb": round(peak / 1024),
+                        "bytes": len(output) if output is not None else None,
+                    }
+                ),
+                flush=True,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+################################################################################
+# Filename: benchmark_startup.py
+# Purpose:  Profile how long the server takes to import and boot a worker.
+# Author:   Darren Seubert
+#
+# Description:
+# This script runs each startup step in a fresh Python process with
+# -X importtime and reports, as one JSON line per step, the wall time of the
+# process, the total import time, the modules that took the longest to
+# import (self time, children excluded) and which of the heavy libraries
+# (TensorFlow, music21, librosa) were imported. The steps are importing the
+# app package, creating the Flask application, importing the Basic Pitch
+# modules as the gunicorn master does before forking, and the Basic Pitch
+# imports in a forked worker after the master imported them.
+#
+# Usage (Optional):
+# From the server directory, run:
+#   python benchmark_startup.py
+#   python benchmark_startup.py --top 20 --repeat 3
+#
+# Notes:
+# - The fastest of the repeated runs is reported, as the first run also pays
+#   for reading the files from disk.
+# - DATABASE_URL defaults to an in-memory SQLite database; no step connects.
+#
+###############################################################################
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ("tensorflow", "music21", "librosa")
+
+# Startup steps, each run as a separate Python program
+STEPS = {
+    "import_app": "import app",
+    "create_app": "from app import create_app; create_app()",
+    "preload_master": (
+        "from app import create_app; create_app()\n"
+        "from app.utils.model_manager import import_model_modules; import_model_modules()"
+    ),
+    # Time the imports a worker forked from a preloaded master still runs
+    "forked_worker": (
+        "import os, sys, time\n"
+        "from app import create_app; create_app()\n"
+        "from app.utils.model_manager import import_model_modules; import_model_modules()\n"
+        "pid = os.fork()\n"
+        "if pid == 0:\n"
+        "    start = time.perf_counter()\n"
+        "    import_model_modules()\n"
+        "    sys.stderr.write(f'worker_seconds={time.perf_counter() - start}\\n')\n"
+        "    os._exit(0)\n"
+        "os.waitpid(pid, 0)\n"
+    ),
+}
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line arguments.
+
+    Args:
+        argv (list): Arguments to parse, defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Profile the server's import and boot time.")
+    parser.add_argument(
+        "steps",
+        nargs="*",
+        help=f"steps to profile, of {', '.join(STEPS)} (default: all)",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        help="slowest modules to report per step (default: 10)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="runs per step, the fastest is reported (default: 3)",
+    )
+    args = parser.parse_args(argv)
+    for step in args.steps:
+        if step not in STEPS:
+            parser.error(f"unknown step: {step}")
+    return args
+
+
+def parse_import_times(stderr: str) -> list:
+    """
+    Parse the -X importtime lines of a process's standard error.
+
+    Args:
+        stderr (str): The standard error of the process.
+
+    Returns:
+        list: (module, self microseconds, cumulative microseconds, depth)
+        tuples, in the order the imports finished.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return imports
+
+
+def run_step(code: str) -> tuple:
+    """
+    Run a startup step in a new Python process with -X importtime.
+
+    Returns:
+        tuple: The wall time in seconds and the process's standard error.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=SERVER_DIR,
+        capture_output=True,
+        text=True,
+        check=False,
+        # create_app only needs a database URL, it does not connect
+        env={"DATABASE_URL": "sqlite://", **os.environ},
+    )
+    seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return seconds, result.stderr
+
+
+def profile_step(name: str, repeat: int, top: int) -> dict:
+    """
+    Profile one startup step.
+
+    Args:
+        name (str): The step, a key of STEPS.
+        repeat (int): Number of runs; the fastest is reported.
+        top (int): Number of slowest modules to report.
+
+    Returns:
+        dict: The report of the fastest run.
+    """
+    seconds, stderr = min(run_step(STEPS[name]) for _ in range(repeat))
+    imports = parse_import_times(stderr)
+    modules = {module for module, _, _, _ in imports}
+    slowest = sorted(imports, key=lambda entry: entry[1], reverse=True)[:top]
+    report = {
+        "step": name,
+        "seconds": round(seconds, 3),
+        # Only top-level imports, as cumulative times include the children
+        "import_seconds": round(sum(entry[2] for entry in imports if entry[3] == 0) / 1e6, 3),
+        "modules": len(imports),
+        "heavy_modules": [module for module in HEAVY_MODULES if module in modules],
+        "slowest": [
+            {"module": module, "self_ms": round(self_us / 1000, 1)}
+            for module, self_us, _, _ in slowest
+        ],
+    }
+    worker = re.search(r"^worker_seconds=(\S+)$", stderr, re.MULTILINE)
+    if worker:
+        report["worker_seconds"] = round(float(worker.group(1)), 4)
+    return report
+
+
+def main(argv=None):
+    """
+    Profile each startup step and report one JSON line per step.
+
+    Returns:
+        int: The process exit code.
+    """
+    args = parse_args(argv)
+    for name in args.steps or STEPS:
+        print(json.dumps(profile_step(name, args.repeat, args.top)), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+################################################################################
+# Filename: benchmark_transcribers.py
+# Purpose:  Compare the speed and accuracy of the transcribers.
+# Author:   Darren Seubert
+#
+# Description:
+# This script decodes each given recording once and transcribes it with every
+# transcriber, timing each run after a warm-up run. The notes of Basic Pitch
+# are taken as the reference: a note of another transcriber counts as found
+# when it has the same pitch and starts within the onset tolerance of a
+# reference note, and precision, recall and F1 are reported from those
+# matches. One JSON line per recording and transcriber is printed, followed
+# by a summary line per transcriber.
+#
+# Usage (Optional):
+# From the server directory, run:
+#   python benchmark_transcribers.py
+#   python benchmark_transcribers.py takes/*.wav --repeat 5
+#
+# Notes:
+# Without arguments the sample recordings in app/utils/audio_sample are used.
+# Basic Pitch is not ground truth, so the scores measure agreement with it.
+#
+###############################################################################
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from app.utils.conversion import AUDIO_SAMPLE_RATE, TRANSCRIBERS, decode_audio
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), "app", "utils", "audio_sample")
+REFERENCE = "basic_pitch"
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line arguments.
+
+    Args:
+        argv (list): Arguments to parse, defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare the speed and accuracy of the transcribers."
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        help="audio files (default: the sample recordings)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="timed runs per recording and transcriber (default: 3)",
+    )
+    parser.add_argument(
+        "--onset-tolerance",
+        type=float,
+        default=0.05,
+        help="largest onset difference of a matching note, in seconds (default: 0.05)",
+    )
+    return parser.parse_args(argv)
+
+
+def match_notes(reference, estimated, onset_tolerance):
+    """
+    Count the estimated notes matching a reference note one to one.
+
+    Args:
+        reference (list): Reference note events.
+        estimated (list): Estimated note events.
+        onset_tolerance (float): Largest onset difference, in seconds.
+
+    Returns:
+        int: The number of matched notes.
+    """
+    unmatched = sorted(estimated, key=lambda note: note[0])
+    matched = 0
+    for start, _, pitch, *_ in sorted(reference, key=lambda note: note[0]):
+        for i, (other_start, _, other_pitch, *_) in enumerate(unmatched):
+            if other_pitch == pitch and abs(other_start - start) <= onset_tolerance:
+                del unmatched[i]
+                matched += 1
+                break
+    return matched
+
+
+def scores(n_reference, n_estimated, matched):
+    """
+    Return precision, recall and F1 of a match count.
+    """
+    precision = matched / n_estimated if n_estimated else 0.0
+    recall = matched / n_reference if n_reference else 0.0
+    total = precision + recall
+    return precision, recall, 2 * precision * recall / total if total else 0.0
+
+
+def time_transcriber(transcriber, pcm, repeat):
+    """
+    Transcribe samples repeat times after a warm-up run.
+
+    Returns:
+        tuple: The note events and the fastest run time in seconds.
+    """
+    note_events = transcriber.transcribe(pcm)
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        transcriber.transcribe(pcm)
+        best = min(best, time.perf_counter() - started)
+    return note_events, best
+
+
+def main(argv=None):
+    """
+    Benchmark every transcriber and report one JSON line per run.
+
+    Returns:
+        int: The process exit code.
+    """
+    args = parse_args(argv)
+    inputs = args.inputs or sorted(glob.glob(os.path.join(SAMPLE_DIR, "sample_*")))
+
+    totals = {name: {"seconds": 0.0, "audio": 0.0, "notes": 0, "matched": 0, "reference": 0}
+              for name in TRANSCRIBERS}
+    for path in inputs:
+        pcm = decode_audio(path)
+        duration = len(pcm) / AUDIO_SAMPLE_RATE
+        results = {
+            name: time_transcriber(transcriber, pcm, args.repeat)
+            for name, transcriber in TRANSCRIBERS.items()
+        }
+        reference = results[REFERENCE][0]
+
+        for name, (note_events, seconds) in results.items():
+            matched = match_notes(reference, note_events, args.onset_tolerance)
+            precision, recall, f1 = scores(len(reference), len(note_events), matched)
+            total = totals[name]
+            total["seconds"] += seconds
+            total["audio"] += duration
+            total["notes"] += len(note_events)
+            total["matched"] += matched
+            total["reference"] += len(reference)
+            print(
+                json.dumps(
+                    {
+                        "file": os.path.basename(path),
+                        "transcriber": name,
+                        "duration": round(duration, 2),
+                        "seconds": round(seconds, 4),
+                        "realtime_factor": round(duration / seconds, 1),
+                        "notes": len(note_events),
+                        "precision": round(precision, 3),
+                        "recall": round(recall, 3),
+                        "f1": round(f1, 3),
+                    }
+                ),
+                flush=True,
+            )
+
+    for name, total in totals.items():
+        precision, recall, f1 = scores(total["reference"], total["notes"], total["matched"])
+        print(
+            json.dumps(
+                {
+                    "transcriber": name,
+                    "summary": True,
+                    "seconds": round(total["seconds"], 4),
+                    "realtime_factor": round(total["audio"] / total["seconds"], 1)
+                    if total["seconds"]
+                    else None,
+                    "precision": round(precision, 3),
+                    "recall": round(recall, 3),
+                    "f1": round(f1, 3),
+                }
+            ),
+            flush=True,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
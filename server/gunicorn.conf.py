@@ -0,0 +1,116 @@
+################################################################################
+# Filename: gunicorn.conf.py
+# Purpose:  Configure gunicorn for serving the Flask application.
+# Author:   Darren Seubert
+#
+# Description:
+# gunicorn reads this file automatically when it is started from the server
+# directory. The worker class, worker count, timeouts and recycling come
+# from the serving pool named by SERVING_POOL (see app/utils/serving.py):
+# "io" for metadata and downloads, "cpu" for conversions, or "all" for both.
+#
+# The application is loaded in the master process before forking. In pools
+# that convert, Basic Pitch and TensorFlow are imported there as well, so
+# the workers share the imported code copy-on-write and boot in
+# milliseconds, and each worker then loads and warms up its own Basic Pitch
+# model as soon as it boots, so the first upload handled by a worker does not
+# pay for loading the model. Every worker starts its music21 processes (see
+# app/utils/musicxml_pool.py), and a worker that is stopped or recycled
+# finishes its queued jobs, within part of the graceful timeout, before it
+# exits.
+# Jobs a worker could not finish are queued again, or failed, by the next
+# worker that boots in a pool that converts.
+#
+# Usage:
+#   gunicorn run:app
+#   SERVING_POOL=io gunicorn run:app
+#
+# Notes:
+# - Options given on the command line take precedence over this file.
+# - Set MODEL_WARMUP=0 to skip the warm-up.
+# - Set GUNICORN_PRELOAD=0 to import the application in each worker instead,
+#   e.g. to use --reload, which does not work with a preloaded application.
+# - The master never loads the model, opens a database connection or starts
+#   a thread or music21 process; all of those belong to the workers.
+#
+###############################################################################
+
+import os
+
+from app.utils.serving import get_pool
+
+pool = get_pool()
+bind = pool.settings["bind"]
+workers = pool.settings["workers"]
+threads = pool.settings["threads"]
+worker_class = pool.settings["worker_class"]
+timeout = pool.settings["timeout"]
+graceful_timeout = pool.settings["graceful_timeout"]
+keepalive = pool.settings["keepalive"]
+# Recycle workers after a number of requests, 0 never recycles them
+max_requests = pool.settings["max_requests"]
+max_requests_jitter = pool.settings["max_requests_jitter"]
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1").lower() not in {"0", "false", "no"}
+proc_name = f"melody-{pool.name}"
+# Share of the graceful timeout a stopping worker waits for its queued jobs.
+# The timeout runs from the stop signal, and the worker has already spent
+# part of it finishing its requests, so the rest is left for that and for
+# stopping its music21 and batch processes before it is killed.
+JOB_DRAIN_SHARE = 0.5
+
+
+def on_starting(server):
+    """
+    Import the Basic Pitch and TensorFlow modules in the master before any
+    worker is forked, when the application is preloaded and the pool
+    converts uploads.
+    """
+    print(f"Serving the {pool.name} pool: {pool.settings}")
+    if server.cfg.preload_app and pool.load_model:
+        from app.utils.model_manager import import_model_modules
+
+        import_model_modules()
+
+
+def post_worker_init(worker):
+    """
+    Load and warm up the Basic Pitch model once the worker has booted, and
+    start the music21 processes, which warm up in the background.
+    """
+    from app.utils.model_manager import model_manager, warmup_enabled
+    from app.utils.musicxml_pool import musicxml_pool
+
+    musicxml_pool.start()
+    if pool.load_model:
+        recover_jobs(worker)
+        if warmup_enabled():
+            model_manager.warm_up()
+
+
+def recover_jobs(worker):
+    """
+    Queue the jobs the worker's predecessors left behind (see
+    job_controller.recover_jobs). A database that cannot be reached only
+    delays the recovery until the next worker boots.
+    """
+    from app.controllers.job_controller import recover_jobs as recover
+
+    try:
+        recover(worker.wsgi)
+    except Exception as e:
+        print(f"[pid {os.getpid()}] Could not recover conversion jobs: {e}")
+
+
+def worker_exit(server, worker):
+    """
+    Finish the jobs queued in the worker and stop its music21 and batch
+    conversion processes.
+    """
+    from app.utils.batch_conversion import batch_pool
+    from app.utils.job_queue import job_queue
+    from app.utils.musicxml_pool import musicxml_pool
+
+    if not job_queue.join(worker.cfg.graceful_timeout * JOB_DRAIN_SHARE):
+        print(f"[pid {os.getpid()}] Exiting with {job_queue.pending()} jobs still queued")
+    musicxml_pool.shutdown()
+    batch_pool.shutdown()
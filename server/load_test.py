@@ -0,0 +1,410 @@
+################################################################################
+# Filename: load_test.py
+# Purpose:  Load test the server with a mix of uploads and metadata requests.
+# Author:   Darren Seubert
+#
+# Description:
+# This script sends uploads (POST /api/v1/midis) from a few clients and
+# metadata and download requests (GET an entry, its MIDI file and the list
+# of entries) from many others at the same time, for a fixed duration, and
+# reports the latency percentiles and throughput of each kind of request as
+# one JSON line per setup and kind.
+#
+# By default it starts the server itself with gunicorn, on a temporary
+# SQLite database and blob store, in two setups: "single", one pool of sync
+# workers serving every route, and "split", the io and cpu pools of
+# app/utils/serving.py with each request sent to its pool as Nginx does.
+# Both setups get the same number of workers that convert uploads, so the
+# difference is what the threaded io pool gains for the cheap requests.
+#
+# Usage (Optional):
+# From the server directory, run:
+#   python load_test.py
+#   python load_test.py --setup split --duration 60 --uploaders 4 --readers 16
+#   python load_test.py --url http://localhost:8080
+#
+# Notes:
+# - --url load tests a running server instead, e.g. through Nginx.
+# - The conversion cache is disabled in the servers started here, as every
+#   upload sends the same recording.
+#
+###############################################################################
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from app.utils.serving import pool_for_request
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_AUDIO = os.path.join(SERVER_DIR, "app", "utils", "audio_sample", "sample_wav.wav")
+FIRST_PORT = 5100
+# Seconds the servers may take to boot, model warm-up included
+BOOT_TIMEOUT = 300
+REQUEST_TIMEOUT = 600
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line arguments.
+
+    Args:
+        argv (list): Arguments to parse, defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Load test the server with a mix of uploads and metadata requests."
+    )
+    parser.add_argument(
+        "--setup",
+        choices=["single", "split", "both"],
+        default="both",
+        help="server setup to start and load test (default: both)",
+    )
+    parser.add_argument("--url", help="load test the server at this URL instead")
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=30,
+        help="seconds to send requests for (default: 30)",
+    )
+    parser.add_argument(
+        "--uploaders",
+        type=int,
+        default=2,
+        help="clients sending uploads one after another (default: 2)",
+    )
+    parser.add_argument(
+        "--readers",
+        type=int,
+        default=8,
+        help="clients sending metadata and download requests (default: 8)",
+    )
+    parser.add_argument(
+        "--think",
+        type=float,
+        default=0.2,
+        help="seconds each reader waits between requests (default: 0.2)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="workers converting uploads in each setup (default: 2)",
+    )
+    parser.add_argument(
+        "--audio",
+        default=SAMPLE_AUDIO,
+        help="recording to upload (default: the sample WAV file)",
+    )
+    parser.add_argument(
+        "-t",
+        "--transcriber",
+        help="transcriber of the uploads (default: the server's)",
+    )
+    return parser.parse_args(argv)
+
+
+def multipart_body(fields: dict, file_field: str, filename: str, data: bytes) -> tuple:
+    """
+    Encode form fields and one file as multipart/form-data.
+
+    Returns:
+        tuple: The request body and its Content-Type header.
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+            f"{value}\r\n".encode("utf-8")
+        )
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+        f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode("utf-8")
+        + data
+        + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class Router:
+    """
+    Send each request to the pool that serves it, as the reverse proxy does.
+
+    Attributes:
+        urls (dict): Base URL of each pool, "io" and "cpu", which may be the
+            same server.
+    """
+
+    def __init__(self, io_url: str, cpu_url: str | None = None):
+        self.urls = {"io": io_url.rstrip("/"), "cpu": (cpu_url or io_url).rstrip("/")}
+
+    def request(self, method: str, path: str, body=None, content_type=None) -> bytes:
+        """
+        Send a request and return the response body.
+
+        Raises:
+            urllib.error.URLError: If the request fails or is answered with an
+                error status.
+        """
+        url = self.urls[pool_for_request(method, path)] + path
+        request = urllib.request.Request(url, data=body, method=method)
+        if content_type:
+            request.add_header("Content-Type", content_type)
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            return response.read()
+
+
+class LoadTest:
+    """
+    Clients sending requests until a deadline, and their latencies.
+
+    Attributes:
+        router (Router): Where the requests are sent.
+        upload (tuple): Multipart body and content type of an upload.
+        latencies (dict): Seconds each successful request took, by kind.
+        errors (dict): Number of failed requests, by kind.
+    """
+
+    def __init__(self, router: Router, audio_path: str, transcriber: str | None):
+        self.router = router
+        fields = {"name": "Load Test", "email": "load@test.local", "title": "Load test"}
+        if transcriber:
+            fields["transcriber"] = transcriber
+        with open(audio_path, "rb") as audio_file:
+            self.upload = multipart_body(
+                fields, "file", os.path.basename(audio_path), audio_file.read()
+            )
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def upload_entry(self) -> dict:
+        """
+        Upload the recording once and return the new entry.
+        """
+        body, content_type = self.upload
+        return json.loads(self.router.request("POST", "/api/v1/midis", body, content_type))
+
+    def _timed(self, kind: str, method: str, path: str, body=None, content_type=None):
+        """
+        Send one request and record its latency or failure.
+        """
+        started = time.perf_counter()
+        try:
+            self.router.request(method, path, body, content_type)
+        except (urllib.error.URLError, OSError) as e:
+            print(f"{kind} {path} failed: {e}", file=sys.stderr)
+            with self._lock:
+                self.errors[kind] = self.errors.get(kind, 0) + 1
+            return
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies.setdefault(kind, []).append(elapsed)
+
+    def _uploader(self, deadline: float):
+        body, content_type = self.upload
+        while time.monotonic() < deadline:
+            self._timed("upload", "POST", "/api/v1/midis", body, content_type)
+
+    def _reader(self, deadline: float, entry: dict, think: float):
+        paths = [
+            ("metadata", entry["url"]),
+            ("download", entry["midi_url"]),
+            ("list", "/api/v1/midis"),
+        ]
+        while time.monotonic() < deadline:
+            for kind, path in paths:
+                self._timed(kind, "GET", path)
+                time.sleep(think)
+
+    def run(self, duration: float, uploaders: int, readers: int, think: float) -> float:
+        """
+        Run the clients for a duration.
+
+        Returns:
+            float: Seconds until the last client finished.
+        """
+        entry = self.upload_entry()
+        started = time.monotonic()
+        deadline = started + duration
+        threads = [
+            threading.Thread(target=self._uploader, args=(deadline,)) for _ in range(uploaders)
+        ] + [
+            threading.Thread(target=self._reader, args=(deadline, entry, think)) for _ in range(readers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.monotonic() - started
+
+    def report(self, setup: str, elapsed: float) -> list:
+        """
+        Summarize the latencies of each kind of request.
+
+        Returns:
+            list: One dict per kind of request.
+        """
+        reports = []
+        for kind in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies.get(kind, []))
+
+            def percentile(fraction):
+                if not latencies:
+                    return None
+                index = min(int(fraction * len(latencies)), len(latencies) - 1)
+                return round(latencies[index] * 1000, 1)
+
+            reports.append(
+                {
+                    "setup": setup,
+                    "kind": kind,
+                    "requests": len(latencies),
+                    "errors": self.errors.get(kind, 0),
+                    "per_second": round(len(latencies) / elapsed, 2),
+                    "p50_ms": percentile(0.5),
+                    "p95_ms": percentile(0.95),
+                    "p99_ms": percentile(0.99),
+                    "max_ms": round(latencies[-1] * 1000, 1) if latencies else None,
+                }
+            )
+        return reports
+
+
+def create_database(url: str):
+    """
+    Create the tables of a new database.
+    """
+    from app import create_app
+    from app.database import db
+
+    class Config:
+        SQLALCHEMY_DATABASE_URI = url
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    app = create_app(Config)
+    with app.app_context():
+        db.create_all()
+
+
+def start_pool(pool: str, port: int, env: dict, log_path: str) -> subprocess.Popen:
+    """
+    Start a gunicorn server for one serving pool.
+
+    Returns:
+        subprocess.Popen: The gunicorn master process.
+    """
+    with open(log_path, "ab") as log:
+        return subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "run:app"],
+            cwd=SERVER_DIR,
+            env={**env, "SERVING_POOL": pool, "GUNICORN_BIND": f"127.0.0.1:{port}"},
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+
+
+def wait_ready(url: str, process: subprocess.Popen, log_path: str):
+    """
+    Wait until a server answers requests.
+
+    Raises:
+        RuntimeError: If the server exits or does not answer in time.
+    """
+    deadline = time.monotonic() + BOOT_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited, see {log_path}")
+        try:
+            urllib.request.urlopen(url + "/api/v1/users", timeout=5).read()
+            return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+    raise RuntimeError(f"The server did not start in time, see {log_path}")
+
+
+def run_setup(setup: str, args, port: int) -> list:
+    """
+    Start the servers of a setup, load test them and stop them.
+
+    Returns:
+        list: The report of each kind of request.
+    """
+    with tempfile.TemporaryDirectory(prefix="melody_load_test_") as directory:
+        database_url = f"sqlite:///{os.path.join(directory, 'load_test.db')}"
+        create_database(database_url)
+        env = {
+            **os.environ,
+            "DATABASE_URL": database_url,
+            "BLOB_STORE": "local",
+            "BLOB_STORE_PATH": os.path.join(directory, "blobs"),
+            "CONVERSION_CACHE_MAX_BYTES": "0",
+        }
+        log_path = os.path.join(SERVER_DIR, f"load_test_{setup}.log")
+        if os.path.exists(log_path):
+            os.remove(log_path)
+
+        if setup == "single":
+            pools = {"all": port}
+            env["GUNICORN_WORKERS"] = str(args.workers)
+        else:
+            pools = {"io": port, "cpu": port + 1}
+        processes = []
+        try:
+            for pool, pool_port in pools.items():
+                pool_env = dict(env)
+                if pool == "cpu":
+                    pool_env["GUNICORN_WORKERS"] = str(args.workers)
+                processes.append(start_pool(pool, pool_port, pool_env, log_path))
+            for process, pool_port in zip(processes, pools.values()):
+                wait_ready(f"http://127.0.0.1:{pool_port}", process, log_path)
+
+            urls = [f"http://127.0.0.1:{pool_port}" for pool_port in pools.values()]
+            load_test = LoadTest(Router(*urls), args.audio, args.transcriber)
+            elapsed = load_test.run(args.duration, args.uploaders, args.readers, args.think)
+            return load_test.report(setup, elapsed)
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+
+
+def main(argv=None):
+    """
+    Run the load test and report one JSON line per setup and kind of request.
+
+    Returns:
+        int: The process exit code.
+    """
+    args = parse_args(argv)
+    if args.url:
+        load_test = LoadTest(Router(args.url), args.audio, args.transcriber)
+        elapsed = load_test.run(args.duration, args.uploaders, args.readers, args.think)
+        reports = load_test.report("url", elapsed)
+    else:
+        setups = ["single", "split"] if args.setup == "both" else [args.setup]
+        reports = []
+        for index, setup in enumerate(setups):
+            reports.extend(run_setup(setup, args, FIRST_PORT + 2 * index))
+
+    for report in reports:
+        print(json.dumps(report), flush=True)
+    return 1 if any(report["errors"] for report in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
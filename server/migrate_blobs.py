@@ -0,0 +1,136 @@
+################################################################################
+# Filename: migrate_blobs.py
+# Purpose:  Move MIDI and MusicXML blobs out of the midis table.
+# Author:   Darren Seubert
+#
+# Description:
+# Rows created before the blob store was introduced keep their MIDI and
+# compressed MusicXML inline in the midi_data and xml_data columns. This
+# script copies those blobs to the configured blob store, records their keys
+# and sizes on the row, and clears the inline columns. Rows are processed in
+# small batches ordered by midi_id and each batch is committed on its own, so
+# the script can be interrupted and run again at any time.
+#
+# Usage (Optional):
+# Apply database/migrations/003_add_midis_blob_keys.sql first, then from the
+# server directory run:
+#   python migrate_blobs.py --batch-size 100
+#
+# Notes:
+# The blob store is selected with the same BLOB_STORE environment variables
+# as the server, so run the script with the server's environment.
+#
+###############################################################################
+
+import argparse
+import sys
+
+from sqlalchemy import or_, select
+
+from app.database import db
+from app.models.midi_model import MIDI
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line arguments.
+
+    Args:
+        argv (list): Arguments to parse, defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Move inline MIDI and MusicXML blobs to the blob store."
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100,
+        help="number of rows to move per transaction (default: 100)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only report how many rows would be moved",
+    )
+    return parser.parse_args(argv)
+
+
+def migrate_rows(store, batch_size=100):
+    """
+    Move the inline blobs of every midis row to a blob store.
+
+    Must be called inside an application context.
+
+    Args:
+        store (BlobStore): The blob store to move the blobs to.
+        batch_size (int): Number of rows loaded and committed at a time.
+
+    Returns:
+        int: The number of rows moved.
+    """
+    inline = or_(MIDI.midi_data.is_not(None), MIDI.xml_data.is_not(None))
+    moved = 0
+    last_id = 0
+    while True:
+        rows = db.session.scalars(
+            select(MIDI)
+            .where(inline, MIDI.midi_id > last_id)
+            .order_by(MIDI.midi_id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return moved
+
+        for midi in rows:
+            if midi.midi_data is not None:
+                if midi.midi_key is None:
+                    midi.midi_key = store.put(midi.midi_data, "midi")
+                    midi.midi_size = len(midi.midi_data)
+                midi.midi_data = None
+            if midi.xml_data is not None:
+                if midi.xml_key is None:
+                    midi.xml_key = store.put(midi.xml_data, "xml")
+                    midi.xml_size = len(midi.xml_data)
+                midi.xml_data = None
+            last_id = midi.midi_id
+
+        db.session.commit()
+        # Release the moved blobs before loading the next batch
+        db.session.expunge_all()
+        moved += len(rows)
+        print(f"Moved {moved} rows (last midi_id {last_id})", flush=True)
+
+
+def main(argv=None):
+    """
+    Move the inline blobs of the configured database.
+
+    Returns:
+        int: The process exit code.
+    """
+    args = parse_args(argv)
+
+    from app import create_app
+    from app.utils.blob_store import blob_store
+
+    app = create_app()
+    with app.app_context():
+        if args.dry_run:
+            pending = db.session.scalar(
+                select(db.func.count(MIDI.midi_id)).where(
+                    or_(MIDI.midi_data.is_not(None), MIDI.xml_data.is_not(None))
+                )
+            )
+            print(f"{pending} rows to move")
+            return 0
+
+        moved = migrate_rows(blob_store, args.batch_size)
+    print(f"Done, moved {moved} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,7 +13,9 @@
 #   python run.py
 #
 # Notes:
-# The development server is for development purposes only.
+# The development server is for development purposes only. gunicorn serves
+# the same application in production (gunicorn run:app, configured by
+# gunicorn.conf.py).
 #
 ###############################################################################
 
@@ -0,0 +1,22 @@
+################################################################################
+# Filename: conftest.py
+# Purpose:  Shared pytest fixtures for the server tests.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains fixtures applied to every test. The blob store used by
+# the controllers is replaced by one in a temporary directory, so tests never
+# write MIDI, MusicXML or audio blobs into the working directory.
+#
+###############################################################################
+
+import pytest
+from app.controllers import midi_controller
+from app.utils.blob_store import LocalBlobStore
+
+
+@pytest.fixture(autouse=True)
+def blob_store(tmp_path, monkeypatch):
+    store = LocalBlobStore(str(tmp_path / "blobs"))
+    monkeypatch.setattr(midi_controller, "blob_store", store)
+    return store
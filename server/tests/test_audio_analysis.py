@@ -0,0 +1,159 @@
+################################################################################
+# Filename: test_audio_analysis.py
+# Purpose:  Contains pytest test cases for key and tempo estimation.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains pytest test cases for the AudioAnalyzer class, including
+# key estimation of synthetic major and minor melodies, tempo estimation of
+# click tracks, the onset autocorrelation accumulated block by block, results
+# that do not depend on how samples are chunked, silent input, and
+# the key signature and tempo written to converted MIDI files.
+#
+# Usage (Optional):
+# Run the tests using the pytest command:
+#   python -m pytest
+#
+###############################################################################
+
+from io import BytesIO
+import mido
+import numpy as np
+import pytest
+import app.utils.audio_analysis as audio_analysis
+import app.utils.conversion as conversion
+from app.utils.audio_analysis import (
+    AudioAnalyzer,
+    OnsetAutocorrelation,
+    analyze_pcm,
+    estimate_key,
+    estimate_tempo,
+)
+
+SAMPLE_RATE = 22050
+
+
+def melody(midi_notes, beat_seconds):
+    """Return decaying sine tones, one per beat."""
+    t = np.arange(int(beat_seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    tones = [
+        np.sin(2 * np.pi * 440.0 * 2 ** ((note - 69) / 12) * t) * np.exp(-3 * t)
+        for note in midi_notes
+    ]
+    return np.concatenate(tones).astype(np.float32)
+
+
+def clicks(bpm, seconds):
+    """Return a click track at a tempo."""
+    pcm = np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+    click = np.hanning(200) * np.sin(np.arange(200) * 0.8)
+    for start in np.arange(0, seconds - 0.01, 60 / bpm):
+        index = int(start * SAMPLE_RATE)
+        pcm[index : index + 200] += click[: len(pcm) - index]
+    return pcm
+
+
+@pytest.mark.parametrize(
+    "notes, key",
+    [
+        ([60, 64, 67, 72, 67, 64, 62, 65, 69, 71, 67, 60], "C major"),
+        ([57, 60, 64, 69, 64, 60, 57, 52], "A minor"),
+        ([62, 66, 69, 74, 69, 66, 64, 67, 71, 73, 69, 62], "D major"),
+    ],
+)
+def test_key(notes, key):
+    """
+    Test that the key of a melody outlining its triads is found.
+    """
+    assert analyze_pcm(melody(notes * 4, 0.5), SAMPLE_RATE)["key"] == key
+
+
+def test_key_profiles_are_rotated():
+    """
+    Test that a chroma vector equal to a key profile gives that key.
+    """
+    from app.utils.audio_analysis import MINOR_PROFILE
+
+    assert estimate_key(np.roll(MINOR_PROFILE, 9)) == 12 + 9
+    assert estimate_key(np.ones(12)) is None
+
+
+@pytest.mark.parametrize("bpm", [90, 120, 150])
+def test_tempo(bpm):
+    """
+    Test that the tempo of a click track is found.
+    """
+    assert analyze_pcm(clicks(bpm, 20), SAMPLE_RATE)["tempo"] == pytest.approx(bpm, rel=0.02)
+
+
+def test_chunking_does_not_change_results():
+    """
+    Test that feeding samples in chunks of any size gives identical results.
+    """
+    pcm = melody([57, 60, 64, 69] * 8, 0.4)
+    expected = analyze_pcm(pcm, SAMPLE_RATE)
+
+    for chunk_samples in (1000, 4096, 100000):
+        analyzer = AudioAnalyzer(SAMPLE_RATE)
+        chunks = (pcm[i : i + chunk_samples] for i in range(0, len(pcm), chunk_samples))
+        assert sum(len(chunk) for chunk in analyzer.tap(chunks)) == len(pcm)
+        assert analyzer.finish() == expected
+        # One onset strength per frame centered on every hop_length-th sample
+        assert analyzer.onset_autocorrelation.count == (len(pcm) - 1) // analyzer.hop_length + 1
+
+
+def test_onset_autocorrelation_matches_estimate_tempo():
+    """
+    Test that the autocorrelation accumulated in blocks gives the tempo found
+    from the whole envelope.
+    """
+    frame_rate = SAMPLE_RATE / 512
+    rng = np.random.default_rng(0)
+    envelope = rng.random(2000)
+    envelope[::25] += 5
+
+    n_lags = AudioAnalyzer(SAMPLE_RATE).onset_autocorrelation.n_lags
+    autocorrelation = OnsetAutocorrelation(n_lags)
+    for start in range(0, len(envelope), 256):
+        autocorrelation.add(envelope[start : start + 256])
+
+    centered = envelope - envelope.mean()
+    expected = [centered[: len(centered) - lag] @ centered[lag:] for lag in range(n_lags)]
+    assert autocorrelation.result() == pytest.approx(expected)
+    tempo = audio_analysis.tempo_from_autocorrelation(autocorrelation.result(), frame_rate)
+    assert tempo == pytest.approx(estimate_tempo(envelope, frame_rate))
+    assert tempo == pytest.approx(60 * frame_rate / 25, rel=0.01)
+
+    flat = OnsetAutocorrelation(n_lags)
+    flat.add(np.full(2000, 0.3))
+    assert flat.result() is None
+
+
+def test_silence():
+    """
+    Test that silence and empty input have no key and the default tempo.
+    """
+    for pcm in (np.zeros(SAMPLE_RATE, dtype=np.float32), np.zeros(0, dtype=np.float32)):
+        assert analyze_pcm(pcm, SAMPLE_RATE) == {
+            "key_number": None,
+            "key": None,
+            "tempo": 120.0,
+        }
+
+
+def test_converted_midi_has_key_and_tempo():
+    """
+    Test that converted MIDI files carry the estimated key signature and tempo.
+    """
+    pcm = melody([57, 60, 64, 69, 64, 60, 57, 52] * 4, 0.5)
+    analysis = analyze_pcm(pcm, SAMPLE_RATE)
+
+    midi_data = conversion.convert_pcm_to_midi(pcm, conversion.get_transcriber("dsp"))
+
+    meta = {
+        message.type: message
+        for message in mido.MidiFile(file=BytesIO(midi_data)).tracks[0]
+        if message.is_meta
+    }
+    assert meta["key_signature"].key == "Am"
+    assert mido.tempo2bpm(meta["set_tempo"].tempo) == pytest.approx(analysis["tempo"], rel=1e-4)
@@ -0,0 +1,229 @@
+################################################################################
+# Filename: test_audio_decoder.py
+# Purpose:  Contains pytest test cases for decoding audio through ffmpeg.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains pytest test cases for decoding files and upload streams
+# to PCM through an ffmpeg pipe, including chunked reads, the temporary file
+# fallback for seekable containers, WEBM recordings, decoding errors,
+# rejecting playlists that point at other files, and creating a MIDI from an
+# upload without saving it. The tests are skipped when ffmpeg is missing.
+#
+# Usage (Optional):
+# Run the tests using the pytest command:
+#   python -m pytest
+#
+###############################################################################
+
+from io import BytesIO
+import os
+import shutil
+import subprocess
+import tempfile
+import numpy as np
+import pytest
+from app import create_app
+from app.controllers import midi_controller
+from app.database import db
+from app.test_config import TestingConfig
+from app.utils import audio_decoder
+from app.utils.conversion_cache import ConversionCache
+from app.utils.status_codes import BAD_REQUEST, CREATED
+
+pytestmark = pytest.mark.skipif(
+    shutil.which(audio_decoder.FFMPEG_BINARY) is None, reason="ffmpeg is not installed"
+)
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), "..", "app", "utils", "audio_sample")
+SAMPLE_WAV = os.path.join(SAMPLE_DIR, "sample_wav.wav")
+SAMPLE_M4A = os.path.join(SAMPLE_DIR, "sample_m4a.m4a")
+
+
+def test_decode_file():
+    """
+    Test decoding a file to mono float32 samples at the model's rate.
+    """
+    pcm = audio_decoder.decode_file(SAMPLE_WAV)
+
+    assert pcm.dtype == np.float32
+    assert pcm.ndim == 1
+    # The sample is about 14.8 seconds long
+    assert abs(len(pcm) / audio_decoder.AUDIO_SAMPLE_RATE - 14.77) < 0.05
+    assert 0 < np.abs(pcm).max() <= 1
+
+
+def test_decode_stream_matches_file():
+    """
+    Test that piping a stream decodes the same samples as reading the file.
+    """
+    with open(SAMPLE_WAV, "rb") as audio_file:
+        pcm = audio_decoder.decode_stream(audio_file, "sample.wav")
+
+    np.testing.assert_array_equal(pcm, audio_decoder.decode_file(SAMPLE_WAV))
+
+
+def test_iter_pcm_chunks():
+    """
+    Test that samples are yielded in chunks of the requested size.
+    """
+    chunks = list(audio_decoder.iter_pcm_chunks(path=SAMPLE_WAV, chunk_samples=4096))
+
+    assert all(len(chunk) == 4096 for chunk in chunks[:-1])
+    assert 0 < len(chunks[-1]) <= 4096
+    np.testing.assert_array_equal(
+        np.concatenate(chunks), audio_decoder.decode_file(SAMPLE_WAV)
+    )
+
+
+def test_decode_seekable_container(tmp_path, monkeypatch):
+    """
+    Test that M4A uploads are decoded through a temporary file that is removed.
+    """
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+
+    with open(SAMPLE_M4A, "rb") as audio_file:
+        pcm = audio_decoder.decode_stream(audio_file, "sample.m4a")
+
+    assert len(pcm) > audio_decoder.AUDIO_SAMPLE_RATE
+    assert os.listdir(tmp_path) == []
+
+
+def test_decode_webm_stream(tmp_path):
+    """
+    Test that a WEBM recording is decoded straight from a pipe, without an MP3.
+    """
+    webm_path = tmp_path / "take.webm"
+    subprocess.run(
+        [audio_decoder.FFMPEG_BINARY, "-loglevel", "error", "-i", SAMPLE_WAV,
+         "-c:a", "libopus", str(webm_path)],
+        check=True,
+    )
+
+    with open(webm_path, "rb") as audio_file:
+        pcm = audio_decoder.decode_stream(audio_file, "take.webm")
+
+    assert pcm.dtype == np.float32
+    assert abs(len(pcm) / audio_decoder.AUDIO_SAMPLE_RATE - 14.77) < 0.05
+    assert os.listdir(tmp_path) == ["take.webm"]
+
+
+def test_decode_invalid_audio():
+    """
+    Test that data ffmpeg cannot decode raises an AudioDecodeError.
+    """
+    with pytest.raises(audio_decoder.AudioDecodeError):
+        audio_decoder.decode_stream(BytesIO(b"not audio"), "song.mp3")
+
+
+def playlists(audio_path):
+    """
+    Return HLS and concat playlists that would read another audio file.
+    """
+    return {
+        "hls.m3u8": (
+            "#EXTM3U\n#EXT-X-TARGETDURATION:15\n#EXTINF:15,\n"
+            f"file://{os.path.abspath(audio_path)}\n#EXT-X-ENDLIST\n"
+        ).encode(),
+        "list.ffconcat": (
+            f"ffconcat version 1.0\nfile '{os.path.abspath(audio_path)}'\n"
+        ).encode(),
+    }
+
+
+@pytest.mark.parametrize("filename", ["hls.m3u8", "list.ffconcat"])
+def test_decode_rejects_playlists(tmp_path, filename):
+    """
+    Test that playlists are rejected instead of reading the files they list.
+    """
+    payload = playlists(SAMPLE_WAV)[filename]
+    playlist_path = tmp_path / filename
+    playlist_path.write_bytes(payload)
+
+    with pytest.raises(audio_decoder.AudioDecodeError, match="whitelist"):
+        audio_decoder.decode_file(str(playlist_path))
+    with pytest.raises(audio_decoder.AudioDecodeError):
+        audio_decoder.decode_stream(BytesIO(payload), filename)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(midi_controller, "AUDIO_UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(midi_controller, "convert_pcm_to_midi", lambda pcm, transcriber: b"MThd")
+    monkeypatch.setattr(
+        midi_controller, "midi_to_musicxml", lambda midi_data: b"<score-partwise/>"
+    )
+    monkeypatch.setattr(
+        midi_controller, "conversion_cache", ConversionCache(str(tmp_path), 0)
+    )
+
+    app = create_app(TestingConfig)
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def post_audio(client, stream, filename, **fields):
+    return client.post(
+        "api/v1/midis",
+        data={
+            "name": "John",
+            "email": "john@gmail.com",
+            "title": "A Random Song",
+            "file": (stream, filename),
+            **fields,
+        },
+        content_type="multipart/form-data",
+    )
+
+
+def test_create_midi_streams_upload(client, tmp_path):
+    """
+    Test that an upload is converted without being saved to the upload folder.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    with open(SAMPLE_WAV, "rb") as audio_file:
+        response = post_audio(client, audio_file, "sample.wav")
+
+    assert response.status_code == CREATED
+    assert client.get(response.json["midi_url"]).data == b"MThd"
+    assert not os.path.exists(tmp_path / "uploads")
+
+
+def test_create_midi_invalid_upload(client):
+    """
+    Test that uploads ffmpeg cannot decode return BAD REQUEST.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    response = post_audio(client, BytesIO(b"fLaC"), "song.flac")
+    assert response.status_code == BAD_REQUEST
+    assert response.json["message"] == "Unsupported audio format"
+
+    response = post_audio(client, BytesIO(b"not audio"), "song.mp3")
+    assert response.status_code == BAD_REQUEST
+    assert response.json["message"] == "Unsupported audio format"
+
+    for filename, payload in playlists(SAMPLE_WAV).items():
+        response = post_audio(client, BytesIO(payload), filename)
+        assert response.status_code == BAD_REQUEST
+        assert response.json["message"] == "Unsupported audio format"
+
+
+def test_create_midi_unknown_transcriber(client):
+    """
+    Test that selecting a transcriber that does not exist returns BAD REQUEST.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    with open(SAMPLE_WAV, "rb") as audio_file:
+        response = post_audio(client, audio_file, "sample.wav", transcriber="crepe")
+
+    assert response.status_code == BAD_REQUEST
+    assert response.json["message"] == "Unknown transcriber"
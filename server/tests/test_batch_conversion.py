@@ -0,0 +1,344 @@
+################################################################################
+# Filename: test_batch_conversion.py
+# Purpose:  Contains pytest test cases for batch conversion of recordings.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains pytest test cases for staging audio files and zip
+# archives, converting a batch with per-file error isolation, sharing one
+# pool between batches, batch limits, and the batch conversion endpoint that
+# streams one result per file. The process pool is replaced by a thread pool,
+# and decoding and conversion by fakes so the tests run without ffmpeg or
+# Basic Pitch.
+#
+# Usage (Optional):
+# Run the tests using the pytest command:
+#   python -m pytest
+#
+###############################################################################
+
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+import json
+import os
+import zipfile
+import pytest
+import app.utils.batch_conversion as batch_conversion
+from app import create_app
+from app.controllers import midi_controller
+from app.database import db
+from app.models.midi_model import MIDI
+from app.test_config import TestingConfig
+from app.utils.batch_conversion import BatchStaging
+from app.utils.status_codes import OK, BAD_REQUEST
+
+
+def make_zip(members):
+    """Build an in-memory zip archive from a name to contents mapping."""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, contents in members.items():
+            archive.writestr(name, contents)
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.fixture(autouse=True)
+def fake_conversion(tmp_path, monkeypatch):
+    """Convert 'good' audio to fake MIDI and fail on anything else."""
+
+    def fake_stream_audio(audio_path):
+        with open(audio_path, "rb") as audio_file:
+            contents = audio_file.read()
+        if contents != b"good":
+            raise RuntimeError("corrupt audio")
+        yield os.path.basename(audio_path)
+
+    def fake_convert_stream_to_midi(pcm_chunks, transcriber=None):
+        return b"MIDI:" + "".join(pcm_chunks).encode()
+
+    monkeypatch.setattr(batch_conversion, "stream_audio", fake_stream_audio)
+    monkeypatch.setattr(
+        batch_conversion, "convert_stream_to_midi", fake_convert_stream_to_midi
+    )
+    monkeypatch.setattr(
+        batch_conversion,
+        "create_executor",
+        lambda n, transcriber=None: ThreadPoolExecutor(n),
+    )
+    monkeypatch.setattr(midi_controller, "batch_pool", batch_conversion.BatchPool(2))
+
+
+def test_staging_zip_archive():
+    """
+    Test that audio members of a zip are staged under unique names.
+    """
+    archive = make_zip(
+        {
+            "a/take.wav": b"good",
+            "b/take.wav": b"good",
+            "notes.txt": b"text",
+            "__MACOSX/a/._take.wav": b"junk",
+        }
+    )
+    with BatchStaging() as staging:
+        staging.add_stream("takes.zip", archive)
+
+        assert [name for name, _ in staging.files] == ["a/take.wav", "b/take.wav"]
+        staged_paths = [path for _, path in staging.files]
+        assert len(set(staged_paths)) == 2
+        assert all(os.path.exists(path) for path in staged_paths)
+        assert staging.skipped == ["notes.txt"]
+
+    assert not os.path.exists(staging.directory)
+
+
+@pytest.mark.parametrize(
+    "limit, value, members",
+    [
+        ("BATCH_MAX_ARCHIVE_MEMBERS", 3, {f"{i}.txt": b"text" for i in range(4)}),
+        ("BATCH_MAX_EXTRACTED_BYTES", 1000, {"take.wav": os.urandom(1001)}),
+        ("BATCH_MAX_COMPRESSION_RATIO", 100, {"bomb.wav": bytes(100000)}),
+    ],
+)
+def test_staging_archive_limits(monkeypatch, limit, value, members):
+    """
+    Test that archives over a limit are rejected before anything is extracted.
+    """
+    monkeypatch.setattr(batch_conversion, limit, value)
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, contents in members.items():
+            archive.writestr(name, contents)
+    buffer.seek(0)
+
+    with BatchStaging() as staging:
+        with pytest.raises(batch_conversion.BatchLimitError):
+            staging.add_stream("takes.zip", buffer)
+        assert os.listdir(staging.directory) == []
+
+
+def test_convert_batch_isolates_failures():
+    """
+    Test that one bad file does not fail the rest of the batch.
+    """
+    with BatchStaging() as staging:
+        staging.add_stream("one.wav", BytesIO(b"good"))
+        staging.add_stream("bad.wav", BytesIO(b"bad"))
+        staging.add_stream("two.wav", BytesIO(b"good"))
+
+        results = {
+            result["file"]: result
+            for result in batch_conversion.convert_batch(staging.files, max_workers=2)
+        }
+
+    assert results["one.wav"]["status"] == "succeeded"
+    assert results["two.wav"]["status"] == "succeeded"
+    assert results["one.wav"]["midi_data"].startswith(b"MIDI:")
+    assert results["bad.wav"] == {
+        "file": "bad.wav",
+        "status": "failed",
+        "error": "corrupt audio",
+    }
+
+
+def test_convert_batch_transcriber(monkeypatch):
+    """
+    Test that every file of a batch is converted with the chosen transcriber.
+    """
+    used = []
+
+    def fake_convert_stream_to_midi(pcm_chunks, transcriber=None):
+        used.append(transcriber.name)
+        return b"MIDI"
+
+    monkeypatch.setattr(
+        batch_conversion, "convert_stream_to_midi", fake_convert_stream_to_midi
+    )
+    with BatchStaging() as staging:
+        for name in ("a.wav", "b.wav"):
+            staging.add_stream(name, BytesIO(b"good"))
+        results = list(batch_conversion.convert_batch(staging.files, 2, "dsp"))
+
+    assert [result["status"] for result in results] == ["succeeded"] * 2
+    assert used == ["dsp", "dsp"]
+
+
+def test_batch_pool_is_shared(monkeypatch):
+    """
+    Test that batches reuse one pool, which is replaced once it is broken.
+    """
+    created = []
+
+    def create_executor(max_workers, transcriber=None):
+        created.append(max_workers)
+        return ThreadPoolExecutor(max_workers)
+
+    monkeypatch.setattr(batch_conversion, "create_executor", create_executor)
+    pool = batch_conversion.BatchPool(2)
+    with BatchStaging() as staging:
+        staging.add_stream("one.wav", BytesIO(b"good"))
+        for _ in range(3):
+            results = list(batch_conversion.convert_batch(staging.files, pool=pool))
+            assert [result["status"] for result in results] == ["succeeded"]
+        assert created == [2]
+
+        def crash(name, audio_path, transcriber=None):
+            raise BrokenProcessPool("A process in the process pool was terminated abruptly")
+
+        convert_file = batch_conversion.convert_file
+        monkeypatch.setattr(batch_conversion, "convert_file", crash)
+        results = list(batch_conversion.convert_batch(staging.files, pool=pool))
+        assert [result["status"] for result in results] == ["failed"]
+
+        monkeypatch.setattr(batch_conversion, "convert_file", convert_file)
+        results = list(batch_conversion.convert_batch(staging.files, pool=pool))
+        assert [result["status"] for result in results] == ["succeeded"]
+        assert created == [2, 2]
+    pool.shutdown()
+
+
+@pytest.mark.parametrize("transcriber, warmed", [("basic_pitch", 1), ("dsp", 0)])
+def test_init_worker_warms_up_model_only_for_basic_pitch(monkeypatch, transcriber, warmed):
+    """
+    Test that pool processes load the model only for Basic Pitch batches.
+    """
+    warm_ups = []
+    monkeypatch.setattr(
+        batch_conversion.model_manager, "warm_up", lambda: warm_ups.append(True)
+    )
+
+    batch_conversion.init_worker(transcriber)
+
+    assert len(warm_ups) == warmed
+
+
+def test_convert_batch_empty():
+    """
+    Test that an empty batch yields no results.
+    """
+    assert list(batch_conversion.convert_batch([])) == []
+
+
+@pytest.fixture
+def client():
+    app = create_app(TestingConfig)
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def test_create_midis_batch(client):
+    """
+    Test that the batch endpoint streams one result per file and stores MIDIs.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    response = client.post(
+        "api/v1/midis/batch",
+        data={
+            "name": "John",
+            "email": "john@gmail.com",
+            "files": [
+                (BytesIO(b"good"), "single.mp3"),
+                (make_zip({"take1.wav": b"good", "take2.wav": b"bad"}), "takes.zip"),
+            ],
+        },
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == OK
+    assert response.mimetype == "application/x-ndjson"
+
+    results = {
+        result["file"]: result
+        for result in map(json.loads, response.get_data(as_text=True).splitlines())
+    }
+    assert results["take2.wav"]["status"] == "failed"
+    for name, title in [("single.mp3", "single"), ("take1.wav", "take1")]:
+        assert results[name]["status"] == "succeeded"
+        assert results[name]["title"] == title
+        assert db.session.get(MIDI, results[name]["midi_id"]).title == title
+
+
+def test_create_midis_batch_invalid(client):
+    """
+    Test that the batch endpoint rejects requests without audio files.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    form = {"name": "John", "email": "john@gmail.com"}
+
+    response = client.post(
+        "api/v1/midis/batch",
+        data={**form, "files": [(BytesIO(b"not a zip"), "takes.zip")]},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == BAD_REQUEST
+
+    response = client.post(
+        "api/v1/midis/batch", data=form, content_type="multipart/form-data"
+    )
+    assert response.status_code == BAD_REQUEST
+
+    response = client.post(
+        "api/v1/midis/batch",
+        data={**form, "transcriber": "crepe", "files": [(BytesIO(b"good"), "a.mp3")]},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == BAD_REQUEST
+    assert response.json["message"] == "Unknown transcriber"
+
+
+def test_create_midis_batch_too_many_files(client, monkeypatch):
+    """
+    Test that batches over BATCH_MAX_FILES are rejected before converting.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    monkeypatch.setattr(midi_controller, "BATCH_MAX_FILES", 2)
+    form = {"name": "John", "email": "john@gmail.com"}
+
+    for files in (
+        [(BytesIO(b"good"), f"{i}.mp3") for i in range(3)],
+        [
+            (BytesIO(b"good"), "single.mp3"),
+            (make_zip({"take1.wav": b"good", "take2.wav": b"good"}), "takes.zip"),
+        ],
+    ):
+        response = client.post(
+            "api/v1/midis/batch",
+            data={**form, "files": files},
+            content_type="multipart/form-data",
+        )
+        assert response.status_code == BAD_REQUEST
+        assert response.json["message"] == "A batch may hold at most 2 audio files"
+    assert db.session.query(MIDI).count() == 0
+
+
+def test_create_midis_batch_zip_bomb(client):
+    """
+    Test that the batch endpoint rejects archives that expand too much.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("bomb.wav", bytes(10 * 1024 * 1024))
+    buffer.seek(0)
+
+    response = client.post(
+        "api/v1/midis/batch",
+        data={"name": "John", "email": "john@gmail.com", "files": [(buffer, "bomb.zip")]},
+        content_type="multipart/form-data",
+    )
+
+    assert response.status_code == BAD_REQUEST
+    assert response.json["message"] == "bomb.wav is compressed too much"
+
@@ -0,0 +1,188 @@
+################################################################################
+# Filename: test_blob_store.py
+# Purpose:  Contains pytest test cases for the blob store backends.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains pytest test cases for the local, content-addressed and
+# S3 blob stores, and for the script moving inline blobs out of the midis
+# table. The S3 backend runs against an in-memory stand-in for the S3 client.
+#
+# Usage (Optional):
+# Run the tests using the pytest command:
+#   python -m pytest
+#
+###############################################################################
+
+from datetime import datetime
+from io import BytesIO
+import pytest
+from app import create_app
+from app.controllers import midi_controller
+from app.database import db
+from app.models.midi_model import MIDI
+from app.models.user_model import User
+from app.test_config import TestingConfig
+from app.utils.blob_store import (
+    BlobNotFoundError,
+    ContentAddressedBlobStore,
+    LocalBlobStore,
+    S3BlobStore,
+    create_blob_store,
+)
+from app.utils.compression import Compressor
+from app.utils.status_codes import OK
+from migrate_blobs import migrate_rows
+
+
+class FakeS3Error(Exception):
+    """Error shaped like botocore's ClientError."""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeS3Client:
+    """In-memory stand-in for the subset of the boto3 S3 client in use."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = bytes(Body)
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error("NoSuchKey")
+        return {"Body": BytesIO(self.objects[(Bucket, Key)])}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error("404")
+        return {"ContentLength": len(self.objects[(Bucket, Key)])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+@pytest.fixture(params=["local", "cas", "s3"])
+def store(request, tmp_path):
+    if request.param == "s3":
+        return S3BlobStore("melodies", FakeS3Client(), prefix="test/")
+    return create_blob_store(request.param, str(tmp_path / request.param))
+
+
+def test_put_get_delete(store):
+    """
+    Test the blob lifecycle on every backend.
+    """
+    key = store.put(b"MThd", "midi")
+
+    assert key.startswith("midi/")
+    assert store.exists(key)
+    assert store.get(key) == b"MThd"
+
+    store.delete(key)
+    assert not store.exists(key)
+    with pytest.raises(BlobNotFoundError):
+        store.get(key)
+    # Deleting a missing blob is not an error
+    store.delete(key)
+
+
+def test_unknown_kind(store):
+    """
+    Test that only known kinds of blobs are accepted.
+    """
+    with pytest.raises(ValueError):
+        store.put(b"data", "video")
+
+
+def test_local_keys_are_unique(tmp_path):
+    """
+    Test that the local store never reuses a key for equal contents.
+    """
+    store = LocalBlobStore(str(tmp_path))
+    assert store.put(b"same", "audio") != store.put(b"same", "audio")
+
+
+def test_content_addressed_deduplicates(tmp_path):
+    """
+    Test that the content-addressed store keeps one copy of equal contents.
+    """
+    store = ContentAddressedBlobStore(str(tmp_path))
+    key = store.put(b"same", "xml")
+
+    assert store.put(b"same", "xml") == key
+    assert store.put(b"other", "xml") != key
+    assert len([path for path in tmp_path.rglob("*") if path.is_file()]) == 2
+
+
+def test_local_rejects_escaping_keys(tmp_path):
+    """
+    Test that keys cannot address files outside the store root.
+    """
+    store = LocalBlobStore(str(tmp_path / "blobs"))
+    (tmp_path / "secret").write_bytes(b"secret")
+
+    for key in ["../secret", "/etc/passwd", ""]:
+        with pytest.raises(ValueError):
+            store.get(key)
+
+
+def test_s3_prefix():
+    """
+    Test that the S3 store prefixes object names.
+    """
+    client = FakeS3Client()
+    key = S3BlobStore("melodies", client, prefix="prod/").put(b"MThd", "midi")
+    assert list(client.objects) == [("melodies", "prod/" + key)]
+
+
+def test_migrate_rows(blob_store):
+    """
+    Test moving inline blobs to the blob store, and serving the moved rows.
+
+    Args:
+        blob_store (LocalBlobStore): The blob store used by the controllers.
+    """
+    app = create_app(TestingConfig)
+    with app.app_context():
+        db.create_all()
+        user = User(name="John", email="john@gmail.com")
+        db.session.add(user)
+        db.session.commit()
+        xml_data = Compressor.compress(b"<score-partwise/>")
+        for i in range(5):
+            db.session.add(
+                MIDI(
+                    user_id=user.user_id,
+                    title=f"Midi{i}",
+                    date=datetime(2024, 4, 10),
+                    midi_data=f"MThd {i}".encode(),
+                    xml_data=xml_data if i % 2 else None,
+                )
+            )
+        db.session.commit()
+
+        assert migrate_rows(blob_store, batch_size=2) == 5
+        assert migrate_rows(blob_store, batch_size=2) == 0
+
+        for midi in db.session.scalars(db.select(MIDI)):
+            i = int(midi.title[-1])
+            assert midi.midi_data is None and midi.xml_data is None
+            assert blob_store.get(midi.midi_key) == f"MThd {i}".encode()
+            assert midi.midi_size == len(f"MThd {i}")
+            if i % 2:
+                assert blob_store.get(midi.xml_key) == xml_data
+            else:
+                assert midi.xml_key is None
+
+        response = app.test_client().get("api/v1/midis/2/file.mid")
+        assert response.status_code == OK
+        assert response.data == b"MThd 1"
+        assert midi_controller.blob_store is blob_store
+
+        db.session.remove()
+        db.drop_all()
@@ -5,9 +5,11 @@
 #
 # Description:
 # This file contains pytest test cases for audio conversion functions,
-# including tests for file format validation, WEBM to MP3 conversion,
-# and audio to MIDI conversion. It uses fixtures to provide sample audio files
-# for testing.
+# including audio to MIDI conversion from files and from memory, the temporary
+# file fallback, in-memory inference on decoded samples, streamed inference
+# checked against a single-shot run on the sample files, and the Basic Pitch
+# constants the application repeats. It uses fixtures to provide sample audio
+# files for testing.
 #
 # Usage (Optional):
 #
@@ -15,9 +17,23 @@
 #
 ###############################################################################
 
+import app.utils.audio_decoder as audio_decoder
 import app.utils.conversion as conversion
+from basic_pitch.inference import Model, run_inference
+import numpy as np
 import os
+import shutil
+import tempfile
+from io import BytesIO
 import pytest
+import soundfile
+import basic_pitch.constants
+from app.utils import basic_pitch_constants
+from app.utils.audio_decoder import FFMPEG_BINARY
+from basic_pitch.note_creation import model_output_to_notes, note_events_to_midi
+
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), "..", "app", "utils", "audio_sample")
 
 
 @pytest.fixture
@@ -37,135 +53,287 @@ def audio_files():
     }
 
 
-def test_is_webm_file(audio_files):
+def test_convert_to_midi_success(audio_files, monkeypatch):
     """
-    Test the is_webm_file function.
+    Test the convert_to_midi function for successful conversion.
 
     Args:
         audio_files (dict): Fixture providing sample audio file paths.
     """
-    assert conversion.is_webm_file(audio_files["webm"])
-    assert not conversion.is_webm_file(audio_files["mp3"])
+    recorded = {}
+
+    def fake_stream_audio(path):
+        recorded["path"] = path
+        yield np.zeros(10, dtype=np.float32)
+
+    def fake_convert_stream_to_midi(pcm_chunks):
+        recorded["samples"] = sum(len(chunk) for chunk in pcm_chunks)
+        return b"MThd"
+
+    monkeypatch.setattr(conversion, "stream_audio", fake_stream_audio)
+    monkeypatch.setattr(conversion, "convert_stream_to_midi", fake_convert_stream_to_midi)
 
+    assert conversion.convert_to_midi(audio_files["webm"]) == b"MThd"
+    assert recorded == {"path": audio_files["webm"], "samples": 10}
 
-def test_replace_extension():
+
+def test_convert_to_midi_in_memory(monkeypatch):
     """
-    Test the replace_extension function.
+    Test converting audio held in memory, given as bytes or a stream.
     """
-    assert conversion.replace_extension("folder/file.webm", "mp3") == "folder/file.mp3"
-    assert conversion.replace_extension("folder/file.webm", ".m4a") == "folder/file.m4a"
+    streamed = []
 
+    def fake_convert_stream_to_midi(pcm_chunks):
+        streamed.append(sum(len(chunk) for chunk in pcm_chunks))
+        return b"MThd"
 
-def test_validate_audio_file_supported_formats(audio_files):
-    """
-    Test the validate_audio_file function for supported formats.
+    monkeypatch.setattr(conversion, "convert_stream_to_midi", fake_convert_stream_to_midi)
+    with open(os.path.join(SAMPLE_DIR, "sample_mp3.mp3"), "rb") as audio_file:
+        audio_data = audio_file.read()
+    with open(os.path.join(SAMPLE_DIR, "sample_m4a.m4a"), "rb") as audio_file:
+        m4a_data = audio_file.read()
 
-    Args:
-        audio_files (dict): Fixture providing sample audio file paths.
-    """
-    for ext in ["mp3", "m4a", "wav"]:
-        assert conversion.validate_audio_file(audio_files[ext]) == audio_files[ext]
+    assert conversion.convert_to_midi(audio_data) == b"MThd"
+    assert conversion.convert_to_midi(BytesIO(audio_data), "take.mp3") == b"MThd"
+    assert conversion.convert_to_midi(m4a_data, "take.m4a") == b"MThd"
+    expected = len(audio_decoder.decode_stream(BytesIO(audio_data)))
+    m4a_expected = len(conversion.decode_audio(os.path.join(SAMPLE_DIR, "sample_m4a.m4a")))
+    assert streamed == [expected, expected, m4a_expected]
 
 
-def test_validate_audio_file_unsupported(audio_files, capsys):
+def test_temp_file_fallback(monkeypatch, tmp_path, capsys):
+    """
+    Test that audio ffmpeg cannot decode from a pipe is retried from a file
+    only when the fallback is enabled, and that the file is removed.
     """
-    Test the validate_audio_file function for unsupported formats.
+    monkeypatch.setattr(
+        conversion,
+        "convert_stream_to_midi",
+        lambda pcm_chunks: sum(len(chunk) for chunk in pcm_chunks) or None,
+    )
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    with open(os.path.join(SAMPLE_DIR, "sample_m4a.m4a"), "rb") as audio_file:
+        m4a_data = audio_file.read()
+
+    # An M4A file without a name is piped into ffmpeg, which cannot seek it
+    # and decodes no samples
+    assert conversion.convert_to_midi(m4a_data) is None
+
+    monkeypatch.setattr(audio_decoder, "TEMP_FILE_FALLBACK", True)
+    assert conversion.convert_to_midi(m4a_data) == len(
+        conversion.decode_audio(os.path.join(SAMPLE_DIR, "sample_m4a.m4a"))
+    )
+    assert "from a temporary file" in capsys.readouterr().out
+    assert os.listdir(tmp_path) == []
+
+
+def test_convert_to_midi_invalid_file(audio_files, monkeypatch, capsys):
+    """
+    Test the convert_to_midi function with an audio file that cannot be decoded.
 
     Args:
         audio_files (dict): Fixture providing sample audio file paths.
         capsys: Pytest fixture to capture stdout/stderr.
     """
-    result = conversion.validate_audio_file(audio_files["flac"])
-    out = capsys.readouterr().out
-    assert result is None
-    assert "Unsupported audio format" in out
+    called = {}
 
+    def fake_stream_audio(path):
+        raise conversion.AudioDecodeError("Invalid data found")
+        yield
 
-def test_validate_audio_file_webm_conversion_success(audio_files):
-    """
-    Test the validate_audio_file function for WEBM conversion success.
+    def fake_convert(pcm_chunks):
+        called["convert"] = True
+        return b"".join(pcm_chunks)
 
-    Args:
-        audio_files (dict): Fixture providing sample audio file paths.
-    """
-    # Save original function to restore later
-    original = conversion.convert_webm_to_mp3
-    called = {}
+    monkeypatch.setattr(conversion, "stream_audio", fake_stream_audio)
+    monkeypatch.setattr(conversion, "convert_stream_to_midi", fake_convert)
 
-    def fake_convert(src, dst):
-        called["args"] = (src, dst)
+    assert conversion.convert_to_midi(audio_files["flac"]) is None
+    assert called == {"convert": True}
+    assert "Invalid data found" in capsys.readouterr().out
 
-    conversion.convert_webm_to_mp3 = fake_convert
-    try:
-        expected_mp3_path = conversion.replace_extension(audio_files["webm"], "mp3")
-        result = conversion.validate_audio_file(audio_files["webm"])
-        assert result == expected_mp3_path
-        assert called["args"] == (audio_files["webm"], expected_mp3_path)
-    finally:
-        conversion.convert_webm_to_mp3 = original
 
+class FakeModel(Model):
+    """Model whose outputs are the window samples taken once per frame."""
 
-def test_convert_to_midi_success(audio_files):
-    """
-    Test the convert_to_midi function for successful conversion.
+    def __init__(self):
+        pass
 
-    Args:
-        audio_files (dict): Fixture providing sample audio file paths.
+    def predict(self, windows):
+        frames = windows[:, :: conversion.FFT_HOP, :][:, :172]
+        # 88 semitone bins for notes and onsets, 3 bins per semitone for contours
+        notes = np.repeat(frames, 88, axis=2)
+        contours = np.repeat(frames, 264, axis=2)
+        return {"note": notes, "onset": notes / 2, "contour": contours}
+
+
+def test_run_pcm_inference_matches_run_inference(tmp_path):
     """
-    # Save originals
-    orig_validate = conversion.validate_audio_file
-    orig_predict = conversion.predict
-    recorded = {}
+    Test that in-memory inference matches Basic Pitch's file-based inference.
+    """
+    rng = np.random.default_rng(0)
+    pcm = rng.uniform(-1, 1, conversion.AUDIO_SAMPLE_RATE * 5).astype(np.float32)
+    wav_path = tmp_path / "noise.wav"
+    soundfile.write(wav_path, pcm, conversion.AUDIO_SAMPLE_RATE, subtype="FLOAT")
 
-    def fake_validate(path):
-        return audio_files["mp3"]
+    expected = run_inference(str(wav_path), FakeModel())
+    output = conversion.run_pcm_inference(pcm, FakeModel())
 
-    class FakeMidi:
-        def write(self, midi_path):
-            recorded["midi_path"] = midi_path
+    assert output.keys() == expected.keys()
+    for name in expected:
+        np.testing.assert_array_equal(output[name], expected[name])
 
-    def fake_predict(path):
-        return None, FakeMidi(), None
 
-    conversion.validate_audio_file = fake_validate
-    conversion.predict = fake_predict
+def test_convert_pcm_to_midi(monkeypatch):
+    """
+    Test that converting samples returns MIDI bytes without writing files.
+    """
+    monkeypatch.setattr(conversion.model_manager, "get_model", FakeModel)
+    rng = np.random.default_rng(0)
+    pcm = rng.uniform(0, 1, conversion.AUDIO_SAMPLE_RATE).astype(np.float32)
 
-    try:
-        os.makedirs(conversion.MIDI_OUTPUT_DIR, exist_ok=True)
-        midi_path = conversion.convert_to_midi(audio_files["mp3"])
-        expected = os.path.join(conversion.MIDI_OUTPUT_DIR, "sample_mp3.mid")
-        assert midi_path == expected
-        assert recorded["midi_path"] == expected
-    finally:
-        conversion.validate_audio_file = orig_validate
-        conversion.predict = orig_predict
+    midi_data = conversion.convert_pcm_to_midi(pcm)
 
+    assert midi_data.startswith(b"MThd")
 
-def test_convert_to_midi_invalid_file(audio_files):
+
+@pytest.mark.parametrize("chunk_samples", [1000, conversion.HOP_SIZE, 100000])
+def test_iter_model_output_matches_run_pcm_inference(chunk_samples):
+    """
+    Test that streamed inference yields exactly the single-shot model output.
     """
-    Test the convert_to_midi function with an invalid audio file.
+    rng = np.random.default_rng(0)
+    pcm = rng.uniform(-1, 1, conversion.AUDIO_SAMPLE_RATE * 5).astype(np.float32)
+    chunks = (pcm[i : i + chunk_samples] for i in range(0, len(pcm), chunk_samples))
 
-    Args:
-        audio_files (dict): Fixture providing sample audio file paths.
+    blocks = list(conversion.iter_model_output(chunks, FakeModel()))
+    expected = conversion.run_pcm_inference(pcm, FakeModel())
+
+    for name in expected:
+        streamed = np.concatenate([block[name] for block in blocks])
+        np.testing.assert_array_equal(streamed, expected[name])
+
+
+def test_stitch_notes():
     """
-    orig_validate = conversion.validate_audio_file
-    orig_predict = conversion.predict
-    called = {}
+    Test that a note cut by a segment boundary is joined with its continuation.
+    """
+    held = [(90, 100, 60, 0.5, [0] * 10), (95, 100, 64, 0.5, None)]
+    notes = [(100, 120, 60, 0.8, [1] * 20), (150, 160, 60, 0.6, None)]
+
+    stitched = conversion.stitch_notes(held, notes, 100)
+
+    assert stitched[0][:3] == (90, 120, 60)
+    assert stitched[0][3] == pytest.approx(0.7)
+    assert stitched[0][4] == [0] * 10 + [1] * 20
+    assert stitched[1:] == [notes[1], held[1]]
+
+
+def matching_notes(expected, streamed, tolerance):
+    """Count the expected notes that have a streamed note of the same pitch
+    starting and ending within a tolerance, in seconds."""
+    unmatched = list(streamed)
+    count = 0
+    for start, end, pitch, *_ in expected:
+        for i, (other_start, other_end, other_pitch, *_) in enumerate(unmatched):
+            if (
+                other_pitch == pitch
+                and abs(other_start - start) <= tolerance
+                and abs(other_end - end) <= tolerance
+            ):
+                del unmatched[i]
+                count += 1
+                break
+    return count
+
+
+@pytest.mark.skipif(shutil.which(FFMPEG_BINARY) is None, reason="ffmpeg is not installed")
+@pytest.mark.parametrize("ext", ["mp3", "m4a", "wav"])
+@pytest.mark.parametrize("max_segment_frames", [conversion.MAX_SEGMENT_FRAMES, 512])
+def test_streamed_notes_match_single_shot(ext, max_segment_frames):
+    """
+    Test that streamed conversion finds the notes of a single-shot run.
+
+    With 512 frame segments every sample file is cut several times, both in
+    silence and inside continuous sound. Notes found near a cut can move by a
+    frame or two, since Basic Pitch scales inferred onsets per segment, and a
+    note held across a cut is split in two. Every other note must match the
+    single-shot run within two model frames, so at most one note may differ
+    per segment the file spans beyond the first.
+    """
+    model = conversion.model_manager.get_model()
+    pcm = conversion.decode_audio(os.path.join(SAMPLE_DIR, f"sample_{ext}.{ext}"))
+    _, expected = model_output_to_notes(
+        conversion.run_pcm_inference(pcm, model), **conversion.NOTE_PARAMS
+    )
+
+    chunks = (pcm[i : i + 4096] for i in range(0, len(pcm), 4096))
+    streamed = list(
+        conversion.iter_note_events(
+            conversion.iter_model_output(chunks, model), max_segment_frames
+        )
+    )
+
+    n_frames = len(pcm) // basic_pitch_constants.FFT_HOP
+    cuts = n_frames // max_segment_frames
+
+    assert len(streamed) == len(expected)
+    # Within two model frames
+    frame_seconds = 1 / basic_pitch_constants.ANNOTATIONS_FPS
+    assert matching_notes(expected, streamed, 2 * frame_seconds) >= len(expected) - cuts
+
 
-    def fake_validate(path):
-        return None
+def test_note_events_to_midi_matches_basic_pitch():
+    """
+    Test that MIDI files are built as Basic Pitch builds them, pitch bends of
+    overlapping notes dropped and large bends clipped.
+    """
+    note_events = [
+        (1.0, 1.5, 64, 0.5, [0, 1, 2, 30]),
+        (0.0, 0.5, 60, 0.8, [-1, -40, 0]),
+        (0.25, 0.75, 67, 1.0, [3, 3]),
+        (2.0, 2.25, 72, 0.2, None),
+    ]
+
+    midi_data = conversion.note_events_to_midi(note_events, 100)
+    expected = note_events_to_midi(note_events, False, 100)
+
+    assert midi_data.get_tempo_changes()[1].tolist() == expected.get_tempo_changes()[1].tolist()
+    (instrument,) = midi_data.instruments
+    (expected_instrument,) = expected.instruments
+    assert instrument.program == expected_instrument.program
+    assert [str(note) for note in instrument.notes] == [
+        str(note) for note in expected_instrument.notes
+    ]
+    assert [(bend.pitch, bend.time) for bend in instrument.pitch_bends] == [
+        (bend.pitch, bend.time) for bend in expected_instrument.pitch_bends
+    ]
+    assert len(instrument.pitch_bends) == 4
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "AUDIO_SAMPLE_RATE",
+        "FFT_HOP",
+        "AUDIO_WINDOW_LENGTH",
+        "ANNOTATIONS_FPS",
+        "ANNOT_N_FRAMES",
+        "AUDIO_N_SAMPLES",
+        "CONTOURS_BINS_PER_SEMITONE",
+    ],
+)
+def test_basic_pitch_constants(name):
+    """
+    Test that the constants repeated to avoid importing TensorFlow match Basic Pitch's.
+    """
+    assert getattr(basic_pitch_constants, name) == getattr(basic_pitch.constants, name)
 
-    def fake_predict(path):
-        called["predict"] = True
-        return None, None, None
 
-    conversion.validate_audio_file = fake_validate
-    conversion.predict = fake_predict
+def test_default_model_name():
+    """
+    Test that the default model name is that of the model Basic Pitch loads.
+    """
+    from basic_pitch import ICASSP_2022_MODEL_PATH
 
-    try:
-        result = conversion.convert_to_midi(audio_files["flac"])
-        assert result is None
-        assert "predict" not in called  # Predict should not have been called
-    finally:
-        conversion.validate_audio_file = orig_validate
-        conversion.predict = orig_predict
+    assert os.path.basename(str(ICASSP_2022_MODEL_PATH)) == basic_pitch_constants.DEFAULT_MODEL_NAME
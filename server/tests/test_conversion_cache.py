@@ -0,0 +1,191 @@
+################################################################################
+# Filename: test_conversion_cache.py
+# Purpose:  Contains pytest test cases for the content-addressed conversion cache.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains pytest test cases for the ConversionCache class,
+# including key derivation from decoded audio, storing and retrieving entries,
+# least recently used eviction under a size cap, the size tracked in memory
+# between evictions, and the hit and miss counters. It also checks that creating a MIDI from audio that was converted
+# before skips the MIDI and MusicXML conversions.
+#
+# Usage (Optional):
+# Run the tests using the pytest command:
+#   python -m pytest
+#
+###############################################################################
+
+from io import BytesIO
+import os
+import time
+import numpy as np
+import pytest
+from app import create_app
+from app.controllers import midi_controller
+from app.database import db
+from app.test_config import TestingConfig
+from app.utils.conversion_cache import ConversionCache
+from app.utils.status_codes import CREATED, OK
+
+PARAMS = {"version": 1, "sample_rate": 22050}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ConversionCache(str(tmp_path / "cache"), 1024)
+
+
+def test_make_key():
+    """
+    Test that keys depend on both the samples and the parameters.
+    """
+    pcm = np.linspace(-1, 1, 100, dtype=np.float32)
+    key = ConversionCache.make_key(pcm, PARAMS)
+
+    assert key == ConversionCache.make_key(pcm.copy(), dict(PARAMS))
+    assert key != ConversionCache.make_key(pcm[::-1], PARAMS)
+    assert key != ConversionCache.make_key(pcm, {**PARAMS, "version": 2})
+    assert len(key) == 64
+    # Hashing the samples chunk by chunk gives the same key
+    assert key == ConversionCache.make_stream_key([pcm[:30], pcm[30:]], PARAMS)
+
+
+def test_get_and_put(cache):
+    """
+    Test storing an entry and reading it back, with hit and miss counters.
+    """
+    assert cache.get("missing") is None
+
+    cache.put("key", b"midi", b"<xml/>")
+    assert cache.get("key") == (b"midi", b"<xml/>")
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+    assert stats["entries"] == 1
+    assert stats["pid"] == os.getpid()
+
+
+def test_lru_eviction(cache):
+    """
+    Test that the least recently used entries are evicted above the size cap.
+    """
+    payload = b"x" * 300
+    for key in ["first", "second", "third"]:
+        cache.put(key, payload, b"")
+        time.sleep(0.01)
+
+    # Use the oldest entry so that "second" becomes the least recently used
+    assert cache.get("first") is not None
+    time.sleep(0.01)
+    cache.put("fourth", payload, b"")
+
+    assert cache.get("second") is None
+    assert cache.get("first") is not None
+    assert cache.get("fourth") is not None
+    assert cache.evictions == 1
+    assert cache.stats()["size_bytes"] <= cache.max_bytes
+
+
+def test_put_scans_directory_only_to_evict(cache, monkeypatch):
+    """
+    Test that the size is tracked in memory after one scan on the first put.
+    """
+    cache.put("old", b"x" * 300, b"")
+    fresh = ConversionCache(cache.directory, cache.max_bytes)
+    scans = []
+    listdir = os.listdir
+    monkeypatch.setattr(os, "listdir", lambda path: scans.append(path) or listdir(path))
+
+    fresh.put("first", b"x" * 300, b"")
+    fresh.put("first", b"x" * 300, b"")
+    fresh.put("second", b"x" * 300, b"")
+    assert len(scans) == 1
+    assert fresh.evictions == 0
+
+    fresh.put("third", b"x" * 300, b"")
+    assert len(scans) == 2
+    assert fresh.evictions == 1
+    assert fresh.stats()["size_bytes"] <= fresh.max_bytes
+
+
+def test_oversized_and_disabled(tmp_path, cache):
+    """
+    Test that oversized entries and disabled caches are never stored.
+    """
+    cache.put("huge", b"x" * 2048, b"")
+    assert cache.stats()["entries"] == 0
+
+    disabled = ConversionCache(str(tmp_path / "disabled"), 0)
+    disabled.put("key", b"midi", b"<xml/>")
+    assert disabled.get("key") is None
+    assert not os.path.exists(disabled.directory)
+
+
+def test_create_midi_cache_hit(tmp_path, monkeypatch):
+    """
+    Test that uploading the same audio twice converts it only once.
+    """
+    calls = {"midi": 0, "xml": 0}
+
+    def fake_convert_pcm_to_midi(pcm, transcriber):
+        calls["midi"] += 1
+        return b"MThd"
+
+    def fake_midi_to_musicxml(midi_data):
+        calls["xml"] += 1
+        return b"<score-partwise/>"
+
+    def fake_decode_stream(stream, filename):
+        return np.frombuffer(stream.read(), dtype=np.uint8)
+
+    cache = ConversionCache(str(tmp_path / "cache"), 1024 * 1024)
+    monkeypatch.setattr(midi_controller, "convert_pcm_to_midi", fake_convert_pcm_to_midi)
+    monkeypatch.setattr(midi_controller, "midi_to_musicxml", fake_midi_to_musicxml)
+    monkeypatch.setattr(midi_controller, "decode_stream", fake_decode_stream)
+    monkeypatch.setattr(midi_controller, "conversion_cache", cache)
+
+    app = create_app(TestingConfig)
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+        responses = [
+            client.post(
+                "api/v1/midis",
+                data={
+                    "name": "John",
+                    "email": "john@gmail.com",
+                    "title": f"Take {i}",
+                    "file": (BytesIO(b"same audio"), f"take{i}.mp3"),
+                },
+                content_type="multipart/form-data",
+            )
+            for i in range(2)
+        ]
+        files = [
+            (
+                client.get(response.json["midi_url"]).data,
+                client.get(response.json["xml_url"]).data,
+            )
+            for response in responses
+        ]
+        db.session.remove()
+        db.drop_all()
+
+    assert [response.status_code for response in responses] == [CREATED, CREATED]
+    assert files == [(b"MThd", b"<score-partwise/>")] * 2
+    assert calls == {"midi": 1, "xml": 1}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_stats_endpoint_reports_cache():
+    """
+    Test that the stats endpoint reports the cache counters.
+    """
+    client = create_app(TestingConfig).test_client()
+    response = client.get("api/v1/stats")
+    assert response.status_code == OK
+    assert "hits" in response.json["cache"]
+    assert "misses" in response.json["cache"]
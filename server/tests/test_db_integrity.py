@@ -80,8 +80,8 @@ def test_add_incomplete_user(app):
 
 def test_add_incomplete_midi(app):
     """
-    Function to test that MIDI fields such as title, user_id, and midi_data must not be null
-    when adding an entry to the database.
+    Function to test that MIDI fields such as title, user_id, and midi_key (or legacy
+    midi_data) must not be null when adding an entry to the database.
 
     Args:
         app (Flask): The Flask application instance.
@@ -94,12 +94,12 @@ def test_add_incomplete_midi(app):
         db.session.add(user)
         db.session.commit()
 
-        # check that an error is thrown when there is no midi_data
+        # check that an error is thrown when there is neither a midi_key nor midi_data
         incomplete_midi1 = MIDI(user_id=user.user_id, title="title", date=datetime.now())
         db.session.add(incomplete_midi1)
         with pytest.raises(IntegrityError) as exc_info:
             db.session.commit()
-        assert 'NOT NULL constraint failed' in str(exc_info.value), "Nullable constraint error not raised for midi_data"
+        assert 'CHECK constraint failed' in str(exc_info.value), "Check constraint error not raised for midi_key/midi_data"
         db.session.rollback()
 
         # check that an error is thrown when there is no title
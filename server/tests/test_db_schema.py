@@ -103,7 +103,20 @@ def test_midis_schema(app):
         None
     """
     with app.app_context():
-        expected_columns = ["midi_id", "user_id", "title", "date", "midi_data"]
+        expected_columns = [
+            "midi_id",
+            "user_id",
+            "title",
+            "date",
+            "midi_key",
+            "midi_size",
+            "xml_key",
+            "xml_size",
+            "audio_key",
+            "audio_size",
+            "midi_data",
+            "xml_data",
+        ]
         midi_columns = []
         for col in db.inspect(MIDI.__table__).columns:
             midi_columns.append(col.name)
@@ -0,0 +1,170 @@
+################################################################################
+# Filename: test_dsp_transcription.py
+# Purpose:  Contains pytest test cases for the NumPy transcriber.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains pytest test cases for the signal-processing transcriber,
+# including pitch tracking and note segmentation of synthetic melodies, and
+# selecting it as the transcriber of a conversion without importing
+# TensorFlow. The synthetic recordings have known notes, so no model or sample
+# file is needed.
+#
+# Usage (Optional):
+# Run the tests using the pytest command:
+#   python -m pytest
+#
+###############################################################################
+
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+import app.utils.conversion as conversion
+from app.utils import dsp_transcription
+
+SAMPLE_RATE = 22050
+
+
+def tone(midi_note, seconds, amplitude=0.5):
+    """Return a sine tone with a few harmonics at a MIDI note."""
+    frequency = 440.0 * 2 ** ((midi_note - 69) / 12)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    wave = sum(np.sin(2 * np.pi * k * frequency * t) / k for k in (1, 2, 3))
+    return (amplitude * wave / 1.84).astype(np.float32)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+def test_yin_tracks_frequency():
+    """
+    Test that YIN finds the frequency of steady tones across the pitch range.
+    """
+    for frequency in (82.41, 220.0, 523.25, 1760.0):
+        t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+        pcm = np.sin(2 * np.pi * frequency * t).astype(np.float32)
+
+        tracked, voiced_probability = dsp_transcription.yin(pcm, SAMPLE_RATE)
+
+        # Away from the padded edges
+        inner = slice(10, -10)
+        assert np.median(tracked[inner]) == pytest.approx(frequency, rel=0.005)
+        assert voiced_probability[inner].min() > 0.9
+
+
+def test_noise_is_unvoiced():
+    """
+    Test that white noise is not taken for a pitch.
+    """
+    rng = np.random.default_rng(0)
+    pcm = rng.uniform(-0.5, 0.5, SAMPLE_RATE).astype(np.float32)
+
+    _, voiced_probability = dsp_transcription.yin(pcm, SAMPLE_RATE)
+
+    assert np.mean(voiced_probability >= dsp_transcription.VOICED_PROBABILITY) < 0.05
+
+
+def test_transcribe_melody():
+    """
+    Test that a melody with rests and repeated notes is split into its notes.
+    """
+    melody = [(60, 0.5), (62, 0.5), (64, 0.5), (64, 0.5), (67, 1.0)]
+    parts = [silence(0.25)]
+    for note, seconds in melody:
+        # A short gap between notes, so repeated notes have an onset
+        parts += [tone(note, seconds - 0.05), silence(0.05)]
+    pcm = np.concatenate(parts)
+
+    events = dsp_transcription.transcribe(pcm, SAMPLE_RATE)
+
+    assert [pitch for _, _, pitch, _, _ in events] == [note for note, _ in melody]
+    expected_start = 0.25
+    for (start, end, _, amplitude, bends), (_, seconds) in zip(events, melody):
+        assert start == pytest.approx(expected_start, abs=0.05)
+        assert end - start == pytest.approx(seconds - 0.05, abs=0.06)
+        assert 0 < amplitude <= 1
+        assert bends is None
+        expected_start += seconds
+
+
+def test_transcribe_silence():
+    """
+    Test that silence and empty input have no notes.
+    """
+    assert dsp_transcription.transcribe(silence(1), SAMPLE_RATE) == []
+    assert dsp_transcription.transcribe(np.zeros(0, dtype=np.float32), SAMPLE_RATE) == []
+
+
+def test_segment_notes_drops_short_notes():
+    """
+    Test that notes shorter than the minimum length are dropped.
+    """
+    pitch = np.array([60.0] * 10 + [62.0] * 3 + [64.0] * 10)
+    voiced = np.ones(len(pitch), dtype=bool)
+    onsets = np.zeros(len(pitch), dtype=bool)
+    level = np.full(len(pitch), 0.5)
+
+    notes = dsp_transcription.segment_notes(pitch, voiced, onsets, level, 5)
+
+    assert notes == [(0, 10, 60, 0.5), (13, 23, 64, 0.5)]
+
+
+def test_get_transcriber():
+    """
+    Test that transcribers are selected by name, with the configured default.
+    """
+    assert conversion.get_transcriber("dsp").name == "dsp"
+    assert conversion.get_transcriber("basic_pitch").name == "basic_pitch"
+    assert conversion.get_transcriber().name == conversion.DEFAULT_TRANSCRIBER
+    with pytest.raises(ValueError, match="Unknown transcriber"):
+        conversion.get_transcriber("crepe")
+    # Results of different transcribers never share a cache entry
+    assert conversion.get_transcriber("dsp").params != conversion.CONVERSION_PARAMS
+
+
+def test_convert_with_dsp_transcriber():
+    """
+    Test that converting with the DSP transcriber writes its notes to MIDI,
+    whether the samples are held in memory or streamed.
+    """
+    import pretty_midi
+    from io import BytesIO
+
+    pcm = np.concatenate([silence(0.2), tone(57, 0.6), silence(0.2), tone(69, 0.6)])
+    transcriber = conversion.get_transcriber("dsp")
+
+    midi_data = conversion.convert_pcm_to_midi(pcm, transcriber)
+    chunks = (pcm[i : i + 4096] for i in range(0, len(pcm), 4096))
+    streamed = conversion.convert_stream_to_midi(chunks, transcriber=transcriber)
+
+    assert streamed == midi_data
+    notes = pretty_midi.PrettyMIDI(BytesIO(midi_data)).instruments[0].notes
+    assert [note.pitch for note in notes] == [57, 69]
+
+
+def test_dsp_conversion_skips_tensorflow():
+    """
+    Test that a DSP conversion, MIDI file included, never imports TensorFlow.
+    """
+    code = (
+        "import sys\n"
+        "import numpy as np\n"
+        "import app.utils.conversion as conversion\n"
+        "t = np.arange(22050) / 22050\n"
+        "pcm = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)\n"
+        "midi_data = conversion.convert_pcm_to_midi(pcm, conversion.get_transcriber('dsp'))\n"
+        "print(midi_data[:4].decode(), 'tensorflow' in sys.modules)\n"
+    )
+    server_dir = os.path.join(os.path.dirname(__file__), "..")
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=server_dir,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert result.stdout.splitlines()[-1] == "MThd False"
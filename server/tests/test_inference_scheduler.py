@@ -0,0 +1,143 @@
+################################################################################
+# Filename: test_inference_scheduler.py
+# Purpose:  Contains pytest test cases for the dynamic batching scheduler.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains pytest test cases for the InferenceScheduler class,
+# including tests for collecting windows from concurrent threads into batches,
+# padding partial batches after the maximum wait, returning each window's
+# output to its caller, reporting errors, and the statistics it reports. A
+# fake model is used so the tests do not depend on TensorFlow.
+#
+# Usage (Optional):
+# Run the tests using the pytest command:
+#   python -m pytest
+#
+###############################################################################
+
+import threading
+import numpy as np
+import pytest
+import app.utils.conversion as conversion
+from app import create_app
+from app.test_config import TestingConfig
+from app.utils.inference_scheduler import InferenceScheduler
+from app.utils.status_codes import OK
+
+WINDOW_SAMPLES = 16
+
+
+class FakeModel:
+    """Model whose output for each window is the window's first sample."""
+
+    def __init__(self):
+        self.batch_shapes = []
+
+    def predict(self, x):
+        self.batch_shapes.append(x.shape)
+        first = x[:, :1, :]
+        return {"note": first, "onset": first * 2, "contour": first * 3}
+
+
+def window(value):
+    return np.full((WINDOW_SAMPLES, 1), value, dtype=np.float32)
+
+
+def test_concurrent_windows_are_batched():
+    """
+    Test that windows submitted from concurrent threads share model calls.
+    """
+    model = FakeModel()
+    scheduler = InferenceScheduler(lambda: model, batch_size=4, max_wait=5)
+    results = {}
+
+    def run(value):
+        results[value] = scheduler.predict(window(value)[np.newaxis])
+
+    threads = [threading.Thread(target=run, args=(value,)) for value in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert model.batch_shapes == [(4, WINDOW_SAMPLES, 1)] * 2
+    for value, output in results.items():
+        assert output["note"].shape == (1, 1, 1)
+        assert output["note"][0, 0, 0] == value
+        assert output["contour"][0, 0, 0] == value * 3
+
+    stats = scheduler.stats()
+    assert stats["window_count"] == 8
+    assert stats["batch_count"] == 2
+    assert stats["average_batch_fill"] == 4
+    assert stats["padded_count"] == 0
+    assert stats["queue_latency_p99"] >= stats["queue_latency_p50"] >= 0
+
+
+def test_partial_batch_is_padded_after_max_wait():
+    """
+    Test that a lone window runs after the maximum wait in a padded batch.
+    """
+    model = FakeModel()
+    scheduler = InferenceScheduler(lambda: model, batch_size=4, max_wait=0.01)
+
+    output = scheduler.predict(np.stack([window(1), window(2)]))
+
+    assert model.batch_shapes == [(4, WINDOW_SAMPLES, 1)]
+    np.testing.assert_array_equal(output["onset"][:, 0, 0], [2, 4])
+    assert scheduler.stats()["padded_count"] == 2
+
+
+def test_model_errors_reach_every_caller():
+    """
+    Test that a failing model call raises in the caller of each window.
+    """
+
+    class BrokenModel:
+        def predict(self, x):
+            raise RuntimeError("out of memory")
+
+    scheduler = InferenceScheduler(BrokenModel, batch_size=2, max_wait=0.01)
+
+    with pytest.raises(RuntimeError, match="out of memory"):
+        scheduler.predict(window(1)[np.newaxis])
+    # The dispatcher keeps running after a failed batch
+    with pytest.raises(RuntimeError):
+        scheduler.predict(window(1)[np.newaxis])
+
+
+def test_run_pcm_inference_through_scheduler():
+    """
+    Test that inference through the scheduler matches calling the model.
+    """
+    from tests.test_conversion import FakeModel as WindowModel
+
+    scheduler = InferenceScheduler(WindowModel, batch_size=4, max_wait=0.01)
+    rng = np.random.default_rng(0)
+    pcm = rng.uniform(-1, 1, conversion.AUDIO_SAMPLE_RATE * 10).astype(np.float32)
+
+    expected = conversion.run_pcm_inference(pcm, WindowModel())
+    output = conversion.run_pcm_inference(pcm, scheduler, scheduler.batch_size)
+
+    for name in expected:
+        np.testing.assert_array_equal(output[name], expected[name])
+
+
+def test_disabled_by_default():
+    """
+    Test that a batch size of 1 leaves conversions calling the model directly.
+    """
+    assert not InferenceScheduler(FakeModel).enabled
+
+
+def test_stats_endpoint_reports_scheduler():
+    """
+    Test that the stats endpoint includes the scheduler statistics.
+    """
+    client = create_app(TestingConfig).test_client()
+    response = client.get("api/v1/stats")
+
+    assert response.status_code == OK
+    assert response.json["scheduler"]["batch_size"] >= 1
+    assert "queue_latency_p99" in response.json["scheduler"]
@@ -0,0 +1,362 @@
+################################################################################
+# Filename: test_job.py
+# Purpose:  Test the asynchronous conversion job API endpoints.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains pytest test cases for submitting an audio file as a
+# background conversion job, polling its status, and fetching its result. The
+# audio and MusicXML conversions are replaced by fakes so the tests exercise
+# the job queue and job state without running Basic Pitch or music21. Jobs
+# left behind by a worker that exited are recovered or failed, a failed job
+# never turns into a succeeded one, and errors are reported without their
+# internal details.
+#
+# Usage (Optional):
+# Run the tests using the pytest command:
+#   python -m pytest
+#
+# Notes:
+# The tests assume that the application is configured for testing and that
+# the test database is properly set up.
+#
+###############################################################################
+
+from datetime import timedelta
+from io import BytesIO
+import os
+import threading
+import numpy as np
+import pytest
+from app import create_app
+from app.controllers import midi_controller
+from app.controllers.job_controller import (
+    CONVERSION_ERROR,
+    INTERRUPTED_ERROR,
+    JOB_STALE_SECONDS,
+    fail_stale_jobs,
+    recover_jobs,
+)
+from app.database import db
+from app.models.job_model import ConversionJob, QUEUED, RUNNING, SUCCEEDED, FAILED
+from app.models.midi_model import MIDI
+from app.test_config import TestingConfig
+from app.utils.audio_decoder import AudioDecodeError
+from app.utils.conversion_cache import ConversionCache
+from app.utils.isodate_converter import DateConverter
+from app.utils.job_queue import JobQueue, job_queue
+from app.utils.status_codes import ACCEPTED, CONFLICT, NOT_FOUND, OK
+
+MIDI_DATA = b"MThd converted"
+XML_DATA = b"<score-partwise/>"
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(midi_controller, "AUDIO_UPLOAD_DIR", str(tmp_path))
+
+    def fake_stream_audio(audio_path):
+        if not audio_path.endswith(".mp3"):
+            raise AudioDecodeError("Invalid data found when processing input")
+        with open(audio_path, "rb") as audio_file:
+            yield np.frombuffer(audio_file.read(), dtype=np.uint8)
+
+    def fake_convert_stream_to_midi(pcm_chunks):
+        list(pcm_chunks)
+        return MIDI_DATA
+
+    def fake_midi_to_musicxml(midi_data):
+        return XML_DATA
+
+    monkeypatch.setattr(midi_controller, "stream_audio", fake_stream_audio)
+    monkeypatch.setattr(
+        midi_controller, "convert_stream_to_midi", fake_convert_stream_to_midi
+    )
+    monkeypatch.setattr(midi_controller, "midi_to_musicxml", fake_midi_to_musicxml)
+    monkeypatch.setattr(
+        midi_controller, "conversion_cache", ConversionCache(str(tmp_path), 0)
+    )
+
+    app = create_app(TestingConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def submit(client, filename):
+    return client.post(
+        "api/v1/jobs",
+        data={
+            "name": "John",
+            "email": "john@gmail.com",
+            "title": "A Random Song",
+            "file": (BytesIO(b"my file contents"), filename),
+        },
+        content_type="multipart/form-data",
+    )
+
+
+def test_submit_job(client):
+    """
+    Test that submitting a job returns ACCEPTED with a Location header.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    response = submit(client, "song.mp3")
+    job_queue.join()
+
+    assert response.status_code == ACCEPTED
+    assert response.json["status"] == QUEUED
+    assert response.headers["Location"].endswith(
+        f"/api/v1/jobs/{response.json['job_id']}"
+    )
+
+
+def test_job_succeeds(client):
+    """
+    Test that a queued job is converted and its result can be fetched.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    job_id = submit(client, "song.mp3").json["job_id"]
+    job_queue.join()
+
+    response = client.get(f"api/v1/jobs/{job_id}")
+    assert response.status_code == OK
+    assert response.json["status"] == SUCCEEDED
+    assert response.json["midi_id"] is not None
+
+    response = client.get(f"api/v1/jobs/{job_id}/result")
+    assert response.status_code == OK
+    assert response.json["title"] == "A Random Song"
+    assert client.get(response.json["midi_url"]).data == MIDI_DATA
+    midi = db.session.get(MIDI, response.json["midi_id"])
+    assert midi.midi_data is None
+    assert midi_controller.blob_store.get(midi.midi_key) == MIDI_DATA
+
+
+def test_job_decodes_once_with_cache(client, tmp_path, monkeypatch):
+    """
+    Test that a cached conversion decodes the upload once, on a miss and a hit.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    monkeypatch.setattr(
+        midi_controller, "conversion_cache", ConversionCache(str(tmp_path / "cache"), 1024)
+    )
+    decodes = []
+    fake_stream_audio = midi_controller.stream_audio
+
+    def counting_stream_audio(audio_path):
+        decodes.append(audio_path)
+        return fake_stream_audio(audio_path)
+
+    monkeypatch.setattr(midi_controller, "stream_audio", counting_stream_audio)
+
+    for _ in range(2):
+        job_id = submit(client, "song.mp3").json["job_id"]
+        job_queue.join()
+        assert client.get(f"api/v1/jobs/{job_id}").json["status"] == SUCCEEDED
+
+    assert len(decodes) == 2
+    assert midi_controller.conversion_cache.hits == 1
+
+
+def test_job_fails(client):
+    """
+    Test that a job with a file that cannot be decoded is marked as failed.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    job_id = submit(client, "song.flac").json["job_id"]
+    job_queue.join()
+
+    response = client.get(f"api/v1/jobs/{job_id}")
+    assert response.json["status"] == FAILED
+    assert response.json["error"] == "Unsupported audio format"
+    assert not os.path.exists(db.session.get(ConversionJob, job_id).audio_path)
+
+    response = client.get(f"api/v1/jobs/{job_id}/result")
+    assert response.status_code == CONFLICT
+
+
+def test_job_result_pending(client):
+    """
+    Test that fetching the result of an unfinished job returns ACCEPTED.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    job = ConversionJob(
+        name="John",
+        email="john@gmail.com",
+        title="Pending",
+        audio_path="pending.mp3",
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    response = client.get(f"api/v1/jobs/{job.job_id}/result")
+    assert response.status_code == ACCEPTED
+    assert response.json["status"] == QUEUED
+
+
+def test_job_not_found(client):
+    """
+    Test that unknown jobs return NOT FOUND.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    assert client.get("api/v1/jobs/42").status_code == NOT_FOUND
+    assert client.get("api/v1/jobs/42/result").status_code == NOT_FOUND
+
+
+def test_job_queue_survives_errors():
+    """
+    Test that a failing callable does not stop the worker threads.
+    """
+    queue = JobQueue(num_workers=1)
+    results = []
+
+    def fail():
+        raise RuntimeError("boom")
+
+    queue.submit(fail)
+    queue.submit(results.append, "done")
+    queue.join()
+
+    assert results == ["done"]
+
+
+def test_job_queue_join_timeout():
+    """
+    Test that join gives up on callables still running after the timeout.
+    """
+    queue = JobQueue(num_workers=1)
+    release = threading.Event()
+
+    queue.submit(release.wait)
+
+    assert not queue.join(timeout=0.05)
+    release.set()
+    assert queue.join(timeout=5)
+
+
+def test_recover_jobs(app):
+    """
+    Test that jobs left queued are run again and stale running jobs are failed.
+    """
+    audio_path = os.path.join(midi_controller.AUDIO_UPLOAD_DIR, "lost.mp3")
+    with open(audio_path, "wb") as audio_file:
+        audio_file.write(b"my file contents")
+    long_ago = DateConverter.current_time() - timedelta(seconds=JOB_STALE_SECONDS + 60)
+    jobs = {
+        status: ConversionJob(
+            name="John",
+            email="john@gmail.com",
+            title=status,
+            audio_path=audio_path,
+            status=status.split("_")[0],
+            created_at=updated_at,
+            updated_at=updated_at,
+        )
+        for status, updated_at in [
+            ("queued", long_ago),
+            ("running_stale", long_ago),
+            ("running", DateConverter.current_time()),
+        ]
+    }
+    db.session.add_all(jobs.values())
+    db.session.commit()
+    job_ids = {status: job.job_id for status, job in jobs.items()}
+
+    assert recover_jobs(app) == 1
+    job_queue.join()
+    db.session.expire_all()
+
+    assert db.session.get(ConversionJob, job_ids["queued"]).status == SUCCEEDED
+    stale = db.session.get(ConversionJob, job_ids["running_stale"])
+    assert stale.status == FAILED
+    assert stale.error == INTERRUPTED_ERROR
+    assert db.session.get(ConversionJob, job_ids["running"]).status == RUNNING
+
+
+def test_stale_job_fails_when_polled(app, client):
+    """
+    Test that polling a job whose worker is gone reports it as failed.
+    """
+    long_ago = DateConverter.current_time() - timedelta(seconds=JOB_STALE_SECONDS + 60)
+    job = ConversionJob(
+        name="John",
+        email="john@gmail.com",
+        title="Lost",
+        audio_path="lost.mp3",
+        status=RUNNING,
+        created_at=long_ago,
+        updated_at=long_ago,
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    response = client.get(f"api/v1/jobs/{job.job_id}")
+    assert response.json["status"] == FAILED
+    assert client.get(f"api/v1/jobs/{job.job_id}/result").status_code == CONFLICT
+
+
+def test_job_error_hides_internal_details(client, monkeypatch):
+    """
+    Test that unexpected errors are reported to clients as CONVERSION_ERROR.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+
+    def broken_convert_upload(audio_file_path):
+        raise RuntimeError(f"could not open {audio_file_path}: disk full")
+
+    monkeypatch.setattr(midi_controller, "convert_upload", broken_convert_upload)
+
+    job_id = submit(client, "song.mp3").json["job_id"]
+    job_queue.join()
+
+    response = client.get(f"api/v1/jobs/{job_id}")
+    assert response.json["status"] == FAILED
+    assert response.json["error"] == CONVERSION_ERROR
+
+
+def test_stale_job_stays_failed(app, client, monkeypatch):
+    """
+    Test that a job failed as stale while converting is not marked as
+    succeeded when its conversion finishes, and its MIDI is discarded.
+    """
+    convert_upload = midi_controller.convert_upload
+
+    def slow_convert_upload(audio_file_path):
+        result = convert_upload(audio_file_path)
+        # A poll gives up on the job while it is still converting
+        fail_stale_jobs(stale_after=-1)
+        return result
+
+    monkeypatch.setattr(midi_controller, "convert_upload", slow_convert_upload)
+
+    job_id = submit(client, "song.mp3").json["job_id"]
+    job_queue.join()
+
+    response = client.get(f"api/v1/jobs/{job_id}")
+    assert response.json["status"] == FAILED
+    assert response.json["error"] == INTERRUPTED_ERROR
+    assert response.json["midi_id"] is None
+    assert db.session.query(MIDI).count() == 0
+    assert [files for _, _, files in os.walk(midi_controller.blob_store.root) if files] == []
@@ -20,14 +20,30 @@
 ###############################################################################
 
 from io import BytesIO
+import base64
+import gzip
+import json
+import os
+import zlib
 import pytest
 from app import create_app
-from app.utils.status_codes import OK, CREATED, NO_CONTENT
+from app.controllers import midi_controller
+from app.utils.status_codes import (
+    OK,
+    CREATED,
+    NO_CONTENT,
+    PARTIAL_CONTENT,
+    NOT_MODIFIED,
+    NOT_FOUND,
+    BAD_REQUEST,
+)
 from app.database import db
 from app.test_config import TestingConfig
 from app.models.user_model import User
 from app.models.midi_model import MIDI
 from app.utils.base64_converter import BinaryConverter
+from app.utils.blob_store import ContentAddressedBlobStore
+from app.utils.compression import Compressor
 from app.utils.isodate_converter import DateConverter
 
 ISODATE = "2024-04-09T12:34:56"
@@ -43,6 +59,7 @@ MIDI1_ENCODED = BinaryConverter.encode_binary(b"MidiData1")
 MIDI2_ENCODED = BinaryConverter.encode_binary(b"MidiData2")
 MIDI1_DATA = BinaryConverter.decode_binary(MIDI1_ENCODED)
 MIDI2_DATA = BinaryConverter.decode_binary(MIDI2_ENCODED)
+XML_DATA = b"<score-partwise>Midi</score-partwise>"
 
 
 def read_midi_file(file_path):
@@ -107,26 +124,331 @@ def test_get_all_midis(client):
         },
     ]
 
-# REQUIRES REFACTORING OF CODE.
-# def test_get_midi(client):
-#     """
-#     Test retrieving a single MIDI file by its ID.
+@pytest.fixture
+def listing_client(client):
+    """Add MIDIs with distinct titles, authors and dates for listing tests."""
+    user3 = User(name="Alice", email="alice@gmail.com")
+    db.session.add(user3)
+    db.session.commit()
+    for day, title in [(10, "Cello"), (11, "Allegro"), (12, "Bolero")]:
+        db.session.add(
+            MIDI(
+                user_id=user3.user_id,
+                title=title,
+                date=DateConverter.encode_date(f"2024-04-{day}T09:00:00"),
+                midi_data=b"data",
+            )
+        )
+    db.session.commit()
+    return client
 
-#     Args:
-#         client (FlaskClient): The test client for the application.
-#     """
-#     MIDIS_API_URL = "api/v1/midis/1"
-#     response = client.get(MIDIS_API_URL)
-#     assert response.status_code == OK
-#     del response["xml_data"]
-#     assert response.json == {
-#         "midi_id": 1,
-#         "name": "User1",
-#         "email": "User1@gmail.com",
-#         "title": "Midi1",
-#         "date": ISODATE,
-#         "midi_data": MIDI1_ENCODED,
-#     }
+
+def list_all_pages(client, query):
+    """Follow the next links of a paginated listing and collect every title."""
+    titles = []
+    url = f"api/v1/midis?{query}"
+    while url:
+        response = client.get(url)
+        assert response.status_code == OK
+        titles.extend(midi["title"] for midi in response.json)
+        url = response.headers.get("Link", "").partition(">")[0].lstrip("<")
+    return titles
+
+
+def test_get_all_midis_sorted(listing_client):
+    """
+    Test sorting the MIDI listing by title, author and date.
+
+    Args:
+        listing_client (FlaskClient): The test client with extra MIDIs.
+    """
+    response = listing_client.get("api/v1/midis?sort=title")
+    assert [midi["title"] for midi in response.json] == [
+        "Allegro",
+        "Bolero",
+        "Cello",
+        "Midi1",
+        "Midi2",
+    ]
+
+    response = listing_client.get("api/v1/midis?sort=date&order=desc")
+    assert [midi["title"] for midi in response.json] == [
+        "Bolero",
+        "Allegro",
+        "Cello",
+        "Midi2",
+        "Midi1",
+    ]
+
+    response = listing_client.get("api/v1/midis?sort=author")
+    assert [midi["name"] for midi in response.json] == [
+        "Alice",
+        "Alice",
+        "Alice",
+        "User1",
+        "User2",
+    ]
+
+
+def test_get_all_midis_paginated(listing_client):
+    """
+    Test keyset pagination of the MIDI listing.
+
+    Args:
+        listing_client (FlaskClient): The test client with extra MIDIs.
+    """
+    response = listing_client.get("api/v1/midis?sort=title&limit=2")
+    assert [midi["title"] for midi in response.json] == ["Allegro", "Bolero"]
+    assert "X-Next-Cursor" in response.headers
+
+    assert list_all_pages(listing_client, "sort=title&limit=2") == [
+        "Allegro",
+        "Bolero",
+        "Cello",
+        "Midi1",
+        "Midi2",
+    ]
+    # Equal dates are ordered by ID, so no row is skipped or repeated
+    assert list_all_pages(listing_client, "sort=date&order=desc&limit=1") == [
+        "Bolero",
+        "Allegro",
+        "Cello",
+        "Midi2",
+        "Midi1",
+    ]
+
+    response = listing_client.get("api/v1/midis?limit=5")
+    assert len(response.json) == 5
+    assert "Link" not in response.headers
+
+
+def test_get_all_midis_filtered(listing_client):
+    """
+    Test filtering the MIDI listing.
+
+    Args:
+        listing_client (FlaskClient): The test client with extra MIDIs.
+    """
+    response = listing_client.get("api/v1/midis?search=LERO")
+    assert [midi["title"] for midi in response.json] == ["Bolero"]
+
+    response = listing_client.get("api/v1/midis?search=user1")
+    assert [midi["title"] for midi in response.json] == ["Midi1"]
+
+    response = listing_client.get("api/v1/midis?email=alice@gmail.com&sort=title")
+    assert [midi["title"] for midi in response.json] == ["Allegro", "Bolero", "Cello"]
+
+    response = listing_client.get(
+        "api/v1/midis?date_from=2024-04-11T00:00:00&date_to=2024-04-12T23:59:59"
+    )
+    assert [midi["title"] for midi in response.json] == ["Allegro", "Bolero"]
+
+
+def test_get_all_midis_invalid(client):
+    """
+    Test that invalid listing arguments are rejected.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    for query in ["sort=size", "order=up", "limit=0", "limit=ten", "cursor=abc"]:
+        response = client.get(f"api/v1/midis?{query}")
+        assert response.status_code == BAD_REQUEST, query
+
+
+@pytest.mark.parametrize(
+    "sort, cursor",
+    [
+        ("title", [[1], 2]),
+        ("title", ["Bolero", "2"]),
+        ("author", [None, 2]),
+        ("id", ["2", 2]),
+        ("id", [True, 2]),
+        ("date", [20240411, 2]),
+        ("date", ["yesterday", 2]),
+        ("title", ["Bolero", 2, 3]),
+        ("title", {"Bolero": 2}),
+    ],
+)
+def test_get_all_midis_invalid_cursor(client, sort, cursor):
+    """
+    Test that a well-formed cursor holding values of the wrong type is rejected.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode("utf-8")).decode("utf-8")
+    response = client.get(f"api/v1/midis?sort={sort}&cursor={encoded}")
+    assert response.status_code == BAD_REQUEST
+
+
+def test_get_midi(client, monkeypatch):
+    """
+    Test retrieving the metadata of a single MIDI file, with links to its files.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+
+    def fail_midi_to_musicxml(midi_data):
+        raise AssertionError("MusicXML should not be rendered for metadata")
+
+    monkeypatch.setattr(midi_controller, "midi_to_musicxml", fail_midi_to_musicxml)
+
+    MIDIS_API_URL = "api/v1/midis/1"
+    response = client.get(MIDIS_API_URL)
+    assert response.status_code == OK
+    assert response.json == {
+        "midi_id": 1,
+        "name": "User1",
+        "email": "User1@gmail.com",
+        "title": "Midi1",
+        "date": ISODATE,
+        "url": "/api/v1/midis/1",
+        "midi_url": "/api/v1/midis/1/file.mid",
+        "xml_url": "/api/v1/midis/1/score.musicxml",
+    }
+
+
+def test_get_midi_file(client):
+    """
+    Test streaming a MIDI file with conditional and range requests.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    _, midi = midi_controller.save_midi("John", "john@gmail.com", "Song", b"MThd 0123")
+    url = f"api/v1/midis/{midi.midi_id}/file.mid"
+
+    response = client.get(url)
+    assert response.status_code == OK
+    assert response.mimetype == "audio/midi"
+    assert response.data == b"MThd 0123"
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["Content-Disposition"] == "inline; filename=Song.mid"
+    etag = response.headers["ETag"]
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == NOT_MODIFIED
+    assert response.data == b""
+
+    response = client.get(url, headers={"Range": "bytes=5-"})
+    assert response.status_code == PARTIAL_CONTENT
+    assert response.data == b"0123"
+    assert response.headers["Content-Range"] == "bytes 5-8/9"
+
+    response = client.get(url + "?download=1")
+    assert response.headers["Content-Disposition"] == "attachment; filename=Song.mid"
+
+    # Legacy rows keep their MIDI inline
+    response = client.get("api/v1/midis/2/file.mid")
+    assert response.status_code == OK
+    assert response.data == MIDI2_DATA
+    assert response.headers["ETag"] != etag
+
+    assert client.get("api/v1/midis/42/file.mid").status_code == NOT_FOUND
+
+
+def test_get_midi_score(client, monkeypatch):
+    """
+    Test sending a stored MusicXML score in every supported encoding.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+
+    def fail_midi_to_musicxml(midi_data):
+        raise AssertionError("MusicXML should not be regenerated")
+
+    monkeypatch.setattr(midi_controller, "midi_to_musicxml", fail_midi_to_musicxml)
+    _, midi = midi_controller.save_midi(
+        "John", "john@gmail.com", "Song", b"MThd", XML_DATA
+    )
+    url = f"api/v1/midis/{midi.midi_id}/score.musicxml"
+    stored_xml = midi_controller.blob_store.get(midi.xml_key)
+
+    response = client.get(url)
+    assert response.status_code == OK
+    assert response.mimetype == "application/vnd.recordare.musicxml+xml"
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.data == XML_DATA
+
+    # gzip is sent exactly as stored, and preferred over brotli
+    response = client.get(url, headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.data == stored_xml
+    gzip_etag = response.headers["ETag"]
+
+    response = client.get(
+        url, headers={"Accept-Encoding": "gzip", "If-None-Match": gzip_etag}
+    )
+    assert response.status_code == NOT_MODIFIED
+
+    response = client.get(url, headers={"Accept-Encoding": "br"})
+    if Compressor.brotli_available():
+        import brotli
+
+        assert response.headers["Content-Encoding"] == "br"
+        assert brotli.decompress(response.data) == XML_DATA
+        assert response.headers["ETag"] != gzip_etag
+    else:
+        assert response.data == XML_DATA
+
+    response = client.get(url, headers={"Range": "bytes=0-9"})
+    assert response.status_code == PARTIAL_CONTENT
+    assert response.data == XML_DATA[:10]
+
+
+def test_get_midi_score_legacy_row(client, monkeypatch, tmp_path):
+    """
+    Test that MusicXML is rendered once and stored for rows without it.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    calls = []
+
+    def fake_midi_to_musicxml(midi_data):
+        calls.append(midi_data)
+        return XML_DATA
+
+    monkeypatch.setattr(midi_controller, "midi_to_musicxml", fake_midi_to_musicxml)
+
+    MIDIS_API_URL = "api/v1/midis/2/score.musicxml"
+    for _ in range(2):
+        response = client.get(MIDIS_API_URL)
+        assert response.status_code == OK
+        assert response.data == XML_DATA
+
+    assert calls == [MIDI2_DATA]
+    midi = db.session.get(MIDI, 2)
+    assert midi.xml_data is None
+    stored_xml = midi_controller.blob_store.get(midi.xml_key)
+    assert Compressor.decompress(stored_xml) == XML_DATA
+    assert midi.xml_size == len(stored_xml)
+
+    # Rows stored with zlib are re-encoded for gzip clients
+    midi = db.session.get(MIDI, 1)
+    midi.xml_data = zlib.compress(XML_DATA)
+    db.session.commit()
+    response = client.get(
+        "api/v1/midis/1/score.musicxml", headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == XML_DATA
+
+
+def test_get_midi_not_found(client):
+    """
+    Test retrieving a MIDI file that does not exist.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    MIDIS_API_URL = "api/v1/midis/42"
+    response = client.get(MIDIS_API_URL)
+    assert response.status_code == NOT_FOUND
 
 
 # def test_create_midi(client):
@@ -188,3 +510,58 @@ def test_delete_midi(client):
     MIDIS_API_URL = "api/v1/midis/1"
     response = client.delete(MIDIS_API_URL)
     assert response.status_code == NO_CONTENT
+
+
+@pytest.mark.parametrize("failure", ["blob", "commit"])
+def test_save_midi_failure_leaves_nothing(client, blob_store, monkeypatch, failure):
+    """
+    Test that a failed save leaves no user, MIDI or blob behind.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    users = db.session.query(User).count()
+    put = blob_store.put
+
+    def failing_put(data, kind):
+        if kind == "xml":
+            raise OSError("disk full")
+        return put(data, kind)
+
+    def failing_commit():
+        raise RuntimeError("database gone")
+
+    if failure == "blob":
+        monkeypatch.setattr(blob_store, "put", failing_put)
+    else:
+        monkeypatch.setattr(db.session, "commit", failing_commit)
+
+    with pytest.raises((OSError, RuntimeError)):
+        midi_controller.save_midi("John", "john@gmail.com", "Song", b"MThd", b"<score/>")
+
+    monkeypatch.undo()
+    assert db.session.query(User).count() == users
+    assert db.session.query(MIDI).filter_by(title="Song").count() == 0
+    assert not any(files for _, _, files in os.walk(blob_store.root))
+
+
+def test_save_midi_failure_keeps_shared_blobs(client, tmp_path, monkeypatch):
+    """
+    Test that a failed save keeps content-addressed blobs other entries use.
+
+    Args:
+        client (FlaskClient): The test client for the application.
+    """
+    store = ContentAddressedBlobStore(str(tmp_path / "shared"))
+    monkeypatch.setattr(midi_controller, "blob_store", store)
+    _, saved = midi_controller.save_midi("John", "john@gmail.com", "First", b"MThd same")
+
+    def failing_commit():
+        raise RuntimeError("database gone")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(db.session, "commit", failing_commit)
+        with pytest.raises(RuntimeError):
+            midi_controller.save_midi("Jane", "jane@gmail.com", "Second", b"MThd same")
+
+    assert store.get(saved.midi_key) == b"MThd same"
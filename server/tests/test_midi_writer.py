@@ -0,0 +1,247 @@
+################################################################################
+# Filename: test_midi_writer.py
+# Purpose:  Contains pytest test cases for the research MIDI file serializer.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains pytest test cases for midi_writer.py, the Standard MIDI
+# File serializer of the research scripts. Every file it writes is read back
+# with mido and compared with the notes it was given, including delta times
+# at the boundaries of the variable-length quantity sizes, running status
+# across channels and serialized blocks, and the key signature of every key.
+#
+# Usage (Optional):
+# Run the tests using the pytest command:
+#   python -m pytest
+#
+# Notes:
+# The research scripts are not a package, so their folder is put on the path.
+#
+###############################################################################
+
+from io import BytesIO
+import os
+import struct
+import sys
+import mido
+from mido.midifiles.meta import encode_variable_int
+import numpy as np
+import pytest
+
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "..", "..", "audio_conversion", "research")
+)
+import midi_writer  # noqa: E402
+from midi_writer import midi_bytes, note_array, write_midi  # noqa: E402
+
+# One tick per millisecond, so onsets in seconds map to whole ticks
+TICKS_PER_BEAT = 1000
+TEMPO = 1000000
+
+
+def read_midi(data):
+    """
+    Parse Standard MIDI File bytes with mido.
+    """
+    return mido.MidiFile(file=BytesIO(data))
+
+
+def channel_messages(midi_file):
+    """
+    Return the note messages of the first track as (type, time, channel,
+    note, velocity) tuples, with note_on at velocity 0 read as note_off.
+    """
+    messages = []
+    for message in midi_file.tracks[0]:
+        if message.type in ("note_on", "note_off"):
+            note_type = message.type
+            if note_type == "note_on" and message.velocity == 0:
+                note_type = "note_off"
+            messages.append(
+                (note_type, message.time, message.channel, message.note, message.velocity)
+            )
+    return messages
+
+
+def smf_track(events):
+    """
+    Wrap serialized track events in a format 0 Standard MIDI File.
+    """
+    track = events + midi_writer.END_OF_TRACK
+    return (
+        b"MThd"
+        + struct.pack(">IHHH", 6, 0, 1, TICKS_PER_BEAT)
+        + b"MTrk"
+        + struct.pack(">I", len(track))
+        + track
+    )
+
+
+@pytest.mark.parametrize(
+    "value", [0, 0x7F, 0x80, 0x3FFF, 0x4000, 0x1FFFFF, 0x200000, midi_writer.MAX_DELTA]
+)
+def test_encode_vlq(value):
+    """
+    Test variable-length quantities on both sides of every size boundary.
+    """
+    assert midi_writer.encode_vlq([value]) == bytes(encode_variable_int(value))
+
+
+def test_encode_vlq_concatenates():
+    """
+    Test that several values are encoded back to back.
+    """
+    values = [0x7F, 0x80, 0x3FFF, 0x4000]
+    expected = b"".join(bytes(encode_variable_int(value)) for value in values)
+
+    assert midi_writer.encode_vlq(values) == expected
+
+
+def test_round_trip_vlq_boundaries():
+    """
+    Test that delta times at the VLQ size boundaries are read back by mido.
+    """
+    gaps = [0x7F, 0x80, 0x3FFF, 0x4000]
+    onsets = np.cumsum([0] + gaps) / TICKS_PER_BEAT
+    notes = note_array(onsets, 0.001, [60, 62, 64, 65, 67], [10, 20, 30, 40, 50])
+
+    midi_file = read_midi(
+        midi_bytes(notes, ticks_per_beat=TICKS_PER_BEAT, tempo=TEMPO)
+    )
+
+    assert midi_file.type == 0
+    assert midi_file.ticks_per_beat == TICKS_PER_BEAT
+    messages = channel_messages(midi_file)
+    # Each note lasts one tick and the next starts one tick short of the gap
+    assert [time for _, time, *_ in messages] == [0, 1] + [
+        time for gap in gaps for time in (gap - 1, 1)
+    ]
+    assert [note for *_, note, _ in messages[::2]] == [60, 62, 64, 65, 67]
+    assert [velocity for *_, velocity in messages[::2]] == [10, 20, 30, 40, 50]
+    assert all(message[0] == "note_off" for message in messages[1::2])
+
+
+def test_round_trip_meta_events(tmp_path):
+    """
+    Test that the tempo and the notes written to a path are read back.
+    """
+    path = tmp_path / "take.mid"
+    notes = note_array([0.5, 0.0], [0.25, 0.5], [64, 60], 90)
+
+    write_midi(notes, str(path), tempo=400000, key="Am", channel=3)
+
+    midi_file = mido.MidiFile(str(path))
+    meta = [message for message in midi_file.tracks[0] if message.is_meta]
+    assert [message.type for message in meta] == ["set_tempo", "key_signature", "end_of_track"]
+    assert meta[0].tempo == 400000
+    assert meta[1].key == "Am"
+    # 480 ticks per beat at 0.4 s per beat is 1200 ticks per second
+    assert channel_messages(midi_file) == [
+        ("note_on", 0, 3, 60, 90),
+        ("note_off", 600, 3, 60, 0),
+        ("note_on", 0, 3, 64, 90),
+        ("note_off", 300, 3, 64, 0),
+    ]
+
+
+@pytest.mark.parametrize("key", midi_writer.MAJOR_KEYS + midi_writer.MINOR_KEYS)
+def test_key_signature_bytes(key):
+    """
+    Test the key signature of every key against mido's own encoding.
+    """
+    expected = mido.MetaMessage("key_signature", key=key)
+
+    assert midi_writer.key_signature_bytes(key) == b"\x00" + bytes(expected.bytes())
+    midi_file = read_midi(midi_bytes(note_array([], [], []), key=key))
+    assert [message.key for message in midi_file.tracks[0] if message.type == "key_signature"] == [key]
+
+
+def test_key_signature_unknown():
+    """
+    Test that keys mido cannot spell are rejected.
+    """
+    with pytest.raises(ValueError):
+        midi_writer.key_signature_bytes("H")
+
+
+def test_running_status_across_channels():
+    """
+    Test that the status byte is only left out when it repeats exactly.
+    """
+    statuses = np.array([0x90, 0x91, 0x91, 0x81, 0x80, 0x80], dtype=np.uint8)
+    deltas = np.array([0, 0, 0x80, 0, 0x4000, 0])
+    pitches = np.array([60, 60, 64, 60, 60, 64], dtype=np.uint8)
+    velocities = np.array([100, 90, 80, 0, 0, 0], dtype=np.uint8)
+
+    events = midi_writer._serialize_events(deltas, statuses, pitches, velocities)
+
+    # Two events repeat the status before them
+    assert len(events) == len(midi_writer.encode_vlq(deltas)) + 3 * 6 - 2
+    assert channel_messages(read_midi(smf_track(events))) == [
+        ("note_on", 0, 0, 60, 100),
+        ("note_on", 0, 1, 60, 90),
+        ("note_on", 0x80, 1, 64, 80),
+        ("note_off", 0, 1, 60, 0),
+        ("note_off", 0x4000, 0, 60, 0),
+        ("note_off", 0, 0, 64, 0),
+    ]
+
+
+def test_running_status_across_blocks(monkeypatch):
+    """
+    Test that a file written in several blocks equals one written at once.
+    """
+    rng = np.random.default_rng(0)
+    notes = note_array(
+        np.sort(rng.integers(0, 20000, 200)) / TICKS_PER_BEAT,
+        rng.integers(1, 500, 200) / TICKS_PER_BEAT,
+        rng.integers(21, 109, 200),
+        rng.integers(1, 128, 200),
+    )
+    options = {"ticks_per_beat": TICKS_PER_BEAT, "tempo": TEMPO, "channel": 9}
+    single = midi_bytes(notes, **options)
+
+    monkeypatch.setattr(midi_writer, "BLOCK_EVENTS", 7)
+    blocked = midi_bytes(notes, **options)
+
+    assert blocked == single
+    messages = channel_messages(read_midi(blocked))
+    assert len(messages) == 2 * len(notes)
+    assert {channel for _, _, channel, *_ in messages} == {9}
+    # Every note starts and ends at its own tick, in any order of events
+    times = np.cumsum([time for _, time, *_ in messages])
+    on_ticks = sorted(
+        (tick, note) for (kind, _, _, note, _), tick in zip(messages, times) if kind == "note_on"
+    )
+    expected = sorted(zip(np.rint(notes["onset"] * TICKS_PER_BEAT).astype(int), notes["pitch"]))
+    assert on_ticks == expected
+
+
+def test_note_off_before_note_on():
+    """
+    Test that a note repeated right after itself is ended before it restarts.
+    """
+    notes = note_array([0.0, 0.01], [0.01, 0.01], [60, 60])
+
+    messages = channel_messages(
+        read_midi(midi_bytes(notes, ticks_per_beat=TICKS_PER_BEAT, tempo=TEMPO))
+    )
+
+    assert [(kind, time) for kind, time, *_ in messages] == [
+        ("note_on", 0),
+        ("note_off", 10),
+        ("note_on", 0),
+        ("note_off", 10),
+    ]
+
+
+def test_invalid_notes():
+    """
+    Test that notes before 0 seconds or gaps too long for a delta are rejected.
+    """
+    with pytest.raises(ValueError):
+        midi_bytes(note_array([-1.0], [1.0], [60]))
+
+    too_late = (midi_writer.MAX_DELTA + 1) / TICKS_PER_BEAT
+    with pytest.raises(ValueError):
+        midi_bytes(note_array([too_late], [0.001], [60]), ticks_per_beat=TICKS_PER_BEAT, tempo=TEMPO)
@@ -0,0 +1,145 @@
+################################################################################
+# Filename: test_model_manager.py
+# Purpose:  Contains pytest test cases for the Basic Pitch model manager.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains pytest test cases for the ModelManager class, including
+# tests for loading the model only once, warming it up on a silent window,
+# recording inference timings, reporting them through the stats endpoint, and
+# importing the application without importing TensorFlow. A fake model is used
+# so the tests do not depend on TensorFlow.
+#
+# Usage (Optional):
+# Run the tests using the pytest command:
+#   python -m pytest
+#
+###############################################################################
+
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+from app import create_app
+from app.test_config import TestingConfig
+from app.utils.model_manager import ModelManager
+from app.utils.status_codes import OK
+
+
+class FakeModel:
+    def __init__(self):
+        self.inputs = []
+
+    def predict(self, x):
+        self.inputs.append(x)
+        return {}
+
+
+class FakeModelManager(ModelManager):
+    def __init__(self):
+        super().__init__()
+        self.load_calls = 0
+
+    def _load(self):
+        self.load_calls += 1
+        self.load_time = 0.0
+        return FakeModel()
+
+
+def test_get_model_loads_once():
+    """
+    Test that the model is loaded on first use and reused afterwards.
+    """
+    manager = FakeModelManager()
+    assert not manager.is_loaded
+
+    first = manager.get_model()
+    second = manager.get_model()
+
+    assert first is second
+    assert manager.load_calls == 1
+    assert manager.is_loaded
+
+
+def test_warm_up_runs_silent_window():
+    """
+    Test that warm_up runs the model once on a silent buffer.
+    """
+    manager = FakeModelManager()
+    manager.warm_up()
+
+    model = manager.get_model()
+    assert len(model.inputs) == 1
+    assert model.inputs[0].ndim == 3
+    assert not np.any(model.inputs[0])
+    assert manager.warmup_time is not None
+
+
+def test_timed_inference_records_stats():
+    """
+    Test that timed_inference accumulates inference timings.
+    """
+    manager = FakeModelManager()
+    with manager.timed_inference():
+        pass
+    with manager.timed_inference():
+        pass
+
+    stats = manager.stats()
+    assert stats["inference_count"] == 2
+    assert stats["last_inference_time"] is not None
+    assert stats["average_inference_time"] == pytest.approx(
+        stats["total_inference_time"] / 2
+    )
+
+
+def test_timed_inference_records_failures():
+    """
+    Test that an inference raising an error is still timed.
+    """
+    manager = FakeModelManager()
+    with pytest.raises(RuntimeError):
+        with manager.timed_inference():
+            raise RuntimeError("inference failed")
+
+    assert manager.inference_count == 1
+
+
+def test_get_stats_endpoint():
+    """
+    Test that the stats endpoint reports the model statistics.
+    """
+    client = create_app(TestingConfig).test_client()
+    response = client.get("api/v1/stats")
+    assert response.status_code == OK
+    assert "inference_count" in response.json["model"]
+
+
+def test_app_import_is_lazy():
+    """
+    Test that creating the application imports neither TensorFlow nor music21
+    until a model is needed.
+    """
+    code = (
+        "import sys\n"
+        "from app import create_app\n"
+        "create_app()\n"
+        "print(' '.join(m for m in ('tensorflow', 'music21') if m in sys.modules))\n"
+        "from app.utils.model_manager import import_model_modules\n"
+        "import_model_modules()\n"
+        "print('tensorflow' in sys.modules)\n"
+    )
+    server_dir = os.path.join(os.path.dirname(__file__), "..")
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=server_dir,
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "DATABASE_URL": "sqlite://"},
+    )
+
+    lines = result.stdout.splitlines()
+    assert lines[0] == ""
+    assert lines[-1] == "True"
@@ -0,0 +1,220 @@
+################################################################################
+# Filename: test_musicxml_pool.py
+# Purpose:  Contains pytest test cases for the music21 worker pool.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains pytest test cases for converting MIDI data to MusicXML
+# on the MusicXMLPool worker processes, including the agreement with music21
+# in process, recycling workers after a number of conversions without
+# waiting for them to exit, timeouts, conversion errors, workers that exit,
+# concurrent conversions, and new entries saved without a score when it
+# cannot be rendered.
+#
+# Usage (Optional):
+# Run the tests using the pytest command:
+#   python -m pytest
+#
+###############################################################################
+
+import os
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from io import BytesIO
+import mido
+import numpy as np
+import pytest
+from app.controllers import midi_controller
+from app.utils.conversion_cache import ConversionCache
+from app.utils import musicxml_pool as musicxml_pool_module
+from app.utils.musicxml_pool import MusicXMLError, MusicXMLPool, MusicXMLTimeoutError
+from app.utils.musicxml_worker import render_music21
+
+# A worker that warms up, then never answers or exits after the first request
+HANGING_WORKER = """
+import sys, time
+sys.stdout.buffer.write(bytes([2, 0, 0, 0, 0]))
+sys.stdout.buffer.flush()
+sys.stdin.buffer.read(4)
+time.sleep(60)
+"""
+# A worker that answers one request, then ignores being asked to exit
+LINGERING_WORKER = """
+import signal, sys, time
+signal.signal(signal.SIGTERM, signal.SIG_IGN)
+sys.stdout.buffer.write(bytes([2, 0, 0, 0, 0]))
+sys.stdout.buffer.flush()
+size = int.from_bytes(sys.stdin.buffer.read(4), "big")
+sys.stdin.buffer.read(size)
+sys.stdout.buffer.write(bytes([0, 0, 0, 0, 6]) + b"<xml/>")
+sys.stdout.buffer.flush()
+time.sleep(60)
+"""
+EXITING_WORKER = """
+import sys
+sys.stdout.buffer.write(bytes([2, 0, 0, 0, 0]))
+sys.stdout.buffer.flush()
+sys.stdin.buffer.read(4)
+"""
+
+
+def chord_midi():
+    """Return MIDI bytes of a C major chord, which music21 has to render."""
+    track = mido.MidiTrack()
+    for pitch in (60, 64, 67):
+        track.append(mido.Message("note_on", note=pitch, velocity=90, time=0))
+    for i, pitch in enumerate((60, 64, 67)):
+        track.append(mido.Message("note_off", note=pitch, velocity=0, time=0 if i else 960))
+    midi = mido.MidiFile()
+    midi.tracks.append(track)
+    buffer = BytesIO()
+    midi.save(file=buffer)
+    return buffer.getvalue()
+
+
+def notes(xml_data):
+    """Return the pitch, duration and chord flag of every note of a score."""
+    return [
+        (
+            note.findtext("pitch/step") + note.findtext("pitch/octave"),
+            note.findtext("duration"),
+            note.find("chord") is not None,
+        )
+        for note in ElementTree.fromstring(xml_data).iter("note")
+        if note.find("pitch") is not None
+    ]
+
+
+@pytest.fixture
+def pool():
+    pool = MusicXMLPool(size=1, max_jobs=2, timeout=60)
+    yield pool
+    pool.shutdown()
+
+
+def test_render_matches_music21(pool):
+    """
+    Test that the workers render what music21 renders in process.
+    """
+    midi_data = chord_midi()
+
+    xml_data = pool.render(midi_data)
+
+    assert notes(xml_data) == notes(render_music21(midi_data))
+    assert [note[2] for note in notes(xml_data)] == [False, True, True]
+
+
+def test_workers_are_recycled(pool):
+    """
+    Test that a worker is replaced after max_jobs conversions.
+    """
+    midi_data = chord_midi()
+
+    for _ in range(5):
+        pool.render(midi_data)
+
+    assert pool.started == 3
+
+
+def test_recycling_does_not_block(tmp_path, monkeypatch):
+    """
+    Test that a recycled worker is stopped without holding up the conversion.
+    """
+    worker_script = tmp_path / "worker.py"
+    worker_script.write_text(LINGERING_WORKER)
+    monkeypatch.setattr(musicxml_pool_module, "WORKER_SCRIPT", str(worker_script))
+    monkeypatch.setattr(musicxml_pool_module, "STOP_TIMEOUT", 3)
+    pool = MusicXMLPool(size=1, max_jobs=1, timeout=10)
+
+    start = time.monotonic()
+    assert pool.render(chord_midi()) == b"<xml/>"
+    assert time.monotonic() - start < musicxml_pool_module.STOP_TIMEOUT
+    # The slot is free again at once, for a new worker
+    assert pool._get_slots().qsize() == 1
+
+    pool.shutdown()
+    assert time.monotonic() - start >= musicxml_pool_module.STOP_TIMEOUT
+    assert pool._reapers == []
+
+
+def test_conversion_error_keeps_worker(pool):
+    """
+    Test that invalid MIDI data raises MusicXMLError from a worker that lives on.
+    """
+    with pytest.raises(MusicXMLError):
+        pool.render(b"not a MIDI file")
+
+    pool.render(chord_midi())
+    assert pool.started == 1
+
+
+@pytest.mark.parametrize(
+    "script, error",
+    [(HANGING_WORKER, MusicXMLTimeoutError), (EXITING_WORKER, MusicXMLError)],
+    ids=["hanging", "exiting"],
+)
+def test_failed_worker_is_replaced(pool, tmp_path, monkeypatch, script, error):
+    """
+    Test that a worker that times out or exits is killed and replaced.
+    """
+    worker_script = tmp_path / "worker.py"
+    worker_script.write_text(script)
+    monkeypatch.setattr(musicxml_pool_module, "WORKER_SCRIPT", str(worker_script))
+
+    with pytest.raises(error):
+        pool.render(chord_midi(), timeout=1)
+
+    monkeypatch.undo()
+    assert b"<chord" in pool.render(chord_midi())
+    assert pool.started == 2
+
+
+def test_concurrent_renders_share_workers(pool):
+    """
+    Test that more conversions than workers wait for a free worker.
+    """
+    results = []
+
+    def render():
+        results.append(pool.render(chord_midi()))
+
+    threads = [threading.Thread(target=render) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 3
+    assert pool.started == 2
+
+
+def test_in_process_pool():
+    """
+    Test that a pool without workers converts in the calling process.
+    """
+    pool = MusicXMLPool(size=0)
+
+    assert b"<chord" in pool.render(chord_midi())
+    with pytest.raises(MusicXMLError):
+        pool.render(b"not a MIDI file")
+    assert pool.started == 0
+
+
+def test_new_entry_without_score(tmp_path, monkeypatch):
+    """
+    Test that a conversion keeps its MIDI data when the score cannot be rendered.
+    """
+
+    def fail_midi_to_musicxml(midi_data):
+        raise MusicXMLTimeoutError("MusicXML conversion timed out")
+
+    monkeypatch.setattr(midi_controller, "midi_to_musicxml", fail_midi_to_musicxml)
+    monkeypatch.setattr(midi_controller, "convert_pcm_to_midi", lambda pcm, transcriber: b"MThd")
+    cache = ConversionCache(str(tmp_path / "cache"), 1024 * 1024)
+    monkeypatch.setattr(midi_controller, "conversion_cache", cache)
+
+    assert midi_controller.convert_pcm(np.zeros(16, dtype=np.float32)) == (b"MThd", None)
+    # Nothing was cached, so the score is rendered again next time
+    assert not os.path.exists(cache.directory)
+
@@ -0,0 +1,267 @@
+################################################################################
+# Filename: test_musicxml_renderer.py
+# Purpose:  Contains pytest test cases for the lightweight MusicXML renderer.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains pytest test cases for rendering single-line MIDI melodies
+# to MusicXML without music21, including quantization, ties across barlines,
+# rests, key signatures and accidentals, other meters and clefs, agreement
+# with music21's reading of the same MIDI file, and the files left to music21.
+#
+# Usage (Optional):
+# Run the tests using the pytest command:
+#   python -m pytest
+#
+###############################################################################
+
+from io import BytesIO
+import xml.etree.ElementTree as ElementTree
+import mido
+import pretty_midi
+import pytest
+from music21 import converter
+from app.utils import midi_to_musicxml as midi_to_musicxml_module
+from app.utils.musicxml_renderer import read_melody, render_musicxml, split_duration
+
+TICKS_PER_BEAT = 480
+
+
+def make_midi(notes, key=None, time_signature=(4, 4), tempo=500000, channels=None):
+    """Return MIDI bytes of (start, end, pitch) notes timed in beats."""
+    events = []
+    for i, (start, end, pitch) in enumerate(notes):
+        channel = channels[i] if channels else 0
+        events.append((round(start * TICKS_PER_BEAT), 1, pitch, channel))
+        events.append((round(end * TICKS_PER_BEAT), 0, pitch, channel))
+
+    track = mido.MidiTrack()
+    track.append(mido.MetaMessage("set_tempo", tempo=tempo))
+    track.append(
+        mido.MetaMessage(
+            "time_signature", numerator=time_signature[0], denominator=time_signature[1]
+        )
+    )
+    if key:
+        track.append(mido.MetaMessage("key_signature", key=key))
+    last = 0
+    for tick, is_on, pitch, channel in sorted(events):
+        message_type = "note_on" if is_on else "note_off"
+        track.append(
+            mido.Message(message_type, note=pitch, velocity=90 if is_on else 0,
+                         channel=channel, time=tick - last)
+        )
+        last = tick
+
+    midi = mido.MidiFile(ticks_per_beat=TICKS_PER_BEAT)
+    midi.tracks.append(track)
+    buffer = BytesIO()
+    midi.save(file=buffer)
+    return buffer.getvalue()
+
+
+def render(midi_data):
+    """Render MIDI bytes and parse the MusicXML document."""
+    out = BytesIO()
+    assert render_musicxml(midi_data, out)
+    return ElementTree.fromstring(out.getvalue())
+
+
+def test_split_duration():
+    """
+    Test that durations are split into written note values.
+    """
+    assert [value[1:] for value in split_duration(16)] == [("whole", False)]
+    assert [value[1:] for value in split_duration(6)] == [("quarter", True)]
+    assert [value[0] for value in split_duration(11)] == [8, 3]
+
+
+def test_measures_ties_and_rests():
+    """
+    Test that notes crossing barlines are tied and gaps become rests.
+    """
+    root = render(make_midi([(0, 1, 60), (1, 2.5, 62), (3.5, 5, 64), (6, 7, 65)]))
+
+    measures = root.findall("part/measure")
+    assert len(measures) == 2
+    for measure in measures:
+        # Every measure is filled to 4 quarters of 4 divisions
+        assert sum(int(note.find("duration").text) for note in measure.findall("note")) == 16
+
+    notes = [
+        (
+            note.findtext("pitch/step") or "rest",
+            int(note.find("duration").text),
+            [tie.get("type") for tie in note.findall("tie")],
+        )
+        for note in root.iter("note")
+    ]
+    assert notes == [
+        ("C", 4, []),
+        ("D", 6, []),
+        ("rest", 4, []),
+        ("E", 2, ["start"]),
+        ("E", 4, ["stop"]),
+        ("rest", 4, []),
+        ("F", 4, []),
+        ("rest", 4, []),
+    ]
+    assert root.find("part/measure/attributes/divisions").text == "4"
+    assert root.find("part/measure/direction/sound").get("tempo") == "120"
+    assert measures[-1].find("barline/bar-style").text == "light-heavy"
+
+
+def test_quantization_and_legato_overlap():
+    """
+    Test that notes are quantized to sixteenths and short overlaps cut off.
+    """
+    melody = read_melody(make_midi([(0.02, 1.1, 60), (0.98, 2.01, 62)]))
+
+    assert [note[:3] for note in melody["notes"]] == [(0, 4, 60), (4, 8, 62)]
+
+
+def test_key_signature_and_accidentals():
+    """
+    Test flat spelling in a flat key and accidentals within a measure.
+    """
+    root = render(make_midi([(0, 1, 70), (1, 2, 71), (2, 3, 71), (3, 4, 66)], key="F"))
+
+    assert root.find("part/measure/attributes/key/fifths").text == "-1"
+    pitches = [
+        (note.findtext("pitch/step"), note.findtext("pitch/alter"), note.findtext("accidental"))
+        for note in root.iter("note")
+    ]
+    # B flat is in the key, B natural needs a natural sign once per measure
+    assert pitches == [
+        ("B", "-1", None),
+        ("B", None, "natural"),
+        ("B", None, None),
+        ("G", "-1", "flat"),
+    ]
+
+
+def test_meter_and_bass_clef():
+    """
+    Test a 3/4 melody in the bass range.
+    """
+    root = render(make_midi([(0, 3, 40), (3, 6, 43)], time_signature=(3, 4)))
+
+    assert root.find("part/measure/attributes/time/beats").text == "3"
+    assert root.find("part/measure/attributes/clef/sign").text == "F"
+    assert [note.findtext("type") for note in root.iter("note")] == ["half", "half"]
+    assert [note.find("dot") is not None for note in root.iter("note")] == [True, True]
+
+
+def test_empty_midi():
+    """
+    Test that a MIDI file without notes renders one measure rest.
+    """
+    root = render(make_midi([]))
+
+    rest = root.find("part/measure/note/rest")
+    assert rest.get("measure") == "yes"
+
+
+def test_matches_music21():
+    """
+    Test that music21 reads the same notes from the rendering and the MIDI.
+    """
+    midi_data = make_midi(
+        [(0, 0.75, 67), (0.75, 1, 69), (1, 3, 71), (3.5, 4.5, 72), (4.5, 8, 74)], key="G"
+    )
+    out = BytesIO()
+    render_musicxml(midi_data, out)
+
+    def notes(score):
+        return [
+            (note.offset, note.quarterLength, note.pitch.midi)
+            for note in score.flatten().stripTies().notes
+        ]
+
+    rendered = converter.parse(out.getvalue(), format="musicxml")
+    assert notes(rendered) == notes(converter.parse(midi_data, format="midi"))
+    assert rendered.recurse().getElementsByClass("KeySignature")[0].sharps == 1
+
+
+@pytest.mark.parametrize(
+    "midi_data",
+    [
+        make_midi([(0, 1, 60), (0, 1, 64)]),
+        make_midi([(0, 2, 60), (1, 2, 64)]),
+        make_midi([(0, 1, 60), (1, 2, 62)], channels=[0, 1]),
+        b"not a MIDI file",
+    ],
+    ids=["chord", "second voice", "two channels", "invalid"],
+)
+def test_complex_midi_is_left_to_music21(midi_data):
+    """
+    Test that files the renderer cannot notate are not rendered.
+    """
+    out = BytesIO()
+    assert not render_musicxml(midi_data, out)
+    assert out.getvalue() == b""
+
+
+def test_tempo_change_is_left_to_music21():
+    """
+    Test that a tempo change mid-piece is left to music21.
+    """
+    midi = mido.MidiFile(file=BytesIO(make_midi([(0, 1, 60), (1, 2, 62)])))
+    track = midi.tracks[0]
+    # Halfway through the first note, which ends 240 ticks later
+    track[3].time = 240
+    track.insert(3, mido.MetaMessage("set_tempo", tempo=400000, time=240))
+    buffer = BytesIO()
+    midi.save(file=buffer)
+
+    assert read_melody(buffer.getvalue()) is None
+
+
+def test_midi_to_musicxml_falls_back(monkeypatch):
+    """
+    Test that melodies skip music21 and chords are converted by it.
+    """
+    melody_data = make_midi([(0, 1, 60), (1, 2, 62)])
+    chord_data = make_midi([(0, 1, 60), (0, 1, 64)])
+
+    rendered = []
+    monkeypatch.setattr(
+        midi_to_musicxml_module.musicxml_pool,
+        "render",
+        lambda midi_data, timeout=None: rendered.append(midi_data) or b"<score-partwise/>",
+    )
+
+    xml_data = midi_to_musicxml_module.midi_to_musicxml(melody_data)
+    assert midi_to_musicxml_module.midi_to_musicxml(chord_data) == b"<score-partwise/>"
+
+    assert rendered == [chord_data]
+    assert ElementTree.fromstring(xml_data).tag == "score-partwise"
+
+    monkeypatch.setattr(midi_to_musicxml_module, "MUSICXML_RENDERER", "music21")
+    midi_to_musicxml_module.midi_to_musicxml(melody_data)
+    assert rendered == [chord_data, melody_data]
+
+
+def test_midi_to_musicxml_inputs(tmp_path):
+    """
+    Test that MIDI files are read from every supported kind of input.
+    """
+    midi_data = make_midi([(0, 1, 60), (1, 2, 62)])
+    midi_path = tmp_path / "take.mid"
+    midi_path.write_bytes(midi_data)
+    expected = midi_to_musicxml_module.midi_to_musicxml(midi_data)
+
+    inputs = [
+        midi_path,
+        str(midi_path),
+        BytesIO(midi_data),
+        mido.MidiFile(file=BytesIO(midi_data)),
+        pretty_midi.PrettyMIDI(BytesIO(midi_data)),
+    ]
+    for midi in inputs:
+        assert midi_to_musicxml_module.midi_to_musicxml(midi) == expected, type(midi)
+
+    score = converter.parse(midi_data, format="midi")
+    assert b"<score-partwise" in midi_to_musicxml_module.midi_to_musicxml(score)
+    with pytest.raises(TypeError):
+        midi_to_musicxml_module.midi_to_musicxml(object())
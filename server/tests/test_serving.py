@@ -0,0 +1,121 @@
+################################################################################
+# Filename: test_serving.py
+# Purpose:  Contains pytest test cases for the gunicorn serving pools.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains pytest test cases for the serving pools, including the
+# pool each request is routed to, the settings read from the environment,
+# unknown pools, the gunicorn configuration built from a pool, and the jobs
+# left queued by a stopping worker.
+#
+# Usage (Optional):
+# Run the tests using the pytest command:
+#   python -m pytest
+#
+###############################################################################
+
+import os
+import runpy
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from app.utils.job_queue import job_queue
+from app.utils.serving import POOLS, get_pool, pool_for_request
+
+SERVER_DIR = os.path.join(os.path.dirname(__file__), "..")
+
+
+@pytest.mark.parametrize(
+    "method, path, pool",
+    [
+        ("POST", "/api/v1/midis", "cpu"),
+        ("POST", "/api/v1/midis/batch", "cpu"),
+        ("POST", "/api/v1/jobs", "cpu"),
+        ("GET", "/api/v1/stats", "cpu"),
+        ("post", "/api/v1/midis/", "cpu"),
+        ("GET", "/api/v1/midis", "io"),
+        ("GET", "/api/v1/midis/3/file.mid", "io"),
+        ("GET", "/api/v1/midis/3/score.musicxml", "io"),
+        ("PUT", "/api/v1/midis/3", "io"),
+        ("GET", "/api/v1/jobs/3/result", "io"),
+        ("POST", "/api/v1/stats", "io"),
+        ("POST", "/api/v1/users", "io"),
+    ],
+)
+def test_pool_for_request(method, path, pool):
+    """
+    Test that only the conversion and stats routes are sent to the cpu pool.
+    """
+    assert pool_for_request(method, path) == pool
+
+
+def test_settings_from_environment(monkeypatch):
+    """
+    Test that GUNICORN_* variables override the defaults of the pool.
+    """
+    monkeypatch.setenv("SERVING_POOL", "cpu")
+    monkeypatch.setenv("GUNICORN_WORKERS", "6")
+    monkeypatch.setenv("GUNICORN_MAX_REQUESTS", "50")
+    monkeypatch.setenv("GUNICORN_BIND", "127.0.0.1:5001")
+
+    pool = get_pool()
+
+    assert pool.name == "cpu"
+    assert pool.load_model
+    assert pool.settings["workers"] == 6
+    assert pool.settings["max_requests"] == 50
+    assert pool.settings["bind"] == "127.0.0.1:5001"
+    assert pool.settings["timeout"] == POOLS["cpu"].settings["timeout"]
+    # The shared defaults are left untouched
+    assert POOLS["cpu"].settings["workers"] == 2
+
+
+def test_invalid_settings(monkeypatch):
+    """
+    Test that unknown pools and non-numeric settings are rejected.
+    """
+    with pytest.raises(ValueError):
+        get_pool("gpu")
+
+    monkeypatch.setenv("GUNICORN_TIMEOUT", "soon")
+    with pytest.raises(ValueError):
+        get_pool("io")
+
+
+def test_gunicorn_config(monkeypatch):
+    """
+    Test that gunicorn.conf.py configures gunicorn from the selected pool.
+    """
+    monkeypatch.setenv("SERVING_POOL", "io")
+    monkeypatch.setenv("GUNICORN_THREADS", "4")
+
+    config = runpy.run_path(os.path.join(SERVER_DIR, "gunicorn.conf.py"))
+
+    assert config["worker_class"] == "gthread"
+    assert config["threads"] == 4
+    assert config["max_requests"] == POOLS["io"].settings["max_requests"]
+    assert config["graceful_timeout"] == POOLS["io"].settings["graceful_timeout"]
+    assert not config["pool"].load_model
+
+
+def test_worker_exit_leaves_time_to_stop(capsys):
+    """
+    Test that a stopping worker waits for its jobs for only part of the
+    graceful timeout, and reports the jobs it leaves queued.
+    """
+    config = runpy.run_path(os.path.join(SERVER_DIR, "gunicorn.conf.py"))
+    worker = SimpleNamespace(cfg=SimpleNamespace(graceful_timeout=1))
+    release = threading.Event()
+    job_queue.submit(release.wait)
+
+    start = time.monotonic()
+    try:
+        config["worker_exit"](None, worker)
+    finally:
+        release.set()
+        job_queue.join()
+
+    assert time.monotonic() - start < worker.cfg.graceful_timeout
+    assert "jobs still queued" in capsys.readouterr().out
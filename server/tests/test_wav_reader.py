@@ -0,0 +1,233 @@
+################################################################################
+# Filename: test_wav_reader.py
+# Purpose:  Contains pytest test cases for reading memory-mapped WAV files.
+# Author:   Darren Seubert
+#
+# Description:
+# This file contains pytest test cases for the WavReader class, including the
+# supported sample formats, extensible and RF64 headers, padded and unset
+# chunk sizes, zero-copy frame views, block conversion with and without
+# resampling, unsupported files, and WAV files taking the memory-mapped path
+# through conversion.
+#
+# Usage (Optional):
+# Run the tests using the pytest command:
+#   python -m pytest
+#
+###############################################################################
+
+import os
+import struct
+import numpy as np
+import pytest
+import soxr
+from app.utils import conversion
+from app.utils.wav_reader import (
+    WAVE_FORMAT_EXTENSIBLE,
+    WAVE_FORMAT_IEEE_FLOAT,
+    WAVE_FORMAT_PCM,
+    WavFormatError,
+    WavReader,
+    is_wav_file,
+)
+
+SAMPLE_WAV = os.path.join(
+    os.path.dirname(__file__), "..", "app", "utils", "audio_sample", "sample_wav.wav"
+)
+
+
+def chunk(chunk_id, data):
+    """Return a RIFF chunk, padded to an even size."""
+    return struct.pack("<4sI", chunk_id, len(data)) + data + b"\0" * (len(data) % 2)
+
+
+def write_wav(
+    path,
+    data,
+    channels,
+    sample_rate,
+    bits,
+    format_tag=WAVE_FORMAT_PCM,
+    extensible=False,
+    extra_chunks=b"",
+    data_size=None,
+):
+    """Write a WAV file holding raw sample bytes."""
+    block_align = channels * bits // 8
+    fmt = struct.pack(
+        "<HHIIHH",
+        WAVE_FORMAT_EXTENSIBLE if extensible else format_tag,
+        channels,
+        sample_rate,
+        sample_rate * block_align,
+        block_align,
+        bits,
+    )
+    if extensible:
+        # cbSize, valid bits, channel mask, then the sub-format GUID
+        fmt += struct.pack("<HHI", 22, bits, 0) + struct.pack("<H", format_tag) + b"\0" * 14
+    data_chunk = struct.pack(
+        "<4sI", b"data", len(data) if data_size is None else data_size
+    ) + data
+    body = b"WAVE" + chunk(b"fmt ", fmt) + extra_chunks + data_chunk
+    with open(path, "wb") as wav_file:
+        wav_file.write(struct.pack("<4sI", b"RIFF", len(body)) + body)
+    return path
+
+
+def ramp(n_frames, channels):
+    """Return test samples between -1 and 1, one column per channel."""
+    t = np.arange(n_frames)[:, np.newaxis]
+    return np.sin(0.01 * t * (1 + np.arange(channels)))
+
+
+@pytest.mark.parametrize(
+    "bits, format_tag, encode, tolerance",
+    [
+        (8, WAVE_FORMAT_PCM, lambda x: np.round(x * 127 + 128).astype("u1"), 1 / 64),
+        (16, WAVE_FORMAT_PCM, lambda x: np.round(x * 32767).astype("<i2"), 1e-4),
+        (32, WAVE_FORMAT_PCM, lambda x: np.round(x * (2**31 - 1)).astype("<i4"), 1e-6),
+        (32, WAVE_FORMAT_IEEE_FLOAT, lambda x: x.astype("<f4"), 1e-7),
+        (64, WAVE_FORMAT_IEEE_FLOAT, lambda x: x.astype("<f8"), 1e-7),
+    ],
+)
+def test_sample_formats(tmp_path, bits, format_tag, encode, tolerance):
+    """
+    Test that every supported sample format reads back as floats.
+    """
+    samples = ramp(1000, 2)
+    path = write_wav(
+        tmp_path / "take.wav", encode(samples).tobytes(), 2, 8000, bits, format_tag
+    )
+
+    reader = WavReader(path)
+
+    assert (reader.sample_rate, reader.channels, reader.n_frames) == (8000, 2, 1000)
+    assert reader.frames.shape == (1000, 2)
+    np.testing.assert_allclose(reader.read(mono=False), samples, atol=tolerance)
+    np.testing.assert_allclose(reader.read(), samples.mean(axis=1), atol=tolerance)
+    assert reader.read().dtype == np.float32
+
+
+def test_24_bit_and_extensible(tmp_path):
+    """
+    Test 24-bit samples, including negative ones, in an extensible header.
+    """
+    values = np.array([0, 1, -1, 2**23 - 1, -(2**23), 123456, -654321])
+    data = b"".join(int(value).to_bytes(3, "little", signed=True) for value in values)
+    path = write_wav(tmp_path / "take.wav", data, 1, 48000, 24, extensible=True)
+
+    reader = WavReader(path)
+
+    assert reader.frames.shape == (len(values), 1, 3)
+    np.testing.assert_array_equal(reader.read(), (values / 2**23).astype(np.float32))
+
+
+def test_chunks_and_sizes(tmp_path):
+    """
+    Test skipping odd-sized chunks and data sizes left unset by recorders.
+    """
+    data = np.arange(-50, 50, dtype="<i2").tobytes()
+    extra = chunk(b"LIST", b"odd")
+    for data_size in (None, 0, 0xFFFFFFFF, 10**6):
+        path = write_wav(
+            tmp_path / "take.wav", data, 1, 8000, 16, extra_chunks=extra, data_size=data_size
+        )
+        np.testing.assert_array_equal(
+            WavReader(path).read(), np.arange(-50, 50, dtype=np.float32) / 32768
+        )
+
+
+def test_rf64(tmp_path):
+    """
+    Test that RF64 files take the data size from their ds64 chunk.
+    """
+    data = np.arange(100, dtype="<i2").tobytes()
+    path = write_wav(
+        tmp_path / "take.wav",
+        data + b"\0" * 20,
+        1,
+        8000,
+        16,
+        extra_chunks=chunk(b"ds64", struct.pack("<QQQ", 0, len(data), 100)),
+        data_size=0xFFFFFFFF,
+    )
+    with open(path, "r+b") as wav_file:
+        wav_file.write(b"RF64")
+
+    assert WavReader(path).n_frames == 100
+
+
+def test_frames_are_views(tmp_path):
+    """
+    Test that frame blocks are views of the memory map, not copies.
+    """
+    path = write_wav(
+        tmp_path / "take.wav", np.arange(1000, dtype="<i2").tobytes(), 1, 8000, 16
+    )
+    reader = WavReader(path)
+
+    blocks = list(reader.iter_frames(300))
+
+    assert [len(block) for block in blocks] == [300, 300, 300, 100]
+    assert all(np.shares_memory(block, reader.frames) for block in blocks)
+    assert not reader.frames.flags.writeable
+
+
+@pytest.mark.parametrize("block_samples", [1000, 4096, 22050])
+def test_iter_blocks_resamples_like_whole_signal(block_samples):
+    """
+    Test that resampling block by block gives the samples of one resampling
+    of the whole recording, cut into blocks of exactly block_samples.
+    """
+    reader = WavReader(SAMPLE_WAV)
+    expected = soxr.resample(reader.read(), reader.sample_rate, 22050)
+
+    blocks = list(reader.iter_blocks(block_samples, sample_rate=22050))
+
+    assert all(len(block) == block_samples for block in blocks[:-1])
+    assert 0 < len(blocks[-1]) <= block_samples
+    np.testing.assert_array_equal(np.concatenate(blocks), expected)
+
+
+def test_iter_blocks_native_rate():
+    """
+    Test that blocks at the file's own rate are converted without resampling.
+    """
+    reader = WavReader(SAMPLE_WAV)
+
+    blocks = list(reader.iter_blocks(50000))
+
+    np.testing.assert_array_equal(np.concatenate(blocks), reader.read())
+
+
+def test_unsupported_files(tmp_path):
+    """
+    Test that other files and WAV codecs raise WavFormatError.
+    """
+    not_wav = tmp_path / "take.mp3"
+    not_wav.write_bytes(b"ID3" + b"\0" * 100)
+    adpcm = write_wav(tmp_path / "adpcm.wav", b"\0" * 64, 1, 8000, 4, format_tag=0x0002)
+
+    assert not is_wav_file(not_wav)
+    assert not is_wav_file(tmp_path / "missing.wav")
+    assert is_wav_file(adpcm)
+    with pytest.raises(WavFormatError):
+        WavReader(not_wav)
+    with pytest.raises(WavFormatError):
+        WavReader(adpcm)
+    assert conversion.open_wav(str(adpcm)) is None
+
+
+def test_conversion_reads_wav_through_memory_map():
+    """
+    Test that conversion streams and decodes WAV files with WavReader.
+    """
+    reader = conversion.open_wav(SAMPLE_WAV)
+    expected = soxr.resample(reader.read(), reader.sample_rate, conversion.AUDIO_SAMPLE_RATE)
+
+    chunks = list(conversion.stream_audio(SAMPLE_WAV))
+
+    assert len(chunks[0]) == conversion.CHUNK_SAMPLES
+    np.testing.assert_array_equal(np.concatenate(chunks), expected)
+    np.testing.assert_array_equal(conversion.decode_audio(SAMPLE_WAV), expected)